@@ -0,0 +1,37 @@
+// File: app/api/market_compare/route.ts
+import { NextResponse } from 'next/server';
+
+export async function POST(request: Request) {
+  try {
+    const body = await request.json();
+    console.log('Market compare request:', body);
+
+    // One request for every location; the backend fetches the missing ones concurrently
+    const flaskResponse = await fetch('https://cs532-project-dubl.onrender.com/api/market_compare', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(body),
+    });
+
+    if (!flaskResponse.ok) {
+      console.error('Flask API market compare response was not ok:', flaskResponse.status);
+      return NextResponse.json(
+        { error: `Market compare failed with status: ${flaskResponse.status}`, locations: [] },
+        { status: flaskResponse.status }
+      );
+    }
+
+    const data = await flaskResponse.json();
+    console.log(`Received market comparison of ${data.locations?.length || 0} locations`);
+
+    return NextResponse.json(data);
+  } catch (error) {
+    console.error('Error in market compare API route:', error);
+    return NextResponse.json(
+      { error: 'Failed to compare markets', locations: [] },
+      { status: 500 }
+    );
+  }
+}
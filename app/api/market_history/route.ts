@@ -0,0 +1,37 @@
+// File: app/api/market_history/route.ts
+import { NextResponse } from 'next/server';
+
+export async function POST(request: Request) {
+  try {
+    const body = await request.json();
+    console.log('Market history request:', body);
+
+    // Served from the backend's stored market snapshots, without a Zillow call
+    const flaskResponse = await fetch('https://cs532-project-dubl.onrender.com/api/market_history', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(body),
+    });
+
+    if (!flaskResponse.ok) {
+      console.error('Flask API market history response was not ok:', flaskResponse.status);
+      return NextResponse.json(
+        { error: `Market history failed with status: ${flaskResponse.status}`, history: null },
+        { status: flaskResponse.status }
+      );
+    }
+
+    const data = await flaskResponse.json();
+    console.log(`Received market history for: ${data.location}`);
+
+    return NextResponse.json(data);
+  } catch (error) {
+    console.error('Error in market history API route:', error);
+    return NextResponse.json(
+      { error: 'Failed to fetch market history', history: null },
+      { status: 500 }
+    );
+  }
+}
@@ -0,0 +1,36 @@
+import { NextResponse } from 'next/server';
+
+export async function POST(request: Request) {
+  try {
+    const body = await request.json();
+    console.log(`Fetching property facets for zip code ${body.zipCode}`);
+
+    // Forward the request to the backend; it returns one page of listings plus facet counts and stats
+    const flaskResponse = await fetch('https://cs532-project-dubl.onrender.com/api/properties/facets', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(body),
+    });
+
+    if (!flaskResponse.ok) {
+      console.error('Flask API property facets response was not ok:', flaskResponse.status, flaskResponse.statusText);
+      return NextResponse.json({
+        error: `Property facets failed with status: ${flaskResponse.status}`,
+        results: []
+      });
+    }
+
+    const data = await flaskResponse.json();
+    console.log(`Received ${data.results?.length || 0} of ${data.total ?? 0} properties for zip code ${body.zipCode}`);
+
+    return NextResponse.json(data);
+  } catch (error) {
+    console.error('Error in property facets API route:', error);
+    return NextResponse.json(
+      { error: 'Failed to process property facets request', results: [] },
+      { status: 200 }
+    );
+  }
+}
@@ -0,0 +1,33 @@
+export async function POST(request: Request) {
+  try {
+    const body = await request.json();
+    console.log(`Streaming properties for zip code ${body.zipCode}`);
+
+    // Forward the request to the backend and pass its NDJSON body through as it arrives
+    const flaskResponse = await fetch('https://cs532-project-dubl.onrender.com/api/properties/stream', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(body),
+    });
+
+    if (!flaskResponse.ok || !flaskResponse.body) {
+      console.error('Flask API properties stream response was not ok:', flaskResponse.status, flaskResponse.statusText);
+      return new Response(
+        JSON.stringify({ type: 'error', error: `Properties search failed with status: ${flaskResponse.status}` }) + '\n',
+        { headers: { 'Content-Type': 'application/x-ndjson' } }
+      );
+    }
+
+    return new Response(flaskResponse.body, {
+      headers: { 'Content-Type': 'application/x-ndjson', 'Cache-Control': 'no-cache' },
+    });
+  } catch (error) {
+    console.error('Error in properties stream API route:', error);
+    return new Response(
+      JSON.stringify({ type: 'error', error: 'Failed to process properties request' }) + '\n',
+      { headers: { 'Content-Type': 'application/x-ndjson' } }
+    );
+  }
+}
@@ -0,0 +1,293 @@
+# agent_directory.py
+"""
+Local directory of real estate agents behind /api/search_agents.
+
+search_agents() proxied every request to Zillow's /search_agents and
+returned the list as it came: nothing was cached, sorted or paged. Every
+response now goes into an AgentDirectory, and requests are answered from
+it:
+
+- Agents are keyed by encodedZuid. An agent returned by several searches is
+  one entry, updated with the latest data. When a refreshed search no longer
+  returns an agent, the agent leaves the indexes that search put it in, and
+  the directory once no search returns it.
+- Zillow's agent records do not list languages or specialties; a search
+  for a language or specialty returns the agents that have it. So the
+  directory indexes each agent under the location, language and specialty
+  of every search that returned it ("Any" specialty adds nothing), and also
+  under the agent's own city.
+- Ranking keys are computed once per agent when it is added: relevance
+  (top agent, then reviews, then sales last year), reviews, sales last year
+  and star rating. The order of a location's agents for a sort key is kept
+  until one of them changes. A query filters that order by its language
+  and specialty indexes and slices a page, without sorting.
+- With the price of the property being viewed, agents whose sale price
+  range of the last three years contains it come first, then those within
+  PRICE_RANGE_MARGIN of the range, each group in ranking order.
+- A (location, specialty, language) search is answered from the directory
+  for AGENT_DIRECTORY_MAX_AGE seconds after Zillow was last asked, and
+  refreshed in the background once it is AGENT_DIRECTORY_REFRESH_AFTER old.
+  An older or new search calls Zillow first. A stale copy served because
+  Zillow failed is added without marking the search as refreshed.
+
+benchmarks/agent_directory_bench.py measures query latency and compares
+the endpoint with the proxy.
+
+Environment variables:
+    AGENT_DIRECTORY_MAX_AGE         seconds a search is served locally, default 86400
+    AGENT_DIRECTORY_REFRESH_AFTER   seconds after which it is refreshed in the background, default 3600
+"""
+import math
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+MAX_AGE = float(os.environ.get("AGENT_DIRECTORY_MAX_AGE", 86400))
+REFRESH_AFTER = float(os.environ.get("AGENT_DIRECTORY_REFRESH_AFTER", 3600))
+# Relative distance from an agent's price range still counted as near it
+PRICE_RANGE_MARGIN = 0.25
+
+SORT_KEYS = ("relevance", "reviews", "sales", "rating")
+ANY = "any"
+
+_SPACES = re.compile(r"\s+")
+
+
+def index_key(value: Optional[str]) -> str:
+    """Normalized location, language or specialty; "any" when empty."""
+    key = _SPACES.sub(" ", str(value or "").strip().lower())
+    if key.endswith(", usa"):
+        key = key[:-5]
+    return key or ANY
+
+
+def _number(value: Any) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return 0.0
+    return float(value)
+
+
+def ranking_keys(agent: Dict[str, Any]) -> Dict[str, Tuple]:
+    """Sort key per SORT_KEYS entry of a Zillow agent; larger ranks first."""
+    top = 1 if agent.get("isTopAgent") else 0
+    reviews = _number(agent.get("numTotalReviews"))
+    rating = _number(agent.get("reviewStarsRating"))
+    sales, all_time = _number(agent.get("saleCountLastYear")), _number(agent.get("saleCountAllTime"))
+    return {
+        "relevance": (top, reviews, sales, rating),
+        "reviews": (reviews, rating, sales),
+        "sales": (sales, all_time, reviews),
+        "rating": (rating, reviews, sales),
+    }
+
+
+def price_bounds(agent: Dict[str, Any]) -> Tuple[float, float, float, float]:
+    """The agent's three-year sale price range, and the range widened by PRICE_RANGE_MARGIN; empty if unknown."""
+    low, high = _number(agent.get("salePriceRangeThreeYearMin")), _number(agent.get("salePriceRangeThreeYearMax"))
+    if high <= 0 or high < low:
+        return (math.inf, -math.inf, math.inf, -math.inf)
+    return (low, high, low * (1 - PRICE_RANGE_MARGIN), high * (1 + PRICE_RANGE_MARGIN))
+
+
+def price_fit(bounds: Tuple[float, float, float, float], price: float) -> int:
+    """2 if price is in the price_bounds() range, 1 if in the widened one, else 0."""
+    if bounds[0] <= price <= bounds[1]:
+        return 2
+    if bounds[2] <= price <= bounds[3]:
+        return 1
+    return 0
+
+
+class AgentDirectory:
+    """Agents seen in /search_agents responses, indexed for local search."""
+
+    def __init__(self):
+        self.agents: Dict[str, Dict[str, Any]] = {}
+        self.ranks: Dict[str, Dict[str, Tuple]] = {}
+        self.bounds: Dict[str, Tuple[float, float, float, float]] = {}
+        self.locations_of: Dict[str, Set[str]] = {}
+        self.by_location: Dict[str, Set[str]] = {}
+        self.by_language: Dict[str, Set[str]] = {}
+        self.by_specialty: Dict[str, Set[str]] = {}
+        # (location, specialty, language) -> time Zillow was last asked
+        self.coverage: Dict[Tuple[str, str, str], float] = {}
+        # (location, specialty, language) -> agents it returned, and the reverse
+        self.members: Dict[Tuple[str, str, str], Set[str]] = {}
+        self.searches_of: Dict[str, Set[Tuple[str, str, str]]] = {}
+        # (location, sort key) -> agent ids in ranking order
+        self.orders: Dict[Tuple[str, str], List[str]] = {}
+        self.lock = threading.Lock()
+        self.stats = {"responses": 0, "stale_responses": 0, "agents_changed": 0, "agents_dropped": 0,
+                      "agents_removed": 0, "queries": 0, "orders_built": 0}
+
+    def __len__(self):
+        return len(self.agents)
+
+    def _index(self, index: Dict[str, Set[str]], key: str, agent_id: str):
+        if key == ANY:
+            return
+        members = index.get(key)
+        if members is None:
+            members = index[key] = set()
+        members.add(agent_id)
+        if index is self.by_location:
+            self.locations_of.setdefault(agent_id, set()).add(key)
+
+    def _unindex(self, index: Dict[str, Set[str]], key: str, agent_id: str):
+        members = index.get(key)
+        if members is not None:
+            members.discard(agent_id)
+            if not members:
+                del index[key]
+        if index is self.by_location:
+            self.locations_of.get(agent_id, set()).discard(key)
+
+    def _drop(self, agent_id: str, search: Tuple[str, str, str]) -> Set[str]:
+        """
+        Take an agent out of what one search indexed it under. Call with the lock held.
+
+        Returns:
+            Locations whose agents changed
+        """
+        location, specialty, language = search
+        searches = self.searches_of.get(agent_id, set())
+        searches.discard(search)
+        if not searches:
+            # No search returns the agent any more
+            locations = self.locations_of.pop(agent_id, set())
+            for key in locations:
+                self._unindex(self.by_location, key, agent_id)
+            self._unindex(self.by_specialty, specialty, agent_id)
+            self._unindex(self.by_language, language, agent_id)
+            for table in (self.agents, self.ranks, self.bounds, self.searches_of):
+                table.pop(agent_id, None)
+            self.stats["agents_removed"] += 1
+            return locations
+        if location != index_key(self.agents[agent_id].get("location")) and \
+                not any(other[0] == location for other in searches):
+            self._unindex(self.by_location, location, agent_id)
+        if not any(other[1] == specialty for other in searches):
+            self._unindex(self.by_specialty, specialty, agent_id)
+        if not any(other[2] == language for other in searches):
+            self._unindex(self.by_language, language, agent_id)
+        return {location}
+
+    def add(self, agents: Iterable[Dict[str, Any]], location: str, specialty: Optional[str] = None,
+            language: Optional[str] = None, searched_at: Optional[float] = None, fresh: bool = True) -> int:
+        """
+        Add the agents of one /search_agents response.
+
+        Args:
+            fresh: The response came from Zillow just now. A stale copy is
+                merged, but leaves the search due for a refresh and drops no one.
+
+        Returns:
+            Number of agents that were new or changed
+        """
+        location, specialty, language = index_key(location), index_key(specialty), index_key(language)
+        search = (location, specialty, language)
+        changed = 0
+        with self.lock:
+            self.stats["responses" if fresh else "stale_responses"] += 1
+            touched = {location}
+            returned = set()
+            for agent in agents:
+                if not isinstance(agent, dict):
+                    continue
+                agent_id = agent.get("encodedZuid") or agent.get("username")
+                if not agent_id:
+                    continue
+                returned.add(agent_id)
+                previous = self.agents.get(agent_id)
+                if previous != agent:
+                    if previous is not None:
+                        own = index_key(previous.get("location"))
+                        if own != index_key(agent.get("location")) and \
+                                not any(other[0] == own for other in self.searches_of.get(agent_id, ())):
+                            self._unindex(self.by_location, own, agent_id)
+                    self.agents[agent_id] = agent
+                    self.ranks[agent_id] = ranking_keys(agent)
+                    self.bounds[agent_id] = price_bounds(agent)
+                    changed += 1
+                    # Its rank may have changed in every location it is in
+                    touched.update(self.locations_of.get(agent_id, ()))
+                own = index_key(agent.get("location"))
+                for key in (location, own):
+                    self._index(self.by_location, key, agent_id)
+                touched.add(own)
+                self._index(self.by_language, language, agent_id)
+                self._index(self.by_specialty, specialty, agent_id)
+                self.searches_of.setdefault(agent_id, set()).add(search)
+            previous_members = self.members.get(search, set())
+            if fresh:
+                for agent_id in previous_members - returned:
+                    touched.update(self._drop(agent_id, search))
+                    self.stats["agents_dropped"] += 1
+                self.members[search] = returned
+                self.coverage[search] = searched_at or time.time()
+            else:
+                self.members[search] = previous_members | returned
+            for key in touched:
+                for sort in SORT_KEYS:
+                    self.orders.pop((key, sort), None)
+            self.stats["agents_changed"] += changed
+        return changed
+
+    def searched_at(self, location: str, specialty: Optional[str] = None,
+                    language: Optional[str] = None) -> Optional[float]:
+        """When Zillow was last asked for this search, or None."""
+        with self.lock:
+            return self.coverage.get((index_key(location), index_key(specialty), index_key(language)))
+
+    def _order(self, location: str, sort: str) -> List[str]:
+        order = self.orders.get((location, sort))
+        if order is None:
+            ranks = self.ranks
+            # Ties in id order, so pages are stable
+            order = sorted(self.by_location.get(location, ()), key=lambda agent_id: (
+                tuple(-value for value in ranks[agent_id][sort]), agent_id))
+            self.orders[(location, sort)] = order
+            self.stats["orders_built"] += 1
+        return order
+
+    def search(self, location: str, specialty: Optional[str] = None, language: Optional[str] = None,
+               sort: str = "relevance", page: int = 1, page_size: Optional[int] = None,
+               price: Optional[float] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Agents in a location with a language and specialty, ranked.
+
+        Args:
+            sort: One of SORT_KEYS
+            page: 1-based page number
+            page_size: Agents per page; None for all of them
+            price: Price of the property being viewed; agents who sell in its range come first
+
+        Returns:
+            (agents of the page, number of matching agents)
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort {sort!r}")
+        location, specialty, language = index_key(location), index_key(specialty), index_key(language)
+        with self.lock:
+            self.stats["queries"] += 1
+            order = self._order(location, sort)
+            filters = [index.get(key, set()) for index, key in ((self.by_specialty, specialty),
+                                                               (self.by_language, language)) if key != ANY]
+            if filters:
+                order = [agent_id for agent_id in order if all(agent_id in members for members in filters)]
+            if price is not None and price > 0:
+                bounds = self.bounds
+                # sorted() is stable, so each fit group keeps the ranking order
+                order = sorted(order, key=lambda agent_id: price_fit(bounds[agent_id], price), reverse=True)
+            total = len(order)
+            if page_size is not None:
+                order = order[(page - 1) * page_size:page * page_size]
+            return [self.agents[agent_id] for agent_id in order], total
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"agents": len(self.agents), "locations": len(self.by_location),
+                    "languages": len(self.by_language), "specialties": len(self.by_specialty),
+                    "searches": len(self.coverage), "cached_orders": len(self.orders), **self.stats}
@@ -1,28 +1,49 @@
+import asyncio
 import math
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import os
-from langchain.chat_models import AzureChatOpenAI
-from langchain.prompts import PromptTemplate
-from serpapi import GoogleSearch
-from geopy.geocoders import Nominatim
-from geopy.distance import geodesic
 import uuid
-import http.client
 import json
 import urllib.parse
-import requests
 import datetime
-import boto3
-from botocore.config import Config
 import logging
 import statistics
 from pydantic import BaseModel, Field
 from typing import Optional, List, Any, Dict
 from dotenv import load_dotenv
-import httpx
 import re
+import threading
+import time
+from upstream_scheduler import scheduler, Priority, current_priority
+from resilience import (
+    HTTP_TIMEOUT, READ_TIMEOUT, UpstreamError,
+    DEEPL_URL, NOMINATIM_URL, SERPAPI_BASE_URL, ZILLOW_BASE_URL,
+    guarded_call, raise_for_upstream_status,
+)
+from http_pools import close_pools, get_async_client, get_session
+import resilience
+from r2_storage import get_r2_service, upload_queue
+import telemetry
+from logging_setup import configure_logging, log_payload
+import chat_prompt
+from chat_prompt import build_chat_messages, record_prompt_tokens
+import query_classifier
+from llm_gateway import DEFAULT_TIER, SMALL_TIER, LLMOverloaded, LLMUnavailable, gateway_from_env
+from telemetry import stage_span, timed_stage, upstream_span
+from ui_context import PropertyContextCache, UIContextStore
+import market_compare
+import market_history
+from agent_directory import MAX_AGE as AGENT_DIRECTORY_MAX_AGE, REFRESH_AFTER as AGENT_DIRECTORY_REFRESH_AFTER
+from agent_directory import SORT_KEYS as AGENT_SORT_KEYS, AgentDirectory
+from comps import MAX_COMPS, MarketAnalysisCache, analyze_property, comp_from_nearby, comp_from_record, describe_analysis
+from listing_query import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, ListingQuery, ListingTable, ListingTableCache
+from listing_stream import decode_cursor, encode_cursor, iter_json_object, ndjson_line, query_digest
+from property_store import (SNAPSHOT_ON_SHUTDOWN, IngestionQueue, get_store, record_from_details, save_snapshot,
+                            search_result_from_record)
+from chat_archive import ChatArchive, session_key
 
 load_dotenv() 
 
@@ -35,6 +56,11 @@ class LocationRequest(BaseModel):
 
 class PropertiesRequest(BaseModel):
     zipCode: str = Field(..., example="90210")
+    propertyFeatures: Optional[Dict[str, Any]] = Field(None, example={"bedrooms": 3, "propertyType": "house"})
+    filters: Optional[Dict[str, Any]] = Field(None, example={"priceRange": [None, 650000]})
+    sortBy: Optional[str] = Field(None, example="price_asc")
+    page: int = Field(1, ge=1, example=1)
+    pageSize: Optional[int] = Field(None, ge=1, le=MAX_PAGE_SIZE, example=20)
 
 class ErrorResponse(BaseModel):
     error: str
@@ -44,9 +70,19 @@ class PropertyResponse(BaseModel):
     error: Optional[str] = None
     results: dict
 
+class PropertiesStreamRequest(PropertiesRequest):
+    cursor: Optional[str] = Field(None, description="cursor from the previous page's last line")
+
 class PropertiesResponse(BaseModel):
     error: Optional[str] = None
     results: List[dict]
+    total: Optional[int] = None
+    page: Optional[int] = None
+    pageSize: Optional[int] = None
+    hasMore: Optional[bool] = None
+
+class PropertiesFacetsResponse(PropertiesResponse):
+    facets: Optional[dict] = None
 
 class ExtractFeaturesRequest(BaseModel):
     message: str = Field(..., example="Looking for a 2-bedroom house near downtown.")
@@ -66,6 +102,7 @@ class SaveChatResponse(BaseModel):
     r2_upload: bool
     file_key: str
     timestamp: str
+    archived_messages: int = 0
 
 class ErrorResponse(BaseModel):
     success: bool
@@ -82,6 +119,32 @@ class MarketTrendsResponse(BaseModel):
     trends: Dict[str, Any] 
 
 
+class MarketHistoryRequest(BaseModel):
+    location: Optional[str] = Field(None, example="Chicago, IL")
+    zipCode: Optional[str] = Field(None, example="60616")
+    startMonth: Optional[str] = Field(None, example="2020-01")
+    endMonth: Optional[str] = Field(None, example="2025-04")
+
+
+class MarketHistoryResponse(BaseModel):
+    location: str
+    history: Dict[str, Any]
+
+
+class MarketCompareRequest(BaseModel):
+    locations: List[str] = Field(..., example=["60616", "60605", "Evanston, IL"])
+    months: Optional[int] = Field(None, example=24)
+
+
+class MarketCompareResponse(BaseModel):
+    base: str
+    locations: List[str]
+    months: List[str]
+    medianRent: List[List[Any]]
+    metrics: Dict[str, Any]
+    missing: List[str]
+
+
 class ChatRequest(BaseModel):
     message: str = Field(..., example="Find me a 2-bedroom apartment in Chicago.")
     session_id: Optional[str] = Field(None, example="a1b2c3d4-5678-90ef-ghij-klmnopqrstuv")
@@ -94,6 +157,8 @@ class ChatResponse(BaseModel):
     session_id: str
     response: str
     extracted_features: Optional[Dict[str, Any]] = Field(default_factory=dict)
+    ui_context_version: Optional[str] = Field(None, example="9f1c2b7e04d35a68c1e0f9a2b4d6e8c0")
+    ui_context_resync: bool = Field(False, example=False)
 
 class ChatErrorResponse(BaseModel):
     error: str
@@ -112,20 +177,33 @@ class AgentSearchRequest(BaseModel):
     location: str = Field(..., example="houston, tx")
     specialty: Optional[str] = Field("Any", example="Residential")
     language: Optional[str] = Field("English", example="English")
+    sortBy: Optional[str] = Field("relevance", example="reviews")  # relevance, reviews, sales or rating
+    page: int = Field(1, ge=1)
+    pageSize: Optional[int] = Field(None, ge=1, le=MAX_PAGE_SIZE, example=10)
+    propertyPrice: Optional[float] = Field(None, example=450000)  # agents who sell at this price come first
 
 class AgentSearchResponse(BaseModel):
     agents: List[Dict[str, Any]]
+    total: Optional[int] = None
+    page: Optional[int] = None
+    pageSize: Optional[int] = None
+    hasMore: Optional[bool] = None
 
 # Set up logging
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger(__name__)
 
-DEEPL_URL = "https://api.deepl.com/v2/translate"
 DEEPL_API_KEY = os.environ.get('DEEPL_API_KEY')
 
 app = FastAPI()
 
+chat_archive = ChatArchive(
+    upload_queue,
+    window_seconds=float(os.environ.get("CHAT_ARCHIVE_WINDOW_SECONDS", 300)),
+    max_batch_records=int(os.environ.get("CHAT_ARCHIVE_MAX_BATCH", 2000)),
+    max_sessions=int(os.environ.get("CHAT_ARCHIVE_MAX_SESSIONS", 10000)),
+)
+
 # Enable CORS for all routes
 app.add_middleware(
     CORSMiddleware,
@@ -133,14 +211,117 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Build the LLM/R2 clients and import the lazily loaded integrations in the
+# background after start-up, so the first requests don't pay for it.
+WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+def warm_up():
+    """Load every lazily initialized integration. Returns milliseconds per step."""
+    steps = (
+        ("llm", lambda: [get_shared_llm(tier) for tier in LLM_DEPLOYMENTS]),
+        ("query_classifier", query_classifier.get_classifier),
+        ("tokenizer", chat_prompt.load_encoding),
+        ("market_history", market_history.get_history),
+        ("r2", lambda: get_r2_service()),
+        ("nominatim", lambda: get_geolocator()),
+        ("serpapi", lambda: __import__("serpapi")),
+        ("httpx", lambda: __import__("httpx")),
+    )
+    timings = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {str(e)}")
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+    logger.info("Warm-up finished (ms): %s", timings)
+    return timings
+
+# Read-only state that is safe to build once in the gunicorn master and share
+# with the forked workers (copy-on-write). Nothing here may open a socket or
+# start a thread: those don't survive fork().
+_preloaded = False
+
+def preload():
+    """Import the heavy integrations and build read-only indexes before workers fork."""
+    global _preloaded
+    if _preloaded:
+        return
+    start = time.perf_counter()
+    for module in ("langchain.chat_models", "geopy.geocoders", "geopy.distance", "serpapi", "httpx",
+                   "boto3", "botocore.config", "numpy"):
+        try:
+            __import__(module)
+        except ImportError as e:
+            logger.warning("Preload of %s failed: %s", module, e)
+    query_classifier.get_classifier()
+    _preloaded = True
+    logger.info("Preload finished in %.1f ms", (time.perf_counter() - start) * 1000)
+
+@app.on_event("startup")
+def start_background_workers():
+    upload_queue.start()
+    property_ingestion.start()
+    chat_archive.start()
+    if market_history.REFRESH_INTERVAL > 0:
+        threading.Thread(target=refresh_market_history, name="market-history", daemon=True).start()
+    if WARMUP_ON_STARTUP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+@app.on_event("shutdown")
+async def flush_r2_uploads():
+    market_history_stop.set()
+    chat_archive.stop()
+    upload_queue.stop()
+    property_ingestion.stop()
+    if SNAPSHOT_ON_SHUTDOWN:
+        try:
+            save_snapshot(property_ingestion.store)
+        except Exception as e:
+            logger.error(f"Failed to write the property snapshot: {str(e)}")
+    await close_pools()
+    await close_shared_llm()
+
+@app.middleware("http")
+async def assign_request_priority(request, call_next):
+    # Background warm-up calls from the frontend send X-Request-Priority: prefetch
+    # so they queue behind interactive traffic at the upstream scheduler.
+    requested = request.headers.get("x-request-priority", "").upper()
+    if requested in Priority.__members__:
+        current_priority.set(Priority[requested])
+    return await call_next(request)
+
+@app.middleware("http")
+async def record_request_timing(request, call_next):
+    # Spans recorded by upstream calls and local stages while serving this request
+    spans = []
+    telemetry.request_spans.set(spans)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        route = request.scope.get("route")
+        telemetry.REQUEST_LATENCY.observe(
+            (request.method, route.path if route else "unmatched", str(status)), elapsed
+        )
+    response.headers["Server-Timing"] = telemetry.server_timing(spans, elapsed)
+    response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
 # Define section IDs - these should match what's in your frontend
 SECTION_IDS = {
     "PROPERTIES": "properties-section",
     "MARKET": "market-trends-section",
     "AMENITIES": "local-amenities-section",
-    "TRANSIT": "transit-section"
+    "TRANSIT": "transit-section",
+    "AGENTS": "agents-section"
 }
 
 # Define property tab IDs - these should match what's in your frontend
@@ -155,16 +336,17 @@ PROPERTY_TAB_IDS = {
 translation_models = {}
 
 # Define prompts
-CONDENSE_PROMPT = PromptTemplate.from_template("""
+# Plain template strings; PromptTemplate.from_template(...) them where needed
+CONDENSE_PROMPT = """
 Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question that includes relevant context from the conversation.
 
 Chat History:
 {chat_history}
 Follow Up Input: {question}
 Standalone question:
-""")
+"""
 
-QA_PROMPT = PromptTemplate.from_template("""
+QA_PROMPT = """
 You are REbot, a helpful and concise real estate AI assistant that helps users search for properties, track market trends, understand neighborhoods, and answer real estate questions.
 
 IMPORTANT GUIDELINES:
@@ -183,10 +365,11 @@ QUERY TYPE: {query_type}
 
 Question: {question}
 Answer:
-""")
-
-# Update the ENHANCED_SYSTEM_PROMPT in app.py
+"""
 
+# Static instructions for /api/chat. The UI context, history and question go
+# in separate messages after it (chat_prompt.build_chat_messages), so this
+# must not contain anything that changes between requests.
 ENHANCED_SYSTEM_PROMPT = """
 You are REbot, a helpful real estate AI assistant that helps users search for properties, track market trends, understand neighborhoods, and answer real estate questions.
 
@@ -226,21 +409,17 @@ Bulleted response:
 * Inventory is down 15% compared to the same period last year
 
 You can see full market trend information in the [[market trends]] section."
-
-CURRENT UI STATE:
-{ui_context}
-
-USER QUERY: {question}
 """
 
 
 import re
 
+@timed_stage("format_response_with_links")
 def format_response_with_links(response_text):
     """Replace markdown and link placeholders with HTML, with enhanced cross-tab navigation."""
     text = response_text
     
-    logging.info(f"Formatting response with links. Input: {text[:100]}...")
+    logger.debug("Formatting response with links. Input: %.100s...", text)
     
     # — 1) Convert headings
     heading_patterns = {
@@ -259,9 +438,8 @@ def format_response_with_links(response_text):
     text = re.sub(r'(?<!\*)\*(?!\*)(.+?)(?<!\*)\*(?!\*)', r'<em>\1</em>', text)
     
     # — 3) Log found link patterns for debugging
-    all_link_patterns = re.findall(r'\[\[.+?\]\]', text)
-    if all_link_patterns:
-        logging.info(f"Found link patterns: {all_link_patterns}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Found link patterns: %s", re.findall(r'\[\[.+?\]\]', text))
     
     # — 4) Define ALL link replacements with enhanced attributes for cross-tab navigation
     replacements = [
@@ -301,22 +479,21 @@ def format_response_with_links(response_text):
     
     # Apply each replacement pattern
     for pattern, replacement in replacements:
-        before_count = text.count("[[")
-        text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
-        after_count = text.count("[[")
-        if before_count > after_count:
-            logging.info(f"Replaced pattern {pattern} - found {before_count - after_count} occurrences")
+        text, replaced = re.subn(pattern, replacement, text, flags=re.IGNORECASE)
+        if replaced:
+            logger.debug("Replaced pattern %s - found %d occurrences", pattern, replaced)
     
     # Check for any unprocessed link patterns
-    remaining_links = re.findall(r'\[\[.+?\]\]', text)
-    if remaining_links:
-        logging.warning(f"Remaining unprocessed link patterns: {remaining_links}")
+    if "[[" in text:
+        remaining_links = re.findall(r'\[\[.+?\]\]', text)
+        if remaining_links:
+            logger.warning("Remaining unprocessed link patterns: %s", remaining_links)
     
     # — 5) Format list items for better readability
     # Convert markdown-style lists to HTML lists
     text = format_bullet_points(text)
     
-    logging.info(f"Formatted output: {text[:100]}...")
+    logger.debug("Formatted output: %.100s...", text)
     
     return text
 
@@ -351,8 +528,10 @@ def format_bullet_points(text):
     
     return processed_text
 # Initialize Azure OpenAI
-def get_llm():
-    logger.info(f"Initializing Azure OpenAI with deployment: VARELab-GPT4o, API version: 2024-08-01-preview")
+def get_llm(deployment="VARELab-GPT4o"):
+    logger.info("Initializing Azure OpenAI with deployment: %s, API version: 2024-08-01-preview", deployment)
+    # Imported here: langchain is the slowest import in the app by far
+    from langchain.chat_models import AzureChatOpenAI
     api_key = os.environ.get('AZURE_OPENAI_VARE_KEY')
     endpoint = os.environ.get('AZURE_ENDPOINT')
     if not api_key or not endpoint:
@@ -360,26 +539,41 @@ def get_llm():
         raise ValueError("Missing Azure OpenAI API key or endpoint")
     try:
         return AzureChatOpenAI(
-            azure_deployment="VARELab-GPT4o",
+            azure_deployment=deployment,
             api_key=api_key,
             api_version="2024-08-01-preview",
             azure_endpoint=endpoint,
             temperature=0.5,
             max_tokens=None,
-            timeout=None,
+            timeout=float(os.environ.get("LLM_TIMEOUT", 60)),
             max_retries=2,
         )
     except Exception as e:
         logger.error(f"Error initializing Azure OpenAI: {str(e)}")
         raise
 
+_geolocator = None
+
+def get_geolocator():
+    """Shared Nominatim client; geopy is imported on first use."""
+    global _geolocator
+    if _geolocator is None:
+        from geopy.geocoders import Nominatim
+        parts = urllib.parse.urlsplit(NOMINATIM_URL)
+        _geolocator = Nominatim(user_agent="geo_locator", timeout=READ_TIMEOUT,
+                                domain=parts.netloc + parts.path, scheme=parts.scheme)
+    return _geolocator
+
 def get_lat_long(address):
-    logger.info(f"Getting coordinates for address: {address}")
-    geolocator = Nominatim(user_agent="geo_locator", timeout=5)
+    logger.info("Getting coordinates for address: %s", address)
+    geolocator = get_geolocator()
+    def geocode():
+        with upstream_span("nominatim", "geocode"):
+            return geolocator.geocode(address)
     try:
-        location = geolocator.geocode(address)
+        location = guarded_call("nominatim", geocode, cache_key=f"geocode:{address}", hedge=True)
         if location:
-            logger.info(f"Found coordinates: {location.latitude}, {location.longitude}")
+            logger.info("Found coordinates: %s, %s", location.latitude, location.longitude)
             return location.latitude, location.longitude
         else:
             logger.warning(f"Could not find coordinates for address: {address}")
@@ -394,12 +588,12 @@ def get_lat_long(address):
         }
         if address.startswith(tuple(zip_coords.keys())):
             zip_code = address.split(",")[0].strip()
-            logger.info(f"Using fallback coordinates for {zip_code}")
+            logger.info("Using fallback coordinates for %s", zip_code)
             return zip_coords.get(zip_code)
         return None
 
 def search_nearby_places(location, query_type="Restaurants"):
-    logger.info(f"Searching for {query_type} near {location}")
+    logger.info("Searching for %s near %s", query_type, location)
     if isinstance(location, str) and location.isdigit() and len(location) == 5:
         zip_code = location
         location = f"{location}, USA"
@@ -422,9 +616,13 @@ def search_nearby_places(location, query_type="Restaurants"):
         "hl": "en",
         "api_key": serpapi_key
     }
+    from serpapi import GoogleSearch
+    from geopy.distance import geodesic
     try:
         search = GoogleSearch(params)
-        results = search.get_dict()
+        search.BACKEND = SERPAPI_BASE_URL
+        search.timeout = HTTP_TIMEOUT
+        results = guarded_call("serpapi", lambda: scheduler.call("serpapi", search.get_dict, endpoint="google_local"))
         local_results = results.get("local_results", [])
         for place in local_results:
             if "gps_coordinates" in place:
@@ -464,13 +662,105 @@ def search_nearby_places(location, query_type="Restaurants"):
         logger.error(f"Error in search: {str(e)}")
         return {"error": str(e), "results": []}
 
-def search_nearby_houses(zipcode, query_type="house"):
-    logger.info(f"Searching for {query_type} near {zipcode}")
+# Parsed search results per ZIP, so paging and re-filtering skip Zillow
+listing_tables = ListingTableCache()
+# Bytes read from the Zillow response at a time by /api/properties/stream
+STREAM_CHUNK_SIZE = int(os.environ.get("PROPERTIES_STREAM_CHUNK", 16384))
+# /api/properties/stream keeps the results of a Zillow page of up to this many
+# listings, to cache it like /api/properties does; a larger one is only streamed
+STREAM_CACHE_MAX_LISTINGS = int(os.environ.get("PROPERTIES_STREAM_CACHE_MAX", 1000))
+
+def search_nearby_houses(zipcode, query_type="house", query=None, page=1, page_size=None, facets=False):
+    """
+    Listings for sale in a ZIP code.
+
+    Without page_size, returns every listing matching the ListingQuery (every
+    listing in Zillow's order without one), and their total. Otherwise
+    returns one page of them, with the paging fields of PropertiesResponse.
+    With facets, the page also carries the facets of every matching listing
+    (compute_facets()).
+    """
+    logger.info("Searching for %s near %s", query_type, zipcode)
     if not isinstance(zipcode, str) or not zipcode.isdigit() or len(zipcode) != 5:
         return {"error": "Please input 5 digits zipcode.", "results": []}
-    zillowapi_key = os.environ.get('ZILLOW_KEY')
-    if not zillowapi_key:
-        return {"error": "Missing Zillow API key", "results": []}
+    table = cached_listing_table(zipcode)
+    if table is None:
+        table = fetch_listing_table(zipcode)
+        if isinstance(table, dict):
+            return table
+    if page_size is None and not facets:
+        if query is None or query.is_empty():
+            return {"results": table.rows, "total": len(table.rows)}
+        with stage_span("filter_listings"):
+            rows, total = table.select_range(query, 0, len(table.rows))
+        return {"results": rows, "total": total}
+    page_size = page_size or DEFAULT_PAGE_SIZE
+    if facets:
+        with stage_span("facet_listings"):
+            rows, total, summary = table.facet_page(query or ListingQuery(), page, page_size)
+        return {"results": rows, "total": total, "page": page, "pageSize": page_size,
+                "hasMore": page * page_size < total, "facets": summary}
+    with stage_span("filter_listings"):
+        rows, total = table.select(query or ListingQuery(), page, page_size)
+    return {"results": rows, "total": total, "page": page, "pageSize": page_size,
+            "hasMore": page * page_size < total}
+
+# Every search result and property detail fetched is upserted into the property store
+property_ingestion = IngestionQueue(get_store())
+# A ZIP searched less than LOCAL_SEARCH_MAX_AGE seconds ago is answered from the
+# store, and refreshed in the background once its search is LOCAL_SEARCH_REFRESH_AFTER old
+LOCAL_SEARCH_MAX_AGE = float(os.environ.get("LOCAL_SEARCH_MAX_AGE", 6 * 3600))
+LOCAL_SEARCH_REFRESH_AFTER = float(os.environ.get("LOCAL_SEARCH_REFRESH_AFTER", 600))
+local_search_stats = {"local_searches": 0, "background_refreshes": 0}
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+def cached_listing_table(zipcode):
+    """
+    ListingTable of a ZIP without calling Zillow, or None.
+
+    Comes from the search cache, or is rebuilt from the property store when
+    the ZIP was searched within LOCAL_SEARCH_MAX_AGE. Listings whose details
+    have since shown them off the market are left out.
+    """
+    table = listing_tables.get(zipcode)
+    if table is not None:
+        return table
+    covered = property_ingestion.store.covered(zipcode)
+    if covered is None:
+        return None
+    searched_at, records = covered
+    age = time.time() - searched_at
+    if age > LOCAL_SEARCH_MAX_AGE:
+        return None
+    if age > LOCAL_SEARCH_REFRESH_AFTER:
+        refresh_listings_in_background(zipcode)
+    results = [search_result_from_record(record) for record in records
+               if record.get("status") in (None, "For Sale")]
+    table = ListingTable(results, [format_listing(result) for result in results])
+    listing_tables.put(zipcode, table)
+    with _refresh_lock:
+        local_search_stats["local_searches"] += 1
+    return table
+
+def refresh_listings_in_background(zipcode):
+    """Search Zillow for a ZIP on a background thread, at prefetch priority; one refresh per ZIP at a time."""
+    with _refresh_lock:
+        if zipcode in _refreshing:
+            return
+        _refreshing.add(zipcode)
+        local_search_stats["background_refreshes"] += 1
+    def refresh():
+        current_priority.set(Priority.PREFETCH)
+        try:
+            fetch_listing_table(zipcode)
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(zipcode)
+    threading.Thread(target=refresh, name=f"refresh-{zipcode}", daemon=True).start()
+
+def zillow_search_request(zipcode, zillowapi_key, page=1):
+    """Query parameters and headers of a zillow56 /search request for a ZIP code."""
     location = f"{zipcode}, USA"
     params = {
         "location": location,
@@ -480,77 +770,319 @@ def search_nearby_houses(zipcode, query_type="house"):
         "listing_type": "by_agent",
         "doz": "any"
     }
+    if page > 1:
+        params["page"] = page
     query_string = urllib.parse.urlencode(params)
     request_path = f"/search?{query_string}"
-    logger.info(f"Zillow API request path: {request_path}")
+    logger.info("Zillow API request path: %s", request_path)
     headers = {
         'x-rapidapi-key': zillowapi_key,
         'x-rapidapi-host': "zillow56.p.rapidapi.com"
     }
+    return params, headers
+
+def format_listing(property):
+    """The listing fields /api/properties returns for one Zillow search result."""
+    return {
+        "address": f"{property.get('streetAddress', 'N/A')}, {property.get('city', 'N/A')}, {property.get('state', 'N/A')} {property.get('zipcode', 'N/A')}",
+        "price": property.get("price", "N/A"),
+        "beds": property.get("bedrooms", "N/A"),
+        "baths": property.get("bathrooms", "N/A"),
+        "sqft": property.get("livingArea", "N/A"),
+        "type": property.get("homeType", "N/A"),
+        "imgSrc": property.get("imgSrc", ""),
+        "zpid": property.get("zpid", "")
+    }
+
+def cache_listing_table(zipcode, search_results, upstream_pages=1):
+    """Cache the results of a ZIP's first Zillow search page as its ListingTable."""
+    table = ListingTable(search_results, [format_listing(property) for property in search_results], upstream_pages)
+    listing_tables.put(zipcode, table)
+    return table
+
+def fetch_listing_table(zipcode):
+    """Search Zillow for a ZIP code and cache the parsed ListingTable. An error dict on failure."""
+    zillowapi_key = os.environ.get('ZILLOW_KEY')
+    if not zillowapi_key:
+        return {"error": "Missing Zillow API key", "results": []}
+    params, headers = zillow_search_request(zipcode, zillowapi_key)
+    def send_search():
+        return get_session().get(f"{ZILLOW_BASE_URL}/search", params=params, headers=headers, timeout=HTTP_TIMEOUT)
+    def fetch_search():
+        response = raise_for_upstream_status("zillow", scheduler.call("zillow", send_search, endpoint="search"))
+        logger.info("Zillow API response status: %s", response.status_code)
+        data = response.text
+        log_payload(logger, "Zillow API response snippet", data, limit=200)
+        return json.loads(data)
     try:
-        conn = http.client.HTTPSConnection("zillow56.p.rapidapi.com")
-        conn.request("GET", request_path, headers=headers)
-        response = conn.getresponse()
-        logger.info(f"Zillow API response status: {response.status}")
-        data = response.read().decode('utf-8')
-        logger.info(f"Zillow API response snippet: {data[:200]}...")
-        formatted_results = json.loads(data)
+        formatted_results = guarded_call("zillow", fetch_search, cache_key=f"search:{zipcode}", hedge=True)
         results_count = len(formatted_results.get("results", []))
-        logger.info(f"Zillow API returned {results_count} results")
+        logger.info("Zillow API returned %s results", results_count)
         if results_count == 0:
             logger.warning("No properties found from Zillow API")
-        property_listings = []
-        for property in formatted_results.get("results", []):
-            listing = {
-                "address": f"{property.get('streetAddress', 'N/A')}, {property.get('city', 'N/A')}, {property.get('state', 'N/A')} {property.get('zipcode', 'N/A')}",
-                "price": property.get("price", "N/A"),
-                "beds": property.get("bedrooms", "N/A"),
-                "baths": property.get("bathrooms", "N/A"),
-                "sqft": property.get("livingArea", "N/A"),
-                "type": property.get("homeType", "N/A"),
-                "imgSrc": property.get("imgSrc", ""),
-                "zpid": property.get("zpid", "")
-            }
-            property_listings.append(listing)
-        return {"results": property_listings}
+        search_results = formatted_results.get("results", [])
+        table = cache_listing_table(zipcode, search_results, int(formatted_results.get("totalPages") or 1))
+        property_ingestion.enqueue_search(zipcode, search_results)
+        return table
     except Exception as e:
         logger.error(f"Error in Zillow search: {str(e)}")
         return {"error": str(e), "results": []}
 
 
+def stream_listings(zipcode, query, page_size, cursor=None):
+    """
+    One page of listings for /api/properties/stream, as NDJSON lines.
+
+    Listings are parsed from the Zillow response as it arrives and written
+    out one by one. A search whose results are already cached
+    (listing_tables), or that asks for a sort order, is served from the
+    ListingTable instead, since sorting needs every listing.
+
+    A request calls Zillow at most once. The rest of a Zillow page is read
+    after the page is full, and ingested into the property store like
+    /api/properties results. The first page is also cached as the ZIP's
+    ListingTable and marks the ZIP covered, so its later pages, and
+    /api/properties, are served locally. A Zillow page of more than STREAM_CACHE_MAX_LISTINGS listings is not
+    kept; reading stops once the page is full. The page line says whether
+    its cursor's page needs another Zillow call ("upstream").
+
+    Args:
+        zipcode: Validated 5-digit ZIP code
+        query: ListingQuery of the request
+        page_size: Listings per page
+        cursor: Decoded cursor state of the previous page, or None for the first
+    """
+    digest = query_digest(zipcode, query.describe())
+    state = cursor or {}
+    count = 0
+    next_state = None
+    try:
+        table = cached_listing_table(zipcode)
+        if state.get("m") == "t" or (not state and (table is not None or query.sort_by is not None)):
+            if table is None:
+                table = fetch_listing_table(zipcode)
+                if isinstance(table, dict):
+                    yield ndjson_line("error", {"error": table["error"]})
+                    return
+            start = state.get("o", 0)
+            with stage_span("filter_listings"):
+                rows, total = table.select_range(query, start, start + page_size)
+            for row in rows:
+                yield ndjson_line("listing", {"listing": row})
+            count = len(rows)
+            if start + count < total:
+                next_state = {"m": "t", "o": start + count}
+            elif table.upstream_pages > 1:
+                next_state = {"m": "s", "p": 2, "o": 0}
+        else:
+            zillowapi_key = os.environ.get('ZILLOW_KEY')
+            if not zillowapi_key:
+                yield ndjson_line("error", {"error": "Missing Zillow API key"})
+                return
+            page, offset = state.get("p", 1), state.get("o", 0)
+            params, headers = zillow_search_request(zipcode, zillowapi_key, page)
+            def send_search():
+                return get_session().get(f"{ZILLOW_BASE_URL}/search", params=params, headers=headers,
+                                         timeout=HTTP_TIMEOUT, stream=True)
+            def open_search():
+                return raise_for_upstream_status("zillow", scheduler.call("zillow", send_search, endpoint="search"))
+            response = guarded_call("zillow", open_search)
+            fields = {}
+            results = []
+            matched = 0
+            try:
+                for kind, value in iter_json_object(response.iter_content(STREAM_CHUNK_SIZE), "results"):
+                    if kind == "field":
+                        fields[value[0]] = value[1]
+                        continue
+                    if results is not None:
+                        results.append(value)
+                        if len(results) > STREAM_CACHE_MAX_LISTINGS:
+                            results = None
+                    if not query.matches(value):
+                        continue
+                    matched += 1
+                    if count == page_size:
+                        if results is None:
+                            break
+                        continue
+                    if matched <= offset:
+                        continue
+                    yield ndjson_line("listing", {"listing": format_listing(value)})
+                    count += 1
+            finally:
+                response.close()
+            upstream_pages = int(fields.get("totalPages") or 1)
+            if results is None:
+                # Stopped reading once the page was full, so more may match further on
+                if count == page_size:
+                    next_state = {"m": "s", "p": page, "o": offset + count}
+                elif page < upstream_pages:
+                    next_state = {"m": "s", "p": page + 1, "o": 0}
+            else:
+                if page == 1:
+                    cache_listing_table(zipcode, results, upstream_pages)
+                property_ingestion.enqueue_search(zipcode, results, covers=page == 1)
+                if matched > offset + count:
+                    # The rest of the first page is served from the cached table
+                    next_state = {"m": "t", "o": offset + count} if page == 1 else \
+                        {"m": "s", "p": page, "o": offset + count}
+                elif page < upstream_pages and results:
+                    next_state = {"m": "s", "p": page + 1, "o": 0}
+    except Exception as e:
+        logger.error(f"Error in Zillow search stream: {str(e)}")
+        yield ndjson_line("error", {"error": str(e)})
+        return
+    cursor_text = encode_cursor({**next_state, "q": digest}) if next_state is not None else None
+    yield ndjson_line("page", {"count": count, "cursor": cursor_text,
+                               "upstream": next_state is not None and next_state["m"] == "s"})
+
+
 # Session management
 chat_histories = {}
 
-# Initialize LLM
-try:
-    LLM = get_llm()
-    logger.info("Successfully initialized Azure OpenAI LLM")
-except Exception as e:
-    logger.error(f"Failed to initialize LLM: {str(e)}")
-    LLM = None
+# Last UI context per chat session, and the chat propertyContext of every
+# property served on /api/property, so chat turns can send diffs and zpids
+ui_contexts = UIContextStore(int(os.environ.get("UI_CONTEXT_SESSIONS", 10000)),
+                             int(os.environ.get("UI_CONTEXT_RENDER_CACHE", 2048)))
+property_contexts = PropertyContextCache(int(os.environ.get("PROPERTY_CONTEXT_CACHE", 2000)))
+
+# Azure deployment per gateway tier; cheap tasks go to the small one if it is set
+LLM_DEPLOYMENTS = {DEFAULT_TIER: os.environ.get("LLM_DEPLOYMENT", "VARELab-GPT4o")}
+if os.environ.get("LLM_SMALL_DEPLOYMENT"):
+    LLM_DEPLOYMENTS[SMALL_TIER] = os.environ["LLM_SMALL_DEPLOYMENT"]
+
+# The LLM clients are built on first use (or by warm_up()), not at import time
+_llms = {}
+_llm_lock = threading.Lock()
+_llm_init_attempted = set()
+
+def get_shared_llm(tier=DEFAULT_TIER):
+    """Return the shared LLM client of a tier, building it on first call. None if unavailable."""
+    if tier in _llms or tier in _llm_init_attempted:
+        return _llms.get(tier)
+    with _llm_lock:
+        if tier not in _llm_init_attempted:
+            try:
+                _llms[tier] = get_llm(LLM_DEPLOYMENTS[tier])
+                logger.info("Successfully initialized Azure OpenAI LLM for the %s tier", tier)
+            except Exception as e:
+                logger.error(f"Failed to initialize LLM: {str(e)}")
+            _llm_init_attempted.add(tier)
+    return _llms.get(tier)
+
+async def close_shared_llm():
+    """Close the HTTP clients held by the shared LLMs; the next call builds new ones."""
+    with _llm_lock:
+        llms = list(_llms.values())
+        _llms.clear()
+        _llm_init_attempted.clear()
+    for llm in llms:
+        try:
+            # client/async_client are the chat.completions resources of the openai clients
+            if getattr(llm, "client", None) is not None:
+                llm.client._client.close()
+            if getattr(llm, "async_client", None) is not None:
+                await llm.async_client._client.close()
+        except Exception as e:
+            logger.warning(f"Failed to close LLM client: {str(e)}")
+
+# Every LLM call goes through the gateway: bounded concurrency per tier, fair
+# per-session queueing and deadline-aware admission (see llm_gateway.py)
+llm_gateway = gateway_from_env(get_shared_llm)
+
+# Listings from the property store shown next to Zillow's nearbyHomes
+SIMILAR_HOMES_COUNT = int(os.environ.get("SIMILAR_HOMES_COUNT", 6))
+
+def similar_listings(property_data, k=SIMILAR_HOMES_COUNT):
+    """
+    The stored listings most like a propertyV2 response, as /api/properties
+    rows with a "distance" (see similar_homes.py). Empty when the store has
+    nothing comparable.
+    """
+    record = record_from_details(property_data)
+    if record is None or k <= 0:
+        return []
+    store = property_ingestion.store
+    try:
+        with stage_span("similar_homes"):
+            matches = store.similar_homes().similar(record, k)
+    except Exception as e:
+        logger.warning("Failed to find similar homes: %s", e)
+        return []
+    listings = []
+    for key, distance in matches:
+        match = store.get(key)
+        if match is not None:
+            listings.append({**format_listing(search_result_from_record(match)), "distance": round(distance, 4)})
+    return listings
+
+market_analyses = MarketAnalysisCache()
+
+def property_market_analysis(zpid, property_data):
+    """
+    Comps valuation of a propertyV2 response (see comps.py), cached per zpid.
+
+    Comps are Zillow's nearbyHomes, filled in from the property store, and
+    the store's most similar listings. None when the response has no usable
+    subject or the analysis fails.
+    """
+    cached = market_analyses.get(zpid)
+    if cached is not None:
+        return cached
+    subject = record_from_details(property_data)
+    if subject is None:
+        return None
+    store = property_ingestion.store
+    with stage_span("market_analysis"):
+        comps = [comp_from_nearby(home, store.get(home.get("zpid")) if home.get("zpid") is not None else None)
+                 for home in property_data.get("nearbyHomes") or [] if isinstance(home, dict)]
+        try:
+            for key, distance in store.similar_homes().similar(subject, MAX_COMPS):
+                record = store.get(key)
+                if record is not None:
+                    comps.append(comp_from_record(record, distance))
+        except Exception as e:
+            logger.warning("Failed to find comps in the property store: %s", e)
+        try:
+            analysis = analyze_property(subject, comps, property_data.get("priceHistory") or [])
+        except Exception as e:
+            logger.warning("Failed to analyze the market of property %s: %s", zpid, e)
+            return None
+    market_analyses.put(zpid, analysis)
+    return analysis
 
-def get_property_details(zpid):
-    logger.info(f"Getting property details for zpid: {zpid}")
+def fetch_property_data(zpid):
+    """Zillow propertyV2 response for a zpid, or an error dict."""
     zillowapi_key = os.environ.get('ZILLOW_KEY')
     if not zillowapi_key:
         return {"error": "Missing Zillow API key", "results": None}
-    url = "https://zillow56.p.rapidapi.com/propertyV2"
+    url = f"{ZILLOW_BASE_URL}/propertyV2"
     querystring = {"zpid": zpid}
     headers = {
         'x-rapidapi-key': zillowapi_key,
         'x-rapidapi-host': "zillow56.p.rapidapi.com"
     }
+    def send_details():
+        return get_session().get(url, params=querystring, headers=headers, timeout=HTTP_TIMEOUT)
+    def fetch_details():
+        response = raise_for_upstream_status("zillow", scheduler.call("zillow", send_details, endpoint="propertyV2"))
+        logger.info("Zillow property details API response status: %s", response.status_code)
+        return response.json()
+    logger.info("Calling Zillow API for property details with zpid: %s", zpid)
+    property_data = guarded_call("zillow", fetch_details, cache_key=f"details:{zpid}", hedge=True)
+    if not property_data or "error" in property_data:
+        logger.error(f"Error in Zillow property details API: {(property_data or {}).get('error', 'Unknown error')}")
+        return {"error": "Failed to retrieve property details", "results": None}
+    return property_data
+
+def get_property_details(zpid):
+    logger.info("Getting property details for zpid: %s", zpid)
     try:
-        logger.info(f"Calling Zillow API for property details with zpid: {zpid}")
-        conn = http.client.HTTPSConnection("zillow56.p.rapidapi.com")
-        conn.request("GET", f"/propertyV2?zpid={zpid}", headers=headers)
-        response = conn.getresponse()
-        logger.info(f"Zillow property details API response status: {response.status}")
-        data = response.read().decode('utf-8')
-        property_data = json.loads(data)
-        if not property_data or "error" in property_data:
-            logger.error(f"Error in Zillow property details API: {property_data.get('error', 'Unknown error')}")
-            return {"error": "Failed to retrieve property details", "results": None}
+        property_data = fetch_property_data(zpid)
+        if "results" in property_data and property_data.get("error"):
+            return property_data
+        property_ingestion.enqueue_details(property_data)
         property_details = {
             "basic_info": {
                 "zpid": property_data.get("zpid"),
@@ -580,38 +1112,59 @@ def get_property_details(zpid):
             "taxes": property_data.get("taxHistory", []),
             "schools": property_data.get("schools", []),
             "nearbyHomes": property_data.get("nearbyHomes", []),
-            "priceHistory": property_data.get("priceHistory", [])
+            "similarHomes": similar_listings(property_data),
+            "priceHistory": property_data.get("priceHistory", []),
+            "marketAnalysis": property_market_analysis(zpid, property_data),
         }
 
         # Fetch property photos
-        url = "https://zillow56.p.rapidapi.com/photos"
+        url = f"{ZILLOW_BASE_URL}/photos"
         querystring = {"zpid": zpid}
         headers = {
             "x-rapidapi-key": os.environ.get('ZILLOW_KEY'),
             "x-rapidapi-host": "zillow56.p.rapidapi.com"
         }
-        response = requests.get(url, headers=headers, params=querystring)
-
-        # Extract the first image URL (jpeg, jpg, or png) from each photo's mixedSources
-        photos = response.json().get('photos', [])
-        image_urls = []
-        for photo in photos:
-            if 'mixedSources' in photo:
-                for key in ['jpeg', 'jpg', 'png']:
-                    if key in photo['mixedSources']:
-                        image_urls.append(photo['mixedSources'][key][0]['url'])
-                        break
-
-        # Add the list of images to the property details
-        property_details["images"] = image_urls
+        try:
+            photos_json = guarded_call(
+                "zillow",
+                lambda: raise_for_upstream_status("zillow", scheduler.call(
+                    "zillow", lambda: get_session().get(url, headers=headers, params=querystring, timeout=HTTP_TIMEOUT),
+                    endpoint="photos",
+                )).json(),
+                cache_key=f"photos:{zpid}",
+                hedge=True,
+            )
+
+            # Extract the first image URL (jpeg, jpg, or png) from each photo's mixedSources
+            photos = photos_json.get('photos', [])
+            image_urls = []
+            for photo in photos:
+                if 'mixedSources' in photo:
+                    for key in ['jpeg', 'jpg', 'png']:
+                        if key in photo['mixedSources']:
+                            image_urls.append(photo['mixedSources'][key][0]['url'])
+                            break
+
+            # Add the list of images to the property details
+            property_details["images"] = image_urls
+        except Exception as e:
+            # Keep the images from the property payload rather than failing the whole lookup
+            logger.warning(f"Failed to fetch property photos: {str(e)}")
 
         # Rent estimate
         try:
-            url = "https://zillow56.p.rapidapi.com/rent_estimate"
+            url = f"{ZILLOW_BASE_URL}/rent_estimate"
             querystring = {"address": property_details["basic_info"]["address"]["streetAddress"]}
 
-            response = requests.get(url, headers=headers, params=querystring)
-            rent_data = response.json().get("data", {}).get("floorplans", [{}])[0].get("zestimate", {})
+            rent_json = guarded_call(
+                "zillow",
+                lambda: raise_for_upstream_status("zillow", scheduler.call(
+                    "zillow", lambda: get_session().get(url, headers=headers, params=querystring, timeout=HTTP_TIMEOUT),
+                    endpoint="rent_estimate",
+                )).json(),
+                cache_key=f"rent:{zpid}",
+            )
+            rent_data = rent_json.get("data", {}).get("floorplans", [{}])[0].get("zestimate", {})
             rent_estimate = rent_data.get("rentZestimate")
             rent_estimate_range_high = rent_data.get("rentZestimateRangeHigh")
             rent_estimate_range_low = rent_data.get("rentZestimateRangeLow")
@@ -631,10 +1184,17 @@ def get_property_details(zpid):
 
         # Walkability, transit, and bike scores
         try:
-            url = "https://zillow56.p.rapidapi.com/walk_transit_bike_score"
+            url = f"{ZILLOW_BASE_URL}/walk_transit_bike_score"
             querystring = {"zpid": zpid}
-            response = requests.get(url, headers=headers, params=querystring)
-            scores_data = response.json().get("data", {}).get("property", {})
+            scores_json = guarded_call(
+                "zillow",
+                lambda: raise_for_upstream_status("zillow", scheduler.call(
+                    "zillow", lambda: get_session().get(url, headers=headers, params=querystring, timeout=HTTP_TIMEOUT),
+                    endpoint="walk_transit_bike_score",
+                )).json(),
+                cache_key=f"scores:{zpid}",
+            )
+            scores_data = scores_json.get("data", {}).get("property", {})
             walkability = scores_data.get("walkScore")
             transit = scores_data.get("transitScore")
             bike = scores_data.get("bikeScore")
@@ -648,7 +1208,7 @@ def get_property_details(zpid):
             property_details["transit"] = None
             property_details["bike"] = None
 
-        logger.info(f"Successfully retrieved property details for zpid: {zpid}")
+        logger.info("Successfully retrieved property details for zpid: %s", zpid)
         return {"results": property_details}
     except Exception as e:
         logger.error(f"Error getting property details: {str(e)}")
@@ -658,29 +1218,55 @@ def get_property_details(zpid):
 async def property_details(data: PropertyRequest):
     try:
         zpid = data.zpid
-        logger.info(f"Received property details request for zpid: {zpid}")
+        logger.info("Received property details request for zpid: %s", zpid)
         if not zpid:
             return JSONResponse(status_code=400, content={"error": "Missing zpid parameter", "results": None})
-        results = get_property_details(zpid)
+        results = await run_in_threadpool(get_property_details, zpid)
         if "error" in results and results["error"] and not results["results"]:
             logger.error(f"Error retrieving property details: {results['error']}")
             return JSONResponse(status_code=500, content=results)
-        logger.info(f"Returning property details for zpid: {zpid}")
+        if results.get("results"):
+            property_contexts.put_details(zpid, results["results"])
+        logger.info("Returning property details for zpid: %s", zpid)
         return results
     except Exception as e:
         error_message = f"Unexpected error in property details endpoint: {str(e)}"
         logger.error(error_message)
         return JSONResponse(status_code=500, content={"error": error_message, "results": None})
 
+@app.post("/api/property_market_analysis", response_model=PropertyResponse,
+          responses={400: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
+async def property_market_analysis_endpoint(data: PropertyRequest):
+    """
+    The property market analysis section on its own: comps, price per sqft
+    distribution, valuation band and price history summary (see comps.py).
+    Cached per zpid; the same object is "marketAnalysis" in /api/property.
+    """
+    try:
+        zpid = data.zpid
+        if not zpid:
+            return JSONResponse(status_code=400, content={"error": "Missing zpid parameter", "results": None})
+        analysis = market_analyses.get(zpid)
+        if analysis is None:
+            property_data = await run_in_threadpool(fetch_property_data, zpid)
+            if "results" in property_data and property_data.get("error"):
+                return JSONResponse(status_code=500, content=property_data)
+            analysis = await run_in_threadpool(property_market_analysis, zpid, property_data)
+        return {"results": analysis or {}}
+    except Exception as e:
+        error_message = f"Unexpected error in property market analysis endpoint: {str(e)}"
+        logger.error(error_message)
+        return JSONResponse(status_code=500, content={"error": error_message, "results": None})
+
 @app.post("/api/location", response_model=PropertiesResponse, responses={400: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
 async def location(data: LocationRequest):
     try:
-        logger.info(f"Received location request: {data}")
+        logger.info("Received location request: zipCode=%s type=%s", data.zipCode, data.type)
         zip_code = data.zipCode
         query_type = data.type
         if not zip_code:
             return JSONResponse(status_code=400, content={"error": "Missing zip code"})
-        results = search_nearby_places(zip_code, query_type)
+        results = await run_in_threadpool(search_nearby_places, zip_code, query_type)
         return results
     except Exception as e:
         error_message = f"Unexpected error in location endpoint: {str(e)}"
@@ -690,17 +1276,68 @@ async def location(data: LocationRequest):
 @app.post("/api/properties", response_model=PropertiesResponse, responses={400: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
 async def properties(data: PropertiesRequest):
     try:
-        logger.info(f"Received property search request: {data}")
+        logger.info("Received property search request: zipCode=%s", data.zipCode)
         zip_code = data.zipCode
         if not zip_code or not zip_code.isdigit() or len(zip_code) != 5:
             return JSONResponse(status_code=400, content={"error": "Invalid zip code", "results": []})
-        results = search_nearby_houses(zip_code)
-        logger.info(f"Found {len(results.get('results', []))} properties")
+        query = ListingQuery.from_features(data.propertyFeatures, data.filters, data.sortBy)
+        # Callers that send neither page nor pageSize get every matching listing, as before paging
+        page_size = data.pageSize or (DEFAULT_PAGE_SIZE if "page" in data.model_fields_set else None)
+        results = await run_in_threadpool(search_nearby_houses, zip_code, "house", query, data.page, page_size)
+        logger.info("Found %s properties", results.get("total", len(results.get('results', []))))
         return results
     except Exception as e:
         error_message = f"Unexpected error in properties endpoint: {str(e)}"
         logger.error(error_message)
         return JSONResponse(status_code=500, content={"error": error_message, "results": []})
+
+@app.post("/api/properties/facets", response_model=PropertiesFacetsResponse,
+          responses={400: {"model": ErrorResponse}, 500: {"model": ErrorResponse}})
+async def properties_facets(data: PropertiesRequest):
+    """
+    One page of listings plus facet counts and stats over every matching listing.
+
+    facets has the listings per bedroom count, bathroom count, home type and
+    price bucket, and min/max/mean/percentiles of price, beds, baths, sqft
+    and days on Zillow; see listing_query.compute_facets().
+    """
+    try:
+        zip_code = data.zipCode
+        if not zip_code or not zip_code.isdigit() or len(zip_code) != 5:
+            return JSONResponse(status_code=400, content={"error": "Invalid zip code", "results": []})
+        query = ListingQuery.from_features(data.propertyFeatures, data.filters, data.sortBy)
+        return await run_in_threadpool(search_nearby_houses, zip_code, "house", query,
+                                       data.page, data.pageSize or DEFAULT_PAGE_SIZE, True)
+    except Exception as e:
+        error_message = f"Unexpected error in properties facets endpoint: {str(e)}"
+        logger.error(error_message)
+        return JSONResponse(status_code=500, content={"error": error_message, "results": []})
+
+@app.post("/api/properties/stream", responses={200: {"content": {"application/x-ndjson": {}}},
+                                               400: {"model": ErrorResponse}})
+async def properties_stream(data: PropertiesStreamRequest):
+    """
+    Listings as NDJSON, one {"type": "listing", "listing": {...}} line each, as they are parsed.
+
+    The last line is {"type": "page", "count": n, "cursor": "...", "upstream": bool};
+    send the cursor back with the same zipCode and filters for the next page.
+    It is null after the last page. upstream says whether that page costs a
+    Zillow call; the rest of the first Zillow page is served from the cache. Failures mid-stream end with a
+    {"type": "error", "error": "..."} line.
+    """
+    zip_code = data.zipCode
+    if not zip_code or not zip_code.isdigit() or len(zip_code) != 5:
+        return JSONResponse(status_code=400, content={"error": "Invalid zip code", "results": []})
+    query = ListingQuery.from_features(data.propertyFeatures, data.filters, data.sortBy)
+    cursor = None
+    if data.cursor:
+        try:
+            cursor = decode_cursor(data.cursor, query_digest(zip_code, query.describe()))
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": f"Invalid cursor: {e}", "results": []})
+    logger.info("Received streamed property search request: zipCode=%s", zip_code)
+    return StreamingResponse(stream_listings(zip_code, query, data.pageSize or DEFAULT_PAGE_SIZE, cursor),
+                             media_type="application/x-ndjson")
 ##########################################################################################################################################
 
 async def translate_with_deepl(text: str, source: str, target: str) -> str:
@@ -712,10 +1349,10 @@ async def translate_with_deepl(text: str, source: str, target: str) -> str:
         "source_lang": source.upper(),
         "target_lang": target.upper(),
     }
-    async with httpx.AsyncClient(timeout=15) as client:
-        r = await client.post(DEEPL_URL, data=payload)
-        r.raise_for_status()
-        resp = r.json()
+    with upstream_span("deepl", "translate"):
+        r = await get_async_client().post(DEEPL_URL, data=payload)
+    r.raise_for_status()
+    resp = r.json()
     return resp["translations"][0]["text"]
 
 async def translate_text(text: str, source: str, target: str) -> str:
@@ -726,9 +1363,9 @@ async def translate_text(text: str, source: str, target: str) -> str:
 # FEATURE EXTRACTION
 ########################################################################################
 
-def extract_query_features(query):
+async def extract_query_features(query, session_id=None):
     try:
-        logger.info(f"🔍 Feature extraction request for: '{query}'")
+        logger.info("🔍 Feature extraction request for: '%s'", query)
         
         # Prepare the feature extraction prompt
         extraction_prompt = f"""
@@ -773,13 +1410,13 @@ def extract_query_features(query):
         
         # Get response from LLM
         logger.info("🤖 Sending feature extraction request to LLM")
-        response = LLM.invoke(messages)
+        response = await llm_gateway.invoke(messages, "extract_features", session_id)
         
         # Extract JSON from response
         content = response.content.strip()
         
         # Log raw response for debugging
-        logger.info(f"📝 Raw LLM response: {content[:200]}...")
+        log_payload(logger, "📝 Raw LLM response", content, limit=200)
         
         # Try to find JSON in the response
         import re
@@ -790,9 +1427,7 @@ def extract_query_features(query):
             json_str = json_match.group(0)
             features = json.loads(json_str)
             
-            # Format features for easier reading in logs
-            formatted_features = json.dumps(features, indent=2)
-            logger.info(f"📊 Extracted features:\n{formatted_features}")
+            log_payload(logger, "📊 Extracted features", features)
             
             return features
         else:
@@ -806,14 +1441,15 @@ def extract_query_features(query):
                 "filters": {},
                 "sortBy": None
             }
-            logger.info(f"📊 Using default features:\n{json.dumps(default_features, indent=2)}")
+            logger.info("📊 Using default features")
             return default_features
             
     except Exception as e:
         logger.error(f"❌ Feature extraction error: {str(e)}")
-        # Fallback to basic classification
+        # Fallback to basic classification, unless the LLM is overloaded anyway
+        overloaded = isinstance(e, (LLMOverloaded, LLMUnavailable))
         fallback = {
-            "queryType": classify_query(query),
+            "queryType": "general" if overloaded else await classify_query(query, session_id),
             "zipCode": None,
             "propertyFeatures": {},
             "locationFeatures": {},
@@ -821,7 +1457,7 @@ def extract_query_features(query):
             "filters": {},
             "sortBy": None
         }
-        logger.info(f"📊 Using fallback features:\n{json.dumps(fallback, indent=2)}")
+        logger.info("📊 Using fallback features with queryType %s", fallback["queryType"])
         return fallback
     
 
@@ -834,9 +1470,9 @@ def extract_query_features(query):
 async def extract_features(data: ExtractFeaturesRequest):
     try:
         query = data.message
-        logger.info(f"🔎 Feature extraction API request: '{query}'")
-        features = extract_query_features(query)
-        logger.info(f"✅ Feature extraction complete. Returning: {json.dumps(features, indent=2)}")
+        logger.info("🔎 Feature extraction API request: '%s'", query)
+        features = await extract_query_features(query)
+        logger.info("✅ Feature extraction complete")
         return {"features": features, "success": True}
     except Exception as e:
         error_msg = f"Feature extraction error: {str(e)}"
@@ -846,42 +1482,6 @@ async def extract_features(data: ExtractFeaturesRequest):
 
 ##########################################################################################################################################
 
-class S3Service:
-    def __init__(self, s3_client, bucket):
-        self.s3_client = s3_client
-        self.bucket = bucket
-
-    def upload_json_to_r2(self, key, json_data, content_type='application/json'):
-        if isinstance(json_data, dict):
-            json_data = json.dumps(json_data)
-        json_bytes = json_data.encode('utf-8')
-        logging.info(f"Uploading to bucket: {self.bucket}, key: {key}")
-        self.s3_client.put_object(
-            Bucket=self.bucket,
-            Key=key,
-            Body=json_bytes,
-            ContentType=content_type
-        )
-
-def new_r2_service():
-    account = os.environ.get('CLOUDFLARE_ACCOUNT')
-    access_key = os.environ.get('CLOUDFLARE_KEY')
-    secret_key = os.environ.get('CLOUDFLARE_SECRET')
-    bucket = "dialogue-json"
-    logging.info(f"Initializing R2 service for account: {account[:4]}... and bucket: {bucket}")
-    r2_config = Config(
-        s3={"addressing_style": "virtual"},
-        retries={"max_attempts": 10, "mode": "standard"}
-    )
-    s3_client = boto3.client(
-        's3',
-        endpoint_url=f"https://{account}.r2.cloudflarestorage.com",
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret_key,
-        config=r2_config
-    )
-    return S3Service(s3_client, bucket)
-
 @app.post(
     "/api/save_chat",
     response_model=SaveChatResponse,
@@ -889,29 +1489,27 @@ def new_r2_service():
 )
 async def save_chat(data: SaveChatRequest):
     try:
-        logger.info(f"Save chat request received: {len(data.get('messages', []))} messages")
+        logger.info("Save chat request received: %s messages", len(data.messages))
         session_id = data.session_id
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        file_key = f"chat_{session_id}_{timestamp}.json"
-        chat_data = {
-            "session_id": session_id,
-            "timestamp": timestamp,
-            "messages": data.get('messages', []),
-            "zipCodes": data.get('zipCodes', [])
-        }
+        # Only messages not archived yet are buffered; they reach R2 in batched segments
+        file_key = session_key(session_id)
         try:
-            s3_service = new_r2_service()
-            s3_service.upload_json_to_r2(file_key, chat_data)
-            logger.info(f"Chat data uploaded to R2 successfully: {file_key}")
+            # Builds the boto3 client on first use; warm_up() normally has already
+            await run_in_threadpool(get_r2_service)
+            archived_messages = chat_archive.append(session_id, data.messages, data.zipCodes or [])
+            logger.info("Archived %s new messages for session %s", archived_messages, session_id)
             r2_upload_success = True
         except Exception as e:
             logger.error(f"R2 upload failed: {str(e)}")
+            archived_messages = 0
             r2_upload_success = False
         return {
             "success": True,
             "r2_upload": r2_upload_success,
             "file_key": file_key,
-            "timestamp": timestamp
+            "timestamp": timestamp,
+            "archived_messages": archived_messages
         }
     except Exception as e:
         logger.error(f"Failed to save chat: {str(e)}")
@@ -923,7 +1521,55 @@ async def save_chat(data: SaveChatRequest):
 
 #######################################################################################################################################
 
-# Add to backend/app.py
+# Every /market_data response is added to the local market history
+market_history_stop = threading.Event()
+
+def fetch_market_data(location):
+    """Zillow /market_data response for a location; raises UpstreamError."""
+    url = f"{ZILLOW_BASE_URL}/market_data"
+    querystring = {"location": location}
+    headers = {
+        "x-rapidapi-key": os.environ.get("ZILLOW_KEY"),
+        "x-rapidapi-host": "zillow56.p.rapidapi.com"
+    }
+    def fetch():
+        response = scheduler.call(
+            "zillow", lambda: get_session().get(url, headers=headers, params=querystring, timeout=HTTP_TIMEOUT),
+            endpoint="market_data",
+        )
+        if not response.ok:
+            logger.error(f"Zillow API error: {response.status_code} - {response.text}")
+            raise UpstreamError("zillow", response.status_code, f"Zillow API error: {response.status_code}")
+        json_data = response.json()
+        market_page = (json_data.get("data") or {}).get("marketPage")
+        if market_page:
+            with stage_span("record_market_history"):
+                market_history.get_history().record(market_page, location)
+        return json_data
+    return guarded_call("zillow", fetch, f"market:{location}", True)
+
+def refresh_market_history():
+    """
+    Re-fetch the market data of stored locations, at prefetch priority.
+
+    Every MARKET_HISTORY_REFRESH_INTERVAL seconds, each location last fetched
+    longer ago than that is fetched again, so new months arrive without a
+    user asking for them. Only in the worker that claims the refresh; the
+    others read its fetches from the shared log.
+    """
+    current_priority.set(Priority.PREFETCH)
+    interval = market_history.REFRESH_INTERVAL
+    while not market_history_stop.wait(interval):
+        history = market_history.get_history()
+        if not os.environ.get("ZILLOW_KEY") or not history.claim_refresh():
+            continue
+        for location in history.stale(interval):
+            if market_history_stop.is_set():
+                return
+            try:
+                fetch_market_data(location)
+            except Exception as e:
+                logger.warning(f"Market history refresh of {location} failed: {str(e)}")
 
 @app.post(
     "/api/market_trends",
@@ -935,7 +1581,7 @@ async def save_chat(data: SaveChatRequest):
 )
 async def market_trends(data: MarketTrendsRequest):
     try:
-        logger.info(f"Received market trends request: {data}")
+        logger.info("Received market trends request: location=%s zipCode=%s", data.location, data.zipCode)
         location = data.location
         zip_code = data.zipCode
 
@@ -944,28 +1590,16 @@ async def market_trends(data: MarketTrendsRequest):
         if zip_code and not location:
             location = f"{zip_code}"
 
-        url = "https://zillow56.p.rapidapi.com/market_data"
-        querystring = {"location": location}
-
         api_key = os.environ.get("ZILLOW_KEY")
-        print(api_key)
         if not api_key:
             logger.error("Zillow API key not found in environment variables")
             return JSONResponse(status_code=500, content={"error": "API key not found. Please set ZILLOW_RAPIDAPI_KEY in your .env file."})
 
-        headers = {
-            "x-rapidapi-key": api_key,
-            "x-rapidapi-host": "zillow56.p.rapidapi.com"
-        }
-
-        logger.info(f"Calling Zillow market data API for {location}")
-        response = requests.get(url, headers=headers, params=querystring)
-
-        if not response.ok:
-            logger.error(f"Zillow API error: {response.status_code} - {response.text}")
-            return JSONResponse(status_code=500, content={"error": f"Zillow API error: {response.status_code}"})
-
-        json_data = response.json()
+        logger.info("Calling Zillow market data API for %s", location)
+        try:
+            json_data = await run_in_threadpool(fetch_market_data, location)
+        except UpstreamError as e:
+            return JSONResponse(status_code=500, content={"error": str(e)})
         results = {
             "location_info": {},
             "market_status": {},
@@ -1130,7 +1764,14 @@ async def market_trends(data: MarketTrendsRequest):
                     
                     results["historical_trends"]["quarterly_averages"] = quarterly_averages
 
-        logger.info(f"Successfully calculated market trends for {location}")
+            # Every month stored for this location, beyond the two years in this response
+            stored = market_history.get_history().trends(market_data.get("areaName") or location)
+            if stored:
+                results["historical_trends"]["stored"] = {
+                    key: stored[key] for key in ("first_month", "latest_month", "quarterly", "yearly")
+                }
+
+        logger.info("Successfully calculated market trends for %s", location)
         return {"location": location, "trends": results}
 
     except Exception as e:
@@ -1138,17 +1779,89 @@ async def market_trends(data: MarketTrendsRequest):
         logger.error(error_message)
         return JSONResponse(status_code=500, content={"error": error_message})
 
+@app.post(
+    "/api/market_compare",
+    response_model=MarketCompareResponse,
+    responses={
+        400: {"description": "Missing or too many locations"},
+        404: {"description": "No market data for any of the locations"},
+        500: {"description": "Internal server error"}
+    }
+)
+async def compare_markets_endpoint(data: MarketCompareRequest):
+    """
+    Compare the rent markets of several locations; the first one is the base.
+
+    Locations without recent market data are fetched concurrently, then all
+    of them are compared from the market history in one pass.
+    """
+    try:
+        locations = list({market_history.location_key(location): location.strip()
+                          for location in data.locations if location and location.strip()}.values())
+        if not locations:
+            return JSONResponse(status_code=400, content={"error": "Missing locations"})
+        if len(locations) > market_compare.MAX_LOCATIONS:
+            return JSONResponse(status_code=400, content={
+                "error": f"At most {market_compare.MAX_LOCATIONS} locations can be compared"})
+        months = min(max(data.months or market_compare.DEFAULT_MONTHS, 2), market_compare.MAX_MONTHS)
+        history = market_history.get_history()
+
+        due = [location for location in locations if not history.fresh(location, market_compare.MAX_AGE)]
+        if due and os.environ.get("ZILLOW_KEY"):
+            logger.info("Fetching market data for %d of %d locations", len(due), len(locations))
+            fetched = await asyncio.gather(*(run_in_threadpool(fetch_market_data, location) for location in due),
+                                           return_exceptions=True)
+            for location, result in zip(due, fetched):
+                if isinstance(result, Exception):
+                    # Older stored data, if any, is still compared
+                    logger.warning(f"Market data for {location} failed: {str(result)}")
+
+        with stage_span("compare_markets"):
+            names, labels, rents, latest = history.matrix(locations, months)
+            if not any(names):
+                return JSONResponse(status_code=404, content={"error": "No market data for these locations"})
+            return market_compare.compare_markets(locations, names, labels, rents, latest)
+
+    except Exception as e:
+        error_message = f"Unexpected error in market compare endpoint: {str(e)}"
+        logger.error(error_message)
+        return JSONResponse(status_code=500, content={"error": error_message})
+
+@app.post(
+    "/api/market_history",
+    response_model=MarketHistoryResponse,
+    responses={
+        400: {"description": "Missing required parameters"},
+        404: {"description": "No stored market data for the location"},
+        500: {"description": "Internal server error"}
+    }
+)
+async def get_market_history(data: MarketHistoryRequest):
+    """Monthly, quarterly and yearly rent trends of a location from the local market history."""
+    try:
+        location = data.location or data.zipCode
+        if not location:
+            return JSONResponse(status_code=400, content={"error": "Missing location or zip code"})
+        with stage_span("market_history"):
+            history = market_history.get_history().trends(location, data.startMonth, data.endMonth)
+        if history is None:
+            return JSONResponse(status_code=404, content={"error": f"No market history for {location}"})
+        return {"location": history["location"], "history": history}
+
+    except Exception as e:
+        error_message = f"Unexpected error in market history endpoint: {str(e)}"
+        logger.error(error_message)
+        return JSONResponse(status_code=500, content={"error": error_message})
+
 
 
 #######################################################################################################################################
 
 # Correct the linkn s in chat
-def parse_ui_context(context_str):
-    """Parse the UI context string into a structured format with UI link information."""
+@timed_stage("render_ui_context")
+def render_ui_context(ui_context):
+    """Turn the UI context into prompt text with UI link information."""
     try:
-        context = json.loads(context_str) if context_str else {}
-        ui_context = context.get('ui_context', {})
-        
         # Create a human-readable context string
         context_description = []
         available_sections = []
@@ -1170,8 +1883,11 @@ def parse_ui_context(context_str):
                 context_description.append(f"This is a {property_context.get('beds', '')}bd {property_context.get('baths', '')}ba {property_context.get('type', 'property')} at {property_context.get('address', '')}, priced at ${property_context.get('price', 0):,}.")
                 context_description.append(f"It was built in {property_context.get('yearBuilt', 'N/A')} and has {property_context.get('sqft', 0)} square feet.")
                 
+                # Precomputed comps and price history numbers, rather than raw events
+                if property_context.get('marketAnalysis'):
+                    context_description.extend(describe_analysis(property_context['marketAnalysis']))
                 # Add price history if available
-                if property_context.get('priceHistory'):
+                elif property_context.get('priceHistory'):
                     price_history = property_context.get('priceHistory', [])
                     if price_history:
                         context_description.append(f"Price history includes {len(price_history)} events:")
@@ -1255,10 +1971,50 @@ IMPORTANT REMINDER:
         logger.error(f"Error parsing UI context: {e}")
         return "UI context not available. Include general links to [[properties]], [[market trends]], [[restaurants]], and [[transit]] in your response."
 
+async def resolve_ui_context(session_id, feature_context):
+    """
+    Apply this turn's feature_context to the session's stored UI context.
+
+    Returns the rendered context text and the session's SessionUIContext.
+    A "propertyRef" zpid is filled in from the cached property details.
+    """
+    try:
+        payload = json.loads(feature_context) if feature_context else {}
+    except ValueError as e:
+        logger.warning("Ignoring unparsable feature_context: %s", e)
+        payload = {}
+    if not isinstance(payload, dict):
+        payload = {}
+    entry = ui_contexts.update(session_id, payload)
+    state, key = entry.state, entry.digest
+    zpid = state.get("propertyRef")
+    if zpid and not state.get("propertyContext"):
+        cached = property_contexts.get(zpid)
+        if cached is None:
+            logger.info("No cached property context for zpid %s, fetching details", zpid)
+            details = await run_in_threadpool(get_property_details, zpid)
+            if details.get("results"):
+                property_contexts.put_details(zpid, details["results"])
+                cached = property_contexts.get(zpid)
+        if cached is not None:
+            state = dict(state, propertyContext=cached[0])
+            key = f"{entry.digest}:{cached[1]}"
+    return ui_contexts.render(key, lambda: render_ui_context(state)), entry
+
 
 # Update the createLinkableContent function in ChatContext.tsx to include property market link
-# On the backend, add a function to classify queries with the LLM
-def classify_query(query):
+# Classify queries locally; the LLM is only asked when the local model is unsure
+async def classify_query(query, session_id=None):
+    if query_classifier.is_trained():
+        classifier = query_classifier.get_classifier()
+    else:
+        # Training takes a few hundred ms; keep it off the event loop
+        classifier = await run_in_threadpool(query_classifier.get_classifier)
+    prediction = classifier.predict(query)
+    if prediction.confidence >= query_classifier.THRESHOLD:
+        logger.debug("Classified query locally as %s (%.2f)", prediction.label, prediction.confidence)
+        return prediction.label
+    logger.info("Local classification unsure (%s, %.2f), asking the LLM", prediction.label, prediction.confidence)
     try:
         classification_prompt = f"""
         Classify the following real estate question into exactly one of these categories:
@@ -1271,7 +2027,7 @@ def classify_query(query):
         Classification (FAQ/Regional/Legal):
         """
         messages = [{"role": "user", "content": classification_prompt}]
-        response = LLM.invoke(messages)
+        response = await llm_gateway.invoke(messages, "classify_query", session_id)
         classification = response.content.strip().lower()
         if "faq" in classification:
             return "faq"
@@ -1283,13 +2039,15 @@ def classify_query(query):
             return "general"
     except Exception as e:
         logger.error(f"Classification error: {str(e)}")
-        return "general"
+        # Fall back to the local model's best guess
+        return prediction.label
 
 @app.post(
     "/api/chat",
     response_model=ChatResponse,
     responses={
-        500: {"model": ChatErrorResponse, "description": "Internal Server Error"}
+        500: {"model": ChatErrorResponse, "description": "Internal Server Error"},
+        503: {"model": ChatErrorResponse, "description": "LLM overloaded, retry after Retry-After seconds"}
     }
 )
 
@@ -1297,13 +2055,18 @@ async def chat(data: ChatRequest):
     session_id = data.session_id
     user_lang  = (data.language or "en").lower()
     original   = data.message
+    if current_priority.get() == Priority.INTERACTIVE:
+        current_priority.set(Priority.CHAT)
     try:
-        logger.info(f"Received chat request: {data}")
+        logger.info(
+            "Received chat request: session=%s language=%s message_chars=%d context_chars=%d",
+            session_id, user_lang, len(original), len(data.feature_context or ""),
+        )
         feature_context = data.feature_context or ""
         is_system_query = data.is_system_query
 
         if user_lang != "en":
-            logger.info(f"Translating user → en: {original[:50]}…")
+            logger.info("Translating user → en: %s…", original[:50])
             message_en = await translate_text(original, user_lang, "en")
         else:
             message_en = original
@@ -1312,7 +2075,11 @@ async def chat(data: ChatRequest):
         if not session_id or session_id not in chat_histories:
             session_id = str(uuid.uuid4())
             chat_histories[session_id] = []
-            logger.info(f"Created new session: {session_id}")
+            logger.info("Created new session: %s", session_id)
+
+        # The client sends its full UI state or only what changed since the last turn
+        ui_context, ui_state = await resolve_ui_context(session_id, feature_context)
+        log_payload(logger, "UI context", ui_context)
 
         # Handle system queries
         if is_system_query:
@@ -1322,20 +2089,16 @@ async def chat(data: ChatRequest):
         # Extract features and UI context
         extracted_features = {}
         query_type = "general"
-        ui_context = ""
         
-        if LLM:  # Only try to extract features if LLM is available
+        llm = get_shared_llm()
+        if llm:  # Only try to extract features if LLM is available
             try:
-                extracted_features = extract_query_features(message_en)
-                logger.info(f"Extracted features: {extracted_features}")
+                extracted_features = await extract_query_features(message_en, session_id)
+                log_payload(logger, "Extracted features", extracted_features)
                 query_type = extracted_features.get('queryType', 'general')
                 
-                # Parse UI context
-                ui_context = parse_ui_context(feature_context)
-                logger.info(f"Parsed UI context: {ui_context}")
-                
             except Exception as e:
-                logger.error(f"Feature extraction or UI context parsing failed: {str(e)}")
+                logger.error(f"Feature extraction failed: {str(e)}")
                 # [existing fallback code]
         else:
             logger.warning("Skipping feature extraction - LLM not available")
@@ -1343,32 +2106,24 @@ async def chat(data: ChatRequest):
         formatted_response = None 
 
         # Process chat message
-        if LLM:
+        if llm:
             try:
-                # Create prompt with UI context
-                system_content = ENHANCED_SYSTEM_PROMPT.format(
-                    ui_context=ui_context,
-                    question=message_en
+                # Instructions, history, UI context, question: most to least stable
+                messages, prompt_tokens = build_chat_messages(
+                    ENHANCED_SYSTEM_PROMPT, chat_histories[session_id], ui_context, message_en
                 )
-                
-                messages = [
-                    {"role": "system", "content": system_content},
-                ]
-                
-                chat_history = chat_histories[session_id]
-                for user_msg, bot_msg in chat_history:
-                    messages.append({"role": "user", "content": user_msg})
-                    messages.append({"role": "assistant", "content": bot_msg})
-                
-                messages.append({"role": "user", "content": message_en})
-                logger.info(f"Sending {len(messages)} messages to LLM with enhanced UI context")
-                response_obj = LLM.invoke(messages)
+                logger.info("Sending %s messages to LLM (%s prompt tokens, %s in the stable prefix)",
+                            len(messages), prompt_tokens["total"], prompt_tokens["stable_prefix"])
+                response_obj = await llm_gateway.invoke(messages, "chat", session_id)
+                prompt_tokens = record_prompt_tokens("chat", prompt_tokens, response_obj)
+                logger.info("Chat prompt tokens for session %s: %s", session_id, prompt_tokens,
+                            extra={"prompt_tokens": prompt_tokens})
                 
                 en_reply = response_obj.content
                 logger.info("Received English reply from LLM")
 
                 if user_lang != "en":
-                    logger.info(f"Translating en → {user_lang}: {en_reply[:50]}…")
+                    logger.info("Translating en → %s: %s…", user_lang, en_reply[:50])
                     translated_reply = await translate_text(en_reply, "en", user_lang)
                 else:
                     translated_reply = en_reply
@@ -1380,6 +2135,14 @@ async def chat(data: ChatRequest):
                 except Exception as e:
                     logger.error(f"Link-formatting failed: {e}")
                     formatted_response = translated_reply  # fall back to raw text
+            except LLMOverloaded as e:
+                # Backpressure: tell the client to come back rather than queueing past the SLA
+                logger.warning("Chat for session %s not admitted: %s", session_id, e)
+                return JSONResponse(status_code=503, headers={"Retry-After": str(math.ceil(e.retry_after))}, content={
+                    "error": str(e),
+                    "session_id": session_id,
+                    "response": "I'm getting a lot of questions right now. Please try again in a few seconds."
+                })
             except Exception as e:
                 formatted_response = f"I'm sorry, I encountered an error while processing your request: {str(e)}"
                 logger.error(f"Error calling LLM: {str(e)}")
@@ -1392,9 +2155,11 @@ async def chat(data: ChatRequest):
         result = {
             "session_id": session_id,
             "response": formatted_response,
-            "extracted_features": extracted_features
+            "extracted_features": extracted_features,
+            "ui_context_version": ui_state.version,
+            "ui_context_resync": ui_state.resync,
         }
-        logger.info(f"Returning response for session {session_id}")
+        logger.info("Returning response for session %s", session_id)
         return result
 
     except Exception as e:
@@ -1415,7 +2180,7 @@ async def nearby_zips(data: LocationRequest):
             return JSONResponse(status_code=400, content={"error": "Missing zip code"})
             
         # Get coordinates for the zip code
-        coords = get_lat_long(zip_code)
+        coords = await run_in_threadpool(get_lat_long, zip_code)
         if not coords:
             return JSONResponse(status_code=400, content={"error": "Could not find coordinates for zip code"})
             
@@ -1429,13 +2194,18 @@ async def nearby_zips(data: LocationRequest):
             offset_lat = lat + (0.02 * math.cos(i * math.pi / 2.5))
             offset_lng = lng + (0.02 * math.sin(i * math.pi / 2.5))
             
-            geolocator = Nominatim(user_agent="geo_locator")
-            result = geolocator.reverse((offset_lat, offset_lng))
-            if result:
-                for address in result:
-                    if 'postal_code' in address.raw:
-                        nearby_zips.append(address.raw['postal_code'])
-                        break
+            geolocator = get_geolocator()
+            point = (round(offset_lat, 4), round(offset_lng, 4))
+            def reverse_geocode():
+                with upstream_span("nominatim", "reverse"):
+                    return geolocator.reverse(point)
+            result = await run_in_threadpool(
+                guarded_call, "nominatim", reverse_geocode, f"reverse:{point}", True
+            )
+            # Nominatim puts the ZIP under address.postcode in the reverse-geocoding result
+            postcode = result.raw.get('address', {}).get('postcode') if result else None
+            if postcode:
+                nearby_zips.append(postcode)
         
         # Remove duplicates and the original zip
         nearby_zips = list(set([z for z in nearby_zips if z != zip_code]))[:5]
@@ -1447,7 +2217,134 @@ async def nearby_zips(data: LocationRequest):
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "ok", "llm_initialized": LLM is not None}
+    # The LLM clients are built per tier on first use (get_shared_llm), so this is False before warm-up
+    return {"status": "ok", "llm_initialized": bool(_llms), "llm_tiers": sorted(_llms)}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of latency histograms and upstream queue state."""
+    circuit_states = {"closed": 0, "half_open": 1, "open": 2}
+    queues = scheduler.metrics()
+    circuits = resilience.metrics()
+    uploads = upload_queue.metrics()
+    llm_tiers = llm_gateway.metrics()["tiers"]
+    lines = telemetry.render_histograms()
+    lines += telemetry.gauge_lines(
+        "rebot_upstream_queue_depth", "Calls waiting for an upstream token.",
+        [({"upstream": name, "priority": priority}, depth)
+         for name, queue in queues.items() for priority, depth in queue["queue_depth_by_priority"].items()]
+    )
+    lines += telemetry.gauge_lines(
+        "rebot_upstream_rate_limited_total", "429 responses received per upstream.",
+        [({"upstream": name}, queue["rate_limited"]) for name, queue in queues.items()], "counter"
+    )
+    lines += telemetry.gauge_lines(
+        "rebot_upstream_circuit_state", "Circuit state per upstream (0 closed, 1 half-open, 2 open).",
+        [({"upstream": name}, circuit_states[circuit["state"]]) for name, circuit in circuits.items()]
+    )
+    lines += telemetry.gauge_lines(
+        "rebot_upstream_stale_served_total", "Results served from the stale cache per upstream.",
+        [({"upstream": name}, circuit["stale_served"]) for name, circuit in circuits.items()], "counter"
+    )
+    lines += telemetry.gauge_lines(
+        "rebot_r2_uploads_pending", "Uploads waiting in the R2 background queue.", [({}, uploads["pending"])]
+    )
+    lines += telemetry.gauge_lines(
+        "rebot_r2_uploads_failed_total", "R2 uploads dropped after all retries.", [({}, uploads["failed"])], "counter"
+    )
+    lines += telemetry.gauge_lines(
+        "rebot_llm_in_flight", "LLM calls in progress per tier.",
+        [({"tier": tier}, stats["in_flight"]) for tier, stats in llm_tiers.items()]
+    )
+    lines += telemetry.gauge_lines(
+        "rebot_llm_queue_depth", "LLM calls waiting for a slot per tier.",
+        [({"tier": tier}, stats["queue_depth"]) for tier, stats in llm_tiers.items()]
+    )
+    lines += telemetry.gauge_lines(
+        "rebot_llm_rejected_total", "LLM calls not admitted per tier and reason.",
+        [({"tier": tier, "reason": reason}, stats[key]) for tier, stats in llm_tiers.items()
+         for reason, key in (("queue_full", "rejected_queue_full"), ("deadline", "rejected_deadline"),
+                             ("timeout", "timed_out"))], "counter"
+    )
+    return "\n".join(lines) + "\n"
+
+@app.get("/api/upstream_metrics")
+async def upstream_metrics():
+    """Queue depth, wait time, rate-limit counters and circuit state per upstream."""
+    return {
+        "scheduler": scheduler.metrics(),
+        "circuits": resilience.metrics(),
+        "r2_uploads": upload_queue.metrics(),
+        "chat_archive": chat_archive.metrics(),
+        "ui_context": ui_contexts.metrics(),
+        "llm": llm_gateway.metrics(),
+        "listings": listing_tables.metrics(),
+        "market_analysis": market_analyses.metrics(),
+        "market_history": market_history.get_history().metrics(),
+        "agent_directory": {**agent_directory.metrics(), **agent_search_stats},
+        "property_store": {**property_ingestion.store.metrics(), "ingestion": property_ingestion.metrics(),
+                           **local_search_stats},
+    }
+
+agent_directory = AgentDirectory()
+agent_search_stats = {"local_searches": 0, "zillow_searches": 0, "background_refreshes": 0}
+
+def fetch_agents(location, specialty, language):
+    """Search Zillow for agents and add them to the agent directory; raises UpstreamError."""
+    url = f"{ZILLOW_BASE_URL}/search_agents"
+    querystring = {
+        "location": location,
+        "specialty": specialty,
+        "language": language
+    }
+    headers = {
+        "x-rapidapi-key": os.environ.get("ZILLOW_KEY"),
+        "x-rapidapi-host": "zillow56.p.rapidapi.com"
+    }
+
+    # guarded_call() serves the last good response when Zillow fails; that must not count as a refresh
+    fetched = []
+
+    def fetch():
+        response = scheduler.call(
+            "zillow", lambda: get_session().get(url, headers=headers, params=querystring, timeout=HTTP_TIMEOUT),
+            endpoint="search_agents",
+        )
+        if not response.ok:
+            logger.error(f"Zillow API error: {response.status_code} - {response.text}")
+            raise UpstreamError("zillow", response.status_code)
+        agents = response.json()
+        fetched.append(agents)
+        return agents
+
+    agents = guarded_call("zillow", fetch, f"agents:{location}:{specialty}:{language}".lower(), True)
+    fresh = any(agents is copy for copy in fetched)
+    if not isinstance(agents, list):
+        agents = []
+    agent_directory.add(agents, location, specialty, language, fresh=fresh)
+    with _refresh_lock:
+        agent_search_stats["zillow_searches"] += 1
+    logger.info("Found %s agents for location: %s", len(agents), location)
+    return agents
+
+def refresh_agents_in_background(location, specialty, language):
+    """Search Zillow for agents on a background thread, at prefetch priority; one refresh per search at a time."""
+    key = ("agents", location.lower(), (specialty or "").lower(), (language or "").lower())
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+        agent_search_stats["background_refreshes"] += 1
+    def refresh():
+        current_priority.set(Priority.PREFETCH)
+        try:
+            fetch_agents(location, specialty, language)
+        except Exception as e:
+            logger.warning("Background agent refresh for %s failed: %s", location, e)
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(key)
+    threading.Thread(target=refresh, name=f"refresh-agents-{location}", daemon=True).start()
 
 @app.post(
     "/api/search_agents",
@@ -1455,27 +2352,39 @@ async def health_check():
     responses={400: {"model": ErrorResponse}, 500: {"model": ErrorResponse}}
 )
 async def search_agents(data: AgentSearchRequest):
-    try:
-        logger.info(f"Received agent search request: {data}")
-        url = "https://zillow56.p.rapidapi.com/search_agents"
-        querystring = {
-            "location": data.location,
-            "specialty": data.specialty,
-            "language": data.language
-        }
-        headers = {
-            "x-rapidapi-key": os.environ.get("ZILLOW_KEY"),
-            "x-rapidapi-host": "zillow56.p.rapidapi.com"
-        }
-
-        response = requests.get(url, headers=headers, params=querystring)
-        if not response.ok:
-            logger.error(f"Zillow API error: {response.status_code} - {response.text}")
-            return JSONResponse(status_code=500, content={"error": "Failed to fetch agents from Zillow API"})
+    """
+    Agents in a location, ranked and paged from the agent directory.
 
-        agents = response.json()
-        logger.info(f"Found {len(agents)} agents for location: {data.location}")
-        return {"agents": agents}
+    Zillow is asked only when this search is new or older than
+    AGENT_DIRECTORY_MAX_AGE; see agent_directory.py. Without pageSize every
+    matching agent is returned.
+    """
+    try:
+        logger.info("Received agent search request: location=%s specialty=%s language=%s",
+                    data.location, data.specialty, data.language)
+        sort = data.sortBy or "relevance"
+        if sort not in AGENT_SORT_KEYS:
+            return JSONResponse(status_code=400, content={
+                "error": f"sortBy must be one of: {', '.join(AGENT_SORT_KEYS)}"})
+        searched_at = agent_directory.searched_at(data.location, data.specialty, data.language)
+        age = None if searched_at is None else time.time() - searched_at
+        if age is None or age > AGENT_DIRECTORY_MAX_AGE:
+            try:
+                await run_in_threadpool(fetch_agents, data.location, data.specialty, data.language)
+            except UpstreamError:
+                return JSONResponse(status_code=500, content={"error": "Failed to fetch agents from Zillow API"})
+        else:
+            if age > AGENT_DIRECTORY_REFRESH_AFTER:
+                refresh_agents_in_background(data.location, data.specialty, data.language)
+            with _refresh_lock:
+                agent_search_stats["local_searches"] += 1
+        with stage_span("search_agents_local"):
+            agents, total = agent_directory.search(data.location, data.specialty, data.language, sort,
+                                                   data.page, data.pageSize, data.propertyPrice)
+        if data.pageSize is None:
+            return {"agents": agents, "total": total}
+        return {"agents": agents, "total": total, "page": data.page, "pageSize": data.pageSize,
+                "hasMore": data.page * data.pageSize < total}
     except Exception as e:
         error_message = f"Unexpected error in agent search endpoint: {str(e)}"
         logger.error(error_message)
@@ -0,0 +1,193 @@
+# agent_directory_bench.py
+"""
+Agent searches answered from the local agent directory (agent_directory.py)
+vs proxied to Zillow's /search_agents.
+
+Fills an AgentDirectory with synthetic /search_agents responses: --agents
+agents over --locations cities, each response one (city, specialty,
+language) search, as the endpoint adds them. Reports:
+
+- ms per response added, for the fill and for refreshing every search
+  with some agents' review and sales counts changed
+- in-process query p50/p99 for a city's agents: every agent, one page,
+  one page with a specialty and language, and one page ranked by price
+  fit; against sorting the search's agents on every query, as a client
+  had to with the raw list
+
+Over HTTP, with the Zillow stub answering after --latency seconds, a
+/api/search_agents request that reaches Zillow (a search nobody made yet)
+against one answered from the directory (the same search, another page).
+
+Usage:
+    python benchmarks/agent_directory_bench.py [--agents 10000] [--locations 200] [--queries 1000]
+        [--latency 0.3] [--output agent_directory.json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from endpoint_bench import percentile, start_server  # noqa: E402
+from upstream_stubs import UpstreamStubs  # noqa: E402
+
+SPECIALTIES = ("Any", "Residential", "Luxury", "Relocation", "First Time Buyers")
+LANGUAGES = ("English", "Spanish", "Chinese")
+PAGE_SIZE = 10
+
+
+def synthetic_agent(i, city, rng):
+    low = rng.choice((50000, 100000, 200000, 350000, 600000))
+    return {
+        "encodedZuid": f"X1-ZU{i:08d}",
+        "fullName": f"Agent {i}",
+        "username": f"agent{i}",
+        "location": city,
+        "isTopAgent": rng.random() < 0.2,
+        "isTeamLead": rng.random() < 0.1,
+        "numTotalReviews": rng.randrange(0, 600),
+        "reviewStarsRating": round(rng.uniform(3, 5), 1),
+        "saleCountLastYear": rng.randrange(0, 80),
+        "saleCountAllTime": rng.randrange(0, 900),
+        "salePriceRangeThreeYearMin": low,
+        "salePriceRangeThreeYearMax": low * rng.choice((2, 4, 10)),
+    }
+
+
+def searches(agents_by_city, rng):
+    """Synthetic /search_agents responses: (city, specialty, language, agents)."""
+    for city, agents in agents_by_city.items():
+        for specialty in SPECIALTIES:
+            for language in LANGUAGES:
+                share = 1.0 if (specialty, language) == ("Any", "English") else rng.uniform(0.1, 0.5)
+                yield city, specialty, language, [agent for agent in agents if rng.random() < share]
+
+
+def timings_ms(fn, count):
+    samples = []
+    for i in range(count):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {"p50_ms": round(percentile(samples, 0.5), 4), "p99_ms": round(percentile(samples, 0.99), 4)}
+
+
+def sort_response(agents, price=None):
+    """Rank and page a raw /search_agents list, as a client did on every query."""
+    ranked = sorted(agents, key=lambda a: (not a["isTopAgent"], -a["numTotalReviews"], -a["saleCountLastYear"]))
+    if price is not None:
+        ranked.sort(key=lambda a: not (a["salePriceRangeThreeYearMin"] <= price <= a["salePriceRangeThreeYearMax"]))
+    return ranked[:PAGE_SIZE]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=10000)
+    parser.add_argument("--locations", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    stubs = UpstreamStubs({"zillow": args.latency}).start()
+    os.environ.update(stubs.env())
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["WARMUP_ON_STARTUP"] = "false"
+    os.environ["PROPERTY_SEED_PATHS"] = ""
+    os.environ["MARKET_HISTORY_REFRESH_INTERVAL"] = "0"
+    os.environ.setdefault("ZILLOW_RATE_PER_SECOND", "100000")
+    os.environ.setdefault("ZILLOW_BURST", "100000")
+
+    from agent_directory import AgentDirectory
+
+    rng = random.Random(0)
+    cities = [f"Town {i}, ST" for i in range(args.locations)]
+    agents_by_city = {city: [] for city in cities}
+    for i in range(args.agents):
+        city = rng.choice(cities)
+        agents_by_city[city].append(synthetic_agent(i, city, rng))
+    responses = list(searches(agents_by_city, rng))
+
+    directory = AgentDirectory()
+    start = time.perf_counter()
+    for city, specialty, language, agents in responses:
+        directory.add(agents, city, specialty, language)
+    fill = time.perf_counter() - start
+
+    # A refresh returns new JSON, in which a tenth of the agents have another review and sale
+    bumped = {agent["encodedZuid"] for agents in agents_by_city.values()
+              for agent in rng.sample(agents, len(agents) // 10)}
+
+    def refreshed_agent(agent):
+        if agent["encodedZuid"] not in bumped:
+            return dict(agent)
+        return dict(agent, numTotalReviews=agent["numTotalReviews"] + 1, saleCountLastYear=agent["saleCountLastYear"] + 1)
+
+    refreshed = [(city, specialty, language, [refreshed_agent(agent) for agent in agents])
+                 for city, specialty, language, agents in responses]
+    agents_by_city = {city: [refreshed_agent(agent) for agent in agents] for city, agents in agents_by_city.items()}
+    changed = directory.stats["agents_changed"]
+    start = time.perf_counter()
+    for city, specialty, language, agents in refreshed:
+        directory.add(agents, city, specialty, language)
+    refresh = time.perf_counter() - start
+
+    pick = [rng.choice(cities) for _ in range(args.queries)]
+    prices = [rng.uniform(100000, 1500000) for _ in range(args.queries)]
+    page = [rng.randrange(1, 4) for _ in range(args.queries)]
+    result = {
+        "agents": len(directory),
+        "locations": args.locations,
+        "responses": len(responses),
+        "add_ms_per_response": round(fill * 1000 / len(responses), 4),
+        "refresh_ms_per_response": round(refresh * 1000 / len(responses), 4),
+        "refresh_agents_changed": directory.stats["agents_changed"] - changed,
+        "all_agents": timings_ms(lambda i: directory.search(pick[i]), args.queries),
+        "page": timings_ms(lambda i: directory.search(pick[i], page=page[i], page_size=PAGE_SIZE), args.queries),
+        "page_specialty_language": timings_ms(
+            lambda i: directory.search(pick[i], "Residential", "Spanish", "reviews", page[i], PAGE_SIZE), args.queries),
+        "page_price": timings_ms(
+            lambda i: directory.search(pick[i], page=page[i], page_size=PAGE_SIZE, price=prices[i]), args.queries),
+        "sort_per_query": timings_ms(lambda i: sort_response(agents_by_city[pick[i]]), args.queries),
+        "sort_per_query_price": timings_ms(lambda i: sort_response(agents_by_city[pick[i]], prices[i]), args.queries),
+        "metrics": directory.metrics(),
+    }
+    print(json.dumps(result, indent=2))
+
+    import requests
+
+    import app
+
+    server, thread, base_url = start_server(app.app)
+    session = requests.Session()
+    http_queries = min(args.queries, 50)
+    try:
+        def search(body):
+            response = session.post(base_url + "/api/search_agents", json=body)
+            response.raise_for_status()
+            return len(response.content)
+
+        # Every location a new search, so each request reaches Zillow
+        result["http_zillow"] = timings_ms(lambda i: search({"location": f"City {i}, ST"}), http_queries)
+        result["http_local"] = timings_ms(
+            lambda i: search({"location": f"City {i}, ST", "page": 1, "pageSize": 2, "sortBy": "sales",
+                              "propertyPrice": 400000}), http_queries)
+        result["http_upstream_calls"] = sum(stubs.servers["zillow"].calls.values())
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+        stubs.stop()
+    print(json.dumps({key: result[key] for key in ("http_zillow", "http_local", "http_upstream_calls")}, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# chat_archive_size.py
+"""
+Compare PUT count and bytes stored for the old full-transcript chat saves and
+the append-only chat archive, then check that compaction and read_session
+reconstruct every session exactly.
+
+Usage:
+    python benchmarks/chat_archive_size.py [--sessions 50] [--turns 20]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from s3_stub import S3Stub  # noqa: E402
+
+
+WORDS = ("home", "price", "bedroom", "school", "zip", "market", "rent", "trend", "condo", "transit",
+         "tax", "listing", "agent", "kitchen", "parking", "yard", "downtown", "median", "offer", "loan")
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+class DirectUploader:
+    """Uploads synchronously so the benchmark can count PUTs deterministically."""
+
+    def __init__(self, service):
+        self.service = service
+
+    def enqueue(self, key, payload, content_type="application/json", on_done=None):
+        self.service.upload_json_to_r2(key, payload, content_type)
+        if on_done is not None:
+            on_done(True)
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--flush-every", type=int, default=100, help="saves per archive window")
+    args = parser.parse_args()
+
+    stub = S3Stub().start()
+    os.environ["R2_ENDPOINT_URL"] = stub.url
+    os.environ.setdefault("CLOUDFLARE_KEY", "bench")
+    os.environ.setdefault("CLOUDFLARE_SECRET", "bench")
+    logging.disable(logging.INFO)
+
+    from chat_archive import ChatArchive, compact, read_session
+    from r2_storage import new_r2_service
+
+    service = new_r2_service()
+    rng = random.Random(7)
+    transcripts = {f"session_{i}": [] for i in range(args.sessions)}
+
+    # Interleave the sessions the way concurrent users would save them
+    saves = [session for session in transcripts for _ in range(args.turns)]
+    rng.shuffle(saves)
+
+    legacy_puts = legacy_bytes = 0
+    archive = ChatArchive(DirectUploader(service), window_seconds=3600)
+    before = dict(stub.stats)
+    for i, session_id in enumerate(saves):
+        messages = transcripts[session_id]
+        messages.append({"sender": "user", "text": sentence(rng, rng.randint(5, 30))})
+        messages.append({"sender": "bot", "text": sentence(rng, rng.randint(30, 150))})
+        legacy_body = json.dumps({"session_id": session_id, "messages": messages, "zipCodes": ["60616"]})
+        legacy_puts += 1
+        legacy_bytes += len(legacy_body.encode())
+        archive.append(session_id, list(messages), ["60616"])
+        if (i + 1) % args.flush_every == 0:
+            archive.flush()
+    archive.flush()
+    archive_puts = stub.stats["put"] - before["put"]
+    archive_bytes = stub.stats["bytes_put"] - before["bytes_put"]
+
+    compaction = compact(service)
+    mismatches = [s for s, messages in transcripts.items() if read_session(service, s)["messages"] != messages]
+    stub.stop()
+
+    print(json.dumps({"mode": "full_transcript_per_save", "puts": legacy_puts, "bytes": legacy_bytes}))
+    print(json.dumps({"mode": "append_only_segments", "puts": archive_puts, "bytes": archive_bytes}))
+    print(json.dumps({"compaction": compaction, "sessions_reconstructed": len(transcripts) - len(mismatches),
+                      "mismatches": mismatches}))
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,340 @@
+# chat_replay.py
+"""
+Replay multi-turn /api/chat conversations against the app with a fake LLM.
+
+Sessions are built from a query corpus (fixtures/chat_queries.jsonl by
+default: message, language and category per line) and sent with
+feature_context payloads shaped like the ones the frontend builds (search
+view, property view with its full propertyContext, or none). Sessions start
+at a target rate (Poisson arrivals) and each sends its turns one after the
+other with think time in between, all against the upstream stubs, so the
+Azure OpenAI deployment is the deterministic stand-in from upstream_stubs.py.
+
+The report groups results by turn number, showing how latency, the
+number of messages and the prompt size sent to the LLM grow with the
+chat_histories of a session, and how many serial LLM/DeepL calls each
+turn makes. The stub emulates Azure OpenAI prompt caching, so the report
+also shows how much of each chat prompt was a cached prefix. Set
+--prefill-ms-per-1k to add latency per uncached prompt token, as a stand-in
+for time to first token.
+
+With --context-mode diff, the client side follows the server-side UI
+context protocol (ui_context.py): the full UI state on the first turn of a
+session, then only the keys that changed, and the property context as a
+zpid reference. --context-mode full sends the whole state every turn, as
+older frontends did.
+
+--queries also accepts a plain text file with one query per line. Lines
+that look like requirements pins (name==version) are skipped, so a mixed
+file such as tests.txt can be passed as is.
+
+Usage:
+    python benchmarks/chat_replay.py [--sessions 40] [--turns 8] [--rate 2]
+        [--think-time 0.2] [--languages "en=0.7,es=0.15,fr=0.05,de=0.05,zh=0.05"]
+        [--latency "azure_openai=0.4,deepl=0.06"] [--prefill-ms-per-1k 0] [--context-mode diff|full]
+        [--queries FILE] [--output replay.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+from endpoint_bench import percentile, start_server  # noqa: E402
+from upstream_stubs import FIXTURES_PATH, UpstreamStubs, parse_per_upstream  # noqa: E402
+
+QUERIES_PATH = os.path.join(BENCH_DIR, "fixtures", "chat_queries.jsonl")
+REQUIREMENT_PIN = re.compile(r"^[A-Za-z0-9_.\-\[\]]+\s*[=<>!~]=")
+
+
+def load_queries(path):
+    """Return [{"message", "language"}] from a JSONL corpus or a text file with one query per line."""
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                row = json.loads(line)
+                message = row.get("message") or row.get("query") or row.get("text") or row.get("title")
+                if message:
+                    queries.append({"message": message, "language": row.get("language", "en")})
+            elif not REQUIREMENT_PIN.match(line):
+                queries.append({"message": line, "language": "en"})
+    if not queries:
+        raise SystemExit(f"No queries found in {path}")
+    return queries
+
+
+def parse_weights(value):
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+class ContextFactory:
+    """Builds feature_context strings like ChatContext.buildUIContext() on the frontend."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        with open(FIXTURES_PATH, encoding="utf-8") as f:
+            zillow = json.load(f)["zillow"]
+        self.listings = zillow["/search"]["results"]
+        self.details = zillow["/propertyV2"]
+
+    def search_view(self, zip_code):
+        count = self.rng.randint(5, len(self.listings))
+        return {"currentProperty": None, "propertyDetails": None, "propertyContext": None,
+                "propertiesCount": count, "activeTab": "explore", "zipCode": zip_code,
+                "hasRestaurants": True, "restaurantCount": self.rng.randint(0, 20),
+                "hasTransit": True, "transitCount": self.rng.randint(0, 10),
+                "hasMarketData": self.rng.random() < 0.7, "marketLocation": zip_code}
+
+    def property_view(self, zip_code):
+        listing = self.rng.choice(self.listings)
+        details = self.details
+        address = f"{listing['streetAddress']}, {listing['city']}, {listing['state']} {listing['zipcode']}"
+        history = details["priceHistory"] * self.rng.randint(1, 4)
+        context = self.search_view(zip_code)
+        context.update({
+            "currentProperty": {"zpid": listing["zpid"], "address": address, "price": listing["price"],
+                                "beds": listing["bedrooms"], "baths": listing["bathrooms"], "type": listing["homeType"]},
+            "propertyDetails": {"address": address, "price": listing["price"], "yearBuilt": details["yearBuilt"],
+                                "propertyTaxes": details["taxHistory"][0]["taxPaid"]},
+            "propertyContext": {
+                "zpid": listing["zpid"], "address": address, "price": listing["price"],
+                "beds": listing["bedrooms"], "baths": listing["bathrooms"], "type": listing["homeType"],
+                "sqft": listing["livingArea"], "yearBuilt": details["yearBuilt"],
+                "description": details["description"], "priceHistory": history,
+                "taxHistory": details["taxHistory"], "schools": details["schools"],
+                "features": details["resoFacts"],
+            },
+            "activeTab": "property",
+        })
+        return context
+
+    def build(self, view, zip_code):
+        if view == "none":
+            return None
+        return self.search_view(zip_code) if view == "search" else self.property_view(zip_code)
+
+
+def feature_context(ui_context, zip_code, mode, last):
+    """
+    The feature_context string for one turn, and the state the server holds afterwards.
+
+    last is (version, state) as acknowledged by the server's previous reply, or None.
+    """
+    if ui_context is None:
+        return None, last[1] if last else None
+    if mode == "full":
+        return json.dumps({"extracted": {"location": zip_code}, "ui_context": ui_context}), None
+    state = {k: v for k, v in ui_context.items() if k != "propertyContext"}
+    if ui_context.get("propertyContext") and ui_context.get("currentProperty"):
+        state["propertyRef"] = ui_context["currentProperty"]["zpid"]
+    if last is None:
+        payload = {"ui_context": state}
+    else:
+        version, previous = last
+        diff = {key: state.get(key) for key in set(previous) | set(state) if previous.get(key) != state.get(key)}
+        payload = {"ui_context_diff": diff, "ui_context_base": version}
+    return json.dumps({"extracted": {"location": zip_code}, **payload}), state
+
+
+def build_sessions(args, queries, rng):
+    by_language = defaultdict(list)
+    for query in queries:
+        by_language[query["language"]].append(query["message"])
+    languages = parse_weights(args.languages)
+    contexts = ContextFactory(rng)
+    sessions = []
+    for index in range(args.sessions):
+        language = rng.choices(list(languages), weights=list(languages.values()))[0]
+        pool = by_language.get(language) or by_language.get("en") or [q["message"] for q in queries]
+        zip_code = rng.choice(["60616", "60607", "02108", "10001", "90210"])
+        turns = []
+        for _ in range(args.turns):
+            view = rng.choices(["none", "search", "property"], weights=[1, 2, 2])[0]
+            turns.append({"message": rng.choice(pool), "language": language,
+                          "ui_context": contexts.build(view, zip_code), "view": view})
+        sessions.append({"index": index, "language": language, "zip_code": zip_code, "turns": turns})
+    return sessions
+
+
+async def run_session(client, session, think_time, rng, results, context_mode):
+    session_id = None
+    last = None
+    opened = None
+    for turn_number, turn in enumerate(session["turns"], start=1):
+        current = (turn["ui_context"] or {}).get("currentProperty")
+        if current and current["zpid"] != opened:
+            # The frontend loads /api/property before it can show (and chat about) a property
+            opened = current["zpid"]
+            try:
+                await client.post("/api/property", json={"zpid": str(opened)})
+            except Exception:
+                pass
+        context, state = feature_context(turn["ui_context"], session["zip_code"], context_mode, last)
+        body = {"message": turn["message"], "language": turn["language"], "session_id": session_id,
+                "feature_context": context}
+        start = time.perf_counter()
+        try:
+            response = await client.post("/api/chat", json=body)
+            status = response.status_code
+            if status == 200:
+                reply = response.json()
+                session_id = reply.get("session_id")
+                version = reply.get("ui_context_version")
+                resync = reply.get("ui_context_resync") or version is None or state is None
+                last = None if resync else (version, state)
+        except Exception as e:
+            status = type(e).__name__
+        results.append({"turn": turn_number, "latency": time.perf_counter() - start, "status": status,
+                        "language": turn["language"], "view": turn["view"],
+                        "context_chars": len(context or "")})
+        if think_time:
+            await asyncio.sleep(rng.expovariate(1 / think_time))
+
+
+async def replay(base_url, sessions, rate, think_time, rng, context_mode):
+    import httpx
+
+    results = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=300,
+                                 limits=httpx.Limits(max_connections=None, max_keepalive_connections=64)) as client:
+        tasks = []
+        start = time.perf_counter()
+        for session in sessions:
+            tasks.append(asyncio.create_task(run_session(client, session, think_time, rng, results, context_mode)))
+            if rate:
+                await asyncio.sleep(rng.expovariate(rate))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def report(results, llm_requests, upstream_calls, elapsed, args):
+    by_turn = defaultdict(list)
+    for result in results:
+        by_turn[result["turn"]].append(result)
+    # Chat prompts carry instructions + 2 messages per earlier turn + UI context + the question
+    chat_prompts = defaultdict(list)
+    for request in llm_requests:
+        if request["kind"] == "chat":
+            chat_prompts[(request["messages"] - 2) // 2 + 1].append(request)
+    llm_per_kind = defaultdict(int)
+    for request in llm_requests:
+        llm_per_kind[request["kind"]] += 1
+
+    turns = []
+    for turn in sorted(by_turn):
+        rows = by_turn[turn]
+        latencies = sorted(r["latency"] for r in rows)
+        prompts = chat_prompts.get(turn, [])
+        turns.append({
+            "turn": turn,
+            "requests": len(rows),
+            "errors": sum(1 for r in rows if r["status"] != 200),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "llm_messages": prompts[0]["messages"] if prompts else None,
+            "mean_prompt_tokens": round(statistics.mean(p["prompt_tokens"] for p in prompts)) if prompts else None,
+            "mean_cached_tokens": round(statistics.mean(p["cached_tokens"] for p in prompts)) if prompts else None,
+            "mean_context_chars": round(statistics.mean(r["context_chars"] for r in rows)),
+        })
+
+    # Least-squares slope of prompt tokens over turn number
+    points = [(t["turn"], t["mean_prompt_tokens"]) for t in turns if t["mean_prompt_tokens"] is not None]
+    slope = None
+    if len(points) > 1:
+        mean_x = statistics.mean(x for x, _ in points)
+        mean_y = statistics.mean(y for _, y in points)
+        denominator = sum((x - mean_x) ** 2 for x, _ in points)
+        slope = round(sum((x - mean_x) * (y - mean_y) for x, y in points) / denominator, 1) if denominator else None
+
+    chat_requests = [r for r in llm_requests if r["kind"] == "chat"]
+    prompt_total = sum(r["prompt_tokens"] for r in chat_requests)
+    count = len(results)
+    return {
+        "sessions": args.sessions,
+        "turns_per_session": args.turns,
+        "context_mode": args.context_mode,
+        "mean_context_chars": round(statistics.mean(r["context_chars"] for r in results)) if results else 0,
+        "requests": count,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+        "statuses": dict(Counter(str(r["status"]) for r in results)),
+        "prompt_tokens_per_turn": slope,
+        "chat_prompt_tokens": prompt_total,
+        "chat_cached_share": round(sum(r["cached_tokens"] for r in chat_requests) / prompt_total, 3)
+                             if prompt_total else 0.0,
+        "llm_calls_per_turn": {kind: round(n / count, 2) for kind, n in llm_per_kind.items()} if count else {},
+        "upstream_calls_per_turn": {name: round(calls["total"] / count, 2)
+                                    for name, calls in upstream_calls.items() if calls["total"] and count},
+        "by_turn": turns,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=2.0, help="new sessions per second (0 = all at once)")
+    parser.add_argument("--think-time", type=float, default=0.2, help="mean seconds between turns of a session")
+    parser.add_argument("--languages", default="en=0.7,es=0.15,fr=0.05,de=0.05,zh=0.05")
+    parser.add_argument("--latency", default="azure_openai=0.4,deepl=0.06",
+                        help='upstream latency in seconds, "0.05" or "azure_openai=0.4,deepl=0.06"')
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=0.0,
+                        help="extra LLM latency in ms per 1000 uncached prompt tokens")
+    parser.add_argument("--context-mode", choices=("diff", "full"), default="diff",
+                        help="send UI context diffs with zpid references, or the full state every turn")
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    sessions = build_sessions(args, load_queries(args.queries), rng)
+
+    stubs = UpstreamStubs(parse_per_upstream(args.latency), llm_prefill_per_1k=args.prefill_ms_per_1k / 1000).start()
+    os.environ.update(stubs.env())
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["WARMUP_ON_STARTUP"] = "false"
+
+    import app as backend
+
+    backend.warm_up()
+    server, thread, base_url = start_server(backend.app)
+    try:
+        stubs.reset_counts()
+        results, elapsed = asyncio.run(replay(base_url, sessions, args.rate, args.think_time, rng,
+                                                    args.context_mode))
+        summary = report(results, list(stubs.llm_requests), stubs.call_counts(), elapsed, args)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        stubs.stop()
+
+    for row in summary["by_turn"]:
+        print(json.dumps(row))
+    print(json.dumps({k: v for k, v in summary.items() if k != "by_turn"}))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
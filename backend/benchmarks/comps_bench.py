@@ -0,0 +1,120 @@
+# comps_bench.py
+"""
+Comps valuation cost and the prompt it replaces.
+
+Uses the propertyV2 fixture (fixtures/upstream_fixtures.json) with its
+priceHistory extended to --events events, and a PropertyStore of
+--listings generated listings for the similar-homes comps. Reports:
+
+- analysis: property_market_analysis() computing the comps from scratch,
+  and the same call answered from the per-zpid cache
+- value_comps() alone for --comps comps, i.e. the numpy batch
+- prompt: the property context the chat renders, and its JSON as stored
+  per session, with the raw priceHistory (before) and with marketAnalysis
+  (after)
+
+Usage:
+    python benchmarks/comps_bench.py [--listings 10000] [--events 40] [--comps 1000] [--output comps.json]
+"""
+import argparse
+import copy
+import datetime
+import json
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "upstream_fixtures.json")
+
+
+def median_ms(fn, repeat=50):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples) * 1000, 3)
+
+
+def property_data(events):
+    with open(FIXTURES, encoding="utf-8") as f:
+        data = copy.deepcopy(json.load(f)["zillow"]["/propertyV2"])
+    history = list(data.get("priceHistory") or [])
+    start = datetime.date(1990, 1, 15)
+    price = 150000
+    while len(history) < events:
+        kind = ("Listed for sale", "Price change", "Price change", "Sold")[len(history) % 4]
+        price = round(price * (0.98 if kind == "Price change" else 1.06))
+        history.insert(0, {"date": str(start + datetime.timedelta(days=120 * len(history))), "event": kind,
+                           "price": price})
+    data["priceHistory"] = history
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, default=10000)
+    parser.add_argument("--events", type=int, default=40)
+    parser.add_argument("--comps", type=int, default=1000)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    os.environ["PROPERTY_SEED_PATHS"] = ""
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["WARMUP_ON_STARTUP"] = "false"
+    import app
+    import comps
+    from property_store import record_from_details
+    from snapshot_bench import build_records
+    from ui_context import property_context_from_details
+
+    app.property_ingestion.store.upsert(build_records(args.listings), "seed")
+    app.property_ingestion.store.similar_homes()
+    data = property_data(args.events)
+    zpid = str(data.get("zpid"))
+
+    def compute():
+        app.market_analyses.entries.clear()
+        return app.property_market_analysis(zpid, data)
+
+    analysis = compute()
+    subject = record_from_details(data)
+    many = [comps.comp_from_record(record, i / args.comps)
+            for i, record in enumerate(build_records(args.comps, seed=3))]
+
+    details = {"basic_info": {"address": {"full": "2100 S Indiana Ave, Chicago, IL 60616"}, "price": data.get("price"),
+                              "bedrooms": data.get("bedrooms"), "bathrooms": data.get("bathrooms"),
+                              "livingArea": data.get("livingArea"), "yearBuilt": data.get("yearBuilt"),
+                              "homeType": data.get("homeType")},
+               "priceHistory": data["priceHistory"]}
+    before = property_context_from_details(details)
+    after = property_context_from_details({**details, "marketAnalysis": analysis})
+    before_prompt = app.render_ui_context({"propertyContext": before})
+    after_prompt = app.render_ui_context({"propertyContext": after})
+
+    result = {
+        "listings": args.listings,
+        "price_events": len(data["priceHistory"]),
+        "comps_used": analysis["valuation"]["compCount"],
+        "analysis_ms": median_ms(compute),
+        "cached_analysis_ms": median_ms(lambda: app.property_market_analysis(zpid, data)),
+        f"value_comps_{args.comps}_ms": median_ms(lambda: comps.value_comps(subject, many)),
+        "summarize_history_ms": median_ms(lambda: comps.summarize_history(data["priceHistory"], data.get("price"))),
+        "prompt_chars_before": len(before_prompt),
+        "prompt_chars_after": len(after_prompt),
+        "context_bytes_before": len(json.dumps(before)),
+        "context_bytes_after": len(json.dumps(after)),
+        "valuation": analysis["valuation"],
+    }
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
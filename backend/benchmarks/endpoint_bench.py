@@ -0,0 +1,230 @@
+# endpoint_bench.py
+"""
+Offline load test of every backend endpoint against local upstream stubs.
+
+Starts the stand-ins from upstream_stubs.py, points the app at them, serves
+it with uvicorn on a local port and drives each endpoint with N requests at
+the given concurrency. Reports p50/p95/p99 latency, throughput, status codes
+and how many upstream calls each request caused.
+
+With --baseline, compares p95 and throughput with an earlier --output file
+and exits non-zero when an endpoint regressed by more than --max-regression.
+
+Usage:
+    python benchmarks/endpoint_bench.py [--requests 200] [--concurrency 8]
+        [--latency "zillow=0.08,azure_openai=0.4"] [--error-rate "zillow=0.05"]
+        [--endpoints chat,properties] [--output bench.json]
+        [--baseline bench.json --max-regression 0.25]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from upstream_stubs import UpstreamStubs, parse_per_upstream  # noqa: E402
+
+UI_CONTEXT = json.dumps({"ui_context": {
+    "currentProperty": {"zpid": 3810000},
+    "propertyContext": {"beds": 3, "baths": 2, "type": "condo", "address": "2100 S Indiana Ave, Chicago, IL 60616",
+                        "price": 549000, "yearBuilt": 2006, "sqft": 1650},
+}})
+
+# name -> (method, path, body factory taking the request index)
+ENDPOINTS = {
+    "health": ("GET", "/api/health", None),
+    "properties": ("POST", "/api/properties", lambda i: {"zipCode": "60616"}),
+    "properties_filtered": ("POST", "/api/properties", lambda i: {
+        "zipCode": "60616", "propertyFeatures": {"bedrooms": 2, "propertyType": "house"},
+        "filters": {"priceRange": [None, 650000]}, "sortBy": "price_asc", "page": 1 + i % 2, "pageSize": 5,
+    }),
+    "properties_facets": ("POST", "/api/properties/facets", lambda i: {
+        "zipCode": "60616", "propertyFeatures": {"bedrooms": 2}, "filters": {"priceRange": [None, 650000]},
+        "pageSize": 5,
+    }),
+    "properties_stream": ("POST", "/api/properties/stream", lambda i: {"zipCode": "60616", "pageSize": 5}),
+    "property": ("POST", "/api/property", lambda i: {"zpid": "3810000"}),
+    "property_market_analysis": ("POST", "/api/property_market_analysis", lambda i: {"zpid": "3810000"}),
+    "location": ("POST", "/api/location", lambda i: {"zipCode": "60616", "type": "Restaurants"}),
+    "nearby_zips": ("POST", "/api/nearby_zips", lambda i: {"zipCode": "60616"}),
+    "market_trends": ("POST", "/api/market_trends", lambda i: {"zipCode": "60616"}),
+    "market_compare": ("POST", "/api/market_compare", lambda i: {"locations": ["60616", "60614", "60608"]}),
+    # Answered from what market_trends and market_compare stored; 404 on its own with an empty history
+    "market_history": ("POST", "/api/market_history", lambda i: {"zipCode": "60616"}),
+    "search_agents": ("POST", "/api/search_agents", lambda i: {"location": "houston, tx"}),
+    "extract_features": ("POST", "/api/extract_features",
+                         lambda i: {"message": "3 bedroom house with a garage in 60616 under $650k"}),
+    "chat": ("POST", "/api/chat", lambda i: {"message": "What homes are for sale near me?", "language": "en",
+                                             "feature_context": UI_CONTEXT}),
+    "chat_translated": ("POST", "/api/chat", lambda i: {"message": "¿Qué casas hay a la venta?", "language": "es",
+                                                        "feature_context": UI_CONTEXT}),
+    "save_chat": ("POST", "/api/save_chat", lambda i: {
+        "session_id": f"bench-{i}", "zipCodes": ["60616"],
+        "messages": [{"sender": "user" if k % 2 == 0 else "bot", "text": f"message {k}"} for k in range(12)],
+    }),
+    "upstream_metrics": ("GET", "/api/upstream_metrics", None),
+    "metrics": ("GET", "/metrics", None),
+}
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def start_server(app):
+    import uvicorn
+
+    # Let uvicorn bind the port itself: sockets handed in via sockets=[...]
+    # don't get TCP_NODELAY, which adds ~40 ms of delayed-ACK stall per response
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+async def drive(base_url, method, path, body_factory, requests, concurrency):
+    import httpx
+
+    latencies, statuses = [], Counter()
+    next_index = iter(range(requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        async def worker():
+            for i in next_index:
+                body = body_factory(i) if body_factory else None
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    statuses[response.status_code] += 1
+                except Exception as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return sorted(latencies), statuses, elapsed
+
+
+def summarize(name, latencies, statuses, elapsed, concurrency, upstream_calls):
+    count = len(latencies)
+    ok = sum(n for status, n in statuses.items() if isinstance(status, int) and status < 400)
+    return {
+        "endpoint": name,
+        "requests": count,
+        "concurrency": concurrency,
+        "ok": ok,
+        "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0,
+        "throughput_rps": round(count / elapsed, 1) if elapsed else 0.0,
+        "upstream_calls_per_request": {
+            upstream: round(calls["total"] / count, 2) for upstream, calls in upstream_calls.items()
+            if calls["total"] and count
+        },
+        "upstream_calls": {upstream: calls for upstream, calls in upstream_calls.items() if calls["total"]},
+    }
+
+
+def compare(results, baseline, max_regression):
+    """Return a list of human-readable regressions against a baseline run."""
+    previous = {r["endpoint"]: r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get(result["endpoint"])
+        if not before:
+            continue
+        # 1 ms of slack so sub-millisecond endpoints don't flap
+        if result["p95_ms"] > before["p95_ms"] * (1 + max_regression) + 1.0:
+            regressions.append(f"{result['endpoint']}: p95 {before['p95_ms']} -> {result['p95_ms']} ms")
+        if result["throughput_rps"] < before["throughput_rps"] * (1 - max_regression):
+            regressions.append(f"{result['endpoint']}: throughput {before['throughput_rps']} -> "
+                               f"{result['throughput_rps']} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", default="zillow=0.08,serpapi=0.15,nominatim=0.05,deepl=0.06,azure_openai=0.4,r2=0.03",
+                        help='upstream latency in seconds, "0.05" or "zillow=0.08,azure_openai=0.4"')
+    parser.add_argument("--error-rate", default="", help="fraction of upstream requests failing, same format")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="comma-separated subset of: " + ", ".join(ENDPOINTS))
+    parser.add_argument("--production-rate-limits", action="store_true",
+                        help="keep the upstream scheduler's production rate limits instead of lifting them")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="earlier --output file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    args = parser.parse_args()
+
+    selected = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+
+    stubs = UpstreamStubs(parse_per_upstream(args.latency), parse_per_upstream(args.error_rate)).start()
+    os.environ.update(stubs.env())
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["WARMUP_ON_STARTUP"] = "false"
+    if not args.production_rate_limits:
+        # The stubs are not rate limited; measure the app, not the token buckets
+        for name in ("ZILLOW", "SERPAPI"):
+            os.environ.setdefault(f"{name}_RATE_PER_SECOND", "100000")
+            os.environ.setdefault(f"{name}_BURST", "100000")
+
+    import app as backend
+
+    backend.warm_up()
+    server, thread, base_url = start_server(backend.app)
+    results = []
+    try:
+        for name in selected:
+            method, path, body_factory = ENDPOINTS[name]
+            # One warm-up round so connection set-up is not in the numbers
+            asyncio.run(drive(base_url, method, path, body_factory, min(args.concurrency, args.requests), args.concurrency))
+            stubs.reset_counts()
+            latencies, statuses, elapsed = asyncio.run(
+                drive(base_url, method, path, body_factory, args.requests, args.concurrency)
+            )
+            result = summarize(name, latencies, statuses, elapsed, args.concurrency, stubs.call_counts())
+            results.append(result)
+            print(json.dumps({k: v for k, v in result.items() if k != "upstream_calls"}), flush=True)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        stubs.stop()
+
+    report = {"config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")}, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
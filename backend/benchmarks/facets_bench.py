@@ -0,0 +1,132 @@
+# facets_bench.py
+"""
+Facet counts and stats on the server (/api/properties/facets) vs shipping
+every listing to the client.
+
+Replaces the Zillow stub's /search fixture with a generated response of
+--listings results (see listing_stream_bench.search_response). For each
+size it reports:
+
+- in-process: ListingTable.facet_page() for a filtered query against a
+  row-by-row Python pass computing the same counts and ranges (what the
+  property tabs did over the full result list)
+- over HTTP, with the ZIP's table already cached: bytes and latency of
+  fetching every matching listing from /api/properties (pages of
+  PROPERTIES_MAX_PAGE_SIZE) against /api/properties/facets with one page of
+  --page-size listings plus facets
+
+Usage:
+    python benchmarks/facets_bench.py [--listings 1000,10000,50000] [--page-size 20]
+        [--repeat 20] [--output facets.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from endpoint_bench import start_server  # noqa: E402
+from listing_stream_bench import search_response  # noqa: E402
+from upstream_stubs import UpstreamStubs  # noqa: E402
+
+FILTERS = {"propertyFeatures": {"bedrooms": 2}, "filters": {"priceRange": [None, 800000]}, "sortBy": "price_asc"}
+
+
+def row_facets(rows, max_price=800000, min_beds=2):
+    """The facets computed one listing at a time, as a client would."""
+    matched = [row for row in rows if row["price"] <= max_price and row["bedrooms"] >= min_beds]
+    facets = {"beds": {}, "baths": {}, "homeType": {}}
+    for row in matched:
+        for name, field in (("beds", "bedrooms"), ("baths", "bathrooms"), ("homeType", "homeType")):
+            facets[name][row[field]] = facets[name].get(row[field], 0) + 1
+    for field in ("price", "bedrooms", "bathrooms", "livingArea", "daysOnZillow"):
+        values = sorted(row[field] for row in matched)
+        facets[field] = {"min": values[0], "max": values[-1], "mean": statistics.fmean(values),
+                         "p50": values[len(values) // 2], "p90": values[int(len(values) * 0.9)]}
+    return facets
+
+
+def median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", default="1000,10000,50000")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    stubs = UpstreamStubs({"zillow": 0}).start()
+    os.environ.update(stubs.env())
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["WARMUP_ON_STARTUP"] = "false"
+    os.environ.setdefault("ZILLOW_RATE_PER_SECOND", "100000")
+    os.environ.setdefault("ZILLOW_BURST", "100000")
+    # Each size replaces the stub's listings; do not answer from the property store
+    os.environ["LOCAL_SEARCH_MAX_AGE"] = "0"
+    import requests
+
+    import app
+    from listing_query import MAX_PAGE_SIZE, ListingQuery, ListingTable
+
+    server, thread, base_url = start_server(app.app)
+    session = requests.Session()
+
+    results = []
+    try:
+        for count in [int(n) for n in args.listings.split(",") if n.strip()]:
+            payload = search_response(count)
+            stubs.servers["zillow"].routes["/search"] = payload
+            app.listing_tables.entries.clear()
+            raw = payload["results"]
+            table = ListingTable(raw, [app.format_listing(result) for result in raw])
+            query = ListingQuery.from_features(FILTERS["propertyFeatures"], FILTERS["filters"], FILTERS["sortBy"])
+            row = {"listings": count, "matching": table.facet_page(query, 1, args.page_size)[1],
+                   "facet_page_ms": median_ms(lambda: table.facet_page(query, 1, args.page_size), args.repeat),
+                   "row_by_row_ms": median_ms(lambda: row_facets(raw), args.repeat)}
+
+            for name, path, body in (
+                ("all_listings", "/api/properties", {"zipCode": "60616", "pageSize": MAX_PAGE_SIZE, **FILTERS}),
+                ("facets", "/api/properties/facets", {"zipCode": "60616", "pageSize": args.page_size, **FILTERS}),
+            ):
+                # The first request fetches and caches the ZIP's table
+                session.post(base_url + path, json=body).raise_for_status()
+                sizes = []
+
+                def request():
+                    size, page, more = 0, 1, True
+                    while more:
+                        response = session.post(base_url + path, json={**body, "page": page})
+                        response.raise_for_status()
+                        size += len(response.content)
+                        more = name == "all_listings" and response.json()["hasMore"]
+                        page += 1
+                    sizes.append(size)
+
+                row[f"{name}_ms"] = median_ms(request, args.repeat)
+                row[f"{name}_bytes"] = sizes[-1]
+            print(json.dumps(row))
+            results.append(row)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+        stubs.stop()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# fault_injection.py
+"""
+Fault-injection check for the upstream circuit breakers and hedged requests.
+
+Starts a local stub server that can be switched between healthy, slow-tail,
+hanging and erroring behaviour, drives calls through resilience.guarded_call
+and reports the latency distribution for each phase. Exits non-zero when the
+tail latency is not bounded.
+
+Usage:
+    python benchmarks/fault_injection.py
+"""
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Short timeouts so the degraded phases finish quickly; must be set before import
+os.environ.setdefault("UPSTREAM_CONNECT_TIMEOUT", "0.2")
+os.environ.setdefault("UPSTREAM_READ_TIMEOUT", "0.5")
+os.environ.setdefault("CIRCUIT_FAILURE_THRESHOLD", "3")
+os.environ.setdefault("CIRCUIT_RESET_TIMEOUT", "1")
+os.environ.setdefault("HEDGE_REQUESTS", "true")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+import resilience  # noqa: E402
+from resilience import HTTP_TIMEOUT, READ_TIMEOUT, guarded_call, raise_for_upstream_status  # noqa: E402
+
+MODE = {"value": "healthy"}
+# Seeded, so which calls land in the slow tail is the same on every run
+RNG = random.Random(0)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        mode = MODE["value"]
+        if mode == "hang":
+            time.sleep(5)
+        elif mode == "error":
+            self.send_response(503)
+            self.end_headers()
+            return
+        elif mode == "slow_tail" and RNG.random() < 0.05:
+            time.sleep(0.3)
+        else:
+            time.sleep(0.01)
+        body = json.dumps({"path": self.path}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_phase(name, url, calls, upstream, hedge=False):
+    latencies = []
+    outcomes = {"ok": 0, "stale": 0, "failed": 0}
+    for i in range(calls):
+        start = time.monotonic()
+        try:
+            result = guarded_call(
+                upstream,
+                lambda: raise_for_upstream_status(upstream, requests.get(url, timeout=HTTP_TIMEOUT)).json(),
+                cache_key="listing",
+                hedge=hedge,
+            )
+            outcomes["stale" if result.get("stale") else "ok"] += 1
+        except Exception:
+            outcomes["failed"] += 1
+        latencies.append(time.monotonic() - start)
+    latencies.sort()
+    report = {
+        "phase": name,
+        "calls": calls,
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+        **outcomes,
+        "circuit": resilience.breaker(upstream).metrics(),
+    }
+    print(json.dumps(report))
+    return report
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/propertyV2"
+
+    # Warm the stale cache and the latency window
+    run_phase("healthy", url, 50, "stub")
+    resilience.stale_cache.put(("stub", "listing"), {"stale": True})
+
+    MODE["value"] = "hang"
+    hang = run_phase("hang", url, 50, "stub")
+
+    MODE["value"] = "error"
+    error = run_phase("error", url, 50, "stub")
+
+    # Fill the hedged upstream's latency window, so hedging is on from the first slow-tail call
+    MODE["value"] = "healthy"
+    run_phase("healthy_hedged", url, 20, "stub_hedged", hedge=True)
+
+    MODE["value"] = "slow_tail"
+    unhedged = run_phase("slow_tail_unhedged", url, 200, "stub_unhedged")
+    hedged = run_phase("slow_tail_hedged", url, 200, "stub_hedged", hedge=True)
+
+    server.shutdown()
+
+    # A hanging upstream may cost at most one read timeout per call, and only
+    # until the circuit opens; afterwards calls are served from the stale cache.
+    bound = (READ_TIMEOUT + 0.25) * 1000
+    failures = [r["phase"] for r in (hang, error) if r["max_ms"] > bound or r["p95_ms"] > 50]
+    # Hedging should cut the slow tail to roughly twice the median plus one fast call
+    if hedged["p99_ms"] > unhedged["p99_ms"] / 2:
+        failures.append(hedged["phase"])
+    if failures:
+        print(f"Tail latency not bounded in: {', '.join(failures)}")
+        return 1
+    print("Tail latency bounded in all phases")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
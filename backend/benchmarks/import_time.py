@@ -0,0 +1,81 @@
+# import_time.py
+"""
+Check the start-up cost of the backend against a budget.
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter and
+reports the cumulative import time of each module app.py pulls in directly,
+then, in another fresh interpreter, how long warm_up() takes to load the
+integrations that are deferred to first use. Exits non-zero when importing
+app exceeds the budget, so it can run in CI.
+
+Usage:
+    python benchmarks/import_time.py [--budget-ms 800] [--top 10] [--runs 3]
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# "import time: self [us] | cumulative | imported package", nesting shown by indentation
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def run_python(code, extra_args=()):
+    env = dict(os.environ, LOG_LEVEL="WARNING", WARMUP_ON_STARTUP="false")
+    return subprocess.run([sys.executable, *extra_args, "-c", code], cwd=BACKEND_DIR, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def measure_imports():
+    """Return (total_ms, {module: cumulative_ms}) for modules imported directly by app."""
+    stderr = run_python("import app", ("-X", "importtime")).stderr
+    total, direct, children = None, {}, {}
+    for _, cumulative_us, indent, name in LINE.findall(stderr):
+        # Children are listed before their parent, so collect them until the
+        # next top-level line and keep them if that line is app itself
+        if len(indent) == 1:
+            if name == "app":
+                total, direct = int(cumulative_us) / 1000, children
+            children = {}
+        elif len(indent) == 3:
+            children[name] = int(cumulative_us) / 1000
+    if total is None:
+        raise RuntimeError("app import not found in -X importtime output")
+    return total, direct
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("IMPORT_TIME_BUDGET_MS", 800)))
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    runs = [measure_imports() for _ in range(args.runs)]
+    totals = [total for total, _ in runs]
+    modules = {}
+    for _, direct in runs:
+        for name, ms in direct.items():
+            modules.setdefault(name, []).append(ms)
+    top = sorted(((statistics.median(v), k) for k, v in modules.items()), reverse=True)[:args.top]
+
+    warm_up = json.loads(run_python("import json, app; print(json.dumps(app.warm_up()))").stdout.splitlines()[-1])
+
+    median_total = statistics.median(totals)
+    print(json.dumps({
+        "import_app_ms": round(median_total, 1),
+        "budget_ms": args.budget_ms,
+        "within_budget": median_total <= args.budget_ms,
+        "top_imports_ms": {name: round(ms, 1) for ms, name in top},
+        "deferred_first_use_ms": warm_up,
+    }, indent=2))
+    sys.exit(0 if median_total <= args.budget_ms else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# listing_stream_bench.py
+"""
+Buffered /api/properties vs streamed /api/properties/stream on large searches.
+
+Replaces the Zillow stub's /search fixture with a generated response of
+--listings results. For each size it reports:
+
+- peak Python memory (tracemalloc) of handling one search body: json.loads of
+  the whole body plus the formatted listings and ListingTable, against
+  iter_json_object() stopping after one page of --page-size listings
+- time to the first listing and to the whole response over HTTP, for
+  /api/properties (pageSize = --page-size) and /api/properties/stream
+
+The listing cache and the property store's coverage are cleared before every
+request so both paths read Zillow.
+
+Usage:
+    python benchmarks/listing_stream_bench.py [--listings 1000,10000,50000]
+        [--page-size 20] [--repeat 5] [--latency 0.05] [--output stream.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from endpoint_bench import start_server  # noqa: E402
+from upstream_stubs import UpstreamStubs  # noqa: E402
+
+HOME_TYPES = ("SINGLE_FAMILY", "CONDO", "TOWNHOUSE", "MULTI_FAMILY")
+
+
+def search_response(count):
+    results = [{
+        "zpid": 4000000 + i,
+        "streetAddress": f"{100 + i} S Example Ave",
+        "city": "Chicago",
+        "state": "IL",
+        "zipcode": "60616",
+        "price": 200000 + (i * 7919) % 900000,
+        "bedrooms": 1 + i % 5,
+        "bathrooms": 1 + i % 3,
+        "livingArea": 600 + (i * 31) % 3000,
+        "homeType": HOME_TYPES[i % len(HOME_TYPES)],
+        "homeStatus": "FOR_SALE",
+        "latitude": 41.85 + (i % 100) / 10000,
+        "longitude": -87.62 - (i % 100) / 10000,
+        "daysOnZillow": i % 120,
+        "imgSrc": f"https://photos.zillowstatic.com/fp/bench{i:06d}-p_e.jpg",
+    } for i in range(count)]
+    return {"results": results, "totalResultCount": count, "totalPages": 1}
+
+
+def chunks_of(data, size):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def measure_memory(body, page_size):
+    import app
+    from listing_query import ListingTable
+    from listing_stream import iter_json_object
+
+    def buffered():
+        data = json.loads(body.decode("utf-8"))
+        rows = [app.format_listing(result) for result in data["results"]]
+        ListingTable(data["results"], rows)
+
+    def streamed():
+        count = 0
+        for kind, value in iter_json_object(chunks_of(body, app.STREAM_CHUNK_SIZE), "results"):
+            if kind == "item":
+                app.format_listing(value)
+                count += 1
+                if count == page_size:
+                    break
+
+    return {"buffered_peak_kb": round(peak_memory(buffered) / 1024, 1),
+            "streamed_peak_kb": round(peak_memory(streamed) / 1024, 1)}
+
+
+def timed_request(session, url, body, streamed):
+    start = time.perf_counter()
+    first = None
+    with session.post(url, json=body, stream=True) as response:
+        response.raise_for_status()
+        if streamed:
+            for line in response.iter_lines():
+                if first is None and line and json.loads(line).get("type") == "listing":
+                    first = time.perf_counter() - start
+        else:
+            json.loads(response.content)
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", default="1000,10000,50000")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="Zillow stub latency in seconds")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    stubs = UpstreamStubs({"zillow": args.latency}).start()
+    os.environ.update(stubs.env())
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["WARMUP_ON_STARTUP"] = "false"
+    # The stubs are not rate limited; measure the app, not the token buckets
+    os.environ.setdefault("ZILLOW_RATE_PER_SECOND", "100000")
+    os.environ.setdefault("ZILLOW_BURST", "100000")
+    import requests
+
+    import app
+    server, thread, base_url = start_server(app.app)
+    session = requests.Session()
+    body = {"zipCode": "60616", "pageSize": args.page_size}
+
+    results = []
+    try:
+        for count in [int(n) for n in args.listings.split(",") if n.strip()]:
+            payload = search_response(count)
+            encoded = json.dumps(payload).encode("utf-8")
+            stubs.servers["zillow"].routes["/search"] = payload
+            row = {"listings": count, "upstream_bytes": len(encoded), "page_size": args.page_size}
+            row.update(measure_memory(encoded, args.page_size))
+            for name, path, streamed in (("buffered", "/api/properties", False),
+                                         ("streamed", "/api/properties/stream", True)):
+                firsts, totals = [], []
+                for _ in range(args.repeat):
+                    app.listing_tables.entries.clear()
+                    # Both paths ingest the search; forget it so the next request reads Zillow again
+                    app.property_ingestion.queue.join()
+                    app.property_ingestion.store.coverage.clear()
+                    first, total = timed_request(session, base_url + path, body, streamed)
+                    firsts.append(first)
+                    totals.append(total)
+                row[f"{name}_first_ms"] = round(statistics.median(firsts) * 1000, 1)
+                row[f"{name}_total_ms"] = round(statistics.median(totals) * 1000, 1)
+            print(json.dumps(row))
+            results.append(row)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+        stubs.stop()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
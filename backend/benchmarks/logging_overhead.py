@@ -0,0 +1,116 @@
+# logging_overhead.py
+"""
+Measure the cost of request logging on /api/chat.
+
+Each configuration runs in its own process (logging is configured at import
+time) with a canned LLM, stderr going to a file. "verbose_sync" approximates
+the old setup: every payload dump emitted and written on the request thread.
+"default" is the new setup: sampled payload dumps written from a background
+thread.
+
+Usage:
+    python benchmarks/logging_overhead.py [--requests 300]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIGS = {
+    "verbose_sync": {"LOG_ASYNC": "false", "LOG_PAYLOAD_SAMPLE_RATE": "1"},
+    "default": {},
+    "default_json": {"LOG_FORMAT": "json"},
+    "warning_only": {"LOG_LEVEL": "WARNING"},
+}
+
+FEATURES = {"queryType": "property", "location": "60616", "bedrooms": 3, "priceRange": {"max": 500000},
+            "amenities": ["garage", "yard", "updated kitchen"], "keywords": ["quiet", "schools"] * 10}
+UI_CONTEXT = json.dumps({"ui_context": {
+    "currentProperty": {"zpid": 1001},
+    "propertyContext": {"beds": 3, "baths": 2, "type": "house", "address": "1 Main St, Chicago, IL",
+                        "price": 450000, "yearBuilt": 1990, "sqft": 1800,
+                        "priceHistory": [{"date": f"20{y:02d}-01-01", "price": 300000 + y * 5000} for y in range(24)]},
+}})
+
+
+class CannedLLM:
+    """Returns the feature JSON for extraction prompts and a fixed answer otherwise."""
+
+    class Response:
+        def __init__(self, content):
+            self.content = content
+
+    def invoke(self, messages):
+        prompt = str(messages[-1].content if hasattr(messages[-1], "content") else messages[-1])
+        if "JSON" in prompt:
+            return self.Response(json.dumps(FEATURES))
+        return self.Response("See [[property schools]] and the [[market trends]] for this area. " * 5)
+
+    async def ainvoke(self, messages):
+        return self.invoke(messages)
+
+
+def worker(requests):
+    import logging
+    sys.path.insert(0, BACKEND_DIR)
+    from fastapi.testclient import TestClient
+    import app as backend
+
+    # The shared client of every tier, as get_shared_llm() would have built it
+    llm = CannedLLM()
+    for tier in backend.LLM_DEPLOYMENTS:
+        backend._llms[tier] = llm
+        backend._llm_init_attempted.add(tier)
+    payload = {"message": "Find a 3 bedroom house with a garage in 60616", "session_id": "bench",
+               "language": "en", "feature_context": UI_CONTEXT}
+    with TestClient(backend.app) as client:
+        for _ in range(20):
+            client.post("/api/chat", json=payload)
+        wall, cpu = [], []
+        for _ in range(requests):
+            start, cpu_start = time.perf_counter(), time.process_time()
+            response = client.post("/api/chat", json=payload)
+            wall.append(time.perf_counter() - start)
+            cpu.append(time.process_time() - cpu_start)
+            assert response.status_code == 200, response.text
+            assert "unable to connect" not in response.json()["response"], "the canned LLM was not used"
+    logging.shutdown()
+    return {
+        "requests": requests,
+        "p50_ms": round(statistics.median(wall) * 1000, 3),
+        "p95_ms": round(sorted(wall)[int(len(wall) * 0.95) - 1] * 1000, 3),
+        "cpu_per_request_ms": round(statistics.mean(cpu) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.requests)))
+        return
+
+    for name, overrides in CONFIGS.items():
+        env = {k: v for k, v in os.environ.items() if not k.startswith("LOG_")}
+        env.update(overrides, WARMUP_ON_STARTUP="false")
+        with tempfile.TemporaryFile() as log_file:
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", "--requests", str(args.requests)],
+                cwd=BACKEND_DIR, env=env, stdout=subprocess.PIPE, stderr=log_file, check=True, text=True,
+            )
+            log_bytes = log_file.tell()
+        stats = json.loads(result.stdout.strip().splitlines()[-1])
+        print(json.dumps({"config": name, **stats, "log_bytes_per_request": log_bytes // (args.requests + 20)}))
+
+
+if __name__ == "__main__":
+    main()
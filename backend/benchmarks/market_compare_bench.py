@@ -0,0 +1,183 @@
+# market_compare_bench.py
+"""
+One /api/market_compare request vs one /api/market_trends round trip per
+location.
+
+Replaces the Zillow stub's /market_data fixture with a responder that
+returns a distinct market page per location, answered after --latency
+seconds. The Zillow rate limit is lifted unless ZILLOW_RATE_PER_SECOND
+and ZILLOW_BURST are set (the production default of 5 per second caps
+both ways of comparing at about five fetches a second). For each number
+of locations it reports:
+
+- sequential: POST /api/market_trends once per location, as the client
+  did to compare markets
+- cold: POST /api/market_compare for locations not stored yet, so every
+  one is fetched (concurrently)
+- warm: the same comparison again, served from the market history
+- response bytes of each
+
+In-process, compare_markets() over --matrix-locations x --matrix-months is
+timed against computing the same metrics one location at a time in Python.
+
+Usage:
+    python benchmarks/market_compare_bench.py [--locations 2,4,8,12] [--latency 0.15]
+        [--matrix-locations 1000] [--matrix-months 240] [--output market_compare.json]
+"""
+import argparse
+import copy
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from endpoint_bench import start_server  # noqa: E402
+from upstream_stubs import UpstreamStubs  # noqa: E402
+
+
+def market_page_responder(fixture):
+    """Stub route: the fixture's market page renamed to the location, with rents scaled per location."""
+    def respond(query, body):
+        location = query["location"] if isinstance(query["location"], str) else query["location"][0]
+        data = copy.deepcopy(fixture)
+        page = data["data"]["marketPage"]
+        page["areaName"] = location
+        page.pop("nearbyAreaTrends", None)
+        scale = random.Random(location).uniform(0.6, 1.8)
+        over_time = page["medianRentPriceOverTime"]
+        for entry in over_time["prevYear"] + over_time["currentYear"]:
+            entry["price"] = round(entry["price"] * scale)
+        page["summary"]["medianRent"] = over_time["currentYear"][-1]["price"]
+        return 200, data
+    return respond
+
+
+def python_metrics(rows):
+    """compare_markets() metrics one location at a time."""
+    base = None
+    results = []
+    for rents in rows:
+        known = [(month, rent) for month, rent in enumerate(rents) if not math.isnan(rent)]
+        if not known:
+            results.append(None)
+            continue
+        last_month, current = known[-1]
+        base = current if base is None else base
+        by_month = dict(known)
+        usable = [(month, math.log(rent)) for month, rent in known if rent > 0]
+        x_mean = statistics.fmean(month for month, _ in usable)
+        y_mean = statistics.fmean(value for _, value in usable)
+        slope = sum((month - x_mean) * (value - y_mean) for month, value in usable) / \
+            sum((month - x_mean) ** 2 for month, _ in usable)
+        results.append({
+            "medianRent": current, "delta": current - base, "deltaPercent": (current - base) / base * 100,
+            "mom": (current / by_month[last_month - 1] - 1) * 100 if last_month - 1 in by_month else None,
+            "yoy": (current / by_month[last_month - 12] - 1) * 100 if last_month - 12 in by_month else None,
+            "trend": math.expm1(slope * 12) * 100,
+        })
+    order = sorted((i for i, r in enumerate(results) if r), key=lambda i: -results[i]["medianRent"])
+    for rank, i in enumerate(order, 1):
+        results[i]["rentRank"] = rank
+    return results
+
+
+def matrix(count, months, seed=0):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    rents = rng.uniform(800, 3000, (count, 1)) * np.cumprod(1 + rng.normal(0.003, 0.01, (count, months)), axis=1)
+    rents[rng.random((count, months)) < 0.05] = np.nan
+    return np.round(rents)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--locations", default="2,4,8,12")
+    parser.add_argument("--latency", type=float, default=0.15)
+    parser.add_argument("--matrix-locations", type=int, default=1000)
+    parser.add_argument("--matrix-months", type=int, default=240)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    stubs = UpstreamStubs({"zillow": args.latency}).start()
+    os.environ.update(stubs.env())
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["WARMUP_ON_STARTUP"] = "false"
+    os.environ["PROPERTY_SEED_PATHS"] = ""
+    os.environ["MARKET_HISTORY_REFRESH_INTERVAL"] = "0"
+    os.environ.setdefault("ZILLOW_RATE_PER_SECOND", "100000")
+    os.environ.setdefault("ZILLOW_BURST", "100000")
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["MARKET_HISTORY_PATH"] = os.path.join(tmp.name, "market_history.jsonl")
+    zillow = stubs.servers["zillow"]
+    zillow.routes["/market_data"] = market_page_responder(zillow.routes["/market_data"])
+    import requests
+
+    import app
+    from market_compare import compare_markets
+
+    server, thread, base_url = start_server(app.app)
+    session = requests.Session()
+    results = []
+    try:
+        for count in [int(n) for n in args.locations.split(",") if n.strip()]:
+            row = {"locations": count}
+            for run, (name, path) in enumerate((("sequential", "/api/market_trends"), ("cold", "/api/market_compare"),
+                                                ("warm", "/api/market_compare"))):
+                # sequential and cold each start from locations nobody asked for yet
+                locations = [f"Town {count}-{min(run, 1)}-{i}, ST" for i in range(count)]
+                zillow.reset()
+                start = time.perf_counter()
+                if name == "sequential":
+                    size = 0
+                    for location in locations:
+                        response = session.post(base_url + path, json={"location": location})
+                        response.raise_for_status()
+                        size += len(response.content)
+                else:
+                    response = session.post(base_url + path, json={"locations": locations, "months": 24})
+                    response.raise_for_status()
+                    size = len(response.content)
+                row[f"{name}_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                row[f"{name}_bytes"] = size
+                row[f"{name}_upstream_calls"] = sum(zillow.calls.values())
+            print(json.dumps(row))
+            results.append(row)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+        stubs.stop()
+        tmp.cleanup()
+
+    rents = matrix(args.matrix_locations, args.matrix_months)
+    names = [f"Town {i}" for i in range(len(rents))]
+    labels = [str(i) for i in range(args.matrix_months)]
+    latest = [{} for _ in names]
+    start = time.perf_counter()
+    compared = compare_markets(names, names, labels, rents, latest)
+    vectorized = time.perf_counter() - start
+    rows = rents.tolist()
+    start = time.perf_counter()
+    reference = python_metrics(rows)
+    loop = time.perf_counter() - start
+    mismatches = sum(1 for row, expected in zip(compared["metrics"]["rows"], reference)
+                     if expected and (abs(row[5] - expected["trend"]) > 0.01 or row[6] != expected["rentRank"]))
+    in_process = {"matrix": f"{args.matrix_locations}x{args.matrix_months}",
+                  "compare_markets_ms": round(vectorized * 1000, 2), "python_loop_ms": round(loop * 1000, 2),
+                  "mismatches": mismatches}
+    print(json.dumps(in_process))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "in_process": in_process}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
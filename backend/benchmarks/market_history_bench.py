@@ -0,0 +1,199 @@
+# market_history_bench.py
+"""
+Market trend queries from the local history (market_history.py) vs from the
+upstream response.
+
+Generates --locations synthetic locations with --years of monthly median
+rents and feeds them to a MarketHistory as /market_data pages, one per
+location and year (each page carries its current and previous year, as
+Zillow's does). Reports:
+
+- ingestion: ms per page for the backfill, then ms per page and log lines
+  written for one more month per location (the incremental update a
+  monthly refresh makes)
+- log size and the time to replay it at start-up
+- in-process queries: p50/p99 of trends() over a location's full history
+  and over the last --range-years, against recomputing the same rollups
+  from the location's points on every query
+- over HTTP, with the Zillow stub answering instantly: /api/market_trends
+  (a fetch and derivation per request) against /api/market_history
+
+Usage:
+    python benchmarks/market_history_bench.py [--locations 1000] [--years 20] [--queries 500]
+        [--range-years 5] [--output market_history.json]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from endpoint_bench import percentile, start_server  # noqa: E402
+from upstream_stubs import UpstreamStubs  # noqa: E402
+
+MONTH_NAMES = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+FIRST_YEAR = 2000
+
+
+def rent_series(months, rng):
+    """Median rents of months consecutive months: a drifting random walk."""
+    rent, rents = rng.uniform(800, 3000), []
+    for _ in range(months):
+        rent *= 1 + rng.gauss(0.003, 0.01)
+        rents.append(round(rent))
+    return rents
+
+
+def market_page(name, rents, last_month):
+    """A marketPage as of month number last_month (0 = Jan FIRST_YEAR), like Zillow's."""
+    year = FIRST_YEAR + last_month // 12
+
+    def months(year_number):
+        first = (year_number - FIRST_YEAR) * 12
+        return [{"month": MONTH_NAMES[i], "year": str(year_number), "price": rents[first + i]}
+                for i in range(12) if 0 <= first + i <= last_month]
+
+    return {
+        "areaName": name,
+        "areaType": "city",
+        "date": f"{year}-{last_month % 12 + 1:02d}-01",
+        "marketTemperature": {"temperature": "WARM"},
+        "summary": {"medianRent": rents[last_month], "availableRentals": 1000 + last_month},
+        "medianRentPriceOverTime": {"currentYear": months(year), "prevYear": months(year - 1)},
+    }
+
+
+def recompute(points, start=None, end=None):
+    """The rollups of one location built from its points, as a query would without precomputed rows."""
+    months = sorted(month for month in points if (start is None or month >= start) and (end is None or month <= end))
+    monthly, quarters, years = [], {}, {}
+    for month in months:
+        rent = points[month]
+        previous, last_year = points.get(month - 1), points.get(month - 12)
+        monthly.append({"month": month, "median_rent": rent,
+                        "mom": (rent / previous - 1) * 100 if previous else None,
+                        "yoy": (rent / last_year - 1) * 100 if last_year else None})
+        quarters.setdefault(month // 3, []).append(rent)
+        years.setdefault(month // 12, []).append(rent)
+    return monthly, {q: statistics.fmean(v) for q, v in quarters.items()}, {y: statistics.fmean(v) for y, v in years.items()}
+
+
+def timings_ms(fn, count):
+    samples = []
+    for i in range(count):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {"p50_ms": round(percentile(samples, 0.5), 3), "p99_ms": round(percentile(samples, 0.99), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--locations", type=int, default=1000)
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--range-years", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    stubs = UpstreamStubs({"zillow": 0}).start()
+    os.environ.update(stubs.env())
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["WARMUP_ON_STARTUP"] = "false"
+    os.environ["PROPERTY_SEED_PATHS"] = ""
+    os.environ["MARKET_HISTORY_REFRESH_INTERVAL"] = "0"
+    os.environ.setdefault("ZILLOW_RATE_PER_SECOND", "100000")
+    os.environ.setdefault("ZILLOW_BURST", "100000")
+    tmp = tempfile.TemporaryDirectory()
+    path = os.path.join(tmp.name, "market_history.jsonl")
+    os.environ["MARKET_HISTORY_PATH"] = path
+
+    import market_history
+
+    rng = random.Random(0)
+    months = args.years * 12
+    names = [f"Town {i}, ST" for i in range(args.locations)]
+    series = {name: rent_series(months + 1, rng) for name in names}
+    history = market_history.MarketHistory(path)
+
+    pages = [(name, market_page(name, series[name], min(year * 12 + 11, months - 1)))
+             for year in range(args.years) for name in names]
+    start = time.perf_counter()
+    for name, page in pages:
+        history.record(page, name)
+    backfill_seconds = time.perf_counter() - start
+
+    written = history.stats["lines_written"]
+    start = time.perf_counter()
+    for name in names:
+        history.record(market_page(name, series[name], months), name)
+    update_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reloaded = market_history.MarketHistory(path)
+    lines = reloaded.load()
+    load_seconds = time.perf_counter() - start
+
+    points = {name: {market_history.month_index(FIRST_YEAR, 1) + m: rent for m, rent in enumerate(series[name])}
+              for name in names}
+    range_start = market_history.month_label(market_history.month_index(FIRST_YEAR, 1) + months - args.range_years * 12)
+    range_start_index = market_history.parse_month(range_start)
+    pick = [rng.choice(names) for _ in range(args.queries)]
+    result = {
+        "locations": args.locations,
+        "years": args.years,
+        "points": history.metrics()["points"],
+        "backfill_ms_per_page": round(backfill_seconds * 1000 / len(pages), 4),
+        "new_month_ms_per_page": round(update_seconds * 1000 / len(names), 4),
+        "new_month_lines_per_page": round((history.stats["lines_written"] - written) / len(names), 2),
+        "log_bytes": os.path.getsize(path),
+        "log_lines": lines,
+        "load_ms": round(load_seconds * 1000, 1),
+        "full_history": timings_ms(lambda i: history.trends(pick[i]), args.queries),
+        "full_history_recompute": timings_ms(lambda i: recompute(points[pick[i]]), args.queries),
+        f"last_{args.range_years}_years": timings_ms(lambda i: history.trends(pick[i], range_start), args.queries),
+        f"last_{args.range_years}_years_recompute": timings_ms(
+            lambda i: recompute(points[pick[i]], range_start_index), args.queries),
+    }
+    print(json.dumps(result, indent=2))
+
+    import requests
+
+    import app
+
+    server, thread, base_url = start_server(app.app)
+    session = requests.Session()
+    try:
+        # Chicago, IL from the stub's /market_data fixture, stored by the first request
+        session.post(base_url + "/api/market_trends", json={"location": "Chicago, IL"}).raise_for_status()
+        for name, path_, body in (("market_trends", "/api/market_trends", {"location": "Chicago, IL"}),
+                                  ("market_history", "/api/market_history", {"location": "Chicago, IL"})):
+            sizes = []
+
+            def request(i):
+                response = session.post(base_url + path_, json=body)
+                response.raise_for_status()
+                sizes.append(len(response.content))
+
+            result[f"http_{name}"] = {**timings_ms(request, min(args.queries, 200)), "bytes": sizes[-1]}
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+        stubs.stop()
+        tmp.cleanup()
+    print(json.dumps({key: result[key] for key in ("http_market_trends", "http_market_history")}, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# query_classifier_bench.py
+"""
+Accuracy and latency of the local query classifier (query_classifier.py).
+
+Runs stratified k-fold cross-validation over the labeled set and reports
+overall and per-label accuracy and the confusion matrix. It also reports
+coverage (the share of queries confident enough to skip the LLM) and the
+accuracy on that share at --threshold. Latency covers training on the full
+set and single predictions (p50/p99 in microseconds).
+
+Usage:
+    python benchmarks/query_classifier_bench.py [--folds 5] [--threshold 0.7]
+        [--data data/query_labels.jsonl] [--output classifier.json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import query_classifier  # noqa: E402
+from endpoint_bench import percentile  # noqa: E402
+
+
+def stratified_folds(examples, folds, seed):
+    by_label = defaultdict(list)
+    for example in examples:
+        by_label[example[1]].append(example)
+    rng = random.Random(seed)
+    assignment = [[] for _ in range(folds)]
+    for label in sorted(by_label):
+        rows = by_label[label]
+        rng.shuffle(rows)
+        for i, row in enumerate(rows):
+            assignment[i % folds].append(row)
+    return assignment
+
+
+def cross_validate(examples, folds, threshold, seed):
+    predictions = []
+    for k, test in enumerate(stratified_folds(examples, folds, seed)):
+        train = [row for i, fold in enumerate(stratified_folds(examples, folds, seed)) if i != k for row in fold]
+        model = query_classifier.QueryClassifier().fit(train)
+        for text, label in test:
+            prediction = model.predict(text)
+            predictions.append((label, prediction.label, prediction.confidence))
+
+    total = len(predictions)
+    correct = sum(1 for label, predicted, _ in predictions if label == predicted)
+    confident = [(label, predicted) for label, predicted, confidence in predictions if confidence >= threshold]
+    per_label = {}
+    for label in query_classifier.LABELS:
+        rows = [p for p in predictions if p[0] == label]
+        if rows:
+            per_label[label] = {"n": len(rows), "accuracy": round(sum(1 for p in rows if p[1] == label) / len(rows), 3)}
+    confusion = Counter(f"{label}->{predicted}" for label, predicted, _ in predictions if label != predicted)
+    return {
+        "examples": total,
+        "accuracy": round(correct / total, 3),
+        "per_label": per_label,
+        "coverage_at_threshold": round(len(confident) / total, 3),
+        "accuracy_when_confident": round(sum(1 for l, p in confident if l == p) / len(confident), 3) if confident else None,
+        "errors": dict(confusion.most_common()),
+    }
+
+
+def latency(examples, repeats):
+    start = time.perf_counter()
+    model = query_classifier.QueryClassifier().fit(examples)
+    train_ms = (time.perf_counter() - start) * 1000
+    timings = []
+    for _ in range(repeats):
+        for text, _label in examples:
+            start = time.perf_counter()
+            model.predict(text)
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "train_ms": round(train_ms, 1),
+        "predict_p50_us": round(percentile(timings, 0.50) * 1e6, 1),
+        "predict_p99_us": round(percentile(timings, 0.99) * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=query_classifier.THRESHOLD)
+    parser.add_argument("--data", default=query_classifier.DATA_PATH)
+    parser.add_argument("--repeats", type=int, default=20, help="prediction passes over the data for latency")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    examples = query_classifier.load_examples(args.data)
+    report = {"threshold": args.threshold, **cross_validate(examples, args.folds, args.threshold, args.seed),
+              **latency(examples, args.repeats)}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
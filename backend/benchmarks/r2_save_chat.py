@@ -0,0 +1,79 @@
+# r2_save_chat.py
+"""
+Benchmark /api/save_chat against a local S3-compatible stand-in.
+
+Compares the old request path (build a new boto3 client and put_object
+synchronously on every save) with the shared client plus background upload
+queue now used by the endpoint.
+
+Usage:
+    python benchmarks/r2_save_chat.py [--requests 200] [--put-latency 0.05]
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from s3_stub import S3Stub  # noqa: E402
+
+
+def summarize(name, latencies):
+    latencies = sorted(latencies)
+    return {
+        "mode": name,
+        "requests": len(latencies),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--put-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    stub = S3Stub(put_latency=args.put_latency).start()
+    os.environ["R2_ENDPOINT_URL"] = stub.url
+    os.environ.setdefault("CLOUDFLARE_KEY", "bench")
+    os.environ.setdefault("CLOUDFLARE_SECRET", "bench")
+
+    logging.disable(logging.INFO)
+    from fastapi.testclient import TestClient
+    import app as backend
+    from r2_storage import new_r2_service, upload_queue
+
+    messages = [{"sender": "user", "text": f"message {i}"} for i in range(20)]
+    payload = {"session_id": "bench", "messages": messages, "zipCodes": ["60616"]}
+
+    # Old path: new client and a synchronous put_object per save
+    legacy = []
+    for i in range(args.requests):
+        start = time.perf_counter()
+        new_r2_service().upload_json_to_r2(f"legacy_{i}.json", payload)
+        legacy.append(time.perf_counter() - start)
+
+    with TestClient(backend.app) as client:
+        queued = []
+        for i in range(args.requests):
+            start = time.perf_counter()
+            response = client.post("/api/save_chat", json=payload)
+            queued.append(time.perf_counter() - start)
+            assert response.status_code == 200 and response.json()["r2_upload"], response.text
+        drain_start = time.perf_counter()
+    drain = time.perf_counter() - drain_start
+
+    stub.stop()
+    print(json.dumps(summarize("legacy_new_client_sync_put", legacy)))
+    print(json.dumps({**summarize("shared_client_background_queue", queued),
+                      "drain_seconds": round(drain, 2), "uploads": upload_queue.metrics()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# s3_stub.py
+"""
+In-memory S3-compatible stand-in for R2, good enough for boto3's
+PutObject, GetObject, ListObjectsV2 and DeleteObjects with path-style URLs.
+"""
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape, unescape
+
+
+class S3Stub:
+    def __init__(self, put_latency: float = 0.0):
+        self.put_latency = put_latency
+        self.objects = {}
+        self.lock = threading.Lock()
+        self.stats = {"put": 0, "get": 0, "list": 0, "delete": 0, "bytes_put": 0}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1 so boto3's "Expect: 100-continue" is answered instead of timing out
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this the client waits on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def _split(self):
+                parsed = urllib.parse.urlparse(self.path)
+                parts = parsed.path.lstrip("/").split("/", 1)
+                key = urllib.parse.unquote(parts[1]) if len(parts) > 1 else ""
+                return parts[0], key, urllib.parse.parse_qs(parsed.query, keep_blank_values=True)
+
+            def _reply(self, status, body=b"", content_type="application/xml", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self):
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_PUT(self):
+                bucket, key, _ = self._split()
+                body = self._body()
+                time.sleep(stub.put_latency)
+                with stub.lock:
+                    stub.objects[(bucket, key)] = (body, self.headers.get("Content-Type", ""))
+                    stub.stats["put"] += 1
+                    stub.stats["bytes_put"] += len(body)
+                self._reply(200, headers={"ETag": '"stub"'})
+
+            def do_GET(self):
+                bucket, key, query = self._split()
+                if not key:
+                    prefix = query.get("prefix", [""])[0]
+                    with stub.lock:
+                        stub.stats["list"] += 1
+                        listing = sorted((k, len(body)) for (b, k), (body, _) in stub.objects.items()
+                                         if b == bucket and k.startswith(prefix))
+                    contents = "".join(
+                        f"<Contents><Key>{escape(k)}</Key><Size>{size}</Size></Contents>" for k, size in listing
+                    )
+                    body = (f"<ListBucketResult><Name>{bucket}</Name><Prefix>{escape(prefix)}</Prefix>"
+                            f"<KeyCount>{len(listing)}</KeyCount><IsTruncated>false</IsTruncated>{contents}"
+                            f"</ListBucketResult>").encode()
+                    return self._reply(200, body)
+                with stub.lock:
+                    stub.stats["get"] += 1
+                    item = stub.objects.get((bucket, key))
+                if item is None:
+                    body = f"<Error><Code>NoSuchKey</Code><Key>{escape(key)}</Key></Error>".encode()
+                    return self._reply(404, body)
+                self._reply(200, item[0], content_type=item[1] or "application/octet-stream")
+
+            def do_POST(self):
+                bucket, _, query = self._split()
+                body = self._body().decode()
+                if "delete" not in query:
+                    return self._reply(400)
+                keys = [unescape(key) for key in re.findall(r"<Key>(.*?)</Key>", body)]
+                with stub.lock:
+                    for key in keys:
+                        stub.objects.pop((bucket, key), None)
+                    stub.stats["delete"] += len(keys)
+                self._reply(200, b"<DeleteResult></DeleteResult>")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
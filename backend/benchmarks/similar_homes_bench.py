@@ -0,0 +1,181 @@
+# similar_homes_bench.py
+"""
+"Similar homes" k-NN latency at 10k and 1M listings.
+
+For each --listings size, generates RAW_COLUMNS values and home types for
+that many listings spread over a metro area and builds a SimilarHomesIndex
+from the arrays (SimilarHomesIndex.from_columns). Reports:
+
+- build time and vector memory
+- p50/p99 of k=--k queries for random listings, with and without
+  same_type, and for a query without coordinates
+- for sizes up to --naive-max: a row-by-row Python scan computing the same
+  distances, to check the results and show the brute-force cost
+- applying --updates changed listings (queued, then applied by one query)
+
+--store-listings also builds the index through PropertyStore.similar_homes()
+from generated property records, as the backend does.
+
+Usage:
+    python benchmarks/similar_homes_bench.py [--listings 10000,1000000] [--k 10] [--queries 200]
+        [--store-listings 10000] [--output similar_homes.json]
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from endpoint_bench import percentile  # noqa: E402
+
+
+def generate(count, seed=0):
+    """RAW_COLUMNS values and home type codes of count listings."""
+    import numpy as np
+
+    from similar_homes import HOME_TYPES
+
+    rng = np.random.default_rng(seed)
+    beds = rng.integers(1, 6, count).astype(np.float64)
+    sqft = np.round(rng.normal(500 + 450 * beds, 250).clip(350, 8000))
+    latitude = rng.normal(41.85, 0.12, count)
+    longitude = rng.normal(-87.70, 0.12, count)
+    # Price per sqft falls away from the center
+    per_sqft = 420 - 900 * np.hypot(latitude - 41.88, longitude + 87.63) + rng.normal(0, 40, count)
+    raw = np.column_stack([
+        np.round(sqft * per_sqft.clip(80, None), -2),
+        beds,
+        np.minimum(beds, rng.integers(1, 4, count)).astype(np.float64),
+        sqft,
+        rng.integers(1890, 2024, count).astype(np.float64),
+        latitude,
+        longitude,
+    ])
+    # A few listings without year_built or sqft, as in Zillow results
+    raw[rng.random(count) < 0.05, 4] = np.nan
+    raw[rng.random(count) < 0.02, 3] = np.nan
+    types = rng.integers(0, len(HOME_TYPES), count).astype(np.int8)
+    return raw, types
+
+
+def naive_nearest(index, raw, types, query_row, k):
+    """Distances one listing at a time, from the index's own vectors."""
+    query = [float(v) for v in index.vectors[:, query_row]]
+    best = []
+    for row in range(index.count):
+        if row == query_row:
+            continue
+        vector = index.vectors[:, row]
+        total = 0.0
+        for a, b in zip(vector.tolist(), query):
+            total += (a - b) * (a - b)
+        if not math.isnan(total):
+            best.append((total, row))
+    best.sort()
+    return [row for _, row in best[:k]]
+
+
+def latency(fn, queries):
+    samples = []
+    for i in range(queries):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {"p50_ms": round(percentile(samples, 0.5), 3), "p99_ms": round(percentile(samples, 0.99), 3)}
+
+
+def bench_size(count, args):
+    import numpy as np
+
+    from similar_homes import HOME_TYPES, SimilarHomesIndex
+
+    raw, types = generate(count)
+    ids = [str(5000000 + i) for i in range(count)]
+    start = time.perf_counter()
+    index = SimilarHomesIndex.from_columns(raw, types, ids)
+    row = {"listings": count, "build_seconds": round(time.perf_counter() - start, 3),
+           "vector_mb": round(index.vectors[:, :count].nbytes / 2**20, 1)}
+    picks = np.random.default_rng(1).integers(0, count, args.queries)
+
+    def query(i, same_type=False, located=True):
+        target = int(picks[i])
+        values = raw[target].copy()
+        if not located:
+            values[-2:] = np.nan
+        return index.nearest(values, HOME_TYPES[types[target]], args.k, ids[target], same_type)
+
+    row["query"] = latency(query, args.queries)
+    row["query_same_type"] = latency(lambda i: query(i, same_type=True), args.queries)
+    row["query_without_location"] = latency(lambda i: query(i, located=False), args.queries)
+    if count <= args.naive_max:
+        target = int(picks[0])
+        fast = [key for key, _ in query(0)]
+        start = time.perf_counter()
+        slow = [ids[r] for r in naive_nearest(index, raw, types, target, args.k)]
+        row["naive_scan_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        row["naive_matches_index"] = fast == slow
+
+    changed = []
+    for i in picks[:args.updates]:
+        values = raw[int(i)]
+        changed.append({"id": ids[int(i)], "price": float(values[0]) * 1.05, "bedrooms": float(values[1]),
+                        "bathrooms": float(values[2]), "sqft": float(values[3]), "year_built": float(values[4]),
+                        "coordinates": {"latitude": float(values[5]), "longitude": float(values[6])},
+                        "home_type": HOME_TYPES[types[int(i)]]})
+    start = time.perf_counter()
+    index.update(changed)
+    query(0)
+    row["updates"] = {"records": len(changed), "apply_and_query_ms": round((time.perf_counter() - start) * 1000, 1)}
+    return row
+
+
+def bench_store(count, args):
+    from property_retriever import PropertyRetriever
+    from property_store import PropertyStore
+    from snapshot_bench import build_records
+
+    store = PropertyStore()
+    records = build_records(count)
+    store.upsert(records, "seed")
+    start = time.perf_counter()
+    store.similar_homes()
+    build = time.perf_counter() - start
+    retriever = PropertyRetriever(store)
+    return {"listings": count, "build_seconds": round(build, 3),
+            "retriever_query": latency(lambda i: retriever.similar_homes(records[i * 7 % count]["id"], args.k),
+                                       args.queries)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", default="10000,1000000")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--updates", type=int, default=100)
+    parser.add_argument("--naive-max", type=int, default=10000)
+    parser.add_argument("--store-listings", type=int, default=10000)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    os.environ["PROPERTY_SEED_PATHS"] = ""
+    result = {"k": args.k, "sizes": []}
+    for count in [int(n) for n in args.listings.split(",") if n.strip()]:
+        row = bench_size(count, args)
+        print(json.dumps(row))
+        result["sizes"].append(row)
+    if args.store_listings:
+        result["store"] = bench_store(args.store_listings, args)
+        print(json.dumps(result["store"]))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# snapshot_bench.py
+"""
+Startup time and per-worker memory: JSON seed files vs a property snapshot.
+
+Generates --listings property records (search fields plus a description
+and features), writes them as a JSONL seed file and as a snapshot, then:
+
+- load time: load_files() of the seed file into an empty PropertyStore,
+  against opening the snapshot (PropertySnapshot + PropertyStore)
+- memory: starts --workers processes that each load the store one way, run
+  a few PropertyRetriever searches and then hold the store while the
+  others start. Reports RSS and PSS (proportional set size, which divides
+  shared pages between the processes that map them) per worker, read from
+  /proc/<pid>/smaps_rollup, minus the same for a process that only
+  imported the modules.
+
+Usage:
+    python benchmarks/snapshot_bench.py [--listings 100000] [--workers 4] [--output snapshot.json]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from listing_stream_bench import search_response  # noqa: E402
+
+WORDS = ("bright", "renovated", "spacious", "quiet", "corner", "updated", "modern", "kitchen", "windows",
+         "lakefront", "garage", "park", "schools", "transit", "light", "views", "hardwood", "storage")
+FEATURES = ("Hardwood floors", "Granite countertops", "Stainless steel appliances", "Backyard", "In-unit laundry",
+            "Balcony", "Concierge", "Fitness center", "Roof deck", "Garage", "Central Air", "Dishwasher")
+
+WORKER = r"""
+import json, os, sys, time
+sys.path.insert(0, {backend!r})
+os.environ["PROPERTY_SEED_PATHS"] = ""
+import numpy, property_store, property_snapshot, property_retriever
+mode, path = sys.argv[1], sys.argv[2]
+
+def usage():
+    values = {{}}
+    with open(f"/proc/{{os.getpid()}}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                values[parts[0][:-1].lower()] = int(parts[1])
+    return values
+
+start = time.perf_counter()
+if mode == "json":
+    store = property_store.PropertyStore()
+    property_store.load_files(store, [path])
+elif mode == "snapshot":
+    store = property_store.PropertyStore(snapshot=property_snapshot.PropertySnapshot(path))
+else:
+    store = property_store.PropertyStore()
+loaded = time.perf_counter() - start
+retriever = property_retriever.PropertyRetriever(store)
+for kwargs in ({{"min_price": 900000, "min_beds": 4}}, {{"location": "Chicago", "max_price": 250000}},
+               {{"property_type": "Condo", "min_baths": 2}}):
+    retriever.search_properties(**kwargs)
+print(json.dumps({{"load_seconds": loaded, "store_rows": len(store)}}), flush=True)
+sys.stdin.readline()
+print(json.dumps(usage()), flush=True)
+sys.stdin.readline()
+"""
+
+
+def build_records(count, seed=0):
+    import property_store
+
+    rng = random.Random(seed)
+    records = []
+    for result in search_response(count)["results"]:
+        record = property_store.record_from_search(result)
+        record["description"] = " ".join(rng.choice(WORDS) for _ in range(30)).capitalize() + "."
+        record["features"] = rng.sample(FEATURES, 4)
+        record["year_built"] = 1900 + rng.randrange(124)
+        records.append(record)
+    return records
+
+
+def run_workers(mode, path, workers):
+    script = WORKER.format(backend=BACKEND_DIR)
+    processes = [subprocess.Popen([sys.executable, "-c", script, mode, path], stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE, text=True) for _ in range(workers)]
+    loads = [json.loads(process.stdout.readline()) for process in processes]
+    # Every worker has loaded and searched; measure them while all are alive
+    for process in processes:
+        process.stdin.write("\n")
+        process.stdin.flush()
+    usages = [json.loads(process.stdout.readline()) for process in processes]
+    for process in processes:
+        process.stdin.write("\n")
+        process.stdin.flush()
+        process.wait()
+    return loads, usages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, default=100000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    os.environ["PROPERTY_SEED_PATHS"] = ""
+    import property_snapshot
+    import property_store
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seed_path = os.path.join(tmp, "seed.jsonl")
+        snapshot_path = os.path.join(tmp, "properties.snap")
+        records = build_records(args.listings)
+        with open(seed_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        start = time.perf_counter()
+        property_snapshot.write_snapshot(records, snapshot_path)
+        write_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        store = property_store.PropertyStore()
+        property_store.load_files(store, [seed_path])
+        json_seconds = time.perf_counter() - start
+        del store
+        start = time.perf_counter()
+        store = property_store.PropertyStore(snapshot=property_snapshot.PropertySnapshot(snapshot_path))
+        snapshot_seconds = time.perf_counter() - start
+
+        result = {
+            "listings": args.listings,
+            "seed_bytes": os.path.getsize(seed_path),
+            "snapshot_bytes": os.path.getsize(snapshot_path),
+            "snapshot_write_seconds": round(write_seconds, 3),
+            "json_load_ms": round(json_seconds * 1000, 1),
+            "snapshot_open_ms": round(snapshot_seconds * 1000, 3),
+            "workers": args.workers,
+        }
+        _, (baseline,) = run_workers("empty", "", 1)
+        for mode, path in (("json", seed_path), ("snapshot", snapshot_path)):
+            loads, usages = run_workers(mode, path, args.workers)
+            result[f"{mode}_worker_load_ms"] = round(max(load["load_seconds"] for load in loads) * 1000, 1)
+            result[f"{mode}_rss_mb_per_worker"] = round(
+                sum(usage["rss"] - baseline["rss"] for usage in usages) / len(usages) / 1024, 1)
+            result[f"{mode}_pss_mb_per_worker"] = round(
+                sum(usage["pss"] - baseline["pss"] for usage in usages) / len(usages) / 1024, 1)
+        print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# text_search_bench.py
+"""
+Full-text search over listing descriptions and features at 100k+ listings.
+
+Generates --listings property records (see snapshot_bench.build_records)
+with descriptions drawn from a Zipf-distributed vocabulary of --vocabulary
+words, so common words match most listings and rare ones a handful, upserts
+them into a PropertyStore, and measures:
+
+- build: time for PropertyStore.text_index() to index every record, plus the
+  same over a snapshot-backed store
+- queries: p50/p99 of PropertyRetriever.search_properties() for keyword,
+  amenity and keyword+filter searches, against a naive scan that tokenizes
+  every record's description and features, applies the same filters and
+  sorts by the number of matching words (what a ranked search without the
+  index has to do)
+- updates: records re-indexed per second when upserts change descriptions
+
+Usage:
+    python benchmarks/text_search_bench.py [--listings 100000] [--rounds 50] [--output text_search.json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from endpoint_bench import percentile  # noqa: E402
+from snapshot_bench import WORDS, build_records  # noqa: E402
+
+QUERIES = {
+    "common_keywords": {"keywords": "renovated lakefront views", "limit": 20},
+    "rare_keywords": {"keywords": "skylight wainscoting", "limit": 20},
+    "amenities": {"amenities": ["In-unit laundry", "Roof deck"], "limit": 20},
+    "keywords_filtered": {"keywords": "quiet hardwood", "min_beds": 3, "max_price": 600000, "limit": 20},
+    "rare_keywords_filtered": {"keywords": "skylight wainscoting", "min_beds": 4, "limit": 20},
+    "keywords_unlimited": {"keywords": "garage"},
+}
+RARE_WORDS = ("skylight", "wainscoting")
+
+
+def vocabulary(size):
+    """WORDS first (most frequent), then generated words, then RARE_WORDS."""
+    rng = random.Random(2)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    generated = {"".join(rng.choice(letters) for _ in range(rng.randrange(5, 10))) for _ in range(size)}
+    return list(WORDS) + sorted(generated)[:max(size - len(WORDS) - len(RARE_WORDS), 0)] + list(RARE_WORDS)
+
+
+def describe(rng, words, weights):
+    return " ".join(rng.choices(words, weights, k=30)).capitalize() + "."
+
+
+def naive_search(records, keywords=None, amenities=(), limit=None, **criteria):
+    """Tokenize every record, filter, and rank by matching query words."""
+    from property_retriever import PropertyRetriever
+    from text_index import tokenize
+
+    words = set(tokenize(keywords))
+    required = [set(tokenize(amenity)) for amenity in amenities]
+    filters = [criteria.get(name) for name in
+               ("location", "min_price", "max_price", "min_beds", "min_baths", "property_type")]
+    scored = []
+    for record in records:
+        terms = set(tokenize(record.get("description")))
+        for feature in record.get("features") or ():
+            terms.update(tokenize(feature))
+        if words and not words & terms:
+            continue
+        if not all(phrase <= terms for phrase in required):
+            continue
+        if not PropertyRetriever._matches(record, *filters):
+            continue
+        scored.append((len(words & terms), record))
+    scored.sort(key=lambda item: -item[0])
+    return [record for _, record in scored[:limit]]
+
+
+def timings(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {"p50_ms": round(percentile(samples, 0.5), 2), "p99_ms": round(percentile(samples, 0.99), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--updates", type=int, default=10000)
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    os.environ["PROPERTY_SEED_PATHS"] = ""
+    import property_retriever
+    import property_snapshot
+    import property_store
+
+    rng = random.Random(1)
+    words = vocabulary(args.vocabulary)
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    records = build_records(args.listings)
+    for record in records:
+        record["description"] = describe(rng, words, weights)
+    store = property_store.PropertyStore()
+    store.upsert(records, "seed")
+    start = time.perf_counter()
+    index = store.text_index()
+    build_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "properties.snap")
+        property_snapshot.write_snapshot(records, path)
+        snapshot_store = property_store.PropertyStore(snapshot=property_snapshot.PropertySnapshot(path))
+        start = time.perf_counter()
+        snapshot_store.text_index()
+        snapshot_build_seconds = time.perf_counter() - start
+        snapshot_retriever = property_retriever.PropertyRetriever(snapshot_store)
+        snapshot_query = timings(lambda: snapshot_retriever.search_properties(**QUERIES["keywords_filtered"]),
+                                 args.rounds)
+        del snapshot_retriever, snapshot_store
+
+    retriever = property_retriever.PropertyRetriever(store)
+    result = {
+        "listings": args.listings,
+        "index": index.metrics(),
+        "build_seconds": round(build_seconds, 2),
+        "snapshot_build_seconds": round(snapshot_build_seconds, 2),
+        "snapshot_keywords_filtered": snapshot_query,
+        "queries": {},
+    }
+    for name, kwargs in QUERIES.items():
+        result["queries"][name] = {
+            "results": len(retriever.search_properties(**kwargs)),
+            "index": timings(lambda: retriever.search_properties(**kwargs), args.rounds),
+            "naive_scan": timings(lambda: naive_search(records, **kwargs), 3),
+        }
+
+    changed = []
+    for record in rng.sample(records, min(args.updates, len(records))):
+        record = dict(record)
+        record["description"] = describe(rng, words, weights)
+        changed.append(record)
+    start = time.perf_counter()
+    for offset in range(0, len(changed), 100):
+        store.upsert(changed[offset:offset + 100], "search")
+    update_seconds = time.perf_counter() - start
+    result["updates"] = {"records": len(changed), "seconds": round(update_seconds, 3),
+                         "records_per_second": round(len(changed) / update_seconds),
+                         "index_after": index.metrics()}
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+# upstream_stubs.py
+"""
+Local stand-ins for every external service the backend calls.
+
+Each upstream gets its own HTTP server answering from recorded fixtures
+(benchmarks/fixtures/upstream_fixtures.json), with configurable latency and
+error injection and a per-path call counter:
+
+    zillow        zillow56 on RapidAPI (search, propertyV2, photos, ...)
+    serpapi       SerpAPI google_local search
+    nominatim     OpenStreetMap geocode / reverse
+    deepl         DeepL /v2/translate (echoes the text tagged with the target language)
+    azure_openai  Azure OpenAI chat completions, answered by fake_llm_reply(), with
+                  prompt caching emulated by PromptPrefixCache
+    r2            S3-compatible object store (s3_stub.S3Stub)
+
+UpstreamStubs.env() returns the environment variables that point the app at
+the stubs; they must be set before importing app.
+
+Usage as a standalone server (prints the env vars to export):
+    python benchmarks/upstream_stubs.py [--latency 0.05] [--error-rate 0.0]
+"""
+import argparse
+import collections
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+from s3_stub import S3Stub
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "upstream_fixtures.json")
+
+UPSTREAMS = ("zillow", "serpapi", "nominatim", "deepl", "azure_openai", "r2")
+
+CHAT_REPLY = (
+    "There are several homes for sale in this area right now; the [[properties]] list shows them with prices "
+    "and sizes. Prices have been rising slowly, which you can see under [[market trends]]. If schools matter "
+    "to you, [[property schools]] lists the closest ones."
+)
+
+FEATURES_REPLY = {
+    "location": "60616", "propertyType": "house", "bedrooms": 3, "bathrooms": 2,
+    "priceRange": {"min": None, "max": 650000}, "amenities": ["garage"], "queryType": "property",
+    "keywords": ["quiet"], "sortBy": None,
+}
+
+
+def prompt_kind(messages) -> str:
+    """Which of the app's LLM calls a message list belongs to."""
+    prompt = messages[-1].get("content", "") if messages else ""
+    if "Classify the following real estate question" in prompt:
+        return "classify_query"
+    if "Extract structured data from this query" in prompt:
+        return "extract_features"
+    return "chat"
+
+
+def fake_llm_reply(messages) -> str:
+    """Deterministic reply to a chat-completions message list, keyed on the prompt kind."""
+    kind = prompt_kind(messages)
+    if kind == "classify_query":
+        return "Regional"
+    if kind == "extract_features":
+        return json.dumps(FEATURES_REPLY)
+    return CHAT_REPLY
+
+
+def approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class StubServer:
+    """
+    HTTP server for one upstream.
+
+    Args:
+        name: Upstream name used in reports
+        routes: Path (without query string) -> responder, or the fixture to return as is
+        latency: Seconds to sleep before answering
+        error_rate: Fraction of requests answered with error_status instead
+        error_status: Status used for injected errors (503, or 429 with Retry-After)
+    """
+
+    def __init__(self, name: str, routes: Dict[str, object], latency: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 503, seed: int = 0):
+        self.name = name
+        self.routes = routes
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = collections.Counter()
+        self.errors = collections.Counter()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name=f"stub-{self.name}", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.errors.clear()
+
+    def _respond(self, path: str, query: Dict[str, str], body: bytes) -> Tuple[int, object, Dict[str, str]]:
+        route = self.routes.get(path)
+        if route is None:
+            # Azure puts the deployment name in the path
+            route = next((r for pattern, r in self.routes.items() if pattern.endswith("*")
+                          and path.startswith(pattern[:-1])), None)
+        with self.lock:
+            self.calls[path] += 1
+            inject = self.error_rate > 0 and self.random.random() < self.error_rate
+            if inject:
+                self.errors[path] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if route is None:
+            return 404, {"message": f"no stub route for {path}"}, {}
+        if inject:
+            headers = {"Retry-After": "0"} if self.error_status == 429 else {}
+            return self.error_status, {"message": "injected error"}, headers
+        if callable(route):
+            status, payload = route(query, body)
+            return status, payload, {}
+        return 200, route, {}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this the client waits on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def _handle(self):
+                parsed = urllib.parse.urlsplit(self.path)
+                query = dict(urllib.parse.parse_qsl(parsed.query, keep_blank_values=True))
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+                status, payload, headers = stub._respond(parsed.path, query, body)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _deepl_translate(query, body):
+    form = dict(urllib.parse.parse_qsl(body.decode("utf-8")))
+    target = form.get("target_lang", "EN")
+    return 200, {"translations": [{"detected_source_language": form.get("source_lang", "EN"),
+                                   "text": f"[{target.lower()}] {form.get('text', '')}"}]}
+
+
+class PromptPrefixCache:
+    """
+    Emulates Azure OpenAI prompt caching.
+
+    The serialized prompt is split into blocks of 128 (approximate) tokens
+    chained by hash. A prompt of at least 1024 tokens gets cached_tokens for
+    the leading blocks an earlier request already had, so only a byte-identical
+    prefix counts, in 128-token steps, as with the real service. With
+    prefill_per_1k set, each uncached prompt token adds latency, standing in
+    for time to first token.
+    """
+
+    MIN_TOKENS = 1024
+    INCREMENT = 128
+
+    def __init__(self, prefill_per_1k: float = 0.0, max_entries: int = 100000):
+        self.prefill_per_1k = prefill_per_1k
+        self.max_entries = max_entries
+        self.prefixes = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def lookup(self, messages) -> Tuple[int, int]:
+        """Return (prompt_tokens, cached_tokens) and remember every prefix of messages."""
+        total = sum(approx_tokens(str(m.get("content", ""))) for m in messages)
+        text = "".join(f"<|{m.get('role')}|>{m.get('content', '')}" for m in messages)
+        block = self.INCREMENT * 4
+        digest = hashlib.sha1()
+        matched, matching = 0, True
+        with self.lock:
+            for start in range(0, len(text) - block + 1, block):
+                digest.update(text[start:start + block].encode("utf-8"))
+                key = digest.hexdigest()
+                if matching and key in self.prefixes:
+                    matched += 1
+                    self.prefixes.move_to_end(key)
+                else:
+                    matching = False
+                    self.prefixes[key] = True
+            while len(self.prefixes) > self.max_entries:
+                self.prefixes.popitem(last=False)
+        cached = min(matched * self.INCREMENT, total)
+        if total < self.MIN_TOKENS or cached < self.MIN_TOKENS:
+            cached = 0
+        return total, cached - cached % self.INCREMENT
+
+    def clear(self):
+        with self.lock:
+            self.prefixes.clear()
+
+
+def _azure_chat_completion(query, body, log=None, prefix_cache=None):
+    request = json.loads(body or b"{}")
+    messages = request.get("messages", [])
+    content = fake_llm_reply(messages)
+    if prefix_cache is not None:
+        prompt_tokens, cached_tokens = prefix_cache.lookup(messages)
+        if prefix_cache.prefill_per_1k:
+            time.sleep((prompt_tokens - cached_tokens) / 1000 * prefix_cache.prefill_per_1k)
+    else:
+        prompt_tokens = sum(approx_tokens(str(m.get("content", ""))) for m in messages)
+        cached_tokens = 0
+    completion_tokens = approx_tokens(content)
+    if log is not None:
+        log.append({"kind": prompt_kind(messages), "messages": len(messages), "prompt_tokens": prompt_tokens,
+                    "cached_tokens": cached_tokens})
+    return 200, {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "gpt-4o",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens,
+                  "prompt_tokens_details": {"cached_tokens": cached_tokens}},
+    }
+
+
+class UpstreamStubs:
+    """
+    All upstream stand-ins together.
+
+    Args:
+        latency: Per-upstream latency in seconds, e.g. {"zillow": 0.08, "azure_openai": 0.5}
+        error_rate: Per-upstream error-injection rate
+        fixtures_path: JSON file with {upstream: {path: response}}
+        llm_prefill_per_1k: Extra Azure OpenAI latency in seconds per 1000 uncached prompt tokens
+    """
+
+    def __init__(self, latency: Optional[Dict[str, float]] = None, error_rate: Optional[Dict[str, float]] = None,
+                 fixtures_path: str = FIXTURES_PATH, seed: int = 0, llm_prefill_per_1k: float = 0.0):
+        latency = latency or {}
+        error_rate = error_rate or {}
+        with open(fixtures_path, encoding="utf-8") as f:
+            fixtures = json.load(f)
+        routes = {
+            "zillow": fixtures["zillow"],
+            "serpapi": fixtures["serpapi"],
+            "nominatim": fixtures["nominatim"],
+            "deepl": {"/v2/translate": _deepl_translate},
+            "azure_openai": {"/openai/deployments/*":
+                             lambda q, b: _azure_chat_completion(q, b, self.llm_requests, self.prompt_cache)},
+        }
+        # One entry per chat completion: kind, number of messages, approximate prompt and cached tokens
+        self.llm_requests = []
+        self.prompt_cache = PromptPrefixCache(llm_prefill_per_1k)
+        self.servers = {
+            name: StubServer(name, routes[name], latency.get(name, 0.0), error_rate.get(name, 0.0),
+                             error_status=429 if name == "zillow" else 503, seed=seed)
+            for name in routes
+        }
+        self.s3 = S3Stub(put_latency=latency.get("r2", 0.0))
+        self.s3_baseline = dict(self.s3.stats)
+
+    def start(self):
+        for server in self.servers.values():
+            server.start()
+        self.s3.start()
+        return self
+
+    def stop(self):
+        for server in self.servers.values():
+            server.stop()
+        self.s3.stop()
+
+    def env(self) -> Dict[str, str]:
+        """Environment variables that point app.py at the stubs."""
+        return {
+            "ZILLOW_BASE_URL": self.servers["zillow"].url,
+            "ZILLOW_KEY": "stub",
+            "SERPAPI_BASE_URL": self.servers["serpapi"].url,
+            "SERPAPI_KEY": "stub",
+            "NOMINATIM_URL": self.servers["nominatim"].url,
+            "DEEPL_URL": self.servers["deepl"].url + "/v2/translate",
+            "DEEPL_API_KEY": "stub",
+            "AZURE_ENDPOINT": self.servers["azure_openai"].url,
+            "AZURE_OPENAI_VARE_KEY": "stub",
+            "R2_ENDPOINT_URL": self.s3.url,
+            "CLOUDFLARE_KEY": "stub",
+            "CLOUDFLARE_SECRET": "stub",
+        }
+
+    def reset_counts(self):
+        for server in self.servers.values():
+            server.reset()
+        self.llm_requests.clear()
+        self.prompt_cache.clear()
+        with self.s3.lock:
+            self.s3_baseline = dict(self.s3.stats)
+
+    def call_counts(self) -> Dict[str, Dict[str, int]]:
+        """Calls per upstream and path since the last reset_counts()."""
+        counts = {}
+        for name, server in self.servers.items():
+            with server.lock:
+                paths = {re.sub(r"^/openai/deployments/[^/]+", "/openai/deployments/*", p): n
+                         for p, n in server.calls.items()}
+                counts[name] = {"total": sum(server.calls.values()), "errors": sum(server.errors.values()), **paths}
+        with self.s3.lock:
+            s3 = {k: v - self.s3_baseline.get(k, 0) for k, v in self.s3.stats.items() if k != "bytes_put"}
+        counts["r2"] = {"total": sum(s3.values()), **s3}
+        return counts
+
+
+def parse_per_upstream(value: str, default: float = 0.0) -> Dict[str, float]:
+    """Parse "0.05" or "zillow=0.08,azure_openai=0.5" into a per-upstream dict."""
+    if not value:
+        return {name: default for name in UPSTREAMS}
+    if "=" not in value:
+        return {name: float(value) for name in UPSTREAMS}
+    result = {name: default for name in UPSTREAMS}
+    for item in value.split(","):
+        name, _, number = item.partition("=")
+        if name.strip() not in UPSTREAMS:
+            raise ValueError(f"Unknown upstream {name!r}; expected one of {', '.join(UPSTREAMS)}")
+        result[name.strip()] = float(number)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency", default="", help='seconds, e.g. "0.05" or "zillow=0.08,azure_openai=0.5"')
+    parser.add_argument("--error-rate", default="", help="fraction of requests failing, same format")
+    args = parser.parse_args()
+
+    stubs = UpstreamStubs(parse_per_upstream(args.latency), parse_per_upstream(args.error_rate)).start()
+    for name, value in stubs.env().items():
+        print(f"export {name}={value}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        stubs.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# worker_scaling.py
+"""
+Throughput of the production server (gunicorn + uvicorn workers) by worker count.
+
+Starts the upstream stubs, then for each worker count launches
+`gunicorn -c gunicorn.conf.py app:app` with WEB_CONCURRENCY set, pointed at
+the stubs, and drives a mix of endpoints (round-robin over --endpoints) at
+the given concurrency. Reports throughput and p50/p95 latency per worker
+count, overall and per endpoint, plus the time until the server answered its
+first request.
+
+Worker processes only help up to the number of cores (and the stubs run on
+the same machine), so compare runs made on the same hardware.
+
+Usage:
+    python benchmarks/worker_scaling.py [--workers 1,2,4,8] [--requests 400]
+        [--concurrency 32] [--endpoints health,properties,market_trends,chat]
+        [--latency "zillow=0.08,azure_openai=0.4"] [--no-preload] [--output scaling.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from endpoint_bench import ENDPOINTS, percentile  # noqa: E402
+from upstream_stubs import UpstreamStubs, parse_per_upstream  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_gunicorn(workers, env, preload):
+    import httpx
+
+    port = free_port()
+    env = dict(env, PORT=str(port), WEB_CONCURRENCY=str(workers), GUNICORN_PRELOAD="true" if preload else "false")
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(BACKEND_DIR, "gunicorn.conf.py"),
+         "--bind", f"127.0.0.1:{port}", "app:app"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"gunicorn exited with status {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/api/health", timeout=1).status_code == 200:
+                return process, base_url, time.perf_counter() - start
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    process.terminate()
+    raise SystemExit("gunicorn did not become ready within 60 s")
+
+
+def stop_gunicorn(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def drive_mix(base_url, endpoints, requests, concurrency):
+    import httpx
+
+    latencies, statuses = defaultdict(list), Counter()
+    next_index = iter(range(requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        async def worker():
+            for i in next_index:
+                name = endpoints[i % len(endpoints)]
+                method, path, body_factory = ENDPOINTS[name]
+                body = body_factory(i) if body_factory else None
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    statuses[response.status_code] += 1
+                except Exception as e:
+                    statuses[type(e).__name__] += 1
+                latencies[name].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+
+def summarize(workers, latencies, statuses, elapsed, ready_s):
+    combined = sorted(value for values in latencies.values() for value in values)
+    return {
+        "workers": workers,
+        "ready_s": round(ready_s, 2),
+        "requests": len(combined),
+        "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+        "throughput_rps": round(len(combined) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(combined, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(combined, 0.95) * 1000, 1),
+        "by_endpoint": {
+            name: {"p50_ms": round(percentile(sorted(values), 0.50) * 1000, 1),
+                   "p95_ms": round(percentile(sorted(values), 0.95) * 1000, 1)}
+            for name, values in sorted(latencies.items())
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--endpoints", default="health,properties,market_trends,chat")
+    parser.add_argument("--latency", default="zillow=0.08,serpapi=0.15,nominatim=0.05,deepl=0.06,azure_openai=0.4,r2=0.03",
+                        help='upstream latency in seconds, "0.05" or "zillow=0.08,azure_openai=0.4"')
+    parser.add_argument("--no-preload", action="store_true", help="import the app in each worker instead of the master")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in endpoints if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+
+    stubs = UpstreamStubs(parse_per_upstream(args.latency)).start()
+    env = dict(os.environ, **stubs.env())
+    env.setdefault("LOG_LEVEL", "WARNING")
+    for name in ("ZILLOW", "SERPAPI"):
+        env.setdefault(f"{name}_RATE_PER_SECOND", "100000")
+        env.setdefault(f"{name}_BURST", "100000")
+
+    results = []
+    try:
+        for workers in [int(n) for n in args.workers.split(",")]:
+            process, base_url, ready_s = start_gunicorn(workers, env, not args.no_preload)
+            try:
+                asyncio.run(drive_mix(base_url, endpoints, min(args.concurrency, args.requests), args.concurrency))
+                latencies, statuses, elapsed = asyncio.run(
+                    drive_mix(base_url, endpoints, args.requests, args.concurrency)
+                )
+            finally:
+                stop_gunicorn(process)
+            result = summarize(workers, latencies, statuses, elapsed, ready_s)
+            results.append(result)
+            print(json.dumps(result), flush=True)
+    finally:
+        stubs.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "cpu_count": os.cpu_count(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+# chat_archive.py
+"""
+Append-only chat archive on R2.
+
+save_chat used to write the full transcript as a new object on every call.
+Instead, only messages that were not archived yet are buffered and written
+in batches, as gzip-compressed JSONL segments per time window:
+
+    chat_archive/segments/<YYYY-MM-DD>/<HH-MM-SS>_<id>.jsonl.gz
+
+A segment holds records from many sessions. compact() merges segments into
+one object per session and removes them:
+
+    chat_archive/sessions/<session_id>.jsonl.gz
+
+read_session() rebuilds a full session from both. Records are keyed by
+(session_id, seq), where seq is the message's index in the conversation, so
+re-archiving a message (e.g. after a worker restart) is harmless. Whenever a
+session is archived from seq 0 again (a new session, one that shrank because
+the client started over, or one whose state was lost), a reset record comes
+first, and records of the session archived before it are dropped.
+
+A session's messages count as archived only once the segment holding them
+is uploaded; if the upload fails for good, the next save of the session
+buffers them again. Per-session state is kept for the max_sessions most
+recently saved sessions; an evicted session that saves again is re-archived
+from its first message.
+"""
+import argparse
+import collections
+import datetime
+import functools
+import gzip
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = "chat_archive"
+SEGMENT_PREFIX = f"{ARCHIVE_PREFIX}/segments/"
+SESSION_PREFIX = f"{ARCHIVE_PREFIX}/sessions/"
+
+
+def session_key(session_id: str) -> str:
+    return f"{SESSION_PREFIX}{session_id}.jsonl.gz"
+
+
+def encode_records(records: List[Dict[str, Any]]) -> bytes:
+    lines = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+    return gzip.compress(lines.encode("utf-8"))
+
+
+def decode_records(body: Optional[bytes]) -> List[Dict[str, Any]]:
+    if not body:
+        return []
+    return [json.loads(line) for line in gzip.decompress(body).decode("utf-8").splitlines() if line]
+
+
+class ChatArchive:
+    """
+    Buffers new chat messages and flushes them as compressed segments.
+
+    Args:
+        uploader: Object with enqueue(key, payload, content_type), e.g. r2_storage.upload_queue
+        window_seconds: Maximum time a buffered message waits before being flushed
+        max_batch_records: Flush early once this many records are buffered
+        max_sessions: Sessions whose archive state is kept, least recently saved evicted first
+    """
+
+    def __init__(self, uploader, window_seconds: float = 300, max_batch_records: int = 2000,
+                 max_sessions: int = 10000):
+        self.uploader = uploader
+        self.window_seconds = window_seconds
+        self.max_batch_records = max_batch_records
+        self.max_sessions = max_sessions
+        # session_id -> {"buffered": messages buffered or uploaded, "archived": messages
+        # confirmed uploaded, "zip_codes": last ZIP codes buffered}, least recently saved first
+        self.sessions: "collections.OrderedDict[str, Dict[str, Any]]" = collections.OrderedDict()
+        self.buffer: List[Dict[str, Any]] = []
+        self.window_start = time.time()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats = {"saves": 0, "records": 0, "segments": 0, "bytes": 0, "failed_segments": 0,
+                      "evicted_sessions": 0}
+
+    def append(self, session_id: str, messages: List[Dict[str, Any]], zip_codes: Optional[List[str]] = None) -> int:
+        """
+        Buffer the messages of a session that have not been archived yet.
+
+        Args:
+            session_id: Chat session ID
+            messages: The full message list as sent by the client
+            zip_codes: ZIP codes the session looked at
+
+        Returns:
+            Number of new messages buffered
+        """
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        with self.lock:
+            state = self._session(session_id)
+            buffered = state["buffered"]
+            shrank = len(messages) < buffered
+            if shrank:
+                # The client started over; seq numbers restart from zero
+                logger.info(f"Session {session_id} shrank from {buffered} to {len(messages)} messages")
+                buffered = state["archived"] = 0
+            new_messages = messages[buffered:]
+            if buffered == 0 and (new_messages or shrank):
+                # Supersedes whatever was archived for the session before, including a longer transcript
+                self.buffer.append({"type": "reset", "session_id": session_id, "archived_at": now})
+                state["zip_codes"] = None
+            for seq, message in enumerate(new_messages, start=buffered):
+                self.buffer.append({"type": "message", "session_id": session_id, "seq": seq,
+                                    "archived_at": now, "message": message})
+            if zip_codes and zip_codes != state["zip_codes"]:
+                state["zip_codes"] = list(zip_codes)
+                self.buffer.append({"type": "zipCodes", "session_id": session_id,
+                                    "archived_at": now, "zipCodes": list(zip_codes)})
+            state["buffered"] = len(messages)
+            self.stats["saves"] += 1
+            flush_now = len(self.buffer) >= self.max_batch_records
+        if flush_now:
+            self.flush()
+        return len(new_messages)
+
+    def _session(self, session_id: str) -> Dict[str, Any]:
+        """Archive state of a session, marked most recently used. Call with the lock held."""
+        state = self.sessions.get(session_id)
+        if state is None:
+            state = self.sessions[session_id] = {"buffered": 0, "archived": 0, "zip_codes": None}
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.stats["evicted_sessions"] += 1
+        else:
+            self.sessions.move_to_end(session_id)
+        return state
+
+    def _uploaded(self, ranges: Dict[str, Tuple[int, int]], zip_sessions: List[str], uploaded: bool):
+        """Upload callback of a segment; ranges maps session_id to the (first, end) seq it holds."""
+        with self.lock:
+            if not uploaded:
+                self.stats["failed_segments"] += 1
+            for session_id, (first, end) in ranges.items():
+                state = self.sessions.get(session_id)
+                if state is None:
+                    continue
+                if uploaded:
+                    # Only a contiguous prefix counts, in case an earlier segment failed
+                    if first <= state["archived"]:
+                        state["archived"] = max(state["archived"], end)
+                else:
+                    # The next save buffers these messages again
+                    state["buffered"] = min(state["buffered"], first)
+                    state["archived"] = min(state["archived"], first)
+            if not uploaded:
+                for session_id in zip_sessions:
+                    if session_id in self.sessions:
+                        self.sessions[session_id]["zip_codes"] = None
+
+    def flush(self) -> Optional[str]:
+        """Write buffered records as one segment. Returns the segment key, if any."""
+        with self.lock:
+            records, self.buffer = self.buffer, []
+            window_start = self.window_start
+            self.window_start = time.time()
+        if not records:
+            return None
+        started = datetime.datetime.fromtimestamp(window_start, datetime.timezone.utc)
+        key = f"{SEGMENT_PREFIX}{started:%Y-%m-%d}/{started:%H-%M-%S}_{uuid.uuid4().hex[:8]}.jsonl.gz"
+        body = encode_records(records)
+        ranges: Dict[str, Tuple[int, int]] = {}
+        for record in records:
+            if record["type"] == "message":
+                first, end = ranges.get(record["session_id"], (record["seq"], record["seq"] + 1))
+                ranges[record["session_id"]] = (min(first, record["seq"]), max(end, record["seq"] + 1))
+        zip_sessions = [record["session_id"] for record in records if record["type"] == "zipCodes"]
+        on_done = functools.partial(self._uploaded, ranges, zip_sessions)
+        if not self.uploader.enqueue(key, body, content_type="application/gzip", on_done=on_done):
+            # Keep the records so the next flush retries them
+            with self.lock:
+                self.buffer[:0] = records
+            return None
+        with self.lock:
+            self.stats["records"] += len(records)
+            self.stats["segments"] += 1
+            self.stats["bytes"] += len(body)
+        logger.info(f"Flushed {len(records)} chat records to {key} ({len(body)} bytes)")
+        return key
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name="chat-archive", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.wait(self.window_seconds):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Chat archive flush failed: {str(e)}")
+
+    def stop(self):
+        """Stop the flusher thread and write whatever is still buffered."""
+        self.stop_event.set()
+        self.flush()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"buffered_records": len(self.buffer), "sessions": len(self.sessions), **self.stats}
+
+
+def _merge(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Dedupe by (type, seq) keeping the latest copy, ordered by seq.
+
+    Records archived before the session's latest reset are dropped; the reset
+    itself is kept, in case a segment written before it is still pending.
+    """
+    resets = [record for record in records if record.get("type") == "reset"]
+    reset = max(resets, key=lambda record: record["archived_at"]) if resets else None
+    messages = {}
+    zip_codes = None
+    for record in records:
+        kind = record.get("type")
+        if kind == "reset" or (reset is not None and record["archived_at"] < reset["archived_at"]):
+            continue
+        if kind == "zipCodes":
+            zip_codes = record
+        else:
+            messages[record["seq"]] = record
+    merged = [reset] if reset is not None else []
+    merged.extend(messages[seq] for seq in sorted(messages))
+    if zip_codes:
+        merged.append(zip_codes)
+    return merged
+
+
+def compact(service, delete_segments: bool = True) -> Dict[str, int]:
+    """
+    Merge all segments into per-session objects.
+
+    Args:
+        service: r2_storage.S3Service
+        delete_segments: Remove segments once their records are merged
+
+    Returns:
+        Counts of segments read and sessions written
+    """
+    segment_keys = service.list_keys(SEGMENT_PREFIX)
+    by_session: Dict[str, List[Dict[str, Any]]] = {}
+    for key in segment_keys:
+        for record in decode_records(service.get_bytes(key)):
+            by_session.setdefault(record["session_id"], []).append(record)
+    for session_id, records in by_session.items():
+        existing = decode_records(service.get_bytes(session_key(session_id)))
+        service.upload_json_to_r2(session_key(session_id), encode_records(_merge(existing + records)),
+                                  content_type="application/gzip")
+    if delete_segments and segment_keys:
+        service.delete_keys(segment_keys)
+    logger.info(f"Compacted {len(segment_keys)} segments into {len(by_session)} sessions")
+    return {"segments": len(segment_keys), "sessions": len(by_session)}
+
+
+def read_session(service, session_id: str) -> Dict[str, Any]:
+    """
+    Reconstruct a full session from its compacted object and pending segments.
+
+    Returns:
+        {"session_id", "messages", "zipCodes"} in the shape save_chat used to store
+    """
+    records = decode_records(service.get_bytes(session_key(session_id)))
+    for key in service.list_keys(SEGMENT_PREFIX):
+        records.extend(r for r in decode_records(service.get_bytes(key)) if r["session_id"] == session_id)
+    merged = _merge(records)
+    zip_codes = next((r["zipCodes"] for r in merged if r.get("type") == "zipCodes"), [])
+    return {
+        "session_id": session_id,
+        "messages": [r["message"] for r in merged if r.get("type") == "message"],
+        "zipCodes": zip_codes,
+    }
+
+
+if __name__ == "__main__":
+    from r2_storage import get_r2_service
+
+    parser = argparse.ArgumentParser(description="Chat archive maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("compact", help="Merge segments into per-session objects")
+    read_parser = subparsers.add_parser("read", help="Print a reconstructed session as JSON")
+    read_parser.add_argument("session_id")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "compact":
+        print(compact(get_r2_service()))
+    else:
+        print(json.dumps(read_session(get_r2_service(), args.session_id), indent=2))
@@ -0,0 +1,137 @@
+# chat_prompt.py
+"""
+Message layout for /api/chat, ordered for provider-side prompt caching.
+
+Azure OpenAI reuses the work done for a prompt prefix it has seen recently
+(for prompts of 1024 tokens or more, in 128-token steps). The prefix has to
+be byte-identical, so the messages go from most to least stable:
+
+    1. system  static instructions, the same for every request
+    2.         the session's earlier turns, which only grow at the end
+    3. system  the current UI context
+    4. user    the question, once
+
+The UI context and the question used to be formatted into the first system
+message, so no two requests shared more than the instructions, and the
+question was sent twice.
+
+build_chat_messages() also counts the tokens of each part, for the prompt
+token histogram on /metrics and the per-turn log line.
+"""
+import functools
+import logging
+import threading
+from typing import Any, Dict, List, Sequence, Tuple
+
+from telemetry import PROMPT_TOKENS
+
+logger = logging.getLogger(__name__)
+
+UI_CONTEXT_MESSAGE = "CURRENT UI STATE:\n{ui_context}"
+
+# gpt-4o's tokenizer; until it is loaded, or when tiktoken or its encoding
+# file is not available, counts fall back to ~4 characters per token
+TOKENIZER_ENCODING = "o200k_base"
+
+_encoding = None
+_encoding_loaded = False
+_encoding_loading = False
+_encoding_lock = threading.Lock()
+
+
+def load_encoding():
+    """
+    Load the tokenizer and return it, or None if it is unavailable.
+
+    tiktoken downloads the encoding file on first use, without a timeout, so
+    this runs in warm_up() or on a background thread, never on a request.
+    """
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if _encoding_loaded:
+            return _encoding
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            logger.warning("Token counts are approximate, tiktoken unavailable: %s", e)
+        _encoding_loaded = True
+    # Counts cached before the tokenizer was there are estimates
+    count_tokens.cache_clear()
+    return _encoding
+
+
+def _get_encoding():
+    """The tokenizer if it is loaded; otherwise start loading it in the background and return None."""
+    global _encoding_loading
+    if _encoding_loaded:
+        return _encoding
+    with _encoding_lock:
+        if _encoding_loading:
+            return None
+        _encoding_loading = True
+    threading.Thread(target=load_encoding, name="load-tokenizer", daemon=True).start()
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """Token count of text; cached, since history messages are counted again every turn."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return max(1, len(text) // 4) if text else 0
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def build_chat_messages(instructions: str, history: Sequence[Tuple[str, str]], ui_context: str,
+                        question: str) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+    """
+    Build the chat completion messages and count their tokens.
+
+    Args:
+        instructions: Static system prompt
+        history: (user message, assistant reply) pairs of earlier turns
+        ui_context: Rendered UI context for this turn
+        question: The user's question
+
+    Returns:
+        (messages, tokens), where tokens has the count per part plus "total"
+        and "stable_prefix" (instructions + history, the part a provider can
+        serve from its cache)
+    """
+    messages = [{"role": "system", "content": instructions}]
+    history_tokens = 0
+    for user_msg, bot_msg in history:
+        messages.append({"role": "user", "content": user_msg})
+        messages.append({"role": "assistant", "content": bot_msg})
+        history_tokens += count_tokens(user_msg) + count_tokens(bot_msg)
+    context_message = UI_CONTEXT_MESSAGE.format(ui_context=ui_context)
+    messages.append({"role": "system", "content": context_message})
+    messages.append({"role": "user", "content": question})
+
+    tokens = {
+        "instructions": count_tokens(instructions),
+        "history": history_tokens,
+        "ui_context": count_tokens(context_message),
+        "question": count_tokens(question),
+    }
+    tokens["stable_prefix"] = tokens["instructions"] + tokens["history"]
+    tokens["total"] = tokens["stable_prefix"] + tokens["ui_context"] + tokens["question"]
+    return messages, tokens
+
+
+def record_prompt_tokens(call: str, tokens: Dict[str, int], response: Any = None) -> Dict[str, int]:
+    """
+    Add a prompt's token counts to the histogram, with the provider's numbers if available.
+
+    The LLM response's token_usage gives the prompt tokens the provider
+    counted ("billed") and how many of them came from its cache ("cached").
+    """
+    tokens = dict(tokens)
+    usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    if usage.get("prompt_tokens") is not None:
+        tokens["billed"] = usage["prompt_tokens"]
+        tokens["cached"] = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    for part, value in tokens.items():
+        PROMPT_TOKENS.observe((call, part), value)
+    return tokens
@@ -0,0 +1,321 @@
+# comps.py
+"""
+Comparable-sales (comps) valuation for the property market analysis section.
+
+get_property_details() returned Zillow's priceHistory and nearbyHomes as
+they came, and the chat prompt quoted the first three price events. Now
+analyze_property() turns them, plus similar listings from the property
+store (similar_homes.py), into a few numbers:
+
+- pricePerSqft: the distribution (min, quartiles, median, mean, max) of the
+  comps' price per square foot
+- valuation: every comp's price adjusted to the subject home, then a
+  weighted median estimate and a 10th-90th percentile band. Comps closer
+  to the subject (by similar-homes distance) weigh more. confidence
+  depends on how many comps there are and how far apart their values are.
+- history: the subject's own sales and listings, with the appreciation
+  between its first and last sale and the change since the last sale
+
+A comp's adjusted value is its price per sqft times the subject's sqft
+(its price when either size is unknown). Each bedroom and bathroom the
+subject has over the comp adds BED_ADJUSTMENT and BATH_ADJUSTMENT of that
+value, and each year newer adds AGE_ADJUSTMENT, capped at 50 years.
+
+All comps are valued in one pass over numpy arrays. Results are cached
+per zpid (MarketAnalysisCache) and attached to /api/property as
+"marketAnalysis". The chat context renders them with describe_analysis()
+instead of raw price events.
+
+Environment variables:
+    COMPS_MAX               comps kept per analysis, default 12
+    COMPS_CACHE_TTL         seconds an analysis is reused, default 3600
+    COMPS_CACHE_ENTRIES     analyses kept, default 2000
+"""
+import collections
+import datetime
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+MAX_COMPS = int(os.environ.get("COMPS_MAX", 12))
+COMPS_CACHE_TTL = float(os.environ.get("COMPS_CACHE_TTL", 3600))
+COMPS_CACHE_ENTRIES = int(os.environ.get("COMPS_CACHE_ENTRIES", 2000))
+
+BED_ADJUSTMENT = 0.02
+BATH_ADJUSTMENT = 0.015
+AGE_ADJUSTMENT = 0.001
+BAND = (0.1, 0.9)
+
+# priceHistory events that are a price for the home
+PRICE_EVENTS = ("Sold", "Listed for sale", "Price change", "Pending sale", "Listing removed")
+
+
+def _number(value: Any) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return math.nan
+    return float(value)
+
+
+def _plain(value: float, digits: int = 0) -> Optional[float]:
+    if value is None or not math.isfinite(value):
+        return None
+    value = round(float(value), digits)
+    return int(value) if digits <= 0 else value
+
+
+def comp_from_nearby(home: Dict[str, Any], stored: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    A comp from one of Zillow's nearbyHomes, with missing fields taken
+    from the stored record of the same zpid.
+    """
+    stored = stored or {}
+    address = home.get("address")
+    if isinstance(address, dict):
+        address = ", ".join(part for part in (address.get("streetAddress"), address.get("city")) if part)
+    return {
+        "zpid": str(home.get("zpid") or stored.get("zpid") or ""),
+        "address": address or stored.get("address"),
+        "price": home.get("price") if home.get("price") is not None else stored.get("price"),
+        "sqft": home.get("livingArea") if home.get("livingArea") is not None else stored.get("sqft"),
+        "bedrooms": home.get("bedrooms") if home.get("bedrooms") is not None else stored.get("bedrooms"),
+        "bathrooms": home.get("bathrooms") if home.get("bathrooms") is not None else stored.get("bathrooms"),
+        "year_built": home.get("yearBuilt") if home.get("yearBuilt") is not None else stored.get("year_built"),
+        "distance": None,
+        "source": "nearby",
+    }
+
+
+def comp_from_record(record: Dict[str, Any], distance: Optional[float] = None) -> Dict[str, Any]:
+    """A comp from a property store record and its similar-homes distance."""
+    return {
+        "zpid": str(record.get("zpid") or record.get("id") or ""),
+        "address": record.get("address"),
+        "price": record.get("price"),
+        "sqft": record.get("sqft"),
+        "bedrooms": record.get("bedrooms"),
+        "bathrooms": record.get("bathrooms"),
+        "year_built": record.get("year_built"),
+        "distance": distance,
+        "source": "store",
+    }
+
+
+def weighted_quantiles(values, weights, quantiles: Sequence[float]):
+    """Quantiles of values under weights (midpoint interpolation); NaN when no weight."""
+    import numpy as np
+
+    keep = weights > 0
+    values, weights = values[keep], weights[keep]
+    if not len(values):
+        return np.full(len(quantiles), np.nan)
+    order = np.argsort(values, kind="stable")
+    values, weights = values[order], weights[order]
+    positions = (np.cumsum(weights) - weights / 2) / weights.sum()
+    return np.interp(quantiles, positions, values)
+
+
+def value_comps(subject: Dict[str, Any], comps: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Price per sqft distribution, adjusted comp values and the valuation band.
+
+    Args:
+        subject: Property record of the home being valued
+        comps: comp_from_nearby() / comp_from_record() dicts
+
+    Returns:
+        {"comps": [...], "pricePerSqft": {...}, "valuation": {...}}
+    """
+    import numpy as np
+
+    def column(name):
+        return np.fromiter((_number(comp.get(name)) for comp in comps), dtype=np.float64, count=len(comps))
+
+    price, sqft = column("price"), column("sqft")
+    beds, baths, year, distance = column("bedrooms"), column("bathrooms"), column("year_built"), column("distance")
+    subject_sqft = _number(subject.get("sqft"))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        per_sqft = np.where(sqft > 0, price / sqft, np.nan)
+    usable = price > 0
+    size_adjusted = per_sqft * subject_sqft if subject_sqft > 0 else np.full(len(comps), np.nan)
+    size_adjusted = np.where(np.isfinite(size_adjusted), size_adjusted, price)
+    # Unknown on either side counts as no difference
+    bed_gap = np.nan_to_num(_number(subject.get("bedrooms")) - beds)
+    bath_gap = np.nan_to_num(_number(subject.get("bathrooms")) - baths)
+    age_gap = np.clip(np.nan_to_num(_number(subject.get("year_built")) - year), -50, 50)
+    adjusted = size_adjusted * (1 + BED_ADJUSTMENT * bed_gap + BATH_ADJUSTMENT * bath_gap + AGE_ADJUSTMENT * age_gap)
+    weights = np.where(usable, 1 / (1 + np.nan_to_num(distance)), 0.0)
+
+    low, estimate, high = weighted_quantiles(adjusted, weights, (BAND[0], 0.5, BAND[1]))
+    count = int(usable.sum())
+    if count:
+        mean = np.average(adjusted[usable], weights=weights[usable])
+        spread = math.sqrt(np.average((adjusted[usable] - mean) ** 2, weights=weights[usable])) / mean
+    else:
+        spread = math.nan
+    if count >= 5 and spread < 0.1:
+        confidence = "high"
+    elif count >= 3 and spread < 0.2:
+        confidence = "medium"
+    else:
+        confidence = "low"
+    list_price = _number(subject.get("price"))
+
+    known = per_sqft[usable & np.isfinite(per_sqft)]
+    rows = zip(*(values.tolist() for values in (price, sqft, beds, baths, per_sqft, adjusted, weights)))
+    quartiles = np.percentile(known, (0, 25, 50, 75, 100)) if len(known) else np.full(5, np.nan)
+    return {
+        "comps": [
+            {"zpid": comp["zpid"], "address": comp.get("address"), "source": comp["source"],
+             "price": _plain(p), "sqft": _plain(s), "beds": _plain(bd, 1), "baths": _plain(ba, 1),
+             "pricePerSqft": _plain(pps), "adjustedValue": _plain(value, -2), "weight": _plain(weight, 3)}
+            for comp, ok, (p, s, bd, ba, pps, value, weight) in zip(comps, usable.tolist(), rows) if ok
+        ],
+        "pricePerSqft": {
+            "count": int(len(known)), "min": _plain(quartiles[0]), "p25": _plain(quartiles[1]),
+            "median": _plain(quartiles[2]), "p75": _plain(quartiles[3]), "max": _plain(quartiles[4]),
+            "mean": _plain(float(known.mean())) if len(known) else None,
+            "subject": _plain(list_price / subject_sqft) if subject_sqft > 0 else None,
+        },
+        "valuation": {
+            "estimate": _plain(estimate, -3), "low": _plain(low, -3), "high": _plain(high, -3),
+            "confidence": confidence, "compCount": count, "spreadPercent": _plain(spread * 100, 1),
+            "listPrice": _plain(list_price),
+            "listVsEstimatePercent": _plain((list_price / estimate - 1) * 100, 1)
+            if math.isfinite(list_price) and estimate > 0 else None,
+        },
+    }
+
+
+def summarize_history(price_history: Sequence[Dict[str, Any]], current_price: Any = None) -> Dict[str, Any]:
+    """Sales and listing events of a home, oldest first, reduced to a few numbers."""
+    import numpy as np
+
+    dates, prices, kinds = [], [], []
+    for event in price_history or ():
+        if not isinstance(event, dict):
+            continue
+        price = _number(event.get("price"))
+        if event.get("event") not in PRICE_EVENTS or not price > 0:
+            continue
+        try:
+            date = datetime.date.fromisoformat(str(event.get("date"))[:10])
+        except ValueError:
+            continue
+        dates.append(date)
+        prices.append(price)
+        kinds.append(event["event"])
+    summary = {"events": len(dates), "sales": 0, "priceChanges": 0, "firstSale": None, "lastSale": None,
+               "annualAppreciationPercent": None, "sinceLastSalePercent": None}
+    if not dates:
+        return summary
+    days = np.array(dates, dtype="datetime64[D]")
+    prices = np.array(prices)
+    kinds = np.array(kinds)
+    order = np.argsort(days, kind="stable")
+    days, prices, kinds = days[order], prices[order], kinds[order]
+    sold = np.flatnonzero(kinds == "Sold")
+    summary["sales"] = int(len(sold))
+    summary["priceChanges"] = int((kinds == "Price change").sum())
+    if len(sold):
+        first, last = sold[0], sold[-1]
+        summary["firstSale"] = {"date": str(days[first]), "price": _plain(prices[first])}
+        summary["lastSale"] = {"date": str(days[last]), "price": _plain(prices[last])}
+        years = (days[last] - days[first]).astype(np.int64) / 365.25
+        if years > 0:
+            summary["annualAppreciationPercent"] = _plain(((prices[last] / prices[first]) ** (1 / years) - 1) * 100, 1)
+        current = _number(current_price)
+        if current > 0:
+            summary["sinceLastSalePercent"] = _plain((current / prices[last] - 1) * 100, 1)
+    return summary
+
+
+def analyze_property(subject: Dict[str, Any], comps: List[Dict[str, Any]],
+                     price_history: Sequence[Dict[str, Any]] = ()) -> Dict[str, Any]:
+    """
+    The market analysis of a home.
+
+    Args:
+        subject: Property record (property_store.record_from_details())
+        comps: Comparable homes; the first MAX_COMPS distinct zpids are used
+        price_history: Zillow priceHistory of the home
+    """
+    seen = {str(subject.get("id"))}
+    unique = []
+    for comp in comps:
+        if comp["zpid"] and comp["zpid"] not in seen:
+            seen.add(comp["zpid"])
+            unique.append(comp)
+    analysis = value_comps(subject, unique[:MAX_COMPS])
+    analysis["history"] = summarize_history(price_history, subject.get("price"))
+    analysis["computedAt"] = int(time.time())
+    return analysis
+
+
+def describe_analysis(analysis: Dict[str, Any]) -> List[str]:
+    """Prompt lines for a market analysis."""
+    lines = []
+    valuation = analysis.get("valuation") or {}
+    if valuation.get("estimate"):
+        line = (f"Comparable-sales estimate: ${valuation['estimate']:,} "
+                f"(range ${valuation['low']:,} - ${valuation['high']:,}, {valuation['confidence']} confidence, "
+                f"{valuation['compCount']} comps)")
+        if valuation.get("listVsEstimatePercent") is not None:
+            line += f"; list price is {valuation['listVsEstimatePercent']:+.1f}% vs the estimate"
+        lines.append(line + ".")
+    per_sqft = analysis.get("pricePerSqft") or {}
+    if per_sqft.get("median"):
+        line = f"Comps' price per sqft: median ${per_sqft['median']:,} (${per_sqft['p25']:,} - ${per_sqft['p75']:,})"
+        if per_sqft.get("subject"):
+            line += f", this home ${per_sqft['subject']:,}"
+        lines.append(line + ".")
+    history = analysis.get("history") or {}
+    if history.get("lastSale"):
+        line = (f"Sold {history['sales']} time(s); last sale {history['lastSale']['date']} "
+                f"at ${history['lastSale']['price']:,}")
+        if history.get("annualAppreciationPercent") is not None:
+            line += f", {history['annualAppreciationPercent']:+.1f}% a year since the first sale"
+        if history.get("sinceLastSalePercent") is not None:
+            line += f", current price {history['sinceLastSalePercent']:+.1f}% vs last sale"
+        lines.append(line + ".")
+    if history.get("priceChanges"):
+        lines.append(f"{history['priceChanges']} price change(s) recorded.")
+    return lines
+
+
+class MarketAnalysisCache:
+    """Market analysis per zpid, dropped after ttl seconds or when least recently used."""
+
+    def __init__(self, ttl: float = COMPS_CACHE_TTL, max_entries: int = COMPS_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "computed": 0}
+
+    def get(self, zpid: Any) -> Optional[Dict[str, Any]]:
+        key = str(zpid)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.entries.pop(key, None)
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, zpid: Any, analysis: Dict[str, Any]):
+        with self.lock:
+            self.stats["computed"] += 1
+            if self.ttl <= 0:
+                return
+            self.entries[str(zpid)] = (time.monotonic() + self.ttl, analysis)
+            self.entries.move_to_end(str(zpid))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"entries": len(self.entries), "ttl_seconds": self.ttl, **self.stats}
@@ -0,0 +1,46 @@
+# gunicorn.conf.py
+"""
+Production server settings: gunicorn managing uvicorn workers.
+
+One worker process per core by default, each running its own event loop,
+threadpool and HTTP connection pools. With preload_app the app module is
+imported once in the master, and app.preload() loads the heavy integrations
+and read-only indexes there, so workers start from a copy-on-write image
+instead of each paying the import cost.
+
+Environment variables:
+    PORT                  default 8000
+    WEB_CONCURRENCY       number of workers, default os.cpu_count()
+    GUNICORN_PRELOAD      "true" (default) to import the app before forking
+    GUNICORN_TIMEOUT      seconds before a silent worker is restarted, default 120
+    GUNICORN_KEEPALIVE    seconds to keep idle client connections open, default 5
+
+Usage:
+    gunicorn -c backend/gunicorn.conf.py app:app
+"""
+import os
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY") or os.cpu_count() or 1)
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+# LLM calls can take tens of seconds; give in-flight chats time to finish on shutdown
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+accesslog = None
+errorlog = "-"
+loglevel = os.environ.get("LOG_LEVEL", "info").lower()
+
+
+def when_ready(server):
+    # Runs in the master after the app was loaded (with preload_app) and before the workers fork
+    if preload_app:
+        import app
+
+        app.preload()
+    server.log.info("Starting %d uvicorn workers", workers)
+
@@ -0,0 +1,74 @@
+# http_pools.py
+"""
+Shared HTTP connection pools.
+
+Zillow calls used to go through requests.get or a fresh http.client
+connection, i.e. a new TCP + TLS handshake per call, and every DeepL
+translation built its own httpx client. Now each worker process keeps one
+requests.Session (for the blocking helpers that run in the threadpool) and
+one httpx.AsyncClient (for code running on the event loop).
+
+Both are created on first use and closed by the app's shutdown hook. A
+worker forked from a preloaded gunicorn master starts with fresh pools
+rather than sharing the master's sockets.
+"""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from resilience import CONNECT_TIMEOUT, READ_TIMEOUT
+
+POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 32))
+
+_session = None
+_async_client = None
+_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Process-wide requests.Session with keep-alive connections per host."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def get_async_client():
+    """Process-wide httpx.AsyncClient; only use it from the server's event loop."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        import httpx
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+        )
+    return _async_client
+
+
+async def close_pools():
+    global _session, _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def _reset_after_fork():
+    global _session, _async_client, _lock
+    _session = None
+    _async_client = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
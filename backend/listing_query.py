@@ -0,0 +1,444 @@
+# listing_query.py
+"""
+Server-side filtering, sorting and paging for /api/properties.
+
+search_nearby_houses() used to return every listing Zillow sent for a ZIP
+code, and the client had to filter them. The criteria extract_query_features()
+pulls out of a chat message can now be sent to /api/properties, which
+answers with only the matching page:
+
+    {"zipCode": "60616",
+     "propertyFeatures": {"bedrooms": 3, "bathrooms": [2, 3], "squareFeet": [1500, null],
+                          "propertyType": "house"},
+     "filters": {"priceRange": [null, 650000]},
+     "sortBy": "price_asc", "page": 1, "pageSize": 20}
+
+A single number means "at least" (3 bedrooms = 3+, as on Zillow), a
+[min, max] pair or {"min": .., "max": ..} is an inclusive range, and null
+leaves that side open. yearBuilt and amenities are not in Zillow search
+results, so they are not applied here. A request with neither page nor
+pageSize gets every matching listing, so callers written before paging
+still see all of them.
+
+The parsed search results of a ZIP are kept as a ListingTable: one numpy
+column per filterable field, so a query is a handful of vectorized
+comparisons, and the sort only orders the rows up to the requested page
+(argpartition, then a sort of those). Tables are cached per ZIP for
+SEARCH_CACHE_TTL seconds, so paging through a search or changing its filters
+does not go back to Zillow.
+
+/api/properties/facets answers the same request with the page plus the
+counts and ranges the property tabs show (listings per bedroom count, per
+bathroom count, per home type and per price bucket, and min/max/mean/
+percentiles of every numeric column) over all matching listings, so the
+client no longer needs every listing to compute them. compute_facets()
+takes the matching rows of the table's column matrix and computes all of
+them at once: one nanpercentile call over the matrix for the stats, and a
+bincount per counted facet.
+
+Environment variables:
+    SEARCH_CACHE_TTL        seconds a ZIP's search results are reused, default 300
+    SEARCH_CACHE_ENTRIES    ZIP codes kept, default 512
+    PROPERTIES_PAGE_SIZE    listings per page when the request has no pageSize, default 50
+    PROPERTIES_MAX_PAGE_SIZE  largest pageSize accepted, default 500
+"""
+import collections
+import math
+import os
+import threading
+import time
+import warnings
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", 300))
+SEARCH_CACHE_ENTRIES = int(os.environ.get("SEARCH_CACHE_ENTRIES", 512))
+DEFAULT_PAGE_SIZE = int(os.environ.get("PROPERTIES_PAGE_SIZE", 50))
+MAX_PAGE_SIZE = int(os.environ.get("PROPERTIES_MAX_PAGE_SIZE", 500))
+
+# Numeric columns: table column -> Zillow search result field
+COLUMNS = {
+    "price": "price",
+    "beds": "bedrooms",
+    "baths": "bathrooms",
+    "sqft": "livingArea",
+    "days": "daysOnZillow",
+}
+
+# sortBy -> (column, descending)
+SORT_KEYS = {
+    "price_asc": ("price", False),
+    "price_desc": ("price", True),
+    "newest": ("days", False),
+    "sqft_desc": ("sqft", True),
+    "beds_desc": ("beds", True),
+}
+
+# propertyFeatures keys -> table column
+FEATURE_COLUMNS = {"bedrooms": "beds", "bathrooms": "baths", "squareFeet": "sqft"}
+
+# Percentiles reported for every numeric column by compute_facets()
+FACET_PERCENTILES = (25, 50, 75, 90)
+# Columns whose distinct values are counted
+COUNTED_COLUMNS = ("beds", "baths")
+# Lower edges of the price buckets; the last bucket is open-ended
+PRICE_BUCKETS = (0, 250000, 500000, 750000, 1000000, 1500000, 2000000, 3000000)
+
+# Property types as the feature extractor names them -> Zillow homeType values
+HOME_TYPES = {
+    "house": ("SINGLE_FAMILY",),
+    "single family": ("SINGLE_FAMILY",),
+    "single-family": ("SINGLE_FAMILY",),
+    "condo": ("CONDO",),
+    "condominium": ("CONDO",),
+    "townhouse": ("TOWNHOUSE",),
+    "townhome": ("TOWNHOUSE",),
+    "apartment": ("APARTMENT", "CONDO"),
+    "multi-family": ("MULTI_FAMILY",),
+    "multi family": ("MULTI_FAMILY",),
+    "land": ("LOT",),
+    "lot": ("LOT",),
+    "manufactured": ("MANUFACTURED",),
+    "mobile": ("MANUFACTURED",),
+}
+
+
+def _number(value: Any) -> float:
+    """value as a float, or NaN for missing and non-numeric values ("N/A")."""
+    if isinstance(value, bool) or value is None:
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(",", "").replace("$", ""))
+    except ValueError:
+        return math.nan
+
+
+def parse_range(value: Any) -> Optional[Tuple[float, float]]:
+    """
+    Inclusive (low, high) bounds from a number, a [min, max] pair or a {"min", "max"} dict.
+
+    Open sides are -inf/inf; None if the value sets no bound at all.
+    """
+    if isinstance(value, dict):
+        low, high = value.get("min"), value.get("max")
+    elif isinstance(value, (list, tuple)):
+        if not value:
+            return None
+        low, high = value[0], value[1] if len(value) > 1 else None
+    else:
+        low, high = value, None
+    low, high = _number(low), _number(high)
+    if math.isnan(low) and math.isnan(high):
+        return None
+    return (-math.inf if math.isnan(low) else low, math.inf if math.isnan(high) else high)
+
+
+def parse_home_types(value: Any) -> Optional[frozenset]:
+    """Zillow homeType values for a propertyType name (or list of names)."""
+    names = value if isinstance(value, (list, tuple)) else [value]
+    types = set()
+    for name in names:
+        if not isinstance(name, str) or not name.strip():
+            continue
+        key = name.strip().lower()
+        types.update(HOME_TYPES.get(key, (key.upper().replace(" ", "_").replace("-", "_"),)))
+    return frozenset(types) or None
+
+
+class ListingQuery:
+    """
+    Filters and sort order for one /api/properties request.
+
+    Args:
+        ranges: table column -> (low, high)
+        home_types: Allowed Zillow homeType values, None for any
+        sort_by: A SORT_KEYS key, None to keep Zillow's order
+    """
+
+    __slots__ = ("ranges", "home_types", "sort_by")
+
+    def __init__(self, ranges: Optional[Dict[str, Tuple[float, float]]] = None,
+                 home_types: Optional[frozenset] = None, sort_by: Optional[str] = None):
+        self.ranges = ranges or {}
+        self.home_types = home_types
+        self.sort_by = sort_by if sort_by in SORT_KEYS else None
+
+    @classmethod
+    def from_features(cls, property_features: Optional[Dict[str, Any]] = None,
+                      filters: Optional[Dict[str, Any]] = None, sort_by: Optional[str] = None) -> "ListingQuery":
+        """Build a query from extract_query_features() output."""
+        property_features = property_features or {}
+        ranges = {}
+        for key, column in FEATURE_COLUMNS.items():
+            bounds = parse_range(property_features.get(key))
+            if bounds is not None:
+                ranges[column] = bounds
+        bounds = parse_range((filters or {}).get("priceRange"))
+        if bounds is not None:
+            ranges["price"] = bounds
+        return cls(ranges, parse_home_types(property_features.get("propertyType")), sort_by)
+
+    def is_empty(self) -> bool:
+        return not self.ranges and self.home_types is None and self.sort_by is None
+
+    def has_filters(self) -> bool:
+        return bool(self.ranges) or self.home_types is not None
+
+    def matches(self, result: Dict[str, Any]) -> bool:
+        """Whether one Zillow search result passes the filters (the row-at-a-time form of ListingTable.mask)."""
+        for column, (low, high) in self.ranges.items():
+            value = _number(result.get(COLUMNS[column]))
+            if not low <= value <= high:
+                return False
+        return self.home_types is None or str(result.get("homeType") or "") in self.home_types
+
+    def describe(self) -> Dict[str, Any]:
+        """JSON-serializable form, for cursor digests."""
+        return {
+            "ranges": {column: [low, high] for column, (low, high) in sorted(self.ranges.items())},
+            "home_types": sorted(self.home_types) if self.home_types is not None else None,
+            "sort_by": self.sort_by,
+        }
+
+
+def _plain(value: float) -> Optional[float]:
+    """value as JSON: None for NaN, an int when it is whole."""
+    if math.isnan(value):
+        return None
+    return int(value) if value.is_integer() else round(value, 2)
+
+
+def compute_facets(matrix, names: Sequence[str], categories: Optional[Dict[str, Tuple[Any, Sequence[Any]]]] = None,
+                   price: Optional[str] = "price") -> Dict[str, Any]:
+    """
+    Facet counts and stats of a set of listings.
+
+    Args:
+        matrix: float array of shape (listings, len(names)), NaN where a value is unknown
+        names: Column names of the matrix
+        categories: facet -> (integer codes per listing, label of each code)
+        price: Column bucketed by PRICE_BUCKETS, None for none
+
+    Returns:
+        {"total": n,
+         "stats": {column: {"count", "min", "max", "mean", "p25", ...}},
+         "counts": {facet: [{"value": v, "count": n}, ...]},
+         "priceBuckets": [{"min": low, "max": high or None, "count": n}, ...]}
+    """
+    import numpy as np
+
+    total, width = matrix.shape
+    known = ~np.isnan(matrix)
+    present = known.sum(axis=0)
+    quantiles = (0, *FACET_PERCENTILES, 100)
+    if total:
+        with warnings.catch_warnings():
+            # Columns without any known value come out as NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            values = np.nanpercentile(matrix, quantiles, axis=0)
+            means = np.nanmean(matrix, axis=0)
+    else:
+        values = np.full((len(quantiles), width), np.nan)
+        means = np.full(width, np.nan)
+
+    stats = {}
+    for i, name in enumerate(names):
+        column = {"count": int(present[i]), "min": _plain(float(values[0, i])), "max": _plain(float(values[-1, i])),
+                  "mean": _plain(float(means[i]))}
+        for j, q in enumerate(FACET_PERCENTILES, start=1):
+            column[f"p{q}"] = _plain(float(values[j, i]))
+        stats[name] = column
+
+    counts = {}
+    for name in COUNTED_COLUMNS:
+        if name in names:
+            i = names.index(name)
+            distinct, tally = np.unique(matrix[known[:, i], i], return_counts=True)
+            counts[name] = [{"value": _plain(float(v)), "count": int(c)} for v, c in zip(distinct, tally)]
+    for name, (codes, labels) in (categories or {}).items():
+        tally = np.bincount(codes, minlength=len(labels))
+        counts[name] = [{"value": labels[code] or None, "count": int(tally[code])}
+                        for code in np.argsort(-tally, kind="stable") if tally[code]]
+
+    facets = {"total": total, "stats": stats, "counts": counts}
+    if price is not None and price in names:
+        column = matrix[:, names.index(price)]
+        edges = np.array(PRICE_BUCKETS, dtype=np.float64)
+        # NaN and prices below the first edge are in no bucket
+        column = column[column >= edges[0]]
+        tally = np.bincount(np.searchsorted(edges, column, side="right") - 1, minlength=len(edges))
+        facets["priceBuckets"] = [
+            {"min": PRICE_BUCKETS[k], "max": PRICE_BUCKETS[k + 1] if k + 1 < len(PRICE_BUCKETS) else None,
+             "count": int(tally[k])}
+            for k in range(len(PRICE_BUCKETS))
+        ]
+    return facets
+
+
+def record_facets(records: Sequence[Dict[str, Any]], fields: Dict[str, str],
+                  categories: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    compute_facets() of a list of dicts.
+
+    Args:
+        records: The listings
+        fields: Column name -> numeric field of a record
+        categories: Facet name -> text field of a record
+    """
+    import numpy as np
+
+    matrix = np.empty((len(records), len(fields)), dtype=np.float64)
+    for i, field in enumerate(fields.values()):
+        matrix[:, i] = np.fromiter((_number(record.get(field)) for record in records), dtype=np.float64,
+                                   count=len(records))
+    coded = {}
+    for name, field in (categories or {}).items():
+        values = np.array([str(record.get(field) or "") for record in records], dtype=object)
+        labels, codes = np.unique(values, return_inverse=True)
+        coded[name] = (codes.astype(np.intp).reshape(-1), [str(label) for label in labels])
+    return compute_facets(matrix, list(fields), coded)
+
+
+class ListingTable:
+    """
+    The listings of one search, with a numpy column per filterable field.
+
+    Args:
+        results: Zillow search results, for the column values
+        rows: The listings as returned to the client, in the same order
+        upstream_pages: Zillow's totalPages for the search; the table holds its first page
+    """
+
+    def __init__(self, results: Sequence[Dict[str, Any]], rows: List[Dict[str, Any]], upstream_pages: int = 1):
+        import numpy as np
+
+        self.rows = rows
+        self.upstream_pages = upstream_pages
+        # One row per listing, one column per COLUMNS entry; columns are views into it
+        self.matrix = np.empty((len(results), len(COLUMNS)), dtype=np.float64)
+        self.columns = {}
+        for i, (column, field) in enumerate(COLUMNS.items()):
+            self.matrix[:, i] = np.fromiter((_number(result.get(field)) for result in results), dtype=np.float64,
+                                            count=len(results))
+            self.columns[column] = self.matrix[:, i]
+        home_types = np.array([str(result.get("homeType") or "") for result in results], dtype=object)
+        labels, codes = np.unique(home_types, return_inverse=True)
+        self.home_type_labels = [str(label) for label in labels]
+        self.home_type_codes = codes.astype(np.intp).reshape(-1)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def mask(self, query: ListingQuery):
+        """Boolean array of the rows matching the query's filters."""
+        import numpy as np
+
+        mask = np.ones(len(self.rows), dtype=bool)
+        for column, (low, high) in query.ranges.items():
+            values = self.columns[column]
+            # NaN (unknown) compares False, so listings without the field drop out
+            mask &= (values >= low) & (values <= high)
+        if query.home_types is not None:
+            allowed = np.array([label in query.home_types for label in self.home_type_labels], dtype=bool)
+            mask &= allowed[self.home_type_codes]
+        return mask
+
+    def matching(self, query: ListingQuery):
+        """Indices of the rows matching the query's filters, in table order."""
+        import numpy as np
+
+        return np.flatnonzero(self.mask(query)) if query.has_filters() else np.arange(len(self.rows))
+
+    def select(self, query: ListingQuery, page: int = 1, page_size: int = DEFAULT_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Rows of one page of the query's results.
+
+        Returns:
+            (rows, total), where total is the number of matching listings
+        """
+        return self.select_range(query, (page - 1) * page_size, page * page_size)
+
+    def select_range(self, query: ListingQuery, start: int, stop: int,
+                     matched=None) -> Tuple[List[Dict[str, Any]], int]:
+        """Rows start..stop of the query's results, and the number of matching listings."""
+        import numpy as np
+
+        if matched is None:
+            matched = self.matching(query)
+        total = len(matched)
+        if start >= total:
+            return [], total
+        end = min(total, stop)
+        if query.sort_by is not None:
+            column, descending = SORT_KEYS[query.sort_by]
+            values = self.columns[column][matched]
+            if descending:
+                values = -values
+            # Unknown values sort last either way
+            values = np.where(np.isnan(values), np.inf, values)
+            if end < total:
+                # Only the first `end` positions need to be in order
+                candidates = np.argpartition(values, end - 1)[:end]
+                order = candidates[np.argsort(values[candidates], kind="stable")]
+            else:
+                order = np.argsort(values, kind="stable")
+            matched = matched[order]
+        return [self.rows[i] for i in matched[start:end]], total
+
+    def facets(self, matched) -> Dict[str, Any]:
+        """compute_facets() of the rows at the indices in matched."""
+        return compute_facets(self.matrix[matched], list(COLUMNS),
+                              {"homeType": (self.home_type_codes[matched], self.home_type_labels)})
+
+    def facet_page(self, query: ListingQuery, page: int = 1,
+                   page_size: int = DEFAULT_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], int, Dict[str, Any]]:
+        """
+        One page of the query's results and the facets of all of them.
+
+        Returns:
+            (rows, total, facets)
+        """
+        matched = self.matching(query)
+        rows, total = self.select_range(query, (page - 1) * page_size, page * page_size, matched)
+        return rows, total, self.facets(matched)
+
+
+class ListingTableCache:
+    """ListingTable per ZIP code, dropped after ttl seconds or when least recently used."""
+
+    def __init__(self, ttl: float = SEARCH_CACHE_TTL, max_entries: int = SEARCH_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0}
+
+    def get(self, key: str) -> Optional[ListingTable]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            expires, table = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return table
+
+    def put(self, key: str, table: ListingTable):
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, table)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"entries": len(self.entries), "ttl_seconds": self.ttl, **self.stats}
@@ -0,0 +1,175 @@
+# listing_stream.py
+"""
+Incremental parsing of Zillow search responses, and opaque page cursors.
+
+search_nearby_houses() reads the whole search response, json.loads() it and
+formats every listing before returning anything, so memory grows with the
+size of the result and the client waits for the last byte. For
+/api/properties/stream the body is read in chunks instead, and
+iter_json_object() hands out the elements of its "results" array one at a
+time, as soon as each is complete. The endpoint writes each matching listing
+as an NDJSON line as soon as it is parsed. It keeps the results of a Zillow
+page of up to PROPERTIES_STREAM_CACHE_MAX listings, to cache it; for a
+larger one it stops reading once the page is full, so memory is bounded by
+one listing plus a read buffer.
+
+The parser only understands the shape it needs, a top-level JSON object.
+Each element of the streamed array, and every other top-level value, is
+decoded with json's raw_decode() once enough of it has arrived.
+
+A page ends with a cursor for the next one. The cursor is base64 of a small
+JSON state (upstream page, offset of the next matching listing in it, and a
+digest of the filters it was created for), so the next request picks up
+where the previous one stopped without the server keeping any state.
+"""
+import base64
+import codecs
+import json
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from ui_context import content_hash
+
+CURSOR_VERSION = 1
+
+_WHITESPACE = " \t\n\r"
+
+
+class IncompleteJSON(ValueError):
+    """The stream ended in the middle of the document."""
+
+
+class _Reader:
+    """Text buffer over an iterator of byte chunks."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Read one more chunk; False at the end of the stream."""
+        if self.eof:
+            return False
+        # Drop what has been consumed so the buffer stays small
+        if self.pos > 65536:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        for chunk in self.chunks:
+            text = self.decoder.decode(chunk)
+            if text:
+                self.buffer += text
+                return True
+        self.buffer += self.decoder.decode(b"", final=True)
+        self.eof = True
+        return False
+
+    def peek(self) -> str:
+        """Next non-whitespace character, without consuming it."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise IncompleteJSON("Unexpected end of JSON stream")
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}, found {found!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next JSON value, reading more chunks until it is complete."""
+        self.peek()
+        decoder = json.JSONDecoder()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number, true/false/null at the end of the buffer may be cut short
+            if end < len(self.buffer) or self.eof or self.buffer[end - 1] in "}]\"":
+                self.pos = end
+                return value
+            if not self.fill():
+                self.pos = end
+                return value
+
+
+def iter_json_object(chunks: Iterable[bytes], array_key: str) -> Iterator[Tuple[str, Any]]:
+    """
+    Parse a JSON object from byte chunks, streaming one of its arrays.
+
+    Yields:
+        ("item", element) for each element of obj[array_key], in order, and
+        ("field", (key, value)) for every other top-level key
+    """
+    reader = _Reader(chunks)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        if not isinstance(key, str):
+            raise ValueError(f"Expected an object key at offset {reader.pos}")
+        reader.expect(":")
+        if key == array_key and reader.peek() == "[":
+            reader.pos += 1
+            if reader.peek() == "]":
+                reader.pos += 1
+            else:
+                while True:
+                    yield "item", reader.value()
+                    separator = reader.peek()
+                    reader.pos += 1
+                    if separator == "]":
+                        break
+                    if separator != ",":
+                        raise ValueError(f"Expected ',' or ']' at offset {reader.pos - 1}")
+        else:
+            yield "field", (key, reader.value())
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == "}":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or '}}' at offset {reader.pos - 1}")
+
+
+def query_digest(zipcode: str, filters: Dict[str, Any]) -> str:
+    """Short hash tying a cursor to the search it was issued for."""
+    return content_hash({"zip": zipcode, **filters})[:12]
+
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    data = json.dumps({"v": CURSOR_VERSION, **state}, separators=(",", ":"), sort_keys=True)
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, digest: str) -> Dict[str, Any]:
+    """
+    State of a cursor from encode_cursor().
+
+    Raises:
+        ValueError: The cursor is malformed, from another version, or was
+            issued for a different ZIP code or filters
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("Malformed cursor") from e
+    if not isinstance(state, dict) or state.get("v") != CURSOR_VERSION:
+        raise ValueError("Unsupported cursor version")
+    if state.get("q") != digest:
+        raise ValueError("Cursor does not belong to this search")
+    return state
+
+
+def ndjson_line(kind: str, payload: Optional[Dict[str, Any]] = None) -> bytes:
+    return (json.dumps({"type": kind, **(payload or {})}, separators=(",", ":"), default=str) + "\n").encode("utf-8")
@@ -0,0 +1,306 @@
+# llm_gateway.py
+"""
+Admission control for Azure OpenAI calls.
+
+Chat, feature extraction and query classification used to call
+LLM.invoke() directly on the event loop. That serialized them and blocked
+every other request while a completion was running. Under load the calls
+also piled up on one deployment without limit, until they timed out
+together.
+
+Every LLM call now goes through LLMGateway.invoke():
+
+- Calls are routed to a tier. Cheap tasks (classification, extraction) can
+  go to a smaller deployment (LLM_SMALL_DEPLOYMENT); everything else uses
+  the default one.
+- Each tier has a bounded number of calls in flight (TierLimiter). Waiting
+  calls queue per session, and sessions are served round-robin, so one
+  chatty session cannot starve the others.
+- Admission is deadline-aware. A call whose estimated queue wait exceeds the
+  task's SLA is rejected up front, as is a call that waits longer than the
+  SLA. Chat can fall back to the small tier instead (degrade). Callers see
+  LLMOverloaded, which carries a Retry-After hint.
+- The completion itself runs with ainvoke() on the event loop, so waiting
+  for the model no longer blocks other requests.
+
+Limits are per process; with several workers each has its own.
+
+Environment variables:
+    LLM_MAX_IN_FLIGHT      concurrent calls per tier, default 8
+    LLM_MAX_QUEUE          waiting calls per tier, default 64
+    LLM_QUEUE_SLA_CHAT     longest queue wait for chat in seconds, default 10
+    LLM_QUEUE_SLA_CHEAP    same for classification/extraction, default 3
+    LLM_SMALL_DEPLOYMENT   Azure deployment for cheap tasks; unset = one tier
+    LLM_CHEAP_TASKS        default "classify_query,extract_features"
+    LLM_CHAT_FALLBACK      "true" (default) to degrade chat to the small tier
+"""
+import asyncio
+import collections
+import itertools
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+from telemetry import UPSTREAM_QUEUE_WAIT, add_span, upstream_span
+from upstream_scheduler import current_priority
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIER = "default"
+SMALL_TIER = "small"
+
+
+class LLMUnavailable(Exception):
+    """Raised when no client can be built for the requested tier."""
+
+
+class LLMOverloaded(Exception):
+    """Raised when a call is not admitted within its queueing SLA."""
+
+    def __init__(self, tier: str, reason: str, retry_after: float):
+        super().__init__(f"LLM tier {tier} overloaded ({reason}), retry in {retry_after:.1f}s")
+        self.tier = tier
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TierLimiter:
+    """
+    Bounded in-flight calls for one deployment, with a fair queue of waiters.
+
+    Waiters are grouped by session; when a slot frees up it goes to the
+    first waiter of the next session in round-robin order.
+    """
+
+    def __init__(self, tier: str, max_in_flight: int, max_queue: int):
+        self.tier = tier
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self.sessions: Dict[str, collections.deque] = {}
+        self.rotation = collections.deque()
+        # Exponentially weighted mean of call durations, for the wait estimate
+        self.service_seconds = None
+        self.stats = {
+            "admitted": 0,
+            "rejected_queue_full": 0,
+            "rejected_deadline": 0,
+            "timed_out": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "max_queue_depth": 0,
+        }
+
+    def estimated_wait(self) -> float:
+        """Expected queueing time for a call arriving now."""
+        if self.in_flight < self.max_in_flight and not self.waiting:
+            return 0.0
+        if self.service_seconds is None:
+            return 0.0
+        return (self.waiting + 1) / self.max_in_flight * self.service_seconds
+
+    def check_admission(self, sla: float) -> Optional[str]:
+        """Reason the call would be rejected right away, or None."""
+        if self.in_flight < self.max_in_flight and not self.waiting:
+            return None
+        if self.waiting >= self.max_queue:
+            return "queue_full"
+        if self.estimated_wait() > sla:
+            return "deadline"
+        return None
+
+    async def acquire(self, session_key: str, sla: float) -> float:
+        """
+        Wait for a slot.
+
+        Args:
+            session_key: Fairness key, normally the chat session id
+            sla: Longest acceptable queue wait in seconds
+
+        Returns:
+            Seconds spent waiting
+        """
+        reason = self.check_admission(sla)
+        if reason is not None:
+            self.stats[f"rejected_{reason}"] += 1
+            raise LLMOverloaded(self.tier, reason, max(1.0, self.estimated_wait()))
+        if self.in_flight < self.max_in_flight and not self.waiting:
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            return 0.0
+
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        queue = self.sessions.get(session_key)
+        if queue is None:
+            queue = self.sessions[session_key] = collections.deque()
+            self.rotation.append(session_key)
+        queue.append(future)
+        self.waiting += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.waiting)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=sla)
+        except asyncio.TimeoutError:
+            if future.done():
+                # The slot was handed over just as the timeout fired; give it back
+                self.release()
+            else:
+                self._remove(session_key, future)
+            self.stats["timed_out"] += 1
+            raise LLMOverloaded(self.tier, "timeout", max(1.0, self.estimated_wait()))
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                self._remove(session_key, future)
+            raise
+        waited = time.monotonic() - start
+        self.stats["admitted"] += 1
+        self.stats["wait_seconds_total"] += waited
+        self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], waited)
+        return waited
+
+    def _remove(self, session_key: str, future: asyncio.Future):
+        future.cancel()
+        queue = self.sessions.get(session_key)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self.waiting -= 1
+            if not queue:
+                del self.sessions[session_key]
+                self.rotation.remove(session_key)
+
+    def release(self, duration: Optional[float] = None):
+        """Free a slot, handing it to the next session's waiter if there is one."""
+        if duration is not None:
+            self.service_seconds = duration if self.service_seconds is None else (
+                0.8 * self.service_seconds + 0.2 * duration
+            )
+        while self.rotation:
+            session_key = self.rotation.popleft()
+            queue = self.sessions[session_key]
+            future = queue.popleft()
+            self.waiting -= 1
+            if queue:
+                self.rotation.append(session_key)
+            else:
+                del self.sessions[session_key]
+            if not future.done():
+                # The slot moves to the waiter; in_flight stays the same
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "sessions_waiting": len(self.sessions),
+            "estimated_wait_seconds": round(self.estimated_wait(), 3),
+            "mean_call_seconds": round(self.service_seconds, 3) if self.service_seconds is not None else None,
+            **self.stats,
+        }
+
+
+class LLMGateway:
+    """
+    Routes LLM calls to a deployment tier and admits them through its TierLimiter.
+
+    Args:
+        client_factory: tier -> LangChain chat model, or None if unavailable
+        max_in_flight: Concurrent calls per tier
+        max_queue: Waiting calls per tier before new ones are rejected
+        slas: Longest acceptable queue wait per task, with "default" as fallback
+        cheap_tasks: Tasks sent to the small tier when it is configured
+        small_tier: Whether a small deployment is configured
+        chat_fallback: Let chat degrade to the small tier instead of being rejected
+    """
+
+    def __init__(self, client_factory: Callable[[str], Any], max_in_flight: int = 8, max_queue: int = 64,
+                 slas: Optional[Dict[str, float]] = None, cheap_tasks=("classify_query", "extract_features"),
+                 small_tier: bool = False, chat_fallback: bool = True):
+        self.client_factory = client_factory
+        self.slas = {"default": 10.0, **(slas or {})}
+        self.cheap_tasks = set(cheap_tasks)
+        self.small_tier = small_tier
+        self.chat_fallback = chat_fallback
+        self.limiters = {DEFAULT_TIER: TierLimiter(DEFAULT_TIER, max_in_flight, max_queue)}
+        if small_tier:
+            self.limiters[SMALL_TIER] = TierLimiter(SMALL_TIER, max_in_flight, max_queue)
+        self.anonymous = itertools.count()
+        self.stats = {"degraded": 0}
+
+    def route(self, task: str) -> str:
+        return SMALL_TIER if self.small_tier and task in self.cheap_tasks else DEFAULT_TIER
+
+    def sla(self, task: str) -> float:
+        return self.slas.get(task, self.slas["default"])
+
+    async def invoke(self, messages, task: str, session_key: Optional[str] = None) -> Any:
+        """
+        Run a chat completion once its tier admits it.
+
+        Args:
+            messages: Chat messages for the model
+            task: Call type, e.g. "chat", "extract_features", "classify_query"
+            session_key: Fairness key; calls without one each get their own queue
+
+        Raises:
+            LLMOverloaded: The call was not admitted within the task's SLA
+            LLMUnavailable: No client could be built for the tier
+        """
+        if session_key is None:
+            session_key = f"anonymous-{next(self.anonymous)}"
+        tier = self.route(task)
+        sla = self.sla(task)
+        limiter = self.limiters[tier]
+        if (tier == DEFAULT_TIER and task not in self.cheap_tasks and self.chat_fallback and self.small_tier
+                and limiter.check_admission(sla) is not None):
+            logger.warning("LLM %s queue over its SLA, degrading %s to the %s tier", tier, task, SMALL_TIER)
+            self.stats["degraded"] += 1
+            tier, limiter = SMALL_TIER, self.limiters[SMALL_TIER]
+
+        llm = self.client_factory(tier)
+        if llm is None:
+            raise LLMUnavailable(f"No LLM client for tier {tier}")
+        waited = await limiter.acquire(session_key, sla)
+        UPSTREAM_QUEUE_WAIT.observe((f"azure_openai_{tier}", current_priority.get().name.lower()), waited)
+        if waited > 0.05:
+            add_span("azure_openai_queue", waited)
+            logger.info("LLM %s call waited %.2fs in the %s queue", task, waited, tier)
+        start = time.monotonic()
+        try:
+            with upstream_span("azure_openai", task):
+                return await llm.ainvoke(messages)
+        finally:
+            limiter.release(time.monotonic() - start)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "tiers": {tier: limiter.metrics() for tier, limiter in self.limiters.items()},
+            "routing": {task: self.route(task) for task in sorted(self.cheap_tasks | {"chat"})},
+            "slas": dict(self.slas),
+            **self.stats,
+        }
+
+
+def gateway_from_env(client_factory: Callable[[str], Any]) -> LLMGateway:
+    """Build the gateway from the LLM_* environment variables."""
+    cheap_tasks = os.environ.get("LLM_CHEAP_TASKS", "classify_query,extract_features")
+    return LLMGateway(
+        client_factory,
+        max_in_flight=int(os.environ.get("LLM_MAX_IN_FLIGHT", 8)),
+        max_queue=int(os.environ.get("LLM_MAX_QUEUE", 64)),
+        slas={
+            "default": float(os.environ.get("LLM_QUEUE_SLA", 10)),
+            "chat": float(os.environ.get("LLM_QUEUE_SLA_CHAT", 10)),
+            "extract_features": float(os.environ.get("LLM_QUEUE_SLA_CHEAP", 3)),
+            "classify_query": float(os.environ.get("LLM_QUEUE_SLA_CHEAP", 3)),
+        },
+        cheap_tasks=[task.strip() for task in cheap_tasks.split(",") if task.strip()],
+        small_tier=bool(os.environ.get("LLM_SMALL_DEPLOYMENT")),
+        chat_fallback=os.environ.get("LLM_CHAT_FALLBACK", "true").lower() in ("1", "true", "yes"),
+    )
@@ -0,0 +1,154 @@
+# logging_setup.py
+"""
+Logging configuration for the backend.
+
+Handlers do their I/O on a background thread (QueueHandler/QueueListener),
+so a log call on the event loop only appends the record to a queue. The message
+itself is rendered on the calling thread, so arguments a request goes on
+changing are logged as they were at the call. Large payload dumps (upstream
+responses, LLM output, extracted features) go through log_payload(), which
+samples them and leaves their serialization to the background thread.
+
+Environment variables:
+    LOG_LEVEL                  default INFO
+    LOG_FORMAT                 "text" (default) or "json" for one JSON object per line
+    LOG_ASYNC                  "true" (default) to write from a background thread
+    LOG_PAYLOAD_SAMPLE_RATE    fraction of payload dumps to emit, default 0.01
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+PAYLOAD_SAMPLE_RATE = float(os.environ.get("LOG_PAYLOAD_SAMPLE_RATE", 0.01))
+
+# Attributes every LogRecord has; anything else was passed via extra=
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including fields passed with extra=."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+_SCALARS = (str, int, float, bool, type(None))
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that defers only LazyJson payloads to the listener thread.
+
+    The message is rendered here, on the calling thread: a dict or list
+    argument formatted later could already have changed. A record with a
+    LazyJson argument keeps it for the listener and has its other arguments
+    snapshotted as strings. Unlike the stock handler, the exception text is
+    not formatted here; the queue is in-process, so exc_info is passed as is.
+    """
+
+    def prepare(self, record):
+        args = record.args
+        if isinstance(args, tuple) and any(isinstance(arg, LazyJson) for arg in args):
+            record.args = tuple(arg if isinstance(arg, (LazyJson, *_SCALARS)) else str(arg) for arg in args)
+        elif args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class LazyJson:
+    """Serializes its payload only if the record is actually formatted."""
+
+    def __init__(self, payload, limit=None):
+        self.payload = payload
+        self.limit = limit
+
+    def __str__(self):
+        text = self.payload if isinstance(self.payload, str) else json.dumps(self.payload, default=str)
+        if self.limit and len(text) > self.limit:
+            return text[:self.limit] + "..."
+        return text
+
+
+def log_payload(logger, label, payload, limit=2000, sample_rate=None):
+    """
+    Log a (possibly large) payload for debugging, for a sample of calls only.
+
+    Args:
+        logger: Logger to use
+        label: Short description of the payload
+        payload: str or JSON-serializable object
+        limit: Maximum number of characters to log
+        sample_rate: Overrides LOG_PAYLOAD_SAMPLE_RATE
+    """
+    rate = PAYLOAD_SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate <= 0 or not logger.isEnabledFor(logging.INFO):
+        return
+    if rate < 1 and random.random() >= rate:
+        return
+    logger.info("%s: %s", label, LazyJson(payload, limit), extra={"payload_sampled": True})
+
+
+_listener = None
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_listener_after_fork():
+    # Only the forking thread survives fork(), so a worker forked from a
+    # gunicorn master that configured logging has a queue but no listener
+    global _listener
+    if _listener is not None:
+        _listener = logging.handlers.QueueListener(_listener.queue, *_listener.handlers,
+                                                   respect_handler_level=_listener.respect_handler_level)
+        _listener.start()
+
+
+atexit.register(_stop_listener)
+os.register_at_fork(after_in_child=_restart_listener_after_fork)
+
+
+def configure_logging():
+    """Install the root handler according to the LOG_* environment variables."""
+    global _listener
+    level = os.environ.get("LOG_LEVEL", "INFO").upper()
+    if os.environ.get("LOG_FORMAT", "text").lower() == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(formatter)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    if os.environ.get("LOG_ASYNC", "true").lower() in ("1", "true", "yes"):
+        _stop_listener()
+        log_queue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        handler = DeferredQueueHandler(log_queue)
+    else:
+        _stop_listener()
+        handler = stream_handler
+    root.handlers = [handler]
@@ -0,0 +1,127 @@
+# market_compare.py
+"""
+Side-by-side comparison of several markets for /api/market_compare.
+
+Comparing a ZIP with the ones from /api/nearby_zips, or with the
+nearbyAreaTrends of /api/market_trends, took one /api/market_trends round
+trip per location and left the arithmetic to the client. The endpoint now
+takes every location at once. Locations the market history
+(market_history.py) fetched within MARKET_COMPARE_MAX_AGE are compared
+from it; the others are fetched from Zillow concurrently, which also adds
+them to the history.
+
+compare_markets() works on the locations x months matrix of median rents
+(MarketHistory.matrix()) in one pass of numpy operations:
+
+- latest median rent, and its difference from the first (base) location
+- month over month and year over year change of the latest rent
+- trend: a least-squares fit of log rent over the months each location
+  has, as percent per year, so gaps and short histories are handled
+- rank by rent and by trend (1 = highest)
+
+The payload is matrix-shaped for charts: one list of month labels, one
+row of rents per location, and a metrics table of columns and rows.
+
+Environment variables:
+    MARKET_COMPARE_MAX      locations per request, default 12
+    MARKET_COMPARE_MONTHS   default number of months compared, default 24
+    MARKET_COMPARE_MAX_AGE  seconds stored market data is used before it is fetched again, default 86400
+"""
+import os
+from typing import Any, Dict, List, Optional
+
+MAX_LOCATIONS = int(os.environ.get("MARKET_COMPARE_MAX", 12))
+DEFAULT_MONTHS = int(os.environ.get("MARKET_COMPARE_MONTHS", 24))
+MAX_AGE = float(os.environ.get("MARKET_COMPARE_MAX_AGE", 86400))
+MAX_MONTHS = 240
+# Months a location needs before it gets a trend
+MIN_TREND_MONTHS = 3
+
+METRIC_COLUMNS = ("medianRent", "deltaVsBase", "deltaVsBasePercent", "momPercent", "yoyPercent",
+                  "trendPercentPerYear", "rentRank", "trendRank", "availableRentals", "temperature")
+
+
+def _plain(values) -> list:
+    """
+    Nested lists of an array rounded to cents: ints where whole, None for NaN.
+
+    Converted as one object array; a Python call per value took ten times as
+    long for a 1000 x 240 matrix.
+    """
+    import numpy as np
+
+    rounded = np.round(values, 2)
+    missing = np.isnan(rounded)
+    whole = ~missing & (rounded == np.floor(rounded))
+    plain = rounded.astype(object)
+    plain[whole] = rounded[whole].astype(np.int64)
+    plain[missing] = None
+    return plain.tolist()
+
+
+def _ranks(values) -> List[Optional[int]]:
+    """1 for the highest value, None where it is NaN."""
+    import numpy as np
+
+    known = ~np.isnan(values)
+    order = np.argsort(-np.where(known, values, -np.inf), kind="stable")
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[order] = np.arange(1, len(values) + 1)
+    return [rank if ok else None for rank, ok in zip(ranks.tolist(), known.tolist())]
+
+
+def compare_markets(locations: List[str], names: List[Optional[str]], months: List[str], rents,
+                    latest: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Comparative metrics of markets; the first location is the base.
+
+    Args:
+        locations: Locations as requested
+        names, months, rents, latest: MarketHistory.matrix() of them
+
+    Returns:
+        {"base", "locations", "months", "medianRent", "metrics": {"columns", "rows"}, "missing"}
+    """
+    import numpy as np
+
+    count, width = rents.shape
+    known = ~np.isnan(rents)
+    has = known.any(axis=1)
+    rows = np.arange(count)
+    # Column of each location's latest month
+    last = np.where(has, width - 1 - np.argmax(known[:, ::-1], axis=1), 0)
+
+    def back(offset):
+        columns = last - offset
+        return np.where(has & (columns >= 0), rents[rows, np.clip(columns, 0, None)], np.nan)
+
+    current, previous_month, previous_year = back(0), back(1), back(12)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        base = current[0]
+        delta = current - base
+        delta_percent = delta / base * 100 if base else np.full(count, np.nan)
+        mom = (current / previous_month - 1) * 100
+        yoy = (current / previous_year - 1) * 100
+
+        # Weighted least squares of log rent on month, weight 1 where the month is known
+        usable = known & (rents > 0)
+        weights = usable.astype(np.float64)
+        log_rents = np.log(np.where(usable, rents, 1.0))
+        points = weights.sum(axis=1)
+        x = np.arange(width, dtype=np.float64)
+        x_mean = (weights * x).sum(axis=1) / points
+        y_mean = (weights * log_rents).sum(axis=1) / points
+        dx = (x - x_mean[:, None]) * weights
+        slope = (dx * (log_rents - y_mean[:, None])).sum(axis=1) / (dx * (x - x_mean[:, None])).sum(axis=1)
+        trend = np.where(points >= MIN_TREND_MONTHS, np.expm1(slope * 12) * 100, np.nan)
+
+    columns = (*_plain(np.stack([current, delta, delta_percent, mom, yoy, trend])), _ranks(current), _ranks(trend),
+               [point.get("available_rentals") for point in latest], [point.get("temperature") for point in latest])
+    return {
+        "base": names[0] or locations[0],
+        "locations": [name or location for name, location in zip(names, locations)],
+        "months": months,
+        "medianRent": _plain(rents),
+        "metrics": {"columns": list(METRIC_COLUMNS), "rows": [list(row) for row in zip(*columns)]},
+        "missing": [location for name, location in zip(names, locations) if name is None],
+    }
@@ -0,0 +1,644 @@
+# market_history.py
+"""
+Local time series of market snapshots per location, with precomputed rollups.
+
+/api/market_trends fetched Zillow's /market_data on every request and only
+derived a YTD change and last year's quarterly averages from that single
+response, which covers at most 24 months. Every response now also goes into
+MarketHistory, so the history of a location keeps growing past what one
+response covers, and trend queries over many years and locations are served
+from memory.
+
+- A market page contributes one point per month of its
+  medianRentPriceOverTime (current and previous year), the current month's
+  summary (median rent, available rentals, market temperature), and the
+  current median rent of each nearby area. A later value for a month
+  replaces the earlier one.
+- Locations are keyed by their normalized area name ("chicago, il"). The
+  query that was used ("60616", "Chicago") is remembered as an alias.
+- Rollups are kept up to date incrementally. A new or changed month
+  recomputes only its own monthly row, the next month's row (month over
+  month change) and the row a year later (YoY change), and likewise for
+  its quarter and year. Queries slice the precomputed rows by month range.
+- Changed points are appended to a JSONL log at MARKET_HISTORY_PATH, one
+  line per location and page, and replayed at start-up. Unchanged points
+  are not written again; a fetch that changed nothing appends a line with
+  only its fetched_at. Replay stores the points first and builds each
+  location's rollups once, with numpy; a log mostly made of superseded
+  values is rewritten (compact()).
+- Every gunicorn worker has its own MarketHistory over the same log. Before
+  answering, a worker replays the lines other workers appended since it
+  last read the log, or the whole log if another worker compacted it.
+  Appends hold a shared lock on <log>.lock and compaction an exclusive one,
+  so no line is lost to a rewrite.
+
+app.refresh_market_history() re-fetches the stored locations in the
+background every MARKET_HISTORY_REFRESH_INTERVAL seconds, in the one worker
+that holds the lock on <log>.refresh (claim_refresh()).
+
+benchmarks/market_history_bench.py measures ingestion, load and query time
+over many locations and years.
+
+Environment variables:
+    MARKET_HISTORY_PATH     JSONL log, default data/market_history.jsonl; empty to keep it in memory only
+    MARKET_HISTORY_REFRESH_INTERVAL  seconds between background refreshes of stored locations,
+                            default 86400; 0 to disable
+"""
+import bisect
+import contextlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no locking between processes, fine for a single worker
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+HISTORY_PATH = os.environ.get("MARKET_HISTORY_PATH", os.path.join(DATA_DIR, "market_history.jsonl"))
+REFRESH_INTERVAL = float(os.environ.get("MARKET_HISTORY_REFRESH_INTERVAL", 86400))
+
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+# Fields a point may carry besides the median rent
+POINT_FIELDS = ("available_rentals", "temperature")
+
+_SPACES = re.compile(r"\s+")
+
+
+def location_key(name: Optional[str]) -> Optional[str]:
+    """Normalized location name: lowercase, single spaces, without a trailing ", USA"."""
+    if not name:
+        return None
+    key = _SPACES.sub(" ", str(name).strip().lower())
+    if key.endswith(", usa"):
+        key = key[:-5]
+    return key or None
+
+
+def month_index(year: int, month: int) -> int:
+    """Months since year 0; month is 1-12."""
+    return year * 12 + month - 1
+
+
+def month_label(index: int) -> str:
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def parse_month(value: Any) -> Optional[int]:
+    """month_index() of "2025-04" or "2025-04-01"; None if it is not a date."""
+    match = re.match(r"^(\d{4})-(\d{1,2})", str(value or ""))
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        return None
+    return month_index(int(match.group(1)), int(match.group(2)))
+
+
+def _log_month(label: str) -> Optional[int]:
+    """parse_month() of a month_label(), without the regular expression."""
+    try:
+        return month_index(int(label[:4]), int(label[5:7]))
+    except ValueError:
+        return parse_month(label)
+
+
+def _change_percent(value: Optional[float], previous: Optional[float]) -> Optional[float]:
+    if value is None or not previous:
+        return None
+    return round((value / previous - 1) * 100, 2)
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def points_from_market_page(market_page: Dict[str, Any],
+                            query: Optional[str] = None) -> List[Tuple[str, str, int, Dict[str, Any], bool]]:
+    """
+    Points in a Zillow marketPage.
+
+    Args:
+        market_page: data.marketPage of a /market_data response
+        query: The location that was requested, as a fallback name
+
+    Returns:
+        (location key, display name, month index, values, nearby) tuples; nearby
+        is True for the points of nearbyAreaTrends
+    """
+    name = market_page.get("areaName") or query
+    key = location_key(name)
+    if key is None:
+        return []
+    points = []
+    over_time = market_page.get("medianRentPriceOverTime") or {}
+    for entry in (over_time.get("prevYear") or []) + (over_time.get("currentYear") or []):
+        month = entry.get("month")
+        if month not in MONTHS or not str(entry.get("year", "")).isdigit() or not _is_number(entry.get("price")):
+            continue
+        points.append((key, name, month_index(int(entry["year"]), MONTHS.index(month) + 1),
+                       {"median_rent": entry["price"]}, False))
+
+    current = parse_month(market_page.get("date"))
+    if current is not None:
+        summary = market_page.get("summary") or {}
+        values = {}
+        if _is_number(summary.get("medianRent")):
+            values["median_rent"] = summary["medianRent"]
+        if _is_number(summary.get("availableRentals")):
+            values["available_rentals"] = summary["availableRentals"]
+        temperature = (market_page.get("marketTemperature") or {}).get("temperature")
+        if temperature:
+            values["temperature"] = temperature
+        if values:
+            points.append((key, name, current, values, False))
+    for area in market_page.get("nearbyAreaTrends") or []:
+        area_key = location_key(area.get("areaName"))
+        month = parse_month(area.get("date")) if area.get("date") else current
+        if area_key and month is not None and _is_number(area.get("medianRent")):
+            points.append((area_key, area["areaName"], month, {"median_rent": area["medianRent"]}, True))
+    return points
+
+
+class MarketSeries:
+    """Monthly points of one location and their monthly, quarterly and yearly rollups."""
+
+    def __init__(self, key: str, name: str):
+        self.key = key
+        self.name = name
+        self.points: Dict[int, Dict[str, Any]] = {}
+        self.months: List[int] = []
+        self.monthly: Dict[int, Dict[str, Any]] = {}
+        self.quarterly: Dict[int, Dict[str, Any]] = {}
+        self.quarters: List[int] = []
+        self.yearly: Dict[int, Dict[str, Any]] = {}
+        self.years: List[int] = []
+        self.fetched_at = 0.0
+
+    def set(self, month: int, values: Dict[str, Any], roll: bool = True) -> bool:
+        """
+        Merge values into a month's point and update the rollups; False if nothing changed.
+
+        With roll=False only the point is stored, and rebuild() must be called
+        before the next query.
+        """
+        point = self.points.get(month, {})
+        changed = {field: value for field, value in values.items() if point.get(field) != value}
+        if not changed:
+            return False
+        if month not in self.points:
+            self.points[month] = point
+            if roll:
+                bisect.insort(self.months, month)
+        point.update(changed)
+        if not roll:
+            return True
+        if "median_rent" in changed:
+            for affected in (month, month + 1, month + 12):
+                self._roll_month(affected)
+            for quarter in (month // 3, month // 3 + 4):
+                self._roll_period(quarter, 3, self.quarterly, self.quarters)
+            for year in (month // 12, month // 12 + 1):
+                self._roll_period(year, 12, self.yearly, self.years)
+        else:
+            self._roll_month(month)
+        return True
+
+    def rebuild(self):
+        """Recompute every rollup from the points, over numpy arrays of whole years."""
+        import numpy as np
+
+        self.months = sorted(self.points)
+        self.monthly, self.quarterly, self.yearly = {}, {}, {}
+        self.quarters, self.years = [], []
+        if not self.months:
+            return
+        first = self.months[0] - self.months[0] % 12
+        # One spare year in front, so the previous month and year are plain shifts
+        rents = np.full(((self.months[-1] - first) // 12 + 2) * 12, np.nan)
+        for month in self.months:
+            rent = self.points[month].get("median_rent")
+            if _is_number(rent):
+                rents[month - first + 12] = rent
+        previous_month = np.roll(rents, 1)
+        previous_year = np.roll(rents, 12)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mom = np.where(previous_month != 0, (rents / previous_month - 1) * 100, np.nan)
+            yoy = np.where(previous_year != 0, (rents / previous_year - 1) * 100, np.nan)
+        mom, yoy = mom.tolist(), yoy.tolist()
+        for month in self.months:
+            point, offset = self.points[month], month - first + 12
+            row = {"month": month_label(month), "median_rent": point.get("median_rent"),
+                   "mom_change_percent": None if math.isnan(mom[offset]) else round(mom[offset], 2),
+                   "yoy_change_percent": None if math.isnan(yoy[offset]) else round(yoy[offset], 2)}
+            for field in POINT_FIELDS:
+                if field in point:
+                    row[field] = point[field]
+            self.monthly[month] = row
+
+        known = ~np.isnan(rents)
+        paired = known & ~np.isnan(previous_year)
+        for length, rows, keys, name in ((3, self.quarterly, self.quarters, "quarter"),
+                                         (12, self.yearly, self.years, "year")):
+            counts = known.reshape(-1, length).sum(axis=1)[12 // length:].tolist()
+            sums = np.where(known, rents, 0).reshape(-1, length).sum(axis=1)[12 // length:].tolist()
+            pair_sums = np.where(paired, rents, 0).reshape(-1, length).sum(axis=1)[12 // length:].tolist()
+            previous_sums = np.where(paired, previous_year, 0).reshape(-1, length).sum(axis=1)[12 // length:].tolist()
+            for i, count in enumerate(counts):
+                if not count:
+                    continue
+                period = first // length + i
+                keys.append(period)
+                label = f"{period // 4:04d}-Q{period % 4 + 1}" if length == 3 else f"{period:04d}"
+                rows[period] = {name: label, "average_rent": round(sums[i] / count, 2), "months": count,
+                                "yoy_change_percent": _change_percent(pair_sums[i], previous_sums[i])}
+
+    def _rent(self, month: int) -> Optional[float]:
+        point = self.points.get(month)
+        return point.get("median_rent") if point else None
+
+    def _roll_month(self, month: int):
+        point = self.points.get(month)
+        if point is None:
+            return
+        rent = point.get("median_rent")
+        row = {"month": month_label(month), "median_rent": rent,
+               "mom_change_percent": _change_percent(rent, self._rent(month - 1)),
+               "yoy_change_percent": _change_percent(rent, self._rent(month - 12))}
+        for field in POINT_FIELDS:
+            if field in point:
+                row[field] = point[field]
+        self.monthly[month] = row
+
+    def _roll_period(self, period: int, length: int, rows: Dict[int, Dict[str, Any]], keys: List[int]):
+        first = period * length
+        rents = [self._rent(first + i) for i in range(length)]
+        known = [rent for rent in rents if rent is not None]
+        if not known:
+            return
+        if period not in rows:
+            bisect.insort(keys, period)
+        # YoY over the months both periods have, so a partial year compares like for like
+        pairs = [(rent, self._rent(first + i - 12)) for i, rent in enumerate(rents) if rent is not None]
+        pairs = [(rent, previous) for rent, previous in pairs if previous is not None]
+        yoy = _change_percent(sum(rent for rent, _ in pairs), sum(previous for _, previous in pairs)) if pairs else None
+        label = f"{period // 4:04d}-Q{period % 4 + 1}" if length == 3 else f"{period:04d}"
+        rows[period] = {"quarter" if length == 3 else "year": label, "average_rent": round(sum(known) / len(known), 2),
+                        "months": len(known), "yoy_change_percent": yoy}
+
+    def trends(self, start: Optional[int] = None, end: Optional[int] = None) -> Dict[str, Any]:
+        """Precomputed rows between two month indexes (inclusive), oldest first."""
+        start = self.months[0] if start is None else start
+        end = self.months[-1] if end is None else end
+        months = self.months[bisect.bisect_left(self.months, start):bisect.bisect_right(self.months, end)]
+        quarters = self.quarters[bisect.bisect_left(self.quarters, start // 3):
+                                 bisect.bisect_right(self.quarters, end // 3)]
+        years = self.years[bisect.bisect_left(self.years, start // 12):bisect.bisect_right(self.years, end // 12)]
+        monthly = [self.monthly[month] for month in months if month in self.monthly]
+        return {
+            "location": self.name,
+            "first_month": month_label(self.months[0]),
+            "latest_month": month_label(self.months[-1]),
+            "latest": self.monthly.get(self.months[-1]),
+            "monthly": monthly,
+            "quarterly": [self.quarterly[quarter] for quarter in quarters],
+            "yearly": [self.yearly[year] for year in years],
+            "fetched_at": self.fetched_at or None,
+        }
+
+
+class MarketHistory:
+    """
+    MarketSeries per location, persisted as an append-only JSONL log.
+
+    Args:
+        path: Log file; None to keep the history in memory only
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.series: Dict[str, MarketSeries] = {}
+        self.aliases: Dict[str, str] = {}
+        self.lock = threading.Lock()
+        # (st_dev, st_ino) of the log as last read, and how far it was read
+        self.log_id: Optional[Tuple[int, int]] = None
+        self.position = 0
+        self.refresh_lock = None
+        self.stats = {"pages": 0, "points_changed": 0, "lines_written": 0, "queries": 0, "write_errors": 0,
+                      "lines_replayed": 0}
+
+    def __len__(self):
+        return len(self.series)
+
+    def load(self) -> int:
+        """
+        Replay the log; returns the number of lines read.
+
+        The points are stored first and each location's rollups are built
+        once at the end. A log that has more than twice as many point values
+        as there are points is rewritten with compact().
+        """
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        start = time.perf_counter()
+        with self.lock:
+            lines, skipped, written = self._replay()
+            points = sum(len(series.points) for series in self.series.values())
+        if skipped:
+            logger.warning("Skipped %d unreadable lines of %s", skipped, self.path)
+        logger.info("Loaded %d market history lines (%d locations) in %.1f ms", lines, len(self.series),
+                    (time.perf_counter() - start) * 1000)
+        if written > 2 * points:
+            self.compact()
+        return lines
+
+    def _replay(self) -> Tuple[int, int, int]:
+        """
+        Apply the complete lines appended to the log since it was last read. Call with the lock held.
+
+        A log that was replaced since (compacted by another process) is read
+        from the start, storing the points first and rebuilding every
+        location's rollups at the end, as at start-up.
+
+        Returns:
+            (lines read, lines skipped as unreadable, point values read)
+        """
+        if not self.path:
+            return 0, 0, 0
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return 0, 0, 0
+        if (stat.st_dev, stat.st_ino) == self.log_id and stat.st_size <= self.position:
+            return 0, 0, 0
+        lines = skipped = written = 0
+        with open(self.path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            roll = (stat.st_dev, stat.st_ino) == self.log_id
+            if not roll:
+                self.log_id, self.position = (stat.st_dev, stat.st_ino), 0
+            f.seek(self.position)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Still being written by another process
+                self.position += len(line)
+                lines += 1
+                try:
+                    written += self._apply(json.loads(line), roll)
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    skipped += 1
+        if not roll:
+            for series in self.series.values():
+                series.rebuild()
+        self.stats["lines_replayed"] += lines
+        return lines, skipped, written
+
+    @contextlib.contextmanager
+    def _log_lock(self, exclusive: bool):
+        """Lock <log>.lock against other processes: shared to append, exclusive to replace the log."""
+        if fcntl is None or not self.path:
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    def compact(self):
+        """
+        Rewrite the log with one line per location and alias.
+
+        Nothing to do if another process compacted the log since this one
+        last read it.
+        """
+        if not self.path:
+            return
+        temporary = f"{self.path}.tmp-{os.getpid()}"
+        with self.lock, self._log_lock(exclusive=True):
+            log_id = self.log_id
+            self._replay()
+            if self.log_id != log_id:
+                return
+            with open(temporary, "w", encoding="utf-8") as f:
+                for alias, key in self.aliases.items():
+                    f.write(json.dumps({"alias": alias, "location": key}, separators=(",", ":")) + "\n")
+                for series in self.series.values():
+                    entry = {"location": series.key, "name": series.name, "fetched_at": round(series.fetched_at, 3),
+                             "points": {month_label(month): series.points[month] for month in series.months}}
+                    if not series.fetched_at:
+                        entry["nearby"] = True
+                    f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            os.replace(temporary, self.path)
+            stat = os.stat(self.path)
+            self.log_id, self.position = (stat.st_dev, stat.st_ino), stat.st_size
+
+    def claim_refresh(self) -> bool:
+        """
+        Whether this process refreshes the stored locations.
+
+        The first process to lock <log>.refresh does, until it exits; the
+        others pick its fetches up from the log. Always True without a log
+        or without fcntl.
+        """
+        if self.refresh_lock is not None or fcntl is None or not self.path:
+            return True
+        f = open(f"{self.path}.refresh", "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self.refresh_lock = f
+        return True
+
+    def _series(self, key: str, name: Optional[str]) -> MarketSeries:
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = MarketSeries(key, name or key)
+        return series
+
+    def _apply(self, entry: Dict[str, Any], roll: bool = True) -> int:
+        """Apply a log line; returns the number of points in it."""
+        if "alias" in entry:
+            self.aliases[entry["alias"]] = entry["location"]
+            return 0
+        series = self._series(entry["location"], entry.get("name"))
+        if not entry.get("nearby"):
+            series.fetched_at = max(series.fetched_at, entry.get("fetched_at") or 0)
+        for label, values in entry["points"].items():
+            month = _log_month(label)
+            if month is None:
+                raise ValueError(f"Bad month {label!r}")
+            series.set(month, values, roll)
+        return len(entry["points"])
+
+    def record(self, market_page: Dict[str, Any], query: Optional[str] = None,
+               fetched_at: Optional[float] = None) -> int:
+        """
+        Add the points of a market page.
+
+        Changed points are appended to the log, one line per location; the
+        fetched location gets a line with its fetched_at even if none of its
+        points changed, so that other processes know it is fresh.
+
+        Returns:
+            Number of points that were new or changed
+        """
+        fetched_at = fetched_at or time.time()
+        points = points_from_market_page(market_page, query)
+        if not points:
+            return 0
+        entries: Dict[str, Dict[str, Any]] = {}
+        changed = 0
+        with self.lock:
+            self._replay()
+            self.stats["pages"] += 1
+            for key, name, month, values, nearby in points:
+                if not self._series(key, name).set(month, values):
+                    continue
+                changed += 1
+                entry = entries.get(key)
+                if entry is None:
+                    entry = entries[key] = {"location": key, "name": name, "fetched_at": round(fetched_at, 3),
+                                            "points": {}}
+                    if nearby:
+                        entry["nearby"] = True
+                entry["points"].setdefault(month_label(month), {}).update(values)
+            lines = list(entries.values())
+            own_key = location_key(market_page.get("areaName") or query)
+            own = self.series.get(own_key)
+            if own is not None:
+                own.fetched_at = fetched_at
+                if own_key not in entries:
+                    lines.append({"location": own_key, "name": own.name, "fetched_at": round(fetched_at, 3),
+                                  "points": {}})
+                alias = location_key(query)
+                if alias and alias != own_key and self.aliases.get(alias) != own_key:
+                    self.aliases[alias] = own_key
+                    lines.append({"alias": alias, "location": own_key})
+            self.stats["points_changed"] += changed
+            if lines and self.path:
+                data = "".join(json.dumps(line, separators=(",", ":")) + "\n" for line in lines).encode("utf-8")
+                try:
+                    with self._log_lock(exclusive=False), open(self.path, "ab") as f:
+                        f.write(data)
+                        f.flush()
+                        stat = os.fstat(f.fileno())
+                        # Skip re-reading our own lines, unless another process appended before them
+                        if (stat.st_dev, stat.st_ino) == self.log_id and f.tell() - len(data) == self.position:
+                            self.position = f.tell()
+                    self.stats["lines_written"] += len(lines)
+                except OSError as e:
+                    self.stats["write_errors"] += 1
+                    logger.error(f"Failed to append to {self.path}: {str(e)}")
+        return changed
+
+    def resolve(self, location: Optional[str]) -> Optional[str]:
+        key = location_key(location)
+        if key is None:
+            return None
+        if key in self.series:
+            return key
+        return self.aliases.get(key)
+
+    def trends(self, location: str, start: Optional[str] = None,
+               end: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Monthly, quarterly and yearly rollups of a location, or None if it has no history.
+
+        Args:
+            location: Area name, or a query it was fetched with
+            start, end: First and last month ("2021-01"), inclusive
+        """
+        with self.lock:
+            self._replay()
+            self.stats["queries"] += 1
+            key = self.resolve(location)
+            if key is None:
+                return None
+            return self.series[key].trends(parse_month(start) if start else None,
+                                           parse_month(end) if end else None)
+
+    def fresh(self, location: str, max_age: float) -> bool:
+        """Whether location was itself fetched within the last max_age seconds."""
+        with self.lock:
+            self._replay()
+            key = self.resolve(location)
+            return key is not None and self.series[key].fetched_at >= time.time() - max_age
+
+    def matrix(self, locations: List[str], months: int):
+        """
+        Median rents of several locations over the same months.
+
+        Args:
+            locations: Area names or queries
+            months: Number of months, ending at the latest month any of them has
+
+        Returns:
+            (names, month labels, rents, latest points): names[i] is None for a
+            location without history; rents is a len(locations) x months float
+            array with NaN where a month is missing; latest points are the
+            newest point of each location ({} if none)
+        """
+        import numpy as np
+
+        with self.lock:
+            self._replay()
+            found = [self.series.get(self.resolve(location)) for location in locations]
+            ends = [series.months[-1] for series in found if series is not None and series.months]
+            end = max(ends) if ends else 0
+            start = end - months + 1
+            rents = np.full((len(locations), months), np.nan)
+            names, latest = [], []
+            for row, series in enumerate(found):
+                if series is None or not series.months:
+                    names.append(None)
+                    latest.append({})
+                    continue
+                names.append(series.name)
+                latest.append(dict(series.points[series.months[-1]]))
+                for month in series.months[bisect.bisect_left(series.months, start):]:
+                    rent = series.points[month].get("median_rent")
+                    if _is_number(rent):
+                        rents[row, month - start] = rent
+        return names, [month_label(month) for month in range(start, end + 1)], rents, latest
+
+    def stale(self, max_age: float) -> List[str]:
+        """
+        Names of locations fetched more than max_age seconds ago, oldest first.
+
+        Locations only seen as nearby areas of another one are not included.
+        """
+        cutoff = time.time() - max_age
+        with self.lock:
+            self._replay()
+            due = [series for series in self.series.values() if 0 < series.fetched_at < cutoff]
+        return [series.name for series in sorted(due, key=lambda series: series.fetched_at)]
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"locations": len(self.series), "aliases": len(self.aliases),
+                    "points": sum(len(series.points) for series in self.series.values()), **self.stats}
+
+
+_history: Optional[MarketHistory] = None
+_history_lock = threading.Lock()
+
+
+def get_history() -> MarketHistory:
+    """The process-wide MarketHistory, loaded from HISTORY_PATH on first use."""
+    global _history
+    with _history_lock:
+        if _history is None:
+            history = MarketHistory(HISTORY_PATH or None)
+            try:
+                history.load()
+            except OSError as e:
+                logger.error(f"Failed to load market history from {HISTORY_PATH}: {str(e)}")
+            _history = history
+        return _history
+
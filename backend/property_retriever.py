@@ -1,10 +1,18 @@
 # property_retriever.py
 import json
+import math
 import os
 from typing import Dict, List, Any, Optional
-import requests
 import statistics
 from dotenv import load_dotenv
+from upstream_scheduler import scheduler
+from http_pools import get_session
+from resilience import HTTP_TIMEOUT, ZILLOW_BASE_URL, guarded_call, raise_for_upstream_status
+from property_store import PropertyStore, get_store
+from listing_query import DEFAULT_PAGE_SIZE, record_facets
+
+# Facet columns (as in listing_query.COLUMNS) -> property record fields
+FACET_FIELDS = {"price": "price", "beds": "bedrooms", "baths": "bathrooms", "sqft": "sqft", "days": "days_on_market"}
 
 # Load environment variables from .env file
 load_dotenv()
@@ -12,70 +20,19 @@ load_dotenv()
 class PropertyRetriever:
     """
     A class to retrieve property information.
-    This is a placeholder until integrating with Zillow or other real estate APIs.
+
+    Listings come from the shared PropertyStore, which is fed by the Zillow
+    searches and property details the backend serves (see property_store.py),
+    plus the seed files it was loaded with.
     """
     
-    def __init__(self):
-        # Mock database of properties
-        self.properties = [
-            {
-                "id": "prop001",
-                "address": "123 Main St, Boston, MA 02108",
-                "price": 850000,
-                "bedrooms": 3,
-                "bathrooms": 2,
-                "sqft": 1800,
-                "year_built": 2005,
-                "property_type": "Single Family",
-                "status": "For Sale",
-                "description": "Beautiful single family home in the heart of Boston with modern amenities.",
-                "features": ["Hardwood floors", "Granite countertops", "Stainless steel appliances", "Backyard"],
-                "coordinates": {"latitude": 42.3601, "longitude": -71.0589},
-                "market_stats": {
-                    "median_price_area": 900000,
-                    "price_trend": "+2.5% last month",
-                    "days_on_market_avg": 21
-                }
-            },
-            {
-                "id": "prop002",
-                "address": "456 Beacon St, Cambridge, MA 02138",
-                "price": 750000,
-                "bedrooms": 2,
-                "bathrooms": 2,
-                "sqft": 1200,
-                "year_built": 1998,
-                "property_type": "Condo",
-                "status": "For Sale",
-                "description": "Modern condo near Harvard with open floor plan and city views.",
-                "features": ["In-unit laundry", "Balcony", "Concierge", "Fitness center"],
-                "coordinates": {"latitude": 42.3736, "longitude": -71.1097},
-                "market_stats": {
-                    "median_price_area": 780000,
-                    "price_trend": "+1.8% last month",
-                    "days_on_market_avg": 18
-                }
-            },
-            {
-                "id": "prop003",
-                "address": "789 Commonwealth Ave, Boston, MA 02215",
-                "price": 1250000,
-                "bedrooms": 4,
-                "bathrooms": 3,
-                "sqft": 2500,
-                "year_built": 2012,
-                "property_type": "Townhouse",
-                "status": "For Sale",
-                "description": "Luxury townhouse near BU with high-end finishes and roof deck.",
-                "features": ["Roof deck", "Smart home system", "Heated floors", "Custom cabinetry"],
-                "coordinates": {"latitude": 42.3492, "longitude": -71.0999},
-                "market_stats": {
-                    "median_price_area": 1300000,
-                    "price_trend": "+3.2% last month",
-                    "days_on_market_avg": 14
-                }
-            }
-        ]
+    def __init__(self, store: Optional[PropertyStore] = None):
+        self.store = store if store is not None else get_store()
+
+    @property
+    def properties(self) -> List[Dict[str, Any]]:
+        """All stored property records."""
+        return self.store.records()
     
     def search_properties(self, 
                          location: Optional[str] = None, 
@@ -83,7 +40,10 @@ class PropertyRetriever:
                          max_price: Optional[int] = None,
                          min_beds: Optional[int] = None,
                          min_baths: Optional[int] = None,
-                         property_type: Optional[str] = None) -> List[Dict[str, Any]]:
+                         property_type: Optional[str] = None,
+                         keywords: Optional[str] = None,
+                         amenities: Optional[List[str]] = None,
+                         limit: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Search for properties based on the given criteria.
         
@@ -94,52 +54,151 @@ class PropertyRetriever:
             min_beds: Minimum number of bedrooms
             min_baths: Minimum number of bathrooms
             property_type: Type of property (Single Family, Condo, etc.)
+            keywords: Free text matched against descriptions and features
+            amenities: Amenities a property must list ("Garage", "In-unit laundry")
+            limit: Maximum number of properties to return
         
         Returns:
-            List of properties matching the criteria
+            List of properties matching the criteria. With keywords or
+            amenities they are ranked by relevance (BM25, see text_index.py)
+            and each carries a "relevance" score.
         """
+        criteria = (location, min_price, max_price, min_beds, min_baths, property_type)
+        if keywords or amenities:
+            return self._search_text(keywords, amenities or [], criteria, limit)
+
         results = []
+
+        # Narrow the snapshot rows on their columns first; the checks below still apply
+        ranges = {}
+        if min_price or max_price:
+            ranges["price"] = (min_price or -math.inf, max_price or math.inf)
+        if min_beds:
+            ranges["bedrooms"] = (min_beds, math.inf)
+        if min_baths:
+            ranges["bathrooms"] = (min_baths, math.inf)
+        categories = {"property_type": property_type} if property_type else None
+        contains = {"address": location} if location else None
         
-        for property in self.properties:
-            # Check if property matches all provided criteria
-            if location and location.lower() not in property["address"].lower():
-                continue
-                
-            if min_price and property["price"] < min_price:
-                continue
-                
-            if max_price and property["price"] > max_price:
+        for property in self.store.candidates(ranges, categories, contains):
+            if not self._matches(property, *criteria):
                 continue
-                
-            if min_beds and property["bedrooms"] < min_beds:
-                continue
-                
-            if min_baths and property["bathrooms"] < min_baths:
-                continue
-                
-            if property_type and property["property_type"].lower() != property_type.lower():
-                continue
-                
             results.append(property)
+            if limit is not None and len(results) >= limit:
+                break
         
         return results
+
+    def search_facets(self, page: int = 1, page_size: int = DEFAULT_PAGE_SIZE, **criteria) -> Dict[str, Any]:
+        """
+        One page of search_properties() results plus the facets of all of them.
+
+        Args:
+            page: 1-based page number
+            page_size: Properties per page
+            **criteria: search_properties() arguments (without limit)
+
+        Returns:
+            {"results": [...], "total": n, "page": .., "pageSize": .., "hasMore": ..,
+             "facets": {...}}, with facets as in listing_query.compute_facets()
+            and a "propertyType" count
+        """
+        properties = self.search_properties(**criteria)
+        start = (page - 1) * page_size
+        return {
+            "results": properties[start:start + page_size],
+            "total": len(properties),
+            "page": page,
+            "pageSize": page_size,
+            "hasMore": start + page_size < len(properties),
+            "facets": record_facets(properties, FACET_FIELDS, {"propertyType": "property_type"}),
+        }
+
+    def _search_text(self, keywords: Optional[str], amenities: List[str], criteria: tuple,
+                     limit: Optional[int]) -> List[Dict[str, Any]]:
+        """Rank text matches, then apply the structured criteria in rank order."""
+        index = self.store.text_index()
+        results = []
+        # With structured criteria some hits are dropped, so ask for more than
+        # limit and widen the window until limit properties pass or hits run out
+        window = limit if limit is None or not any(criteria) else limit * 4
+        seen = 0
+        while True:
+            hits = index.search(keywords, amenities, window)
+            for property_id, score in hits[seen:]:
+                property = self.store.get(property_id)
+                if property is None or not self._matches(property, *criteria):
+                    continue
+                results.append({**property, "relevance": round(score, 4)})
+                if limit is not None and len(results) >= limit:
+                    return results
+            if window is None or len(hits) < window:
+                return results
+            seen = len(hits)
+            window *= 4
+
+    @staticmethod
+    def _matches(property: Dict[str, Any], location, min_price, max_price, min_beds, min_baths, property_type) -> bool:
+        """Check a property against the structured search criteria."""
+        if location and location.lower() not in (property.get("address") or "").lower():
+            return False
+            
+        if min_price and (property.get("price") is None or property["price"] < min_price):
+            return False
+            
+        if max_price and (property.get("price") is None or property["price"] > max_price):
+            return False
+            
+        if min_beds and (property.get("bedrooms") is None or property["bedrooms"] < min_beds):
+            return False
+            
+        if min_baths and (property.get("bathrooms") is None or property["bathrooms"] < min_baths):
+            return False
+            
+        if property_type and (property.get("property_type") or "").lower() != property_type.lower():
+            return False
+
+        return True
     
     def get_property_details(self, property_id: str) -> Dict[str, Any]:
         """
         Get detailed information for a specific property.
         
         Args:
-            property_id: The ID of the property
+            property_id: The ID (or zpid) of the property
             
         Returns:
             Property details or None if not found
         """
-        for property in self.properties:
-            if property["id"] == property_id:
-                return property
+        property = self.store.get(property_id)
+        if property is not None:
+            return property
                 
         return {"error": "Property not found"}
     
+    def similar_homes(self, property_id: str, k: int = 6, same_type: bool = False) -> List[Dict[str, Any]]:
+        """
+        The k stored properties most like a given one (see similar_homes.py).
+
+        Args:
+            property_id: The ID (or zpid) of the property
+            k: Number of properties to return
+            same_type: Only return properties of the same home type
+
+        Returns:
+            Property records, most similar first, each with a "distance"
+            (0 = identical); empty if the property is not stored
+        """
+        property = self.store.get(property_id)
+        if property is None:
+            return []
+        results = []
+        for key, distance in self.store.similar_homes().similar(property, k, same_type):
+            match = self.store.get(key)
+            if match is not None:
+                results.append({**match, "distance": round(distance, 4)})
+        return results
+
     def get_market_trends(self, location: str) -> Dict[str, Any]:
         """
         Get market trends for a specific location.
@@ -150,7 +209,7 @@ class PropertyRetriever:
         Returns:
             A dictionary containing comprehensive market trend data suitable for frontend display.
         """
-        url = "https://zillow56.p.rapidapi.com/market_data"
+        url = f"{ZILLOW_BASE_URL}/market_data"
         querystring = {"location": location}
         
         # Get API key from environment variable
@@ -163,10 +222,19 @@ class PropertyRetriever:
             "x-rapidapi-host": "zillow56.p.rapidapi.com"
         }
 
-        response = requests.get(url, headers=headers, params=querystring)
-        json_data = response.json()  # Parse JSON response
+        try:
+            json_data = guarded_call(
+                "zillow",
+                lambda: raise_for_upstream_status("zillow", scheduler.call(
+                    "zillow", lambda: get_session().get(url, headers=headers, params=querystring, timeout=HTTP_TIMEOUT),
+                    endpoint="market_data",
+                )).json(),
+                cache_key=f"market:{location}",
+                hedge=True,
+            )
+        except Exception as e:
+            return {"error": f"Failed to fetch market data: {str(e)}"}
         
-        print(json_data)
         # Initialize result structure with all fields the frontend might need
         results = {
             "location_info": {
@@ -0,0 +1,404 @@
+# property_snapshot.py
+"""
+Memory-mapped, columnar snapshot of the PropertyStore.
+
+Rebuilding the store from JSON at every worker start takes seconds once it
+holds a real corpus (about 1.5 s per 100k listings), and every worker ends up
+with its own copy of every record. A snapshot is written once, with
+write_snapshot(). Each worker then opens it with mmap: opening reads only
+the header, and since the data is never copied out of the mapping, the
+workers share one copy of it in the page cache.
+
+File layout (all integers little-endian):
+
+    magic "PROPSNAP", uint32 format version, uint32 header length
+    header      JSON: row count, creation time, coverage times, and
+                name -> {dtype, offset, count} for every section
+    sections    numpy arrays, each starting on a 64-byte boundary
+
+Columns are stored by kind:
+
+    numeric     float64, NaN for missing (price, bedrooms, sqft, ...)
+    string      uint64 offsets (n + 1) into UTF-8 bytes (address, description, ...)
+    category    int32 codes into a string table, -1 for missing (zipcode, status, ...)
+    list        uint64 row offsets into int32 codes into a string table (features)
+    extra       a string column of per-row JSON with every other field
+                (history, market_stats, non-numeric values of numeric fields)
+
+Prebuilt indexes: row numbers sorted by id, for binary search
+(PropertySnapshot.find), and for each ZIP code the rows in it. The per-ZIP
+search coverage of the store is kept the same way.
+
+A file with another magic or format version is rejected with SnapshotError.
+The caller can then rebuild from the seed files.
+
+    python property_snapshot.py write OUT.snap SEED_FILE...
+    python property_snapshot.py info OUT.snap
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+MAGIC = b"PROPSNAP"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct("<8sII")
+
+NUMERIC_COLUMNS = ("price", "bedrooms", "bathrooms", "sqft", "year_built", "days_on_market", "latitude",
+                   "longitude", "first_seen", "last_seen", "last_changed")
+STRING_COLUMNS = ("id", "zpid", "address", "description", "img_src")
+CATEGORY_COLUMNS = ("city", "state", "zipcode", "property_type", "home_type", "status", "source")
+LIST_COLUMNS = ("features",)
+
+
+class SnapshotError(ValueError):
+    """The file is not a snapshot this version can read."""
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _string_table(values: List[Optional[str]]):
+    import numpy as np
+
+    encoded = [(value or "").encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype="u1")
+
+
+def write_snapshot(records: Iterable[Dict[str, Any]], path: str,
+                   coverage: Optional[Dict[str, Tuple[float, List[str]]]] = None) -> Dict[str, Any]:
+    """
+    Write records (and per-ZIP coverage) as a snapshot file.
+
+    The file is written next to path and renamed over it, so readers never
+    see a partial snapshot.
+
+    Returns:
+        The header
+    """
+    import numpy as np
+
+    records = list(records)
+    n = len(records)
+    sections: Dict[str, Any] = {}
+
+    for name in NUMERIC_COLUMNS:
+        column = np.full(n, np.nan, dtype="<f8")
+        sections[f"num.{name}"] = column
+    extras = []
+    for row, record in enumerate(records):
+        extra = {}
+        coordinates = record.get("coordinates")
+        flat = dict(record)
+        if isinstance(coordinates, dict) and set(coordinates) <= {"latitude", "longitude"} \
+                and all(_is_number(v) for v in coordinates.values()):
+            flat.pop("coordinates")
+            flat.update(coordinates)
+        for key, value in flat.items():
+            if value is None or (key == "history" and not value):
+                continue
+            if key in NUMERIC_COLUMNS and _is_number(value):
+                sections[f"num.{key}"][row] = value
+            elif key in STRING_COLUMNS and isinstance(value, str):
+                continue
+            elif key in CATEGORY_COLUMNS and isinstance(value, str):
+                continue
+            elif key in LIST_COLUMNS and isinstance(value, list) and all(isinstance(v, str) for v in value):
+                continue
+            else:
+                extra[key] = value
+        extras.append(json.dumps(extra, separators=(",", ":"), default=str) if extra else "")
+
+    def text(record, name):
+        value = record.get(name)
+        return value if isinstance(value, str) else None
+
+    for name in STRING_COLUMNS:
+        sections[f"str.{name}.offsets"], sections[f"str.{name}.data"] = _string_table(
+            [text(record, name) for record in records])
+    sections["str.extra.offsets"], sections["str.extra.data"] = _string_table(extras)
+
+    dictionaries = {}
+    for name in CATEGORY_COLUMNS:
+        values = [text(record, name) for record in records]
+        dictionary = sorted({value for value in values if value is not None})
+        lookup = {value: code for code, value in enumerate(dictionary)}
+        sections[f"cat.{name}.codes"] = np.array([lookup[v] if v is not None else -1 for v in values], dtype="<i4")
+        sections[f"cat.{name}.dict.offsets"], sections[f"cat.{name}.dict.data"] = _string_table(dictionary)
+        dictionaries[name] = lookup
+
+    for name in LIST_COLUMNS:
+        lists = [record.get(name) if isinstance(record.get(name), list)
+                 and all(isinstance(v, str) for v in record[name]) else [] for record in records]
+        dictionary = sorted({value for values in lists for value in values})
+        lookup = {value: code for code, value in enumerate(dictionary)}
+        offsets = np.zeros(n + 1, dtype="<u8")
+        np.cumsum([len(values) for values in lists], out=offsets[1:])
+        sections[f"list.{name}.offsets"] = offsets
+        sections[f"list.{name}.values"] = np.array([lookup[v] for values in lists for v in values], dtype="<i4")
+        sections[f"list.{name}.dict.offsets"], sections[f"list.{name}.dict.data"] = _string_table(dictionary)
+
+    # Indexes: rows by id, and rows per zipcode code
+    ids = [text(record, "id") or "" for record in records]
+    sections["index.id"] = np.array(sorted(range(n), key=ids.__getitem__), dtype="<i4")
+    zip_codes = sections["cat.zipcode.codes"]
+    order = np.argsort(zip_codes, kind="stable").astype("<i4")
+    sections["index.zipcode.rows"] = order[zip_codes[order] >= 0]
+    counts = np.bincount(zip_codes[zip_codes >= 0], minlength=len(dictionaries["zipcode"]))
+    zip_offsets = np.zeros(len(dictionaries["zipcode"]) + 1, dtype="<i8")
+    np.cumsum(counts, out=zip_offsets[1:])
+    sections["index.zipcode.offsets"] = zip_offsets
+
+    # Coverage: ZIP -> (searched at, rows in search order)
+    row_of = {record_id: row for row, record_id in enumerate(ids)}
+    coverage_zips, coverage_times, coverage_rows, coverage_offsets = [], [], [], [0]
+    for zipcode, (searched_at, covered_ids) in sorted((coverage or {}).items()):
+        coverage_zips.append(zipcode)
+        coverage_times.append(searched_at)
+        coverage_rows.extend(row_of[key] for key in covered_ids if key in row_of)
+        coverage_offsets.append(len(coverage_rows))
+    sections["coverage.rows"] = np.array(coverage_rows, dtype="<i4")
+    sections["coverage.offsets"] = np.array(coverage_offsets, dtype="<i8")
+
+    # Section offsets relative to the start of the data
+    layout = {}
+    relative = 0
+    for name, array in sections.items():
+        array = np.ascontiguousarray(array)
+        sections[name] = array
+        layout[name] = (array.dtype.str, relative, int(array.size))
+        relative += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+    # The data starts after the header, whose length depends on the offsets
+    # written into it; grow the start until the header fits
+    data_start = 0
+    while True:
+        header = {
+            "rows": n,
+            "created_at": time.time(),
+            "coverage": {"zips": coverage_zips, "searched_at": coverage_times},
+            "sections": {name: {"dtype": dtype, "offset": data_start + offset, "count": count}
+                         for name, (dtype, offset, count) in layout.items()},
+        }
+        header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        needed = -(-(_PREAMBLE.size + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+        if needed <= data_start:
+            break
+        data_start = needed
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in sections.items():
+            f.seek(header["sections"][name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + relative)
+    os.replace(tmp_path, path)
+    return header
+
+
+class PropertySnapshot:
+    """
+    Read-only view of a snapshot file through mmap.
+
+    Columns are numpy arrays over the mapping; records are built from them
+    only when asked for.
+    """
+
+    def __init__(self, path: str):
+        import numpy as np
+
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < _PREAMBLE.size:
+            raise SnapshotError(f"{path} is not a property snapshot")
+        magic, version, header_length = _PREAMBLE.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path} is not a property snapshot")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"{path} has snapshot format {version}, expected {FORMAT_VERSION}")
+        self.header = json.loads(self.map[_PREAMBLE.size:_PREAMBLE.size + header_length])
+        self.rows = self.header["rows"]
+        self.sections = {
+            name: np.frombuffer(self.map, dtype=entry["dtype"], count=entry["count"], offset=entry["offset"])
+            for name, entry in self.header["sections"].items()
+        }
+        self._dictionaries: Dict[str, List[str]] = {}
+        self._zip_codes: Optional[Dict[str, int]] = None
+        coverage = self.header["coverage"]
+        self.coverage_index = {zipcode: i for i, zipcode in enumerate(coverage["zips"])}
+
+    def __len__(self):
+        return self.rows
+
+    def close(self):
+        self.sections = {}
+        self.map.close()
+
+    def numeric(self, name: str):
+        """float64 column, NaN where missing."""
+        return self.sections[f"num.{name}"]
+
+    def _string(self, prefix: str, i: int) -> str:
+        offsets = self.sections[f"{prefix}.offsets"]
+        start, end = int(offsets[i]), int(offsets[i + 1])
+        return self.sections[f"{prefix}.data"][start:end].tobytes().decode("utf-8")
+
+    def string(self, name: str, row: int) -> Optional[str]:
+        value = self._string(f"str.{name}", row)
+        return value or None
+
+    def rows_containing(self, name: str, text: str):
+        """
+        Rows of a string column containing text, ignoring ASCII case.
+
+        Scans the column's bytes with bytes.find instead of decoding every
+        row. For non-ASCII text, use string() and compare.
+        """
+        import numpy as np
+
+        needle = text.lower().encode("ascii")
+        offsets = self.sections[f"str.{name}.offsets"]
+        haystack = self.sections[f"str.{name}.data"].tobytes().lower()
+        positions = []
+        position = haystack.find(needle)
+        while position >= 0:
+            positions.append(position)
+            position = haystack.find(needle, position + 1)
+        if not positions:
+            return np.zeros(0, dtype=np.int64)
+        starts = np.array(positions, dtype=np.uint64)
+        rows = np.searchsorted(offsets, starts, side="right") - 1
+        # A match must end inside the row it starts in
+        inside = starts + len(needle) <= offsets[rows + 1]
+        return np.unique(rows[inside])
+
+    def dictionary(self, prefix: str) -> List[str]:
+        """The string table of a category or list column."""
+        if prefix not in self._dictionaries:
+            count = self.header["sections"][f"{prefix}.dict.offsets"]["count"] - 1
+            self._dictionaries[prefix] = [self._string(f"{prefix}.dict", i) for i in range(count)]
+        return self._dictionaries[prefix]
+
+    def category(self, name: str, row: int) -> Optional[str]:
+        code = int(self.sections[f"cat.{name}.codes"][row])
+        return self.dictionary(f"cat.{name}")[code] if code >= 0 else None
+
+    def codes(self, name: str):
+        """int32 codes of a category column, -1 where missing."""
+        return self.sections[f"cat.{name}.codes"]
+
+    def list_values(self, name: str, row: int) -> List[str]:
+        offsets = self.sections[f"list.{name}.offsets"]
+        dictionary = self.dictionary(f"list.{name}")
+        return [dictionary[code] for code in self.sections[f"list.{name}.values"][int(offsets[row]):int(offsets[row + 1])]]
+
+    def find(self, record_id: Any) -> Optional[int]:
+        """Row of the record with this id, by binary search of the id index."""
+        target = str(record_id)
+        order = self.sections["index.id"]
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            if self._string("str.id", int(order[middle])) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(order) and self._string("str.id", int(order[low])) == target:
+            return int(order[low])
+        return None
+
+    def rows_for_zip(self, zipcode: str):
+        """Rows whose zipcode is zipcode, in row order."""
+        if self._zip_codes is None:
+            self._zip_codes = {value: code for code, value in enumerate(self.dictionary("cat.zipcode"))}
+        code = self._zip_codes.get(zipcode)
+        if code is None:
+            return self.sections["index.zipcode.rows"][:0]
+        offsets = self.sections["index.zipcode.offsets"]
+        return self.sections["index.zipcode.rows"][int(offsets[code]):int(offsets[code + 1])]
+
+    def coverage(self, zipcode: str) -> Optional[Tuple[float, List[int]]]:
+        """(searched at, rows in search order) of a ZIP's last search, or None."""
+        i = self.coverage_index.get(zipcode)
+        if i is None:
+            return None
+        offsets = self.sections["coverage.offsets"]
+        rows = self.sections["coverage.rows"][int(offsets[i]):int(offsets[i + 1])]
+        return self.header["coverage"]["searched_at"][i], [int(row) for row in rows]
+
+    def coverage_zips(self) -> List[str]:
+        return list(self.coverage_index)
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """The record at row, as PropertyStore holds it."""
+        record: Dict[str, Any] = {}
+        for name in STRING_COLUMNS:
+            value = self.string(name, row)
+            if value is not None:
+                record[name] = value
+        for name in CATEGORY_COLUMNS:
+            value = self.category(name, row)
+            if value is not None:
+                record[name] = value
+        for name in NUMERIC_COLUMNS:
+            value = float(self.sections[f"num.{name}"][row])
+            if not math.isnan(value):
+                record[name] = int(value) if value.is_integer() and name not in ("latitude", "longitude") else value
+        if "latitude" in record and "longitude" in record:
+            record["coordinates"] = {"latitude": record.pop("latitude"), "longitude": record.pop("longitude")}
+        for name in LIST_COLUMNS:
+            if self.sections[f"list.{name}.offsets"][row] != self.sections[f"list.{name}.offsets"][row + 1]:
+                record[name] = self.list_values(name, row)
+        extra = self.string("extra", row)
+        if extra:
+            record.update(json.loads(extra))
+        record.setdefault("history", [])
+        return record
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        for row in range(self.rows):
+            yield self.record(row)
+
+    def ids(self) -> Iterator[str]:
+        for row in range(self.rows):
+            yield self._string("str.id", row)
+
+
+def main(argv: List[str]):
+    if len(argv) >= 2 and argv[0] == "write":
+        from property_store import PropertyStore, load_files
+
+        store = PropertyStore()
+        start = time.perf_counter()
+        counts = load_files(store, argv[2:])
+        loaded = time.perf_counter() - start
+        start = time.perf_counter()
+        header = write_snapshot(store.records(), argv[1], store.coverage_map())
+        print(json.dumps({**counts, "rows": header["rows"], "load_seconds": round(loaded, 3),
+                          "write_seconds": round(time.perf_counter() - start, 3),
+                          "bytes": os.path.getsize(argv[1])}))
+    elif len(argv) == 2 and argv[0] == "info":
+        snapshot = PropertySnapshot(argv[1])
+        header = snapshot.header
+        print(json.dumps({"rows": header["rows"], "created_at": header["created_at"],
+                          "zips_covered": len(header["coverage"]["zips"]),
+                          "bytes": os.path.getsize(argv[1]),
+                          "sections": {name: entry["count"] for name, entry in header["sections"].items()}}, indent=2))
+    else:
+        print("usage: property_snapshot.py write OUT SEED_FILE... | info SNAPSHOT", file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
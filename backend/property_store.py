@@ -0,0 +1,651 @@
+# property_store.py
+"""
+Local store of every listing the backend has seen, behind PropertyRetriever.
+
+Zillow search results and property details used to pass through
+search_nearby_houses() and get_property_details() and were then forgotten,
+while PropertyRetriever searched three hard-coded listings. Now both feed an
+IngestionQueue. A background worker normalizes each result into a property
+record and upserts it into the PropertyStore:
+
+- Records are keyed by zpid, so a listing seen in several searches, and
+  again in its details, is one record. Search results fill in the basics,
+  details add the description, features and year built. A later, partial
+  record never clears fields an earlier one set.
+- A price or status that differs from the stored one is a change. It is
+  appended to the record's history and to the store's recent changes, and
+  it is counted in the metrics.
+- Each searched ZIP code remembers when it was last searched and which
+  listings came back, in Zillow's order. app.search_nearby_houses() answers
+  a recently covered ZIP from the store and refreshes it in the background,
+  instead of calling Zillow on the request path.
+
+load_files() is the bulk loader for offline seed files. It reads JSONL or
+JSON files of property records, Zillow search responses or propertyV2
+details. The store starts with the files in PROPERTY_SEED_PATHS, by default
+data/seed_properties.jsonl (the listings PropertyRetriever used to
+hard-code).
+
+    python property_store.py data/listings/*.jsonl
+
+loads files and prints the counts and timing.
+
+With a snapshot file (property_snapshot.py) at PROPERTY_SNAPSHOT_PATH, the
+store opens it with mmap as its base layer, then loads the seed files on top.
+save_snapshot() writes the whole store back as a new snapshot.
+
+Environment variables:
+    PROPERTY_SNAPSHOT_PATH     snapshot file, default data/properties.snap
+    PROPERTY_SNAPSHOT_ON_SHUTDOWN  "true" to write the store to it when the app stops, default false
+    PROPERTY_SEED_PATHS        seed files, separated by os.pathsep
+    PROPERTY_HISTORY_LIMIT     change events kept per record, default 20
+    PROPERTY_INGEST_QUEUE      pending ingestion batches before new ones are dropped, default 1000
+"""
+import collections
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+SEED_PATHS = [path for path in os.environ.get(
+    "PROPERTY_SEED_PATHS", os.path.join(DATA_DIR, "seed_properties.jsonl")
+).split(os.pathsep) if path]
+HISTORY_LIMIT = int(os.environ.get("PROPERTY_HISTORY_LIMIT", 20))
+INGEST_QUEUE_SIZE = int(os.environ.get("PROPERTY_INGEST_QUEUE", 1000))
+SNAPSHOT_PATH = os.environ.get("PROPERTY_SNAPSHOT_PATH", os.path.join(DATA_DIR, "properties.snap"))
+SNAPSHOT_ON_SHUTDOWN = os.environ.get("PROPERTY_SNAPSHOT_ON_SHUTDOWN", "false").lower() in ("1", "true", "yes")
+
+# Zillow homeType -> the property_type names PropertyRetriever uses
+PROPERTY_TYPES = {
+    "SINGLE_FAMILY": "Single Family",
+    "CONDO": "Condo",
+    "TOWNHOUSE": "Townhouse",
+    "MULTI_FAMILY": "Multi Family",
+    "APARTMENT": "Apartment",
+    "MANUFACTURED": "Manufactured",
+    "LOT": "Lot",
+}
+
+# Zillow homeStatus -> status
+STATUSES = {
+    "FOR_SALE": "For Sale",
+    "PENDING": "Pending",
+    "RECENTLY_SOLD": "Sold",
+    "SOLD": "Sold",
+    "FOR_RENT": "For Rent",
+    "OFF_MARKET": "Off Market",
+}
+
+# resoFacts keys turned into feature strings
+FEATURE_FACTS = ("appliances", "heating", "cooling", "flooring", "parkingFeatures", "exteriorFeatures",
+                 "interiorFeatures", "laundryFeatures", "communityFeatures")
+
+TRACKED_FIELDS = ("price", "status")
+
+
+def _full_address(street, city, state, zipcode) -> Optional[str]:
+    if not street:
+        return None
+    return f"{street}, {city or 'N/A'}, {state or 'N/A'} {zipcode or 'N/A'}"
+
+
+def record_from_search(result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Property record from one Zillow search result; None without a zpid."""
+    zpid = result.get("zpid")
+    if zpid in (None, ""):
+        return None
+    latitude, longitude = result.get("latitude"), result.get("longitude")
+    return {
+        "id": str(zpid),
+        "zpid": str(zpid),
+        "address": _full_address(result.get("streetAddress"), result.get("city"), result.get("state"),
+                                 result.get("zipcode")),
+        "city": result.get("city"),
+        "state": result.get("state"),
+        "zipcode": result.get("zipcode"),
+        "price": result.get("price"),
+        "bedrooms": result.get("bedrooms"),
+        "bathrooms": result.get("bathrooms"),
+        "sqft": result.get("livingArea"),
+        "home_type": result.get("homeType"),
+        "property_type": PROPERTY_TYPES.get(result.get("homeType"), result.get("homeType")),
+        "status": STATUSES.get(result.get("homeStatus"), result.get("homeStatus")),
+        "days_on_market": result.get("daysOnZillow"),
+        "coordinates": ({"latitude": latitude, "longitude": longitude}
+                        if latitude is not None and longitude is not None else None),
+        "img_src": result.get("imgSrc"),
+    }
+
+
+def record_from_details(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Property record from a Zillow propertyV2 response; None without a zpid."""
+    address = data.get("address") or {}
+    record = record_from_search({
+        "zpid": data.get("zpid"),
+        "streetAddress": address.get("streetAddress"),
+        "city": address.get("city"),
+        "state": address.get("state"),
+        "zipcode": address.get("zipcode"),
+        "price": data.get("price"),
+        "bedrooms": data.get("bedrooms"),
+        "bathrooms": data.get("bathrooms"),
+        "livingArea": data.get("livingArea"),
+        "homeType": data.get("homeType"),
+        "homeStatus": data.get("homeStatus"),
+        "daysOnZillow": data.get("daysOnZillow"),
+        "latitude": data.get("latitude"),
+        "longitude": data.get("longitude"),
+    })
+    if record is None:
+        return None
+    facts = data.get("resoFacts") or {}
+    features = []
+    for key in FEATURE_FACTS:
+        value = facts.get(key)
+        if isinstance(value, list):
+            features.extend(str(item) for item in value if item)
+        elif isinstance(value, str) and value:
+            features.append(value)
+    if facts.get("hasGarage"):
+        features.append("Garage")
+    record.update({
+        "description": data.get("description"),
+        "features": features or None,
+        "year_built": data.get("yearBuilt"),
+        "lot_size": data.get("lotSize"),
+    })
+    return record
+
+
+def record_from_seed(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """A record as written in a seed file (PropertyRetriever's field names); None without an id."""
+    key = row.get("zpid") or row.get("id")
+    if key in (None, ""):
+        return None
+    record = dict(row)
+    record["id"] = str(row.get("id") or key)
+    if row.get("zpid") is not None:
+        record["zpid"] = str(row["zpid"])
+    return record
+
+
+class PropertyStore:
+    """
+    Property records keyed by zpid (or id), with per-ZIP search coverage.
+
+    With a snapshot, its records are the base layer: they are read from the
+    mapping when asked for, and copied into the store only when an upsert
+    changes them.
+
+    Args:
+        history_limit: Change events kept per record
+        snapshot: PropertySnapshot to start from
+    """
+
+    def __init__(self, history_limit: int = HISTORY_LIMIT, snapshot=None):
+        self.history_limit = history_limit
+        self.snapshot = snapshot
+        # Records added or changed since the snapshot (all of them without one)
+        self.properties: Dict[str, Dict[str, Any]] = {}
+        # Snapshot rows replaced by one of those
+        self.shadowed = set()
+        # zipcode -> (time of the last search, zpids in Zillow's order)
+        self.coverage: Dict[str, Tuple[float, List[str]]] = {}
+        self.changes = collections.deque(maxlen=1000)
+        self.lock = threading.Lock()
+        self.stats = {"inserted": 0, "updated": 0, "unchanged": 0, "price_changes": 0, "status_changes": 0}
+        # Called with the records each upsert inserts or changes
+        self.listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+        self._text_index = None
+        self._text_index_lock = threading.Lock()
+        self._similar_homes = None
+
+    def __len__(self):
+        return len(self.properties) + (len(self.snapshot) - len(self.shadowed) if self.snapshot is not None else 0)
+
+    def _lookup(self, key: str, copy: bool = False) -> Optional[Dict[str, Any]]:
+        """A record from the store or the snapshot; copy=True moves a snapshot record into the store."""
+        record = self.properties.get(key)
+        if record is None and self.snapshot is not None:
+            row = self.snapshot.find(key)
+            if row is not None:
+                record = self.snapshot.record(row)
+                if copy:
+                    self.properties[key] = record
+                    self.shadowed.add(row)
+        return record
+
+    def upsert(self, records: Iterable[Dict[str, Any]], source: str, seen_at: Optional[float] = None) -> Dict[str, int]:
+        """
+        Insert new records and merge the others into what is stored.
+
+        Returns:
+            Counts of inserted, updated and unchanged records, and of price
+            and status changes
+        """
+        seen_at = time.time() if seen_at is None else seen_at
+        counts = dict.fromkeys(self.stats, 0)
+        touched = []
+        with self.lock:
+            for record in records:
+                key = record["id"]
+                current = self._lookup(key, copy=True)
+                if current is None:
+                    stored = {key: value for key, value in record.items() if value is not None}
+                    stored.update({"source": source, "first_seen": seen_at, "last_seen": seen_at,
+                                   "last_changed": seen_at, "history": []})
+                    self.properties[key] = stored
+                    touched.append(stored)
+                    counts["inserted"] += 1
+                    continue
+                changed = False
+                for field, value in record.items():
+                    if value is None or current.get(field) == value:
+                        continue
+                    if field in TRACKED_FIELDS and current.get(field) is not None:
+                        event = {"at": seen_at, "field": field, "old": current[field], "new": value}
+                        current["history"] = (current["history"] + [event])[-self.history_limit:]
+                        self.changes.append({"id": key, **event})
+                        counts[f"{field}_changes"] += 1
+                    current[field] = value
+                    changed = True
+                current["last_seen"] = seen_at
+                current["source"] = source
+                if changed:
+                    current["last_changed"] = seen_at
+                    touched.append(current)
+                    counts["updated"] += 1
+                else:
+                    counts["unchanged"] += 1
+            for key, value in counts.items():
+                self.stats[key] += value
+        if touched:
+            for listener in self.listeners:
+                listener(touched)
+        return counts
+
+    def add_listener(self, listener: Callable[[List[Dict[str, Any]]], None]):
+        """Call listener with the records every later upsert inserts or changes."""
+        self.listeners.append(listener)
+
+    def text_index(self):
+        """
+        The TextIndex over every record's description and features.
+
+        Built on first use and kept current by upserts.
+        """
+        if self._text_index is None:
+            with self._text_index_lock:
+                if self._text_index is None:
+                    from text_index import TextIndex
+
+                    index = TextIndex()
+                    # Subscribe first: a record upserted while the index is
+                    # being built is indexed twice, which is harmless
+                    self.add_listener(index.update)
+                    index.update(self.iter_text())
+                    self._text_index = index
+        return self._text_index
+
+    def similar_homes(self):
+        """
+        The SimilarHomesIndex over every record.
+
+        Built on first use; records upserts insert or change are applied
+        before its next query.
+        """
+        if self._similar_homes is None:
+            with self._text_index_lock:
+                if self._similar_homes is None:
+                    from similar_homes import SimilarHomesIndex
+
+                    index = SimilarHomesIndex()
+                    # Subscribe first, as in text_index(); queued records are applied after the build
+                    self.add_listener(index.update)
+                    with self.lock:
+                        records = list(self.properties.values())
+                        shadowed = set(self.shadowed)
+                    index.load(records, self.snapshot, shadowed)
+                    self._similar_homes = index
+        return self._similar_homes
+
+    def iter_text(self) -> Iterator[Dict[str, Any]]:
+        """id, description and features of every record, without building snapshot records."""
+        with self.lock:
+            records = list(self.properties.values())
+            shadowed = set(self.shadowed)
+        for record in records:
+            yield {"id": record["id"], "description": record.get("description"), "features": record.get("features")}
+        if self.snapshot is not None:
+            for row in range(len(self.snapshot)):
+                if row not in shadowed:
+                    yield {"id": self.snapshot.string("id", row), "description": self.snapshot.string("description", row),
+                           "features": self.snapshot.list_values("features", row)}
+
+    def mark_covered(self, zipcode: str, ids: List[str], searched_at: Optional[float] = None):
+        """Record that a search of zipcode returned these listings."""
+        with self.lock:
+            self.coverage[zipcode] = (time.time() if searched_at is None else searched_at, list(ids))
+
+    def covered(self, zipcode: str) -> Optional[Tuple[float, List[Dict[str, Any]]]]:
+        """(time of the last search, its records in order), or None if the ZIP was never searched."""
+        with self.lock:
+            entry = self.coverage.get(zipcode)
+            if entry is None and self.snapshot is not None:
+                covered = self.snapshot.coverage(zipcode)
+                if covered is not None:
+                    entry = (covered[0], [self.snapshot.string("id", row) for row in covered[1]])
+            if entry is None:
+                return None
+            searched_at, ids = entry
+            records = (self._lookup(key) for key in ids)
+            return searched_at, [record for record in records if record is not None]
+
+    def coverage_map(self) -> Dict[str, Tuple[float, List[str]]]:
+        """zipcode -> (time of the last search, ids), including the snapshot's."""
+        with self.lock:
+            coverage = dict(self.coverage)
+            zips = self.snapshot.coverage_zips() if self.snapshot is not None else []
+        for zipcode in zips:
+            if zipcode not in coverage:
+                searched_at, rows = self.snapshot.coverage(zipcode)
+                coverage[zipcode] = (searched_at, [self.snapshot.string("id", row) for row in rows])
+        return coverage
+
+    def get(self, key: Any) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            return self._lookup(str(key))
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Every record; snapshot records are built from the mapping, which takes a while for large ones."""
+        return self.candidates()
+
+    def candidates(self, ranges: Optional[Dict[str, Tuple[float, float]]] = None,
+                   categories: Optional[Dict[str, str]] = None,
+                   contains: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """
+        Records that can match the given bounds: every record in the store,
+        plus the snapshot rows that pass them.
+
+        The snapshot rows are filtered on their columns before any record is
+        built, so callers still apply their full criteria to the result.
+
+        Args:
+            ranges: Numeric snapshot column -> inclusive (low, high)
+            categories: Category snapshot column -> value, compared case-insensitively
+            contains: String snapshot column -> text it must contain, ignoring case
+        """
+        with self.lock:
+            records = list(self.properties.values())
+            shadowed = list(self.shadowed)
+        if self.snapshot is None:
+            return records
+        import numpy as np
+
+        mask = np.ones(len(self.snapshot), dtype=bool)
+        for column, (low, high) in (ranges or {}).items():
+            values = self.snapshot.numeric(column)
+            mask &= (values >= low) & (values <= high)
+        for column, value in (categories or {}).items():
+            codes = [code for code, name in enumerate(self.snapshot.dictionary(f"cat.{column}"))
+                     if name.lower() == value.lower()]
+            mask &= np.isin(self.snapshot.codes(column), codes)
+        for column, text in (contains or {}).items():
+            if text.isascii():
+                found = np.zeros(len(self.snapshot), dtype=bool)
+                found[self.snapshot.rows_containing(column, text)] = True
+                mask &= found
+        mask[shadowed] = False
+        records.extend(self.snapshot.record(int(row)) for row in np.flatnonzero(mask))
+        return records
+
+    def recent_changes(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self.lock:
+            return list(self.changes)[-limit:]
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            snapshot_rows = len(self.snapshot) if self.snapshot is not None else 0
+            zips = set(self.coverage).union(self.snapshot.coverage_index if self.snapshot is not None else ())
+            metrics = {"properties": len(self), "snapshot_rows": snapshot_rows, "zips_covered": len(zips),
+                       **self.stats}
+        if self._text_index is not None:
+            metrics["text_index"] = self._text_index.metrics()
+        if self._similar_homes is not None:
+            metrics["similar_homes"] = self._similar_homes.metrics()
+        return metrics
+
+
+def search_result_from_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """The Zillow search result fields of a record, for ListingTable and format_listing()."""
+    address = record.get("address") or ""
+    coordinates = record.get("coordinates") or {}
+    zpid = record.get("zpid") or record.get("id")
+    return {
+        # Zillow sends zpids as numbers
+        "zpid": int(zpid) if isinstance(zpid, str) and zpid.isdigit() else zpid,
+        "streetAddress": address.split(",")[0] if address else None,
+        "city": record.get("city"),
+        "state": record.get("state"),
+        "zipcode": record.get("zipcode"),
+        "price": record.get("price"),
+        "bedrooms": record.get("bedrooms"),
+        "bathrooms": record.get("bathrooms"),
+        "livingArea": record.get("sqft"),
+        "homeType": record.get("home_type"),
+        "homeStatus": next((code for code, name in STATUSES.items() if name == record.get("status")), None),
+        "daysOnZillow": record.get("days_on_market"),
+        "latitude": coordinates.get("latitude"),
+        "longitude": coordinates.get("longitude"),
+        "imgSrc": record.get("img_src") or "",
+    }
+
+
+class IngestionQueue:
+    """
+    Background worker that upserts fetched listings into a PropertyStore.
+
+    Request handlers enqueue the raw Zillow data and return; normalizing and
+    upserting happen on the worker thread.
+    """
+
+    def __init__(self, store: PropertyStore, maxsize: int = INGEST_QUEUE_SIZE):
+        self.store = store
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stats = {"queued": 0, "ingested": 0, "rejected": 0, "failed": 0}
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="property-ingest", daemon=True)
+                self.thread.start()
+
+    def _count(self, key: str, n: int = 1):
+        with self.lock:
+            self.stats[key] += n
+
+    def _put(self, item) -> bool:
+        self.start()
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self._count("rejected")
+            logger.warning("Property ingestion queue full, dropping a %s batch", item[0])
+            return False
+        self._count("queued")
+        return True
+
+    def enqueue_search(self, zipcode: str, results: List[Dict[str, Any]], covers: bool = True) -> bool:
+        """
+        Schedule the results of a ZIP code search for ingestion.
+
+        Args:
+            covers: The results are the search's first Zillow page, which
+                covered() answers the ZIP with; False for its later pages
+        """
+        return self._put(("search" if covers else "search_page", zipcode, results, time.time()))
+
+    def enqueue_details(self, data: Dict[str, Any]) -> bool:
+        """Schedule a propertyV2 response for ingestion."""
+        return self._put(("details", None, data, time.time()))
+
+    def ingest(self, kind: str, zipcode: Optional[str], data: Any, seen_at: float):
+        if kind in ("search", "search_page"):
+            records = [record for record in map(record_from_search, data) if record is not None]
+            self.store.upsert(records, "search", seen_at)
+            if kind == "search":
+                self.store.mark_covered(zipcode, [record["id"] for record in records], seen_at)
+        else:
+            record = record_from_details(data)
+            if record is not None:
+                self.store.upsert([record], "details", seen_at)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            try:
+                self.ingest(*item)
+                self._count("ingested")
+            except Exception as e:
+                self._count("failed")
+                logger.error(f"Property ingestion of a {item[0]} batch failed: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+    def stop(self, timeout: float = 10.0):
+        """Ingest what is pending and stop the worker."""
+        with self.lock:
+            thread = self.thread
+        if thread is None or not thread.is_alive():
+            return
+        self.queue.put(None)
+        thread.join(timeout)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"pending": self.queue.qsize(), **self.stats}
+
+
+def iter_file_records(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    (source, record) pairs from a seed file.
+
+    The file is JSONL, or one JSON document. Each row or document may be a
+    property record, a Zillow search response ({"results": [...]}), a
+    propertyV2 response, or a list of any of these.
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            documents = (json.loads(line) for line in f if line.strip())
+        else:
+            documents = iter([json.load(f)])
+        stack = []
+        for document in documents:
+            stack.append(document)
+            while stack:
+                item = stack.pop()
+                if isinstance(item, list):
+                    stack.extend(reversed(item))
+                elif not isinstance(item, dict):
+                    continue
+                elif isinstance(item.get("results"), list):
+                    stack.extend(reversed(item["results"]))
+                elif isinstance(item.get("address"), dict):
+                    record = record_from_details(item)
+                    if record is not None:
+                        yield "details", record
+                elif "streetAddress" in item:
+                    record = record_from_search(item)
+                    if record is not None:
+                        yield "search", record
+                else:
+                    record = record_from_seed(item)
+                    if record is not None:
+                        yield "seed", record
+
+
+def load_files(store: PropertyStore, paths: Iterable[str], batch_size: int = 1000) -> Dict[str, int]:
+    """
+    Bulk-load seed files into the store.
+
+    Returns:
+        Summed upsert counts, plus "files" and "records"
+    """
+    totals = dict.fromkeys(store.stats, 0)
+    totals.update({"files": 0, "records": 0})
+    for path in paths:
+        batch, batch_source = [], None
+        for source, record in iter_file_records(path):
+            if batch and source != batch_source or len(batch) >= batch_size:
+                for key, value in store.upsert(batch, f"file:{batch_source}").items():
+                    totals[key] += value
+                batch = []
+            batch_source = source
+            batch.append(record)
+            totals["records"] += 1
+        if batch:
+            for key, value in store.upsert(batch, f"file:{batch_source}").items():
+                totals[key] += value
+        totals["files"] += 1
+    return totals
+
+
+_store: Optional[PropertyStore] = None
+_store_lock = threading.Lock()
+
+
+def open_snapshot(path: str = SNAPSHOT_PATH):
+    """The PropertySnapshot at path, or None if it is missing or unreadable."""
+    if not path or not os.path.exists(path):
+        return None
+    from property_snapshot import PropertySnapshot, SnapshotError
+
+    try:
+        return PropertySnapshot(path)
+    except (OSError, SnapshotError) as e:
+        logger.warning("Ignoring property snapshot %s: %s", path, e)
+        return None
+
+
+def save_snapshot(store: PropertyStore, path: str = SNAPSHOT_PATH) -> Dict[str, Any]:
+    """Write the store, snapshot records and all, as a new snapshot file."""
+    from property_snapshot import write_snapshot
+
+    return write_snapshot(store.records(), path, store.coverage_map())
+
+
+def get_store() -> PropertyStore:
+    """The process-wide store, opened from the snapshot and loaded with the seed files on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = PropertyStore(snapshot=open_snapshot())
+                if store.snapshot is not None:
+                    logger.info("Opened property snapshot %s with %s rows", SNAPSHOT_PATH, len(store.snapshot))
+                paths = [path for path in SEED_PATHS if os.path.exists(path)]
+                if paths:
+                    counts = load_files(store, paths)
+                    logger.info("Loaded %s seed properties from %s files", counts["records"], counts["files"])
+                _store = store
+    return _store
+
+
+if __name__ == "__main__":
+    store = PropertyStore()
+    start = time.perf_counter()
+    counts = load_files(store, sys.argv[1:])
+    elapsed = time.perf_counter() - start
+    print(json.dumps({**counts, "properties": len(store), "seconds": round(elapsed, 3)}))
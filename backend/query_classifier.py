@@ -0,0 +1,149 @@
+# query_classifier.py
+"""
+In-process classifier for real estate questions: faq, regional, legal or general.
+
+classify_query() used to spend a full GPT-4o round trip to pick one of four
+labels. This is a multinomial logistic regression over hashed word 1-2 grams
+and character 3-grams, trained from the bundled labeled set
+(data/query_labels.jsonl, seeded from the benchmark chat queries). Training
+takes a few hundred milliseconds and happens once per process, in
+app.preload() or warm_up(), or in the threadpool if a chat turn needs it
+first; a prediction takes about 0.1 ms. It returns a
+probability per label, and classify_query() only asks the LLM when the top
+probability is below QUERY_CLASSIFIER_THRESHOLD.
+
+benchmarks/query_classifier_bench.py reports cross-validated accuracy and
+prediction latency.
+
+Environment variables:
+    QUERY_CLASSIFIER_THRESHOLD   minimum confidence to skip the LLM, default 0.7
+    QUERY_CLASSIFIER_DATA        labeled JSONL file, default data/query_labels.jsonl
+"""
+import json
+import math
+import os
+import random
+import re
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DATA_PATH = os.environ.get(
+    "QUERY_CLASSIFIER_DATA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "query_labels.jsonl")
+)
+THRESHOLD = float(os.environ.get("QUERY_CLASSIFIER_THRESHOLD", 0.7))
+LABELS = ("faq", "regional", "legal", "general")
+
+_TOKEN = re.compile(r"\w+")
+_ZIP = re.compile(r"^\d{5}$")
+
+
+def load_examples(path: str = DATA_PATH) -> List[Tuple[str, str]]:
+    """Return (message, category) pairs from a JSONL file."""
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                examples.append((row["message"], row["category"]))
+    return examples
+
+
+def featurize(text: str, buckets: int) -> Dict[int, float]:
+    """Hashed, L2-normalized counts of word unigrams/bigrams and character trigrams."""
+    tokens = ["<zip>" if _ZIP.match(t) else t for t in _TOKEN.findall(text.lower())]
+    grams = [f"w:{t}" for t in tokens]
+    grams += [f"b:{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    for token in tokens:
+        padded = f"^{token}$"
+        grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    counts: Dict[int, float] = {}
+    for gram in grams:
+        # crc32 rather than hash(): the same bucket in every process
+        index = zlib.crc32(gram.encode("utf-8")) % buckets
+        counts[index] = counts.get(index, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+    return {k: v / norm for k, v in counts.items()}
+
+
+class Prediction:
+    __slots__ = ("label", "confidence", "probabilities")
+
+    def __init__(self, label: str, confidence: float, probabilities: Dict[str, float]):
+        self.label = label
+        self.confidence = confidence
+        self.probabilities = probabilities
+
+
+class QueryClassifier:
+    """
+    Softmax regression over hashed n-gram features, trained with SGD.
+
+    Args:
+        labels: Class names
+        buckets: Size of the hashed feature space
+    """
+
+    def __init__(self, labels: Iterable[str] = LABELS, buckets: int = 1 << 18):
+        self.labels = tuple(labels)
+        self.buckets = buckets
+        # feature index -> weight per label; the vectors are sparse, so a dict
+        self.weights: Dict[int, List[float]] = {}
+        self.bias = [0.0] * len(self.labels)
+
+    def _scores(self, features: Dict[int, float]) -> List[float]:
+        scores = list(self.bias)
+        for index, value in features.items():
+            row = self.weights.get(index)
+            if row is not None:
+                for k in range(len(scores)):
+                    scores[k] += row[k] * value
+        top = max(scores)
+        exps = [math.exp(s - top) for s in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def fit(self, examples: List[Tuple[str, str]], epochs: int = 10, learning_rate: float = 1.0,
+            l2: float = 1e-4, seed: int = 0) -> "QueryClassifier":
+        data = [(featurize(text, self.buckets), self.labels.index(label)) for text, label in examples]
+        rng = random.Random(seed)
+        n = len(self.labels)
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            rate = learning_rate / (1 + epoch * 0.1)
+            for features, target in data:
+                gradient = self._scores(features)
+                gradient[target] -= 1.0
+                for k in range(n):
+                    self.bias[k] -= rate * gradient[k]
+                for index, value in features.items():
+                    row = self.weights.get(index)
+                    if row is None:
+                        row = self.weights[index] = [0.0] * n
+                    for k in range(n):
+                        row[k] -= rate * (gradient[k] * value + l2 * row[k])
+        return self
+
+    def predict(self, text: str) -> Prediction:
+        probs = self._scores(featurize(text, self.buckets))
+        best = max(range(len(probs)), key=probs.__getitem__)
+        return Prediction(self.labels[best], probs[best], dict(zip(self.labels, probs)))
+
+
+_classifier: Optional[QueryClassifier] = None
+_lock = threading.Lock()
+
+
+def get_classifier() -> QueryClassifier:
+    """The classifier trained on the bundled data, built on first use."""
+    global _classifier
+    if _classifier is None:
+        with _lock:
+            if _classifier is None:
+                _classifier = QueryClassifier().fit(load_examples())
+    return _classifier
+
+
+def is_trained() -> bool:
+    """Whether get_classifier() returns without training."""
+    return _classifier is not None
@@ -0,0 +1,214 @@
+# r2_storage.py
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from resilience import CONNECT_TIMEOUT, READ_TIMEOUT
+from telemetry import upstream_span
+
+logger = logging.getLogger(__name__)
+
+R2_BUCKET = os.environ.get("R2_BUCKET", "dialogue-json")
+
+
+class S3Service:
+    def __init__(self, s3_client, bucket):
+        self.s3_client = s3_client
+        self.bucket = bucket
+
+    def upload_json_to_r2(self, key, json_data, content_type='application/json'):
+        if isinstance(json_data, dict):
+            json_data = json.dumps(json_data)
+        json_bytes = json_data if isinstance(json_data, bytes) else json_data.encode('utf-8')
+        logging.info(f"Uploading to bucket: {self.bucket}, key: {key}")
+        with upstream_span("r2", "put_object"):
+            self.s3_client.put_object(
+                Bucket=self.bucket,
+                Key=key,
+                Body=json_bytes,
+                ContentType=content_type
+            )
+
+    def get_bytes(self, key) -> Optional[bytes]:
+        """Return the object body, or None if the key does not exist."""
+        with upstream_span("r2", "get_object"):
+            try:
+                response = self.s3_client.get_object(Bucket=self.bucket, Key=key)
+            except self.s3_client.exceptions.NoSuchKey:
+                return None
+            return response["Body"].read()
+
+    def list_keys(self, prefix):
+        keys = []
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        with upstream_span("r2", "list_objects"):
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+                keys.extend(item["Key"] for item in page.get("Contents", []))
+        return keys
+
+    def delete_keys(self, keys):
+        # DeleteObjects accepts at most 1000 keys per call
+        for i in range(0, len(keys), 1000):
+            with upstream_span("r2", "delete_objects"):
+                self.s3_client.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={"Objects": [{"Key": key} for key in keys[i:i + 1000]], "Quiet": True}
+                )
+
+def new_r2_service():
+    # boto3/botocore take a noticeable share of app start-up; load them on first use
+    import boto3
+    from botocore.config import Config
+
+    account = os.environ.get('CLOUDFLARE_ACCOUNT')
+    access_key = os.environ.get('CLOUDFLARE_KEY')
+    secret_key = os.environ.get('CLOUDFLARE_SECRET')
+    # R2_ENDPOINT_URL points the client at an S3-compatible stand-in (local benchmarks)
+    endpoint_url = os.environ.get('R2_ENDPOINT_URL')
+    if not endpoint_url and not account:
+        raise ValueError("Missing CLOUDFLARE_ACCOUNT for R2")
+    logging.info(f"Initializing R2 service for account: {(account or 'local')[:4]}... and bucket: {R2_BUCKET}")
+    r2_config = Config(
+        s3={"addressing_style": "path" if endpoint_url else "virtual"},
+        retries={"max_attempts": 10, "mode": "standard"},
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT
+    )
+    s3_client = boto3.client(
+        's3',
+        endpoint_url=endpoint_url or f"https://{account}.r2.cloudflarestorage.com",
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        region_name="auto",
+        config=r2_config
+    )
+    return S3Service(s3_client, R2_BUCKET)
+
+
+_service: Optional[S3Service] = None
+_service_lock = threading.Lock()
+
+
+def get_r2_service() -> S3Service:
+    """
+    Return the process-wide R2 service, creating it on first use.
+
+    boto3 clients are thread-safe, so one client (and its connection pool)
+    is shared by every request instead of being rebuilt per upload.
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = new_r2_service()
+    return _service
+
+
+class UploadQueue:
+    """
+    Background uploader for R2 objects.
+
+    Requests enqueue (key, payload) and return immediately; a worker thread
+    uploads with exponential backoff and jitter on failure.
+    """
+
+    def __init__(self, max_attempts: int = 5, backoff_base: float = 0.5, maxsize: int = 1000):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stats = {"queued": 0, "uploaded": 0, "retries": 0, "failed": 0, "rejected": 0}
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="r2-uploader", daemon=True)
+                self.thread.start()
+
+    def enqueue(self, key: str, payload: Any, content_type: str = 'application/json',
+                on_done: Optional[Callable[[bool], None]] = None) -> bool:
+        """
+        Schedule an upload.
+
+        Args:
+            on_done: Called on the worker thread with True once the object is
+                uploaded, or False once every attempt has failed
+
+        Returns:
+            False if the queue is full and the upload was dropped
+        """
+        self.start()
+        try:
+            self.queue.put_nowait((key, payload, content_type, on_done))
+        except queue.Full:
+            self._count("rejected")
+            logger.error(f"R2 upload queue full, dropping {key}")
+            return False
+        self._count("queued")
+        return True
+
+    def _count(self, key: str):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _upload(self, key: str, payload: Any, content_type: str, on_done: Optional[Callable[[bool], None]] = None):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                get_r2_service().upload_json_to_r2(key, payload, content_type)
+                self._count("uploaded")
+                self._done(on_done, key, True)
+                return
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    self._count("failed")
+                    logger.error(f"R2 upload of {key} failed after {attempt} attempts: {str(e)}")
+                    self._done(on_done, key, False)
+                    return
+                self._count("retries")
+                delay = random.uniform(0, self.backoff_base * (2 ** attempt))
+                logger.warning(f"R2 upload of {key} failed ({str(e)}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    @staticmethod
+    def _done(on_done: Optional[Callable[[bool], None]], key: str, uploaded: bool):
+        if on_done is None:
+            return
+        try:
+            on_done(uploaded)
+        except Exception as e:
+            logger.error(f"Upload callback for {key} failed: {str(e)}")
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            try:
+                self._upload(*item)
+            finally:
+                self.queue.task_done()
+
+    def stop(self, timeout: float = 10.0):
+        """Flush pending uploads and stop the worker."""
+        with self.lock:
+            thread = self.thread
+        if thread is None or not thread.is_alive():
+            return
+        self.queue.put(None)
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.warning(f"R2 uploader did not drain within {timeout}s, {self.queue.qsize()} uploads pending")
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"pending": self.queue.qsize(), **self.stats}
+
+
+upload_queue = UploadQueue(max_attempts=int(os.environ.get("R2_UPLOAD_ATTEMPTS", 5)))
@@ -0,0 +1,286 @@
+# resilience.py
+import collections
+import concurrent.futures
+import contextvars
+import http.client
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Explicit timeouts for every outbound call. requests takes (connect, read).
+CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", 3.05))
+READ_TIMEOUT = float(os.environ.get("UPSTREAM_READ_TIMEOUT", 10))
+HTTP_TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+HEDGE_REQUESTS = os.environ.get("HEDGE_REQUESTS", "false").lower() in ("1", "true", "yes")
+# A hedged call races a second copy once it has taken this many times the
+# upstream's median latency. A high percentile is no good as the delay: when
+# more than a few percent of calls are slow it converges on the slow calls.
+HEDGE_AFTER_MEDIANS = float(os.environ.get("HEDGE_AFTER_MEDIANS", 2))
+
+# Base URLs of external services, overridable so benchmarks can point the
+# app at local stand-ins (see benchmarks/upstream_stubs.py)
+ZILLOW_HOST = "zillow56.p.rapidapi.com"
+ZILLOW_BASE_URL = os.environ.get("ZILLOW_BASE_URL", f"https://{ZILLOW_HOST}").rstrip("/")
+SERPAPI_BASE_URL = os.environ.get("SERPAPI_BASE_URL", "https://serpapi.com").rstrip("/")
+NOMINATIM_URL = os.environ.get("NOMINATIM_URL", "https://nominatim.openstreetmap.org").rstrip("/")
+DEEPL_URL = os.environ.get("DEEPL_URL", "https://api.deepl.com/v2/translate")
+
+
+class UpstreamError(Exception):
+    """Raised when an upstream answers with a server error or rate limit."""
+
+    def __init__(self, upstream: str, status: Optional[int] = None, message: Optional[str] = None):
+        super().__init__(message or f"{upstream} returned status {status}")
+        self.upstream = upstream
+        self.status = status
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+    def __init__(self, upstream: str):
+        super().__init__(upstream, message=f"{upstream} is unavailable (circuit open)")
+
+
+def raise_for_upstream_status(upstream: str, response: Any):
+    """Raise UpstreamError for 5xx and 429 responses so they count as breaker failures."""
+    status = getattr(response, "status_code", None)
+    if status is None:
+        status = getattr(response, "status", None)
+    if isinstance(status, int) and (status >= 500 or status == 429):
+        raise UpstreamError(upstream, status)
+    return response
+
+
+def upstream_connection(base_url: str) -> http.client.HTTPConnection:
+    """Open an HTTP(S)Connection to base_url with separate connect and read timeouts."""
+    parts = urllib.parse.urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    conn = connection_class(parts.netloc, timeout=CONNECT_TIMEOUT)
+    conn.connect()
+    conn.sock.settimeout(READ_TIMEOUT)
+    return conn
+
+
+def https_connection(host: str) -> http.client.HTTPSConnection:
+    """Open an HTTPSConnection with separate connect and read timeouts."""
+    return upstream_connection(f"https://{host}")
+
+
+class CircuitBreaker:
+    """
+    Classic three-state circuit breaker.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    fail fast for reset_timeout seconds. Then a single trial call is let
+    through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "failures": 0, "rejected": 0, "stale_served": 0, "hedged": 0}
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.stats["calls"] += 1
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit for {self.name} closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.stats["calls"] += 1
+            self.stats["failures"] += 1
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+
+    def record(self, key: str):
+        with self.lock:
+            self.stats[key] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"state": self.state, "consecutive_failures": self.failures, **self.stats}
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies, used to pick the hedge delay."""
+
+    def __init__(self, window: int = 200):
+        self.samples = collections.deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self.lock:
+            if len(self.samples) < 20:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class StaleCache:
+    """Bounded LRU of the last good result per key, served while a circuit is open."""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key: Hashable, value: Any):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, LatencyTracker] = {}
+_registry_lock = threading.Lock()
+stale_cache = StaleCache(int(os.environ.get("STALE_CACHE_ENTRIES", 1000)))
+_hedge_pool = concurrent.futures.ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+
+def breaker(upstream: str) -> CircuitBreaker:
+    with _registry_lock:
+        if upstream not in _breakers:
+            _breakers[upstream] = CircuitBreaker(
+                upstream,
+                failure_threshold=int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", 5)),
+                reset_timeout=float(os.environ.get("CIRCUIT_RESET_TIMEOUT", 30)),
+            )
+            _latencies[upstream] = LatencyTracker()
+        return _breakers[upstream]
+
+
+def _hedged(upstream: str, fn: Callable[[], Any]) -> Any:
+    """Run fn; if it is slower than HEDGE_AFTER_MEDIANS times the upstream's median, race a second copy."""
+    median = _latencies[upstream].percentile(50)
+    if median is None:
+        return fn()
+    delay = median * HEDGE_AFTER_MEDIANS
+    # Copy the context so the upstream scheduler sees the caller's priority
+    first = _hedge_pool.submit(contextvars.copy_context().run, fn)
+    try:
+        return first.result(timeout=delay)
+    except concurrent.futures.TimeoutError:
+        pass
+    breaker(upstream).record("hedged")
+    second = _hedge_pool.submit(contextvars.copy_context().run, fn)
+    pending = {first, second}
+    while pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        # Both may finish in the same wait(); a success wins over a failure
+        succeeded = [future for future in done if future.exception() is None]
+        if succeeded:
+            return succeeded[0].result()
+        if not pending:
+            return done.pop().result()
+
+
+def guarded_call(upstream: str, fn: Callable[[], Any], cache_key: Optional[Hashable] = None,
+                 hedge: bool = False) -> Any:
+    """
+    Call an upstream through its circuit breaker.
+
+    Args:
+        upstream: Name of the upstream, e.g. "zillow" or "nominatim"
+        fn: Zero-argument callable that performs the request and returns parsed data.
+            It should raise (e.g. via raise_for_upstream_status) when the upstream fails.
+        cache_key: If given, successful results are kept and served stale when the
+            circuit is open or the call fails
+        hedge: Allow a hedged duplicate request (only for idempotent GETs).
+            Has no effect unless HEDGE_REQUESTS is enabled.
+
+    Returns:
+        The result of fn, or the last good result for cache_key
+    """
+    circuit = breaker(upstream)
+    full_key = (upstream, cache_key) if cache_key is not None else None
+    if not circuit.allow():
+        stale = stale_cache.get(full_key) if full_key else None
+        if stale is not None:
+            circuit.record("stale_served")
+            logger.debug(f"Circuit for {upstream} is open, serving stale result for {cache_key}")
+            return stale
+        raise CircuitOpenError(upstream)
+
+    start = time.monotonic()
+    try:
+        result = _hedged(upstream, fn) if hedge and HEDGE_REQUESTS else fn()
+    except Exception as e:
+        if isinstance(e, UpstreamError) and e.status is not None and e.status < 500 and e.status != 429:
+            # The upstream answered; a bad request says nothing about its health
+            circuit.record_success()
+            raise
+        circuit.record_failure()
+        stale = stale_cache.get(full_key) if full_key else None
+        if stale is not None:
+            circuit.record("stale_served")
+            logger.warning(f"{upstream} call failed ({e}), serving stale result for {cache_key}")
+            return stale
+        raise
+    _latencies[upstream].add(time.monotonic() - start)
+    circuit.record_success()
+    if full_key:
+        stale_cache.put(full_key, result)
+    return result
+
+
+def metrics() -> Dict[str, Any]:
+    with _registry_lock:
+        names = list(_breakers)
+    result = {}
+    for name in names:
+        result[name] = breaker(name).metrics()
+        result[name]["latency_p50_seconds"] = _latencies[name].percentile(50)
+        result[name]["latency_p95_seconds"] = _latencies[name].percentile(95)
+    return result
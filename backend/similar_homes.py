@@ -0,0 +1,341 @@
+# similar_homes.py
+"""
+"Homes like this one": nearest-neighbour search over listing feature vectors.
+
+The property detail view only had Zillow's nearbyHomes, which are chosen by
+distance alone and come with the propertyV2 call. SimilarHomesIndex ranks
+every listing in the PropertyStore by how close it is to a given home in
+price, size, age, location and type, without calling Zillow.
+
+Each listing becomes a float32 vector:
+
+- price and sqft (log scale), bedrooms, bathrooms and year_built, each
+  standardized with the mean and standard deviation over the indexed
+  listings and multiplied by its WEIGHTS entry. A missing value is the mean.
+- latitude/longitude projected to kilometres and divided by
+  SIMILAR_HOMES_DISTANCE_KM, so two homes that far apart differ as much as
+  two homes one standard deviation apart in price. A listing without
+  coordinates gets NaN here and is never returned; a query without them
+  is compared on the other columns only.
+- a one-hot home type (HOME_TYPES, anything else is OTHER) scaled so that a
+  different type adds WEIGHTS["home_type"] to the distance.
+
+A query is exact brute force: one matrix-vector product gives the squared
+distances to every listing (|x|^2 - 2 x.q + |q|^2, with |x|^2 kept per
+listing), and argpartition picks the k smallest. The vectors are stored one
+dimension per row (shape dimensions x listings), which makes the product
+about three times faster than listing-per-row storage. At 15 dimensions
+this needs no tree or approximate index: 1M listings take about 12 ms per
+query (see benchmarks/similar_homes_bench.py).
+
+PropertyStore.similar_homes() builds the index on first use, reading the
+snapshot's numeric columns directly, and queues every record an upsert
+changes. Queued records are applied, in place or as new rows, before the
+next query. The standardization stays as it was at build time.
+
+Environment variables:
+    SIMILAR_HOMES_DISTANCE_KM   km that count as one unit of difference, default 5
+"""
+import math
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DISTANCE_SCALE_KM = float(os.environ.get("SIMILAR_HOMES_DISTANCE_KM", 5))
+
+# Raw columns, in order; latitude and longitude must stay last
+RAW_COLUMNS = ("price", "bedrooms", "bathrooms", "sqft", "year_built", "latitude", "longitude")
+LOG_COLUMNS = ("price", "sqft")
+WEIGHTS = {
+    "price": 1.5,
+    "bedrooms": 1.0,
+    "bathrooms": 0.75,
+    "sqft": 1.0,
+    "year_built": 0.5,
+    "location": 1.0,
+    "home_type": 1.0,
+}
+HOME_TYPES = ("SINGLE_FAMILY", "CONDO", "TOWNHOUSE", "MULTI_FAMILY", "APARTMENT", "MANUFACTURED", "LOT")
+OTHER_TYPE = len(HOME_TYPES)
+_TYPE_CODES = {name: code for code, name in enumerate(HOME_TYPES)}
+
+_KM_PER_DEGREE = 111.2
+
+
+def home_type_code(value: Any) -> int:
+    return _TYPE_CODES.get(str(value or "").upper(), OTHER_TYPE)
+
+
+def _number(value: Any) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return math.nan
+    return float(value)
+
+
+def raw_values(record: Dict[str, Any]) -> List[float]:
+    """RAW_COLUMNS of a property record, NaN where missing."""
+    coordinates = record.get("coordinates") or {}
+    return [_number(record.get(name)) for name in RAW_COLUMNS[:-2]] + [
+        _number(coordinates.get("latitude")), _number(coordinates.get("longitude"))]
+
+
+class SimilarHomesIndex:
+    """
+    Exact k-nearest-neighbour index over listing vectors.
+
+    Rows come either from a PropertySnapshot (identified by snapshot row, so
+    building does not read the ids) or from records (identified by id).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.count = 0
+        self.vectors = None
+        self.norms = None
+        self.types = None
+        # index row -> snapshot row for the first len(snapshot_rows) rows
+        self.snapshot = None
+        self.snapshot_rows = None
+        self.row_of_snapshot = None
+        # id -> index row for rows built from records
+        self.ids: Dict[int, str] = {}
+        self.row_of: Dict[str, int] = {}
+        self.center = (0.0, 0.0)
+        self.means = None
+        self.scales = None
+        self.stats = {"queries": 0, "updates": 0}
+
+    def __len__(self):
+        return self.count
+
+    def load(self, records: Sequence[Dict[str, Any]], snapshot=None, skip_rows: Iterable[int] = ()):
+        """
+        Build the index from records plus the snapshot rows not in skip_rows.
+
+        The standardization is computed over exactly these listings.
+        """
+        import numpy as np
+
+        raw = np.array([raw_values(record) for record in records], dtype=np.float64).reshape(-1, len(RAW_COLUMNS))
+        types = np.fromiter((home_type_code(record.get("home_type")) for record in records), dtype=np.int8,
+                            count=len(records))
+        snapshot_rows = None
+        if snapshot is not None and len(snapshot):
+            keep = np.ones(len(snapshot), dtype=bool)
+            keep[np.fromiter(skip_rows, dtype=np.int64)] = False
+            snapshot_rows = np.flatnonzero(keep)
+            snapshot_raw = np.column_stack([snapshot.numeric(name)[snapshot_rows] for name in RAW_COLUMNS])
+            lookup = np.array([home_type_code(name) for name in snapshot.dictionary("cat.home_type")] + [OTHER_TYPE],
+                              dtype=np.int8)
+            # Code -1 (missing) picks the trailing OTHER_TYPE
+            snapshot_types = lookup[np.asarray(snapshot.codes("home_type"))[snapshot_rows]]
+            raw = np.vstack([snapshot_raw, raw])
+            types = np.concatenate([snapshot_types, types])
+        with self.lock:
+            self.snapshot = snapshot if snapshot_rows is not None else None
+            self.snapshot_rows = snapshot_rows if snapshot_rows is not None else np.zeros(0, dtype=np.int64)
+            if self.snapshot is not None:
+                self.row_of_snapshot = np.full(len(snapshot), -1, dtype=np.int64)
+                self.row_of_snapshot[snapshot_rows] = np.arange(len(snapshot_rows))
+            offset = len(self.snapshot_rows)
+            self.ids = {offset + i: str(record["id"]) for i, record in enumerate(records)}
+            self.row_of = {key: row for row, key in self.ids.items()}
+            self._build(raw, types)
+
+    @classmethod
+    def from_columns(cls, raw, types, ids: Sequence[str]) -> "SimilarHomesIndex":
+        """An index over RAW_COLUMNS values and home type codes already in arrays (as in the benchmark)."""
+        import numpy as np
+
+        index = cls()
+        with index.lock:
+            index.snapshot_rows = np.zeros(0, dtype=np.int64)
+            index.ids = dict(enumerate(str(key) for key in ids))
+            index.row_of = {key: row for row, key in index.ids.items()}
+            index._build(np.asarray(raw, dtype=np.float64), np.asarray(types, dtype=np.int8))
+        return index
+
+    def _build(self, raw, types):
+        import numpy as np
+
+        self._fit(raw)
+        capacity = max(len(raw), 16)
+        # Dimension-major: self.vectors[:, row] is one listing
+        self.vectors = np.zeros((self.width, capacity), dtype=np.float32)
+        self.norms = np.zeros(capacity, dtype=np.float32)
+        self.types = np.zeros(capacity, dtype=np.int8)
+        self._write(np.arange(len(raw)), raw, types)
+        self.count = len(raw)
+
+    @property
+    def width(self) -> int:
+        # Numeric columns, projected location and the home type one-hot
+        return len(RAW_COLUMNS) + OTHER_TYPE + 1
+
+    def _fit(self, raw):
+        """Standardization of the numeric columns and the center of the projection."""
+        import warnings
+
+        import numpy as np
+
+        values = self._scaled(raw[:, :-2])
+        with np.errstate(all="ignore"), warnings.catch_warnings():
+            # Columns without any value come out as NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            means = np.nanmean(values, axis=0) if len(values) else np.zeros(values.shape[1])
+            scales = np.nanstd(values, axis=0) if len(values) else np.ones(values.shape[1])
+        self.means = np.where(np.isnan(means), 0.0, means)
+        self.scales = np.where(np.isnan(scales) | (scales == 0), 1.0, scales)
+        latitude = raw[:, -2]
+        longitude = raw[:, -1]
+        known = ~(np.isnan(latitude) | np.isnan(longitude))
+        self.center = (float(latitude[known].mean()), float(longitude[known].mean())) if known.any() else (0.0, 0.0)
+
+    @staticmethod
+    def _scaled(values):
+        import numpy as np
+
+        values = values.copy()
+        for name in LOG_COLUMNS:
+            i = RAW_COLUMNS.index(name)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                values[:, i] = np.log1p(np.where(values[:, i] >= 0, values[:, i], np.nan))
+        return values
+
+    def vectorize(self, raw, types):
+        """float32 vectors of RAW_COLUMNS rows and their home type codes."""
+        import numpy as np
+
+        raw = np.asarray(raw, dtype=np.float64).reshape(-1, len(RAW_COLUMNS))
+        numeric = (self._scaled(raw[:, :-2]) - self.means) / self.scales
+        numeric = np.where(np.isnan(numeric), 0.0, numeric)
+        numeric *= np.array([WEIGHTS[name] for name in RAW_COLUMNS[:-2]])
+        latitude0, longitude0 = self.center
+        scale = WEIGHTS["location"] * _KM_PER_DEGREE / DISTANCE_SCALE_KM
+        y = (raw[:, -2] - latitude0) * scale
+        x = (raw[:, -1] - longitude0) * scale * math.cos(math.radians(latitude0))
+        one_hot = np.zeros((len(raw), OTHER_TYPE + 1))
+        one_hot[np.arange(len(raw)), np.asarray(types, dtype=np.intp)] = WEIGHTS["home_type"] / math.sqrt(2)
+        return np.hstack([numeric, y[:, None], x[:, None], one_hot]).astype(np.float32)
+
+    def _write(self, rows, raw, types):
+        import numpy as np
+
+        vectors = self.vectorize(raw, types)
+        # A row without coordinates gets zeros there and an infinite norm, so
+        # it is never among the nearest and the product needs no NaN checks
+        missing = np.isnan(vectors).any(axis=1)
+        vectors[np.isnan(vectors)] = 0
+        self.vectors[:, rows] = vectors.T
+        self.norms[rows] = np.where(missing, np.inf, np.einsum("ij,ij->i", vectors, vectors))
+        self.types[rows] = types
+
+    def update(self, records: Iterable[Dict[str, Any]]):
+        """Queue inserted or changed records; they are applied before the next query."""
+        with self.lock:
+            for record in records:
+                self.pending[str(record["id"])] = record
+
+    def _apply_pending(self):
+        import numpy as np
+
+        if not self.pending or self.means is None:
+            return
+        records = list(self.pending.values())
+        self.pending = {}
+        rows = []
+        for record in records:
+            key = str(record["id"])
+            row = self.row_of.get(key)
+            if row is None and self.snapshot is not None:
+                snapshot_row = self.snapshot.find(key)
+                if snapshot_row is not None and self.row_of_snapshot[snapshot_row] >= 0:
+                    row = int(self.row_of_snapshot[snapshot_row])
+            if row is None:
+                row = self.count
+                if row == len(self.norms):
+                    grow = len(self.norms)
+                    self.vectors = np.hstack([self.vectors, np.zeros((self.width, grow), dtype=np.float32)])
+                    self.norms = np.concatenate([self.norms, np.zeros(grow, dtype=np.float32)])
+                    self.types = np.concatenate([self.types, np.zeros(grow, dtype=np.int8)])
+                self.count += 1
+                self.ids[row] = key
+                self.row_of[key] = row
+            rows.append(row)
+        raw = np.array([raw_values(record) for record in records], dtype=np.float64)
+        types = np.array([home_type_code(record.get("home_type")) for record in records], dtype=np.int8)
+        self._write(np.array(rows), raw, types)
+        self.stats["updates"] += len(records)
+
+    def _key(self, row: int) -> str:
+        if row < len(self.snapshot_rows):
+            return self.snapshot.string("id", int(self.snapshot_rows[row]))
+        return self.ids[row]
+
+    def _row(self, key: str) -> Optional[int]:
+        row = self.row_of.get(key)
+        if row is None and self.snapshot is not None:
+            snapshot_row = self.snapshot.find(key)
+            if snapshot_row is not None and self.row_of_snapshot[snapshot_row] >= 0:
+                row = int(self.row_of_snapshot[snapshot_row])
+        return row
+
+    def nearest(self, raw: Sequence[float], home_type: Any = None, k: int = 10, exclude: Optional[str] = None,
+                same_type: bool = False) -> List[Tuple[str, float]]:
+        """
+        The k listings closest to a home.
+
+        Args:
+            raw: The home's RAW_COLUMNS values
+            home_type: Its Zillow homeType
+            k: Number of listings to return
+            exclude: Id left out of the results (the home itself)
+            same_type: Only return listings of the same home type
+
+        Returns:
+            (id, distance) pairs, closest first
+        """
+        import numpy as np
+
+        code = home_type_code(home_type)
+        with self.lock:
+            self._apply_pending()
+            self.stats["queries"] += 1
+            if not self.count or self.means is None:
+                return []
+            query = self.vectorize([raw], [code])[0]
+            count = self.count
+            location = slice(len(RAW_COLUMNS) - 2, len(RAW_COLUMNS))
+            if np.isnan(query[location]).any():
+                # Leave location out: zero it in the query and drop it from the row norms
+                query[location] = 0
+                vectors = self.vectors[location, :count]
+                norms = self.norms[:count] - np.einsum("ij,ij->j", vectors, vectors)
+            else:
+                norms = self.norms[:count]
+            # |x|^2 - 2 x.q, computed in place; |q|^2 is the same for every row
+            distances = query @ self.vectors[:, :count]
+            distances *= -2
+            distances += norms
+            skip = self._row(exclude) if exclude is not None else None
+            if skip is not None:
+                distances[skip] = np.inf
+            if same_type:
+                distances[self.types[:count] != code] = np.inf
+            k = min(k, count)
+            if k <= 0:
+                return []
+            best = np.argpartition(distances, k - 1)[:k] if k < count else np.arange(count)
+            best = best[np.argsort(distances[best], kind="stable")]
+            best = best[np.isfinite(distances[best])]
+            offset = float(query @ query)
+            return [(self._key(int(row)), math.sqrt(max(float(distances[row]) + offset, 0.0))) for row in best]
+
+    def similar(self, record: Dict[str, Any], k: int = 10, same_type: bool = False) -> List[Tuple[str, float]]:
+        """The k listings closest to a property record, leaving out the record itself."""
+        return self.nearest(raw_values(record), record.get("home_type"), k, str(record.get("id")), same_type)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"listings": self.count, "pending": len(self.pending), **self.stats}
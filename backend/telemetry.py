@@ -0,0 +1,158 @@
+# telemetry.py
+"""
+Latency histograms and per-request timing breakdown.
+
+Every request gets a list of (name, seconds) spans in a context variable.
+Upstream calls and local stages append to it, the middleware in app.py turns
+it into a Server-Timing header, and all spans are also recorded in
+process-wide histograms rendered in the Prometheus text format at /metrics.
+Metrics are per process; with several workers, scrape each one or sum them.
+"""
+import bisect
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Spans of the request currently being served, None outside a request
+request_spans: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_spans", default=None
+)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                # one counter per bucket, then +Inf, sum and count
+                series = self.series[labels] = [0.0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = [(labels, list(series)) for labels, series in self.series.items()]
+        for labels, series in sorted(items):
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labels))
+            sep = "," if base else ""
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-2]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{le}"}} {cumulative:g}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]:g}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+REQUEST_LATENCY = Histogram(
+    "rebot_request_duration_seconds", "End-to-end HTTP request latency.", ("method", "route", "status")
+)
+UPSTREAM_LATENCY = Histogram(
+    "rebot_upstream_duration_seconds", "Latency of calls to external services.", ("upstream", "endpoint", "outcome")
+)
+UPSTREAM_QUEUE_WAIT = Histogram(
+    "rebot_upstream_queue_wait_seconds", "Time spent waiting in the upstream scheduler.", ("upstream", "priority")
+)
+STAGE_LATENCY = Histogram(
+    "rebot_stage_duration_seconds", "Latency of local processing stages.", ("stage",)
+)
+PROMPT_TOKENS = Histogram(
+    "rebot_llm_prompt_tokens", "Prompt tokens per LLM call, by prompt part.", ("call", "part"),
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768),
+)
+
+
+def add_span(name: str, seconds: float):
+    spans = request_spans.get()
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+@contextlib.contextmanager
+def upstream_span(upstream: str, endpoint: str):
+    """Time a call to an external service."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        elapsed = time.perf_counter() - start
+        UPSTREAM_LATENCY.observe((upstream, endpoint, outcome), elapsed)
+        add_span(f"{upstream}_{endpoint}", elapsed)
+
+
+@contextlib.contextmanager
+def stage_span(stage: str):
+    """Time a local processing stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.observe((stage,), elapsed)
+        add_span(stage, elapsed)
+
+
+def timed_stage(stage: str):
+    """Decorator form of stage_span."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage_span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing(spans: List[Tuple[str, float]], total: float) -> str:
+    """Build a Server-Timing header value, summing repeated spans of the same name."""
+    totals: Dict[str, float] = {}
+    counts: Dict[str, int] = {}
+    for name, seconds in spans:
+        totals[name] = totals.get(name, 0.0) + seconds
+        counts[name] = counts.get(name, 0) + 1
+    entries = [f"total;dur={total * 1000:.1f}"]
+    for name, seconds in totals.items():
+        desc = f';desc="x{counts[name]}"' if counts[name] > 1 else ""
+        entries.append(f"{name};dur={seconds * 1000:.1f}{desc}")
+    return ", ".join(entries)
+
+
+def gauge_lines(name: str, documentation: str, samples: Iterable[Tuple[Dict[str, str], float]],
+                metric_type: str = "gauge") -> List[str]:
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        lines.append(f"{name}{{{rendered}}} {value}" if rendered else f"{name} {value}")
+    return lines
+
+
+def render_histograms() -> List[str]:
+    lines = []
+    for histogram in (REQUEST_LATENCY, UPSTREAM_LATENCY, UPSTREAM_QUEUE_WAIT, STAGE_LATENCY, PROMPT_TOKENS):
+        lines.extend(histogram.render())
+    return lines
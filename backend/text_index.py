@@ -0,0 +1,263 @@
+# text_index.py
+"""
+BM25 full-text index over listing descriptions and features.
+
+Listings carry a description and a features list ("Roof deck", "In-unit
+laundry"), and extract_query_features() puts requested amenities into
+filters.amenities, but PropertyRetriever.search_properties() could only
+filter on price, rooms, type and address. TextIndex is an in-process
+inverted index over those two fields. search_properties() uses it for its
+keywords and amenities arguments.
+
+- Text is lowercased and split into words. Stopwords are dropped and each
+  word is reduced with a light suffix stemmer (stem()), so "floors",
+  "flooring" and "floor" are one term. Feature words count FEATURE_WEIGHT
+  times, since a listed feature is a stronger signal than a word in the
+  description.
+- Each term's postings are two compact arrays (document numbers and term
+  frequencies). A query copies the postings of its few terms into numpy and
+  scores every matching document with BM25 in a handful of vector
+  operations.
+- Keywords are ranked with OR semantics. Each amenity is a requirement: a
+  document must contain every term of it ("in-unit laundry" needs "unit"
+  and "laundry"), and its terms also add to the score.
+- Updates are incremental. A changed document gets a new number and its
+  old one is marked dead, and dead postings are dropped once they make up
+  a quarter of the index. PropertyStore calls update() for every record an
+  upsert inserts or changes.
+
+benchmarks/text_search_bench.py measures build time, query latency and
+update throughput at 100k+ listings.
+"""
+import functools
+import math
+import re
+import threading
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+K1 = 1.2
+B = 0.75
+FEATURE_WEIGHT = 2
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be been by for from has have in into is it its of on or our that the their this to was
+were will with near very all your you
+""".split())
+
+
+@functools.lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    """
+    Light suffix-stripping stemmer for English listing text.
+
+    Plural and -ing/-ed forms map to the same stem ("garages" and "garage",
+    "heated" and "heating"). It is not a full Porter stemmer; it only has
+    to be consistent between documents and queries.
+    """
+    if len(word) <= 3 or word.isdigit():
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        word = word[:-3] + "y"
+    elif word.endswith("sses"):
+        word = word[:-2]
+    elif word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        word = word[:-1]
+    for suffix in ("ing", "ed"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            base = word[:-len(suffix)]
+            if any(vowel in base for vowel in "aeiouy"):
+                word = base
+                # "stopped" -> "stop"
+                if len(word) > 3 and word[-1] == word[-2] and word[-1] not in "lsz":
+                    word = word[:-1]
+            break
+    if word.endswith("e") and len(word) > 4:
+        word = word[:-1]
+    return word
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Stemmed terms of text, without stopwords."""
+    if not text:
+        return []
+    return [stem(word) for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+def document_terms(description: Optional[str], features: Optional[Sequence[str]]) -> Dict[str, int]:
+    """Term frequencies of a listing, with feature terms weighted by FEATURE_WEIGHT."""
+    counts: Dict[str, int] = {}
+    for term in tokenize(description):
+        counts[term] = counts.get(term, 0) + 1
+    for feature in features or ():
+        if isinstance(feature, str):
+            for term in tokenize(feature):
+                counts[term] = counts.get(term, 0) + FEATURE_WEIGHT
+    return counts
+
+
+class TextIndex:
+    """
+    Inverted index with BM25 ranking; documents are keyed by record id.
+
+    Args:
+        k1: BM25 term-frequency saturation
+        b: BM25 length normalization
+    """
+
+    def __init__(self, k1: float = K1, b: float = B):
+        self.k1 = k1
+        self.b = b
+        # term -> (document numbers, term frequencies)
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        # live documents per term
+        self.document_frequency: Dict[str, int] = {}
+        self.lengths = array("f")
+        self.alive = bytearray()
+        self.ids: List[str] = []
+        self.number_of: Dict[str, int] = {}
+        self.doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self.live_documents = 0
+        self.live_length = 0.0
+        self.dead_postings = 0
+        self.total_postings = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.live_documents
+
+    def _remove(self, record_id: str):
+        number = self.number_of.pop(record_id, None)
+        if number is None:
+            return
+        self.alive[number] = 0
+        terms = self.doc_terms.pop(number)
+        for term in terms:
+            self.document_frequency[term] -= 1
+        self.dead_postings += len(terms)
+        self.live_documents -= 1
+        self.live_length -= self.lengths[number]
+
+    def _add(self, record_id: str, counts: Dict[str, int]):
+        if not counts:
+            return
+        number = len(self.ids)
+        self.ids.append(record_id)
+        self.number_of[record_id] = number
+        self.alive.append(1)
+        length = float(sum(counts.values()))
+        self.lengths.append(length)
+        self.doc_terms[number] = tuple(counts)
+        for term, count in counts.items():
+            entry = self.postings.get(term)
+            if entry is None:
+                entry = self.postings[term] = (array("i"), array("H"))
+            entry[0].append(number)
+            entry[1].append(min(count, 65535))
+            self.document_frequency[term] = self.document_frequency.get(term, 0) + 1
+        self.total_postings += len(counts)
+        self.live_documents += 1
+        self.live_length += length
+
+    def update(self, records: Iterable[Dict[str, Any]]):
+        """Index new records and re-index changed ones; records without text are removed."""
+        with self.lock:
+            for record in records:
+                record_id = str(record["id"])
+                self._remove(record_id)
+                self._add(record_id, document_terms(record.get("description"), record.get("features")))
+            if self.dead_postings * 4 > self.total_postings:
+                self._compact()
+
+    def remove(self, record_ids: Iterable[Any]):
+        with self.lock:
+            for record_id in record_ids:
+                self._remove(str(record_id))
+
+    def _compact(self):
+        """Drop the postings of dead documents."""
+        for term in list(self.postings):
+            numbers, counts = self.postings[term]
+            keep = [i for i, number in enumerate(numbers) if self.alive[number]]
+            if not keep:
+                del self.postings[term]
+                self.document_frequency.pop(term, None)
+            elif len(keep) < len(numbers):
+                self.postings[term] = (array("i", (numbers[i] for i in keep)), array("H", (counts[i] for i in keep)))
+        self.total_postings -= self.dead_postings
+        self.dead_postings = 0
+
+    def search(self, keywords: Optional[str] = None, required: Sequence[str] = (),
+               limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        Rank documents by BM25.
+
+        Args:
+            keywords: Free text; a document needs at least one of its terms
+            required: Phrases (amenities) whose terms must all be in a document
+            limit: Keep the best limit documents; None for all matches
+
+        Returns:
+            (record id, score) pairs, best first
+        """
+        import numpy as np
+
+        keyword_terms = list(dict.fromkeys(tokenize(keywords)))
+        required_terms = [list(dict.fromkeys(tokenize(phrase))) for phrase in required]
+        required_terms = [terms for terms in required_terms if terms]
+        if not keyword_terms and not required_terms:
+            return []
+        with self.lock:
+            count = len(self.ids)
+            if not self.live_documents:
+                return []
+            average_length = self.live_length / self.live_documents
+            lengths = np.array(self.lengths, dtype=np.float32)
+            alive = np.frombuffer(bytes(self.alive), dtype=np.uint8).astype(bool)
+            term_data = {}
+            for term in set(keyword_terms).union(*required_terms):
+                entry = self.postings.get(term)
+                if entry is not None:
+                    term_data[term] = (np.array(entry[0], dtype=np.int64), np.array(entry[1], dtype=np.float32),
+                                       self.document_frequency.get(term, 0))
+            live = self.live_documents
+            ids = self.ids
+
+        scores = np.zeros(count, dtype=np.float64)
+        norm = self.k1 * (1 - self.b + self.b * lengths / average_length)
+        for term, (numbers, frequencies, df) in term_data.items():
+            idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+            scores += np.bincount(numbers, weights=idf * frequencies * (self.k1 + 1)
+                                  / (frequencies + norm[numbers]), minlength=count)
+
+        if keyword_terms:
+            matched = np.zeros(count, dtype=bool)
+            for term in keyword_terms:
+                if term in term_data:
+                    matched[term_data[term][0]] = True
+        else:
+            matched = np.ones(count, dtype=bool)
+        for terms in required_terms:
+            for term in terms:
+                present = np.zeros(count, dtype=bool)
+                if term in term_data:
+                    present[term_data[term][0]] = True
+                matched &= present
+        matched &= alive
+
+        hits = np.flatnonzero(matched)
+        if limit is not None and limit < len(hits):
+            # Keep every hit tied with the limit-th score so the order below,
+            # and so each prefix of it, does not depend on limit
+            kth = scores[hits][np.argpartition(-scores[hits], limit - 1)[limit - 1]]
+            hits = hits[scores[hits] >= kth]
+        # Best score first, ties in indexing order
+        hits = hits[np.lexsort((hits, -scores[hits]))][:limit]
+        return list(zip([ids[number] for number in hits.tolist()], scores[hits].tolist()))
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"documents": self.live_documents, "terms": len(self.postings), "postings": self.total_postings,
+                    "dead_postings": self.dead_postings}
@@ -0,0 +1,212 @@
+# ui_context.py
+"""
+Server-side UI context for /api/chat sessions.
+
+The chat frontend used to send its whole UI state as feature_context on
+every turn, including the full propertyContext (price and tax history,
+schools, features), and the server re-parsed it and rebuilt the context
+prose each time. Now the server keeps the last UI context of each session,
+and feature_context carries one of:
+
+    {"ui_context": {...}}                               full state (first turn, or after a resync)
+    {"ui_context_diff": {...}, "ui_context_base": "9f1c..."}    only the keys that changed; null removes a key
+
+In both forms propertyContext can be left out in favour of
+"propertyRef": <zpid>. The server then fills it in from the property details
+it already served on /api/property (PropertyContextCache).
+
+Each stored context is versioned by the hash of its content, returned to
+the client as ui_context_version. The client sends it back as
+ui_context_base. A hash rather than a counter, so that workers holding
+different states never agree on a version: if the server's state does not
+hash to the base (it restarted, or another worker served the previous turn),
+the diff is applied to whatever it has and the response sets
+ui_context_resync, asking the client to send the full state next turn.
+
+Rendering the context prose is memoized by a hash of the context content, so
+a turn with an unchanged UI costs one dictionary lookup.
+"""
+import collections
+import datetime
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+def content_hash(value: Any) -> str:
+    """Stable hash of a JSON-serializable value (key order does not matter)."""
+    data = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used key."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key: Hashable, value: Any):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def property_context_from_details(details: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the chat propertyContext from get_property_details() results.
+
+    Mirrors the contextData object SinglePropertyOverview.tsx builds from the
+    same /api/property response.
+    """
+    basic = details.get("basic_info") or {}
+    analysis = details.get("marketAnalysis") or {}
+    features = details.get("features") or {}
+    tax_history = []
+    for item in details.get("taxes") or []:
+        year = None
+        if item.get("time"):
+            year = datetime.datetime.fromtimestamp(item["time"] / 1000, tz=datetime.timezone.utc).year
+        tax_history.append({"year": year, "taxPaid": item.get("taxPaid"), "value": item.get("value")})
+    return {
+        "address": (basic.get("address") or {}).get("full"),
+        "price": basic.get("price"),
+        "beds": basic.get("bedrooms"),
+        "baths": basic.get("bathrooms"),
+        "sqft": basic.get("livingArea"),
+        "yearBuilt": basic.get("yearBuilt"),
+        "type": basic.get("homeType"),
+        "daysOnMarket": basic.get("daysOnZillow"),
+        # Summarized by marketAnalysis when the backend computed one
+        "priceHistory": [{"date": item.get("date"), "event": item.get("event"), "price": item.get("price")}
+                         for item in details.get("priceHistory") or []] if not analysis else [],
+        "taxHistory": tax_history,
+        "schools": [{"name": school.get("name"), "type": school.get("type"), "grades": school.get("grades"),
+                     "rating": school.get("rating"), "distance": school.get("distance")}
+                    for school in details.get("schools") or []],
+        "features": {key: features.get(key) for key in ("appliances", "cooling", "heating", "exteriorFeatures")},
+        # The summary of comps.analyze_property(); the comps themselves are not rendered
+        "marketAnalysis": {key: analysis[key] for key in ("valuation", "pricePerSqft", "history") if key in analysis}
+                          if analysis else None,
+    }
+
+
+class PropertyContextCache:
+    """propertyContext per zpid, with the hash of its content."""
+
+    def __init__(self, max_entries: int = 2000):
+        self.entries = LRUCache(max_entries)
+
+    def put_details(self, zpid: Any, details: Dict[str, Any]):
+        context = property_context_from_details(details)
+        self.entries.put(str(zpid), (context, content_hash(context)))
+
+    def get(self, zpid: Any) -> Optional[Tuple[Dict[str, Any], str]]:
+        return self.entries.get(str(zpid))
+
+
+class SessionUIContext:
+    """The UI context of one session as of its latest chat turn."""
+
+    __slots__ = ("state", "digest", "resync")
+
+    def __init__(self, state: Dict[str, Any], digest: str, resync: bool = False):
+        self.state = state
+        self.digest = digest
+        self.resync = resync
+
+    @property
+    def version(self) -> str:
+        """The version token the client echoes back as ui_context_base."""
+        return self.digest
+
+
+class UIContextStore:
+    """
+    Last UI context per chat session, plus memoized renderings.
+
+    Args:
+        max_sessions: Sessions kept before the least recently used is dropped
+        max_rendered: Rendered context strings kept, keyed by content hash
+    """
+
+    def __init__(self, max_sessions: int = 10000, max_rendered: int = 2048):
+        self.sessions = LRUCache(max_sessions)
+        self.rendered = LRUCache(max_rendered)
+        self.lock = threading.Lock()
+        self.stats = {"full": 0, "diff": 0, "unchanged": 0, "resync": 0, "render_hits": 0, "render_misses": 0}
+
+    def _count(self, key: str):
+        with self.lock:
+            self.stats[key] += 1
+
+    def update(self, session_id: str, payload: Dict[str, Any]) -> SessionUIContext:
+        """
+        Apply the ui_context / ui_context_diff of a chat request to the session.
+
+        A payload with neither leaves the stored context as it is.
+        """
+        current = self.sessions.get(session_id)
+        resync = False
+        if "ui_context" in payload:
+            state = dict(payload.get("ui_context") or {})
+            self._count("full")
+        elif "ui_context_diff" in payload:
+            resync = current is None or payload.get("ui_context_base") != current.digest
+            state = dict(current.state) if current else {}
+            for key, value in (payload.get("ui_context_diff") or {}).items():
+                if value is None:
+                    state.pop(key, None)
+                else:
+                    state[key] = value
+            self._count("diff")
+        else:
+            state = current.state if current else {}
+        if resync:
+            self._count("resync")
+
+        if current is not None and state is current.state:
+            entry = current
+        else:
+            digest = content_hash(state)
+            if current is not None and digest == current.digest:
+                entry = current
+                self._count("unchanged")
+            else:
+                entry = SessionUIContext(state, digest)
+                self.sessions.put(session_id, entry)
+        if resync:
+            return SessionUIContext(entry.state, entry.digest, resync=True)
+        return entry
+
+    def render(self, key: str, render: Callable[[], str]) -> str:
+        """Return the rendering memoized under key, calling render() on a miss."""
+        text = self.rendered.get(key)
+        if text is None:
+            self._count("render_misses")
+            text = render()
+            self.rendered.put(key, text)
+        else:
+            self._count("render_hits")
+        return text
+
+    def metrics(self) -> Dict[str, int]:
+        with self.lock:
+            stats = dict(self.stats)
+        stats["sessions"] = len(self.sessions)
+        stats["rendered"] = len(self.rendered)
+        return stats
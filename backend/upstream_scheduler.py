@@ -0,0 +1,281 @@
+# upstream_scheduler.py
+import contextlib
+import contextvars
+import datetime
+import email.utils
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from enum import IntEnum
+from typing import Any, Callable, Dict, Optional
+
+from telemetry import UPSTREAM_QUEUE_WAIT, add_span, upstream_span
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Priority classes for upstream calls. Lower values are served first."""
+    INTERACTIVE = 0
+    CHAT = 1
+    PREFETCH = 2
+
+
+# Priority of the request currently being served. Endpoint handlers set this
+# once and every upstream call made while serving the request inherits it.
+current_priority = contextvars.ContextVar("current_priority", default=Priority.INTERACTIVE)
+
+
+@contextlib.contextmanager
+def request_priority(priority: Priority):
+    """Run the enclosed upstream calls with the given priority class."""
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header value.
+
+    Args:
+        value: Either a number of seconds or an HTTP date
+
+    Returns:
+        Seconds to wait, or None if the header is missing or malformed
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (retry_at - now).total_seconds())
+
+
+def _response_status(response: Any) -> Optional[int]:
+    # requests/httpx expose status_code, http.client exposes status
+    status = getattr(response, "status_code", None)
+    if status is None:
+        status = getattr(response, "status", None)
+    return status if isinstance(status, int) else None
+
+
+def _response_retry_after(response: Any) -> Optional[float]:
+    headers = getattr(response, "headers", None)
+    if headers is not None and hasattr(headers, "get"):
+        return parse_retry_after(headers.get("Retry-After"))
+    if hasattr(response, "getheader"):
+        return parse_retry_after(response.getheader("Retry-After"))
+    return None
+
+
+class UpstreamQueue:
+    """
+    Token bucket for a single upstream with a priority queue of waiters.
+
+    Callers block in acquire() until a token is available and no waiter of a
+    higher priority (or an earlier waiter of the same priority) is ahead of them.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        # A 429 with Retry-After pauses the whole upstream, not just the caller
+        self.paused_until = 0.0
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.stats = {
+            "requests": 0,
+            "rate_limited": 0,
+            "retries": 0,
+            "failures": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "max_queue_depth": 0,
+        }
+        self.depth_by_priority = {priority.name.lower(): 0 for priority in Priority}
+
+    def _refill(self, now: float):
+        elapsed = now - self.last_refill
+        if elapsed > 0:
+            self.tokens = min(float(self.burst), self.tokens + elapsed * self.rate)
+            self.last_refill = now
+
+    def acquire(self, priority: Priority) -> float:
+        """
+        Wait for a token.
+
+        Args:
+            priority: Priority class of the caller
+
+        Returns:
+            Seconds spent waiting in the queue
+        """
+        start = time.monotonic()
+        entry = (int(priority), next(self.sequence))
+        with self.condition:
+            heapq.heappush(self.waiters, entry)
+            self.depth_by_priority[priority.name.lower()] += 1
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], len(self.waiters))
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self.waiters[0] == entry and now >= self.paused_until and self.tokens >= 1:
+                        self.tokens -= 1
+                        heapq.heappop(self.waiters)
+                        break
+                    if now < self.paused_until:
+                        timeout = self.paused_until - now
+                    elif self.tokens < 1:
+                        timeout = (1 - self.tokens) / self.rate
+                    else:
+                        # A token is free but someone else is first in line
+                        timeout = None
+                    self.condition.wait(timeout)
+            except BaseException:
+                self.waiters.remove(entry)
+                heapq.heapify(self.waiters)
+                raise
+            finally:
+                self.depth_by_priority[priority.name.lower()] -= 1
+                self.condition.notify_all()
+            waited = time.monotonic() - start
+            self.stats["requests"] += 1
+            self.stats["wait_seconds_total"] += waited
+            self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], waited)
+        return waited
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for the given number of seconds."""
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+            self.condition.notify_all()
+
+    def record(self, key: str):
+        with self.condition:
+            self.stats[key] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.condition:
+            return {
+                "rate_per_second": self.rate,
+                "burst": self.burst,
+                "queue_depth": len(self.waiters),
+                "queue_depth_by_priority": dict(self.depth_by_priority),
+                "paused_seconds_remaining": max(0.0, self.paused_until - time.monotonic()),
+                **self.stats,
+            }
+
+
+class UpstreamScheduler:
+    """
+    Central scheduler for rate-limited upstream APIs (RapidAPI, SerpAPI).
+
+    Every upstream has its own token bucket. Calls are admitted in priority
+    order, 429 responses are retried after Retry-After (or exponential backoff
+    with full jitter when the header is missing).
+    """
+
+    def __init__(self, max_retries: int = 3, backoff_base: float = 0.5, backoff_cap: float = 8.0):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.queues: Dict[str, UpstreamQueue] = {}
+        self.lock = threading.Lock()
+
+    def configure(self, upstream: str, rate: float, burst: int):
+        """Register an upstream with its sustained rate (requests/second) and burst size."""
+        with self.lock:
+            self.queues[upstream] = UpstreamQueue(upstream, rate, burst)
+
+    def queue(self, upstream: str) -> UpstreamQueue:
+        with self.lock:
+            if upstream not in self.queues:
+                self.queues[upstream] = UpstreamQueue(upstream, 5.0, 5)
+            return self.queues[upstream]
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def call(self, upstream: str, fn: Callable[[], Any], priority: Optional[Priority] = None,
+             endpoint: str = "request") -> Any:
+        """
+        Run fn once the upstream's scheduler admits it.
+
+        Args:
+            upstream: Name of the upstream, e.g. "zillow" or "serpapi"
+            fn: Zero-argument callable that performs the request
+            priority: Priority class, defaults to the current request's priority
+            endpoint: Upstream endpoint name used to label latency metrics
+
+        Returns:
+            Whatever fn returns. A final 429 response is returned unchanged so
+            callers keep their existing error handling.
+        """
+        if priority is None:
+            priority = current_priority.get()
+        queue = self.queue(upstream)
+        response = None
+        for attempt in range(self.max_retries + 1):
+            waited = queue.acquire(priority)
+            UPSTREAM_QUEUE_WAIT.observe((upstream, priority.name.lower()), waited)
+            if waited > 0.05:
+                add_span(f"{upstream}_queue", waited)
+                logger.info(f"{upstream} call waited {waited:.2f}s in {priority.name.lower()} queue")
+            try:
+                with upstream_span(upstream, endpoint):
+                    response = fn()
+            except Exception:
+                queue.record("failures")
+                raise
+            if _response_status(response) != 429:
+                return response
+            queue.record("rate_limited")
+            retry_after = _response_retry_after(response)
+            delay = retry_after if retry_after is not None else self.backoff(attempt)
+            queue.pause(delay)
+            if attempt < self.max_retries:
+                queue.record("retries")
+                logger.warning(f"{upstream} returned 429, retrying in {delay:.2f}s (attempt {attempt + 1})")
+        logger.error(f"{upstream} still rate limited after {self.max_retries} retries")
+        return response
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            queues = list(self.queues.values())
+        return {queue.name: queue.metrics() for queue in queues}
+
+
+scheduler = UpstreamScheduler(
+    max_retries=int(os.environ.get("UPSTREAM_MAX_RETRIES", 3)),
+)
+scheduler.configure(
+    "zillow",
+    rate=float(os.environ.get("ZILLOW_RATE_PER_SECOND", 5)),
+    burst=int(os.environ.get("ZILLOW_BURST", 5)),
+)
+scheduler.configure(
+    "serpapi",
+    rate=float(os.environ.get("SERPAPI_RATE_PER_SECOND", 2)),
+    burst=int(os.environ.get("SERPAPI_BURST", 2)),
+)
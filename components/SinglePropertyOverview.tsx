@@ -42,6 +42,7 @@ interface PropertyDetailsTypes {
     transit?: any;
     bike?: any;
     rent_estimate?: any;
+    marketAnalysis?: any;
 }
 
 interface NeighborhoodScoreProps {
@@ -191,7 +192,8 @@ const SinglePropertyOverview = () => {
                 yearBuilt: propertyDetails.basic_info.yearBuilt,
                 type: propertyDetails.basic_info.homeType,
                 daysOnMarket: propertyDetails.basic_info.daysOnZillow,
-                priceHistory: propertyDetails.priceHistory?.map((item: { date: any; event: any; price: any; }) => ({
+                // The backend's marketAnalysis summarizes the price history for the chat
+                priceHistory: propertyDetails.marketAnalysis ? [] : propertyDetails.priceHistory?.map((item: { date: any; event: any; price: any; }) => ({
                     date: item.date,
                     event: item.event,
                     price: item.price
@@ -238,7 +240,13 @@ const SinglePropertyOverview = () => {
                         description: propertyDetails.bike?.description
                     }
                 },
-                rentEstimate: propertyDetails.rent_estimate
+                rentEstimate: propertyDetails.rent_estimate,
+                // Comps valuation and price history summary computed by the backend
+                marketAnalysis: propertyDetails.marketAnalysis ? {
+                    valuation: propertyDetails.marketAnalysis.valuation,
+                    pricePerSqft: propertyDetails.marketAnalysis.pricePerSqft,
+                    history: propertyDetails.marketAnalysis.history
+                } : undefined
             };
 
             // Store this in context for the chat to access
@@ -104,7 +104,11 @@ const PropertyMarketTab = () => {
             setPropertyMarketData({
                 ...relevantData,
                 similarProperties,
-                priceHistory
+                priceHistory,
+                // Comps valuation computed by the backend (comps.py)
+                valuation: propertyDetails?.marketAnalysis?.valuation,
+                comps: propertyDetails?.marketAnalysis?.comps || [],
+                compsPricePerSqFt: propertyDetails?.marketAnalysis?.pricePerSqft
             });
             
             setComparisonData(comparisons);
@@ -308,6 +312,44 @@ const PropertyMarketTab = () => {
                 </div>
             </div>
 
+            {/* Comparable-sales valuation */}
+            {propertyMarketData.valuation?.estimate && (
+                <div className="bg-white rounded-xl border border-slate-200 p-4 shadow-sm hover:shadow-md transition-shadow">
+                    <h3 className="text-lg font-semibold text-slate-800 mb-3 border-b pb-2">Comparable Sales Valuation</h3>
+                    <div className="grid grid-cols-1 md:grid-cols-3 gap-4 text-sm">
+                        <div>
+                            <p className="text-slate-500">Estimated value</p>
+                            <p className="text-xl font-semibold text-slate-900">{formatDollar(propertyMarketData.valuation.estimate)}</p>
+                            <p className="text-slate-600">
+                                {formatDollar(propertyMarketData.valuation.low)} - {formatDollar(propertyMarketData.valuation.high)}
+                            </p>
+                        </div>
+                        <div>
+                            <p className="text-slate-500">List price vs estimate</p>
+                            <p className="text-xl font-semibold text-slate-900">
+                                {propertyMarketData.valuation.listVsEstimatePercent != null
+                                    ? `${propertyMarketData.valuation.listVsEstimatePercent >= 0 ? '+' : ''}${propertyMarketData.valuation.listVsEstimatePercent}%`
+                                    : 'N/A'}
+                            </p>
+                            <p className="text-slate-600 capitalize">
+                                {propertyMarketData.valuation.confidence} confidence, {propertyMarketData.valuation.compCount} comps
+                            </p>
+                        </div>
+                        <div>
+                            <p className="text-slate-500">Comps' price per sq ft</p>
+                            <p className="text-xl font-semibold text-slate-900">
+                                {propertyMarketData.compsPricePerSqFt?.median ? formatDollar(propertyMarketData.compsPricePerSqFt.median) : 'N/A'}
+                            </p>
+                            <p className="text-slate-600">
+                                {propertyMarketData.compsPricePerSqFt?.p25 && propertyMarketData.compsPricePerSqFt?.p75
+                                    ? `${formatDollar(propertyMarketData.compsPricePerSqFt.p25)} - ${formatDollar(propertyMarketData.compsPricePerSqFt.p75)}`
+                                    : ''}
+                            </p>
+                        </div>
+                    </div>
+                </div>
+            )}
+
             {/* Price History */}
             {propertyMarketData.priceHistory && propertyMarketData.priceHistory.length > 0 && (
                 <div className="bg-white rounded-xl border border-slate-200 p-4 shadow-sm hover:shadow-md transition-shadow">
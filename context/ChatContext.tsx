@@ -55,6 +55,8 @@ export const ChatProvider = ({ children }: { children: React.ReactNode }) => {
 
     const [propertyContext, setPropertyContext] = useState<any>(null);
     const messagesEndRef = useRef<HTMLDivElement>(null);
+    // UI context the backend holds for this session (see buildUIContextPayload)
+    const lastUIContextRef = useRef<{ sessionId: string; version: string; context: Record<string, any> } | null>(null);
 
     // Add new state variables
     const [workflowState, setWorkflowState] = useState<string | null>(null);
@@ -153,6 +155,33 @@ export const ChatProvider = ({ children }: { children: React.ReactNode }) => {
         };
     };
 
+    // The backend keeps the last UI context of each chat session, so send the full
+    // state once and then only the keys that changed (null removes a key). The
+    // property context goes as propertyRef (the zpid); the backend fills it in from
+    // the property details it served on /api/property.
+    const buildUIContextPayload = () => {
+        const { propertyContext: fullPropertyContext, ...rest } = buildUIContext();
+        const uiContext: Record<string, any> = { ...rest };
+        if (fullPropertyContext && selectedProperty?.zpid) {
+            uiContext.propertyRef = selectedProperty.zpid;
+        } else if (fullPropertyContext) {
+            uiContext.propertyContext = fullPropertyContext;
+        }
+
+        const last = lastUIContextRef.current;
+        if (!last || !sessionId || last.sessionId !== sessionId) {
+            return { uiContext, payload: { ui_context: uiContext } };
+        }
+        const diff: Record<string, any> = {};
+        const keys = new Set([...Object.keys(last.context), ...Object.keys(uiContext)]);
+        keys.forEach(key => {
+            if (JSON.stringify(last.context[key]) !== JSON.stringify(uiContext[key])) {
+                diff[key] = uiContext[key] === undefined ? null : uiContext[key];
+            }
+        });
+        return { uiContext, payload: { ui_context_diff: diff, ui_context_base: last.version } };
+    };
+
     // Add new functions to manage workflow persistence
     const persistWorkflow = (query: string) => {
         if (zipCode) {
@@ -512,20 +541,50 @@ export const ChatProvider = ({ children }: { children: React.ReactNode }) => {
 
             // Start fetching properties in parallel
             setIsLoadingProperties(true);
-            fetch('/api/properties', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ zipCode: zip })
-            }).then(async propertiesResponse => {
-                console.log('Properties response:', propertiesResponse);
-                const propertiesData = await propertiesResponse.json();
-                setProperties(propertiesData.results || []);
+            (async () => {
+                // NDJSON: one listing per line, shown as soon as it arrives. The
+                // cursor is followed while its pages come from the server's cache
+                // of the search; pages that cost another Zillow call are not loaded.
+                const loaded: Property[] = [];
+                setProperties([]);
+                let cursor: string | null = null;
+                do {
+                    const propertiesResponse = await fetch('/api/properties/stream', {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify(cursor ? { zipCode: zip, cursor } : { zipCode: zip })
+                    });
+                    console.log('Properties response:', propertiesResponse);
+                    const reader = propertiesResponse.body!.getReader();
+                    const decoder = new TextDecoder();
+                    let buffer = '';
+                    let next: string | null = null;
+                    while (true) {
+                        const { done, value } = await reader.read();
+                        buffer += decoder.decode(value, { stream: !done });
+                        const lines = buffer.split('\n');
+                        buffer = done ? '' : lines.pop() || '';
+                        const batch = lines.filter(line => line.trim()).map(line => JSON.parse(line));
+                        const listings = batch.filter(item => item.type === 'listing').map(item => item.listing);
+                        if (listings.length > 0) {
+                            loaded.push(...listings);
+                            setProperties([...loaded]);
+                            setIsLoadingProperties(false);
+                        }
+                        batch.filter(item => item.type === 'error').forEach(item => console.error('Properties stream error:', item.error));
+                        for (const item of batch) {
+                            if (item.type === 'page' && item.cursor && !item.upstream) next = item.cursor;
+                        }
+                        if (done) break;
+                    }
+                    cursor = next;
+                } while (cursor);
                 setIsLoadingProperties(false);
-                console.log('Properties loaded:', propertiesData.results?.length || 0);
+                console.log('Properties loaded:', loaded.length);
 
                 // Generate new follow-up questions after properties data is loaded
                 setTimeout(generateFollowUpQuestions, 300);
-            }).catch(err => {
+            })().catch(err => {
                 console.error('Failed to fetch properties:', err);
                 setIsLoadingProperties(false);
             });
@@ -869,6 +928,8 @@ export const ChatProvider = ({ children }: { children: React.ReactNode }) => {
 
             console.log('Sending UI context to LLM:', uiContext);
 
+            const uiContextPayload = buildUIContextPayload();
+
             // Only make the API call once
             const response = await fetch('/api/chat', {
                 method: 'POST',
@@ -881,7 +942,7 @@ export const ChatProvider = ({ children }: { children: React.ReactNode }) => {
                     // Add extracted features and enhanced UI state
                     feature_context: JSON.stringify({
                         extracted: features,
-                        ui_context: buildUIContext()
+                        ...uiContextPayload.payload
                     }),
                     location_context: zipCode || '{}'
                 }),
@@ -919,6 +980,11 @@ export const ChatProvider = ({ children }: { children: React.ReactNode }) => {
 
             if (!sessionId && data.session_id) setSessionId(data.session_id);
 
+            // On resync the backend lost the context the diff was based on: send it in full next turn
+            lastUIContextRef.current = data.session_id && data.ui_context_version != null && !data.ui_context_resync
+                ? { sessionId: data.session_id, version: data.ui_context_version, context: uiContextPayload.uiContext }
+                : null;
+
             // Generate new follow-up questions after response is received
             setTimeout(generateFollowUpQuestions, 500);
 